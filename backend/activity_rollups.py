@@ -0,0 +1,195 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+METRICA_REGISTROS = "registros"
+METRICA_DESAFIOS = "desafios"
+METRICA_RESPOSTAS = "respostas"
+METRICA_AVALIACOES = "avaliacoes"
+METRICAS = (METRICA_REGISTROS, METRICA_DESAFIOS, METRICA_RESPOSTAS, METRICA_AVALIACOES)
+
+GRANULARIDADE_HORA = "hora"
+GRANULARIDADE_DIA = "dia"
+GRANULARIDADE_SEMANA = "semana"
+GRANULARIDADES = (GRANULARIDADE_HORA, GRANULARIDADE_DIA, GRANULARIDADE_SEMANA)
+
+DIMENSOES = ("tipo", "empresa")
+
+# Hourly buckets feed short ranges, daily buckets feed day/week charts
+COLLECTIONS = {
+    GRANULARIDADE_HORA: "atividade_horaria",
+    GRANULARIDADE_DIA: "atividade_diaria",
+}
+
+MAX_PONTOS = 2000
+# Backfills write to "<collection>_reconstrucao" and rename it over the rollup when complete
+REBUILD_SUFFIX = "_reconstrucao"
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """Stored periods are naive UTC, as Motor returns them; aware bounds (…Z, +03:00) are converted."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def truncate(moment: datetime, granularidade: str) -> datetime:
+    if granularidade == GRANULARIDADE_HORA:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularidade == GRANULARIDADE_SEMANA:
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def rollup_id(metrica: str, periodo: datetime) -> str:
+    return f"{metrica}|{periodo.isoformat()}"
+
+
+def step(granularidade: str) -> timedelta:
+    return {
+        GRANULARIDADE_HORA: timedelta(hours=1),
+        GRANULARIDADE_DIA: timedelta(days=1),
+        GRANULARIDADE_SEMANA: timedelta(weeks=1),
+    }[granularidade]
+
+
+def increments(metrica: str, moment: datetime, tipo: Optional[str] = None, empresa_id: Optional[str] = None,
+               count: int = 1) -> List[Tuple[str, str, Dict[str, int], Dict]]:
+    """(collection, _id, $inc, $setOnInsert) for every bucket an event is counted in."""
+    counts = {"total": count}
+    if tipo:
+        counts[f"por_tipo.{tipo}"] = count
+    if empresa_id:
+        counts[f"por_empresa.{empresa_id}"] = count
+    buckets = []
+    for granularidade, collection in COLLECTIONS.items():
+        periodo = truncate(moment, granularidade)
+        buckets.append((collection, rollup_id(metrica, periodo), counts, {"metrica": metrica, "periodo": periodo}))
+    return buckets
+
+
+async def ensure_indexes(db, collections: Optional[List[str]] = None):
+    for collection in collections or COLLECTIONS.values():
+        await db[collection].create_index([("metrica", ASCENDING), ("periodo", ASCENDING)])
+
+
+async def query_series(db, metrica: str, inicio: datetime, fim: datetime, granularidade: str,
+                       dimensao: Optional[str] = None) -> Dict:
+    """Chart-ready series read only from the rollup collections."""
+    source = GRANULARIDADE_HORA if granularidade == GRANULARIDADE_HORA else GRANULARIDADE_DIA
+    inicio = truncate(naive_utc(inicio), granularidade)
+    fim = naive_utc(fim)
+    cursor = db[COLLECTIONS[source]].find(
+        {"metrica": metrica, "periodo": {"$gte": inicio, "$lte": fim}},
+        {"_id": 0, "periodo": 1, "total": 1, "por_tipo": 1, "por_empresa": 1},
+    )
+
+    totals: Dict[datetime, int] = defaultdict(int)
+    breakdown: Dict[str, Dict[datetime, int]] = defaultdict(lambda: defaultdict(int))
+    field = {"tipo": "por_tipo", "empresa": "por_empresa"}.get(dimensao)
+    async for doc in cursor:
+        periodo = truncate(doc["periodo"], granularidade)
+        totals[periodo] += doc.get("total", 0)
+        if field:
+            for chave, valor in doc.get(field, {}).items():
+                breakdown[chave][periodo] += valor
+
+    labels = []
+    atual, passo = inicio, step(granularidade)
+    while atual <= fim and len(labels) < MAX_PONTOS:
+        labels.append(atual)
+        atual += passo
+
+    series = [{"nome": "total", "dados": [totals.get(p, 0) for p in labels]}]
+    for chave in sorted(breakdown):
+        series.append({"nome": chave, "dados": [breakdown[chave].get(p, 0) for p in labels]})
+
+    return {
+        "metrica": metrica,
+        "granularidade": granularidade,
+        "dimensao": dimensao,
+        "labels": [p.isoformat() for p in labels],
+        "series": series,
+    }
+
+
+async def backfill(db, batch_size: int = 1000, marcar=None) -> Dict[str, int]:
+    """Rebuild all rollups from the hot and archived documents in a single pass per collection.
+
+    Buckets are written to scratch collections renamed over the rollups at
+    the end. ``marcar(collection, ids)`` is told which entities were counted,
+    see OutboxWorker.rebuild_projection.
+    """
+    desafio_empresa = {}
+    for name in ("desafios", "desafios_arquivo"):
+        async for d in db[name].find({}, {"_id": 0, "id": 1, "empresa_id": 1}):
+            desafio_empresa[d["id"]] = d["empresa_id"]
+    resposta_desafio = {}
+    for name in ("respostas", "respostas_arquivo"):
+        async for r in db[name].find({}, {"_id": 0, "id": 1, "desafio_id": 1}):
+            resposta_desafio[r["id"]] = r["desafio_id"]
+
+    # (metrica, entity collection, archive, time field, dimensions, projection)
+    sources = [
+        (METRICA_REGISTROS, "usuarios", None, "criado_em", lambda d: (d.get("tipo"), None), {"tipo": 1}),
+        (METRICA_DESAFIOS, "desafios", "desafios_arquivo", "criado_em",
+         lambda d: (None, d.get("empresa_id")), {"empresa_id": 1}),
+        (METRICA_RESPOSTAS, "respostas", "respostas_arquivo", "enviada_em",
+         lambda d: (None, desafio_empresa.get(d.get("desafio_id"))), {"desafio_id": 1}),
+        (METRICA_AVALIACOES, "avaliacoes", "avaliacoes_arquivo", "avaliado_em",
+         lambda d: (None, desafio_empresa.get(resposta_desafio.get(d.get("resposta_id")))), {"resposta_id": 1}),
+    ]
+
+    scratch = {granularidade: collection + REBUILD_SUFFIX for granularidade, collection in COLLECTIONS.items()}
+    for name in scratch.values():
+        await db[name].drop()
+
+    processed = {}
+    for metrica, entidade, arquivo, time_field, dims, projection in sources:
+        buckets: Dict[str, Dict[str, Dict[str, int]]] = {
+            granularidade: defaultdict(lambda: defaultdict(int)) for granularidade in COLLECTIONS
+        }
+        count = 0
+        for name in filter(None, (entidade, arquivo)):
+            ids: List[str] = []
+            async for doc in db[name].find({}, {"_id": 0, "id": 1, time_field: 1, **projection}):
+                moment = doc.get(time_field)
+                if moment is None:
+                    continue
+                tipo, empresa_id = dims(doc)
+                for granularidade in COLLECTIONS:
+                    counts = buckets[granularidade][truncate(moment, granularidade)]
+                    counts["total"] += 1
+                    if tipo:
+                        counts[f"por_tipo.{tipo}"] += 1
+                    if empresa_id:
+                        counts[f"por_empresa.{empresa_id}"] += 1
+                count += 1
+                ids.append(doc["id"])
+                if len(ids) >= batch_size and marcar is not None:
+                    await marcar(entidade, ids)
+                    ids = []
+            if marcar is not None:
+                await marcar(entidade, ids)
+        processed[metrica] = count
+
+        for granularidade, periodos in buckets.items():
+            updates = [
+                UpdateOne(
+                    {"_id": rollup_id(metrica, periodo)},
+                    {"$inc": dict(counts), "$setOnInsert": {"metrica": metrica, "periodo": periodo}},
+                    upsert=True,
+                )
+                for periodo, counts in periodos.items()
+            ]
+            for start in range(0, len(updates), batch_size):
+                await db[scratch[granularidade]].bulk_write(updates[start:start + batch_size], ordered=False)
+
+    # Creating the indexes also creates empty scratch collections, so every rename has a source
+    await ensure_indexes(db, list(scratch.values()))
+    for granularidade, collection in COLLECTIONS.items():
+        await db[scratch[granularidade]].rename(collection, dropTarget=True)
+    return processed
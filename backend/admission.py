@@ -0,0 +1,230 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.routing import Match
+
+from metrics import registry
+
+CLASSE_AUTH = "auth"
+CLASSE_PESADA = "pesada"
+# Uploads, exports and admin jobs that run without a deadline: kept apart so a
+# few slow ones cannot take the slots bounded heavy reads need
+CLASSE_LONGA = "longa"
+CLASSE_PADRAO = "padrao"
+
+# Routes not listed here fall into the cheap default class
+ROUTE_COST_CLASSES = {
+    ("POST", "/api/login"): CLASSE_AUTH,
+    ("POST", "/api/register"): CLASSE_AUTH,
+    ("GET", "/api/matches"): CLASSE_PESADA,
+    ("GET", "/api/admin/stats"): CLASSE_PESADA,
+    ("GET", "/api/admin/usuarios"): CLASSE_PESADA,
+    ("GET", "/api/desafios/recomendados"): CLASSE_PESADA,
+    ("GET", "/api/respostas/desafio/{desafio_id}/duplicadas"): CLASSE_PESADA,
+    ("POST", "/api/avaliacoes/lote"): CLASSE_PESADA,
+    ("GET", "/api/export/respostas"): CLASSE_LONGA,
+    ("POST", "/api/respostas/{resposta_id}/anexos"): CLASSE_LONGA,
+    ("POST", "/api/admin/atividade/backfill"): CLASSE_LONGA,
+    ("POST", "/api/admin/analytics/notas/rebuild"): CLASSE_LONGA,
+    ("POST", "/api/admin/arquivamento"): CLASSE_LONGA,
+    ("POST", "/api/admin/consistencia/nomes"): CLASSE_LONGA,
+    ("POST", "/api/admin/outbox/replay"): CLASSE_LONGA,
+}
+
+# Rate limited per client IP before the handler runs
+RATE_LIMITED_ROUTES = {
+    ("POST", "/api/login"),
+    ("POST", "/api/register"),
+}
+
+# (concurrency, queue) defaults per class
+DEFAULT_LIMITS = {
+    CLASSE_AUTH: (8, 32),
+    CLASSE_PESADA: (4, 16),
+    CLASSE_LONGA: (2, 8),
+    CLASSE_PADRAO: (64, 256),
+}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class CostClassLimiter:
+    """Concurrency semaphore with a bounded wait queue for one cost class."""
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                registry.inc("admission_rejected_total", classe=self.name, motivo="fila_cheia")
+                raise Rejected(503, "Servidor sobrecarregado, tente novamente", self.queue_timeout)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                registry.inc("admission_rejected_total", classe=self.name, motivo="timeout_fila")
+                raise Rejected(503, "Servidor sobrecarregado, tente novamente", self.queue_timeout)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        registry.inc("admission_admitted_total", classe=self.name)
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets, bounded to the most recently seen keys."""
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int, max_keys: int = 100_000):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def check(self, key: str):
+        """Consume one token for key or raise Rejected with the wait time."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens < 1.0:
+            self._buckets[key] = (tokens, now)
+            registry.inc("rate_limited_total", limite=self.name)
+            raise Rejected(429, "Muitas tentativas, aguarde antes de tentar novamente", (1.0 - tokens) / self.rate)
+        self._buckets[key] = (tokens - 1.0, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.enabled = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+        queue_timeout = _env_int("ADMISSION_QUEUE_TIMEOUT_MS", 2000) / 1000.0
+        self.limiters: Dict[str, CostClassLimiter] = {}
+        for classe, (concurrency, queue) in DEFAULT_LIMITS.items():
+            prefix = f"ADMISSION_{classe.upper()}"
+            self.limiters[classe] = CostClassLimiter(
+                classe,
+                _env_int(f"{prefix}_CONCURRENCY", concurrency),
+                _env_int(f"{prefix}_QUEUE", queue),
+                queue_timeout,
+            )
+        login_rate = _env_float("RATE_LIMIT_LOGIN_PER_MINUTE", 10)
+        login_burst = _env_int("RATE_LIMIT_LOGIN_BURST", 5)
+        self.ip_limiter = TokenBucketLimiter("ip", login_rate * 3, login_burst * 3)
+        self.user_limiter = TokenBucketLimiter("usuario", login_rate, login_burst)
+        self.account_limiter = TokenBucketLimiter("conta", login_rate * 3, login_burst * 3)
+        self.trust_forwarded_for = os.environ.get("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+        registry.describe("admission_admitted_total", "counter", "Requests admitted per cost class")
+        registry.describe("admission_rejected_total", "counter", "Requests shed per cost class and reason")
+        registry.describe("rate_limited_total", "counter", "Requests rejected by token-bucket rate limits")
+        registry.gauge("admission_active", "Requests currently executing per cost class",
+                       lambda: [({"classe": n}, l.active) for n, l in self.limiters.items()])
+        registry.gauge("admission_waiting", "Requests queued per cost class",
+                       lambda: [({"classe": n}, l.waiting) for n, l in self.limiters.items()])
+
+    def client_ip(self, scope) -> str:
+        if self.trust_forwarded_for:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode().split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "desconhecido"
+
+    def check_user(self, identifier: str, ip: str):
+        # Keyed on (account, IP), so a flood from one address does not lock the owner out,
+        # plus a looser per-account bucket that attempts spread over many addresses still drain
+        if self.enabled:
+            self.user_limiter.check(f"{identifier.lower()}|{ip}")
+            self.account_limiter.check(identifier.lower())
+
+
+def resolve_route(router, scope) -> Optional[str]:
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+
+async def _send_rejection(send, rejected: Rejected):
+    body = json.dumps({"detail": rejected.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": rejected.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", rejected.retry_after_header.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware so streamed responses hold their slot until they finish."""
+
+    def __init__(self, app, controller: AdmissionController, router):
+        self.app = app
+        self.controller = controller
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        path = resolve_route(self.router, scope)
+        key = (scope["method"], path)
+        limiter = self.controller.limiters[ROUTE_COST_CLASSES.get(key, CLASSE_PADRAO)]
+        try:
+            if key in RATE_LIMITED_ROUTES:
+                self.controller.ip_limiter.check(self.controller.client_ip(scope))
+            await limiter.acquire()
+        except Rejected as rejected:
+            await _send_rejection(send, rejected)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+admission_controller = AdmissionController()
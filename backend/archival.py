@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Hot/cold split: desafios closed for longer than a grace period move, with
+# their respostas and avaliacoes, to *_arquivo collections. Every step is a
+# copy followed by a delete of exactly what was copied, so a run that stops
+# halfway is finished by the next one. Each archived formando/desafio pair
+# leaves a compact row in matches_arquivo so matches can still count it.
+
+STATUS_ABERTO = "aberto"
+STATUS_ENCERRADO = "encerrado"
+STATUS = (STATUS_ABERTO, STATUS_ENCERRADO)
+
+ARQUIVO = {
+    "desafios": "desafios_arquivo",
+    "respostas": "respostas_arquivo",
+    "avaliacoes": "avaliacoes_arquivo",
+}
+MATCHES_ARQUIVO = "matches_arquivo"
+
+BATCH_SIZE = 500
+DUPLICATE_KEY = 11000
+
+
+def encerrado(desafio_doc: dict, agora: Optional[datetime] = None) -> bool:
+    """Closed explicitly or past its deadline."""
+    if desafio_doc.get("status") == STATUS_ENCERRADO:
+        return True
+    prazo = desafio_doc.get("prazo")
+    return prazo is not None and prazo <= (agora or datetime.utcnow())
+
+
+def open_filter(agora: Optional[datetime] = None) -> Dict:
+    """The complement of ``encerrado``, as a query."""
+    return {
+        "status": {"$ne": STATUS_ENCERRADO},
+        "$or": [{"prazo": None}, {"prazo": {"$gt": agora or datetime.utcnow()}}],
+    }
+
+
+def closed_filter(limite: datetime) -> Dict:
+    """Desafios closed, explicitly or by deadline, no later than ``limite``."""
+    return {"$or": [
+        {"status": STATUS_ENCERRADO, "encerrado_em": {"$lte": limite}},
+        {"prazo": {"$lte": limite}},
+    ]}
+
+
+async def ensure_indexes(db):
+    await db.desafios.create_index([("status", ASCENDING), ("encerrado_em", ASCENDING)])
+    await db.desafios.create_index([("prazo", ASCENDING)], sparse=True)
+    for archive in ARQUIVO.values():
+        await db[archive].create_index([("id", ASCENDING)], unique=True)
+    await db.desafios_arquivo.create_index([("empresa_id", ASCENDING)])
+    await db.respostas_arquivo.create_index([("desafio_id", ASCENDING)])
+    await db.respostas_arquivo.create_index([("usuario_id", ASCENDING)])
+    await db.avaliacoes_arquivo.create_index([("resposta_id", ASCENDING)])
+    await db.avaliacoes_arquivo.create_index([("desafio_id", ASCENDING)])
+
+
+async def _copy(db, archive: str, docs: List[dict]):
+    """Insert into the archive, skipping documents a previous run already copied."""
+    if not docs:
+        return
+    try:
+        await db[archive].insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        if any(error["code"] != DUPLICATE_KEY for error in exc.details.get("writeErrors", [])):
+            raise
+
+
+async def _move_respostas(db, desafio: dict, batch_size: int) -> Dict[str, int]:
+    movidos = {"respostas": 0, "avaliacoes": 0}
+    while True:
+        respostas = await db.respostas.find({"desafio_id": desafio["id"]}, {"_id": 0}).to_list(batch_size)
+        if not respostas:
+            # Avaliacoes written while their resposta was being moved
+            tardias = await db.avaliacoes.find({"desafio_id": desafio["id"]}, {"_id": 0}).to_list(None)
+            await _copy(db, ARQUIVO["avaliacoes"], tardias)
+            await db.avaliacoes.delete_many({"id": {"$in": [a["id"] for a in tardias]}})
+            movidos["avaliacoes"] += len(tardias)
+            return movidos
+        por_id = {r["id"]: r for r in respostas}
+        avaliacoes = await db.avaliacoes.find({"resposta_id": {"$in": list(por_id)}}, {"_id": 0}).to_list(None)
+        for avaliacao in avaliacoes:
+            # Legacy avaliacoes may predate the embedded owner fields the summary groups by
+            resposta = por_id[avaliacao["resposta_id"]]
+            donos = {
+                "desafio_id": desafio["id"],
+                "desafio_titulo": desafio.get("titulo"),
+                "empresa_id": desafio.get("empresa_id"),
+                "empresa_nome": desafio.get("empresa_nome"),
+                "formando_id": resposta["usuario_id"],
+                "formando_nome": resposta.get("formando_nome"),
+            }
+            for campo, valor in donos.items():
+                if avaliacao.get(campo) is None:
+                    avaliacao[campo] = valor
+
+        await _copy(db, ARQUIVO["avaliacoes"], avaliacoes)
+        await _copy(db, ARQUIVO["respostas"], respostas)
+        await db.avaliacoes.delete_many({"id": {"$in": [a["id"] for a in avaliacoes]}})
+        await db.respostas.delete_many({"id": {"$in": list(por_id)}})
+        movidos["respostas"] += len(respostas)
+        movidos["avaliacoes"] += len(avaliacoes)
+
+
+async def _summarize(db, desafio_id: str):
+    """Rewrite the desafio's matches_arquivo rows from its archived avaliacoes."""
+    rows = await db.avaliacoes_arquivo.aggregate([
+        {"$match": {"desafio_id": desafio_id, "formando_id": {"$ne": None}, "empresa_id": {"$ne": None}}},
+        {"$group": {
+            "_id": "$formando_id",
+            "empresa_id": {"$first": "$empresa_id"},
+            "empresa_nome": {"$first": "$empresa_nome"},
+            "formando_nome": {"$first": "$formando_nome"},
+            "desafio_titulo": {"$first": "$desafio_titulo"},
+            "soma": {"$sum": "$nota"},
+            "total": {"$sum": 1},
+        }},
+    ]).to_list(None)
+    if rows:
+        await db[MATCHES_ARQUIVO].bulk_write([
+            UpdateOne(
+                {"_id": f"{desafio_id}:{row['_id']}"},
+                {"$set": {
+                    "desafio_id": desafio_id,
+                    "formando_id": row["_id"],
+                    **{k: row[k] for k in ("empresa_id", "empresa_nome", "formando_nome", "desafio_titulo", "soma", "total")},
+                }},
+                upsert=True,
+            )
+            for row in rows
+        ], ordered=False)
+
+
+async def archive_closed(db, idade_minima: timedelta, batch_size: int = BATCH_SIZE,
+                         agora: Optional[datetime] = None) -> Dict[str, int]:
+    """Move desafios closed for at least ``idade_minima`` to the archive collections."""
+    limite = (agora or datetime.utcnow()) - idade_minima
+    totais = {"desafios": 0, "respostas": 0, "avaliacoes": 0}
+    while True:
+        desafios = await db.desafios.find(closed_filter(limite), {"_id": 0}).to_list(batch_size)
+        if not desafios:
+            return totais
+        for desafio in desafios:
+            movidos = await _move_respostas(db, desafio, batch_size)
+            totais["respostas"] += movidos["respostas"]
+            totais["avaliacoes"] += movidos["avaliacoes"]
+            await _summarize(db, desafio["id"])
+            await _copy(db, ARQUIVO["desafios"], [desafio])
+            await db.desafios.delete_one({"id": desafio["id"]})
+            totais["desafios"] += 1
@@ -0,0 +1,279 @@
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+try:
+    from python_multipart.exceptions import ParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13 ships the module as "multipart"
+    from multipart.exceptions import ParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+STORAGE_GRIDFS = "gridfs"
+STORAGE_LOCAL = "local"
+
+MAX_BYTES = int(os.environ.get("ATTACHMENT_MAX_BYTES", str(20 * 1024 * 1024)))
+MAX_FILES_PER_UPLOAD = 5
+READ_CHUNK = 64 * 1024
+
+ALLOWED_EXTENSIONS = {".pdf", ".zip", ".png", ".jpg", ".jpeg", ".txt", ".docx", ".pptx", ".xlsx"}
+
+SAFE_NAME_RE = re.compile(r"[^\w. -]+")
+
+
+class AttachmentError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+
+
+def safe_filename(name: str) -> str:
+    name = os.path.basename(name.replace("\\", "/")).strip()
+    return SAFE_NAME_RE.sub("_", name)[:200] or "arquivo"
+
+
+class GridFSStorage:
+    def __init__(self, database, bucket_name: str = "anexos"):
+        self.bucket = AsyncIOMotorGridFSBucket(database, bucket_name=bucket_name)
+
+    async def open_writer(self, filename: str, content_type: str):
+        stream = self.bucket.open_upload_stream(filename, metadata={"content_type": content_type})
+        return _GridFSWriter(self.bucket, stream)
+
+    async def read(self, key: str, start: int, length: int) -> AsyncIterator[bytes]:
+        stream = await self.bucket.open_download_stream(ObjectId(key))
+        # Motor's GridOut.seek is synchronous: it only moves the position, read() fetches the chunks
+        stream.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = await stream.read(min(READ_CHUNK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    async def delete(self, key: str):
+        await self.bucket.delete(ObjectId(key))
+
+
+class _GridFSWriter:
+    def __init__(self, bucket, stream):
+        self.bucket = bucket
+        self.stream = stream
+
+    async def write(self, data: bytes):
+        await self.stream.write(data)
+
+    async def close(self) -> str:
+        await self.stream.close()
+        return str(self.stream._id)
+
+    async def abort(self):
+        await self.stream.abort()
+
+
+class LocalStorage:
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    async def open_writer(self, filename: str, content_type: str):
+        key = uuid.uuid4().hex
+        path = self._path(key)
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        partial = path.with_suffix(".parcial")
+        handle = await asyncio.to_thread(open, partial, "wb")
+        return _LocalWriter(key, path, partial, handle)
+
+    async def read(self, key: str, start: int, length: int) -> AsyncIterator[bytes]:
+        handle = await asyncio.to_thread(open, self._path(key), "rb")
+        try:
+            await asyncio.to_thread(handle.seek, start)
+            remaining = length
+            while remaining > 0:
+                data = await asyncio.to_thread(handle.read, min(READ_CHUNK, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        finally:
+            handle.close()
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._path(key).unlink, True)
+
+
+class _LocalWriter:
+    def __init__(self, key: str, path: Path, partial: Path, handle):
+        self.key = key
+        self.path = path
+        self.partial = partial
+        self.handle = handle
+
+    async def write(self, data: bytes):
+        await asyncio.to_thread(self.handle.write, data)
+
+    async def close(self) -> str:
+        await asyncio.to_thread(self.handle.close)
+        # Rename only complete files into place
+        await asyncio.to_thread(os.replace, self.partial, self.path)
+        return self.key
+
+    async def abort(self):
+        await asyncio.to_thread(self.handle.close)
+        await asyncio.to_thread(self.partial.unlink, True)
+
+
+class _Upload:
+    def __init__(self, writer, filename: str, content_type: str):
+        self.writer = writer
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.key: Optional[str] = None
+
+
+async def receive_multipart(content_type_header: str, body: AsyncIterator[bytes], storage,
+                            max_bytes: int = MAX_BYTES) -> List[dict]:
+    """Stream every file part of a multipart body into storage.
+
+    The push parser only queues events while a network chunk is fed to it;
+    the queued part data is written out before the next chunk is read, so
+    memory stays at one chunk per request whatever the file size.
+    """
+    _, params = parse_options_header(content_type_header)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise AttachmentError(400, "Requisição multipart inválida")
+
+    events: List[Tuple] = []
+    header = {"field": b"", "value": b""}
+    headers = {}
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        headers[header["field"].lower()] = header["value"]
+        header["field"] = header["value"] = b""
+
+    def on_headers_finished():
+        events.append(("headers", dict(headers)))
+        headers.clear()
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end",))
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    finished: List[_Upload] = []
+    current: Optional[_Upload] = None
+    try:
+        async for chunk in body:
+            parser.write(chunk)
+            for event in events:
+                if event[0] == "headers":
+                    _, part_params = parse_options_header(event[1].get(b"content-disposition", b""))
+                    filename = part_params.get(b"filename")
+                    if filename is None:
+                        current = None  # plain form field, ignored
+                        continue
+                    if len(finished) >= MAX_FILES_PER_UPLOAD:
+                        raise AttachmentError(400, f"Máximo de {MAX_FILES_PER_UPLOAD} arquivos por envio")
+                    name = safe_filename(filename.decode("utf-8", "replace"))
+                    if Path(name).suffix.lower() not in ALLOWED_EXTENSIONS:
+                        raise AttachmentError(400, "Tipo de arquivo não permitido")
+                    part_type = event[1].get(b"content-type", b"application/octet-stream").decode()
+                    current = _Upload(await storage.open_writer(name, part_type), name, part_type)
+                elif event[0] == "data" and current is not None:
+                    current.size += len(event[1])
+                    if current.size > max_bytes:
+                        raise AttachmentError(413, f"Arquivo excede o limite de {max_bytes // (1024 * 1024)} MB")
+                    current.sha256.update(event[1])
+                    await current.writer.write(event[1])
+                elif event[0] == "end" and current is not None:
+                    current.key = await current.writer.close()
+                    finished.append(current)
+                    current = None
+            events.clear()
+        parser.finalize()
+    except BaseException as error:
+        if current is not None:
+            await current.writer.abort()
+        for upload in finished:
+            await storage.delete(upload.key)
+        if isinstance(error, ParseError):
+            # A malformed body is the client's error, not a 500
+            raise AttachmentError(400, "Requisição multipart inválida") from error
+        raise
+
+    if current is not None:
+        await current.writer.abort()
+        for upload in finished:
+            await storage.delete(upload.key)
+        raise AttachmentError(400, "Envio incompleto")
+
+    return [
+        {
+            "nome_arquivo": upload.filename,
+            "content_type": upload.content_type,
+            "tamanho": upload.size,
+            "sha256": upload.sha256.hexdigest(),
+            "storage_key": upload.key,
+        }
+        for upload in finished
+    ]
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Single byte range as (start, end inclusive); None serves the whole file."""
+    if not header:
+        return None
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        raise AttachmentError(416, "Intervalo inválido")
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise AttachmentError(416, "Intervalo inválido")
+    return start, end
+
+
+def new_metadata(resposta_id: str, usuario_id: str, storage_kind: str, stored: dict) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "resposta_id": resposta_id,
+        "usuario_id": usuario_id,
+        "storage": storage_kind,
+        "enviado_em": datetime.utcnow(),
+        **stored,
+    }
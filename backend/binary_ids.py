@@ -0,0 +1,571 @@
+import uuid
+from typing import Dict, List, Optional
+
+from bson.binary import UUID_SUBTYPE, Binary
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Native binary ids for the core collections. Documents are stored with the
+# UUID as ``_id`` (BSON binary subtype 4, 16 bytes) instead of an ObjectId
+# plus a 36-character ``id`` string, and foreign keys are stored as binary
+# UUIDs too. IdCodecDatabase translates at the collection boundary: handlers
+# and helper modules keep reading and writing ``{"id": "<uuid string>", ...}``
+# and never see the stored form.
+#
+# Strings that are not canonical UUIDs (ids written by tests or older tools)
+# are stored as they are, so they round-trip unchanged. Values are written as
+# explicit Binary, so this works whatever uuidRepresentation the client uses.
+#
+# Foreign keys are recognised by their last path segment, so "resposta.usuario_id"
+# in a filter and a usuario_id inside an embedded document are binary as well;
+# embedded ``id`` fields are left as written. Inside $expr, field paths are
+# renamed and literals compared against an id or foreign-key path are encoded.
+# Updates support the operators listed in _UPDATE_FIELDS, _UPDATE_ARRAYS and
+# _UPDATE_PASSTHROUGH; any other operator raises ValueError rather than
+# writing ids in the wrong form.
+#
+# Existing databases are converted with migrate_ids.py before BINARY_IDS is
+# turned on.
+
+ID_FIELD = "id"
+FOREIGN_KEYS = ("usuario_id", "empresa_id", "desafio_id", "resposta_id", "formando_id")
+
+# Collections whose ``id`` is stored as ``_id``
+ID_COLLECTIONS = {
+    "usuarios", "empresas", "desafios", "respostas", "avaliacoes",
+    "desafios_arquivo", "respostas_arquivo", "avaliacoes_arquivo",
+}
+# Collections whose foreign keys are stored binary; matches_arquivo keeps its composite string _id
+FK_COLLECTIONS = ID_COLLECTIONS | {"matches_arquivo"}
+
+MIGRATION_BATCH = 1000
+DUPLICATE_KEY = 11000
+
+_LOGICAL = ("$or", "$and", "$nor")
+_LIST_OPERATORS = ("$in", "$nin", "$all")
+_SCALAR_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte")
+_EXPR_COMPARISONS = _SCALAR_OPERATORS + ("$in",)
+
+# Update operators whose values are stored fields, those adding or removing
+# array elements, and those that never carry ids
+_UPDATE_FIELDS = ("$set", "$setOnInsert", "$min", "$max")
+_UPDATE_ARRAYS = ("$push", "$addToSet", "$pull", "$pullAll")
+_UPDATE_PASSTHROUGH = ("$inc", "$mul", "$unset", "$currentDate", "$rename", "$pop")
+
+
+def encode_id(value):
+    """The stored form of an id: binary for canonical UUID strings, anything else unchanged."""
+    if isinstance(value, str) and len(value) == 36:
+        try:
+            parsed = uuid.UUID(value)
+        except ValueError:
+            return value
+        # Only canonical strings, so decoding gives back exactly what was written
+        if str(parsed) == value:
+            return Binary.from_uuid(parsed)
+    return value
+
+
+def decode(value):
+    """Stored values back to API form: every UUID, however nested, becomes its string."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    # Clients without uuidRepresentation="standard" read subtype 4 back as plain Binary
+    if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE:
+        return str(value.as_uuid())
+    if isinstance(value, dict):
+        return {k: decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    return value
+
+
+def _is_key(field: str) -> bool:
+    return field.rsplit(".", 1)[-1] in FOREIGN_KEYS
+
+
+def _encode_key_value(value):
+    if isinstance(value, list):
+        return [encode_id(v) for v in value]
+    return encode_id(value)
+
+
+def _encode_value(value):
+    """Embedded documents, however nested, store their foreign keys binary too."""
+    if isinstance(value, dict):
+        return _encode_fields(value)
+    if isinstance(value, list):
+        return [_encode_value(v) for v in value]
+    return value
+
+
+def _encode_fields(fields: Dict) -> Dict:
+    return {k: _encode_key_value(v) if _is_key(k) else _encode_value(v) for k, v in fields.items()}
+
+
+def _is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(k.startswith("$") for k in value)
+
+
+def _encode_condition(condition):
+    if _is_operator_dict(condition):
+        encoded = {}
+        for op, operand in condition.items():
+            if op in _LIST_OPERATORS:
+                encoded[op] = [encode_id(v) for v in operand]
+            elif op in _SCALAR_OPERATORS:
+                encoded[op] = encode_id(operand)
+            elif op == "$not":
+                encoded[op] = _encode_condition(operand)
+            elif op == "$elemMatch":
+                encoded[op] = _encode_condition(operand)
+            else:
+                encoded[op] = operand
+        return encoded
+    return encode_id(condition)
+
+
+def encode_filter(filtro: Optional[Dict], ids: bool) -> Optional[Dict]:
+    if not filtro:
+        return filtro
+    encoded = {}
+    for field, condition in filtro.items():
+        if field in _LOGICAL:
+            encoded[field] = [encode_filter(f, ids) for f in condition]
+        elif field == "$expr":
+            encoded[field] = _encode_expr(condition, ids)
+        elif field == ID_FIELD and ids:
+            encoded["_id"] = _encode_condition(condition)
+        elif _is_key(field):
+            encoded[field] = _encode_condition(condition)
+        elif _is_operator_dict(condition) and isinstance(condition.get("$elemMatch"), dict):
+            # Arrays of embedded documents: the element query holds the foreign keys
+            encoded[field] = {**condition, "$elemMatch": encode_filter(condition["$elemMatch"], False)}
+        else:
+            encoded[field] = condition
+    return encoded
+
+
+def encode_document(doc: Dict, ids: bool) -> Dict:
+    encoded = {k: v for k, v in doc.items() if k != "_id"} if ids and ID_FIELD in doc else dict(doc)
+    if ids and ID_FIELD in encoded:
+        encoded["_id"] = encode_id(encoded.pop(ID_FIELD))
+    return _encode_fields(encoded)
+
+
+def _encode_array_update(op: str, field: str, value):
+    if op == "$pull":
+        # $pull takes a value, a condition on the elements, or a query over embedded documents
+        if isinstance(value, dict) and not _is_operator_dict(value):
+            return encode_filter(value, False)
+        return _encode_condition(value) if _is_key(field) else value
+    if op == "$pullAll":
+        return _encode_key_value(value) if _is_key(field) else _encode_value(value)
+    encode = _encode_key_value if _is_key(field) else _encode_value
+    if isinstance(value, dict) and "$each" in value:
+        # Modifiers such as $slice and $sort hold no ids
+        return {**value, "$each": [encode(v) for v in value["$each"]]}
+    return encode(value)
+
+
+def encode_update(update, ids: bool):
+    if not isinstance(update, dict):
+        # Aggregation-pipeline updates are passed through
+        return update
+    encoded = {}
+    for op, fields in update.items():
+        if op in _UPDATE_FIELDS:
+            encoded[op] = _encode_fields(fields)
+        elif op in _UPDATE_ARRAYS:
+            encoded[op] = {field: _encode_array_update(op, field, value) for field, value in fields.items()}
+        elif op in _UPDATE_PASSTHROUGH:
+            encoded[op] = fields
+        else:
+            raise ValueError(f"Operador de atualização não suportado com ids binários: {op}")
+    return encoded
+
+
+def decode_document(doc: Optional[Dict], ids: bool) -> Optional[Dict]:
+    if doc is None:
+        return None
+    doc = decode(doc)
+    if ids and "_id" in doc:
+        stored_id = doc.pop("_id")
+        # Documents not migrated yet keep their ObjectId _id next to the id string
+        if isinstance(stored_id, str):
+            doc[ID_FIELD] = stored_id
+    return doc
+
+
+def _field(name: str, ids: bool) -> str:
+    return "_id" if ids and name == ID_FIELD else name
+
+
+def encode_sort(key, direction=None, ids: bool = True):
+    if isinstance(key, str):
+        return _field(key, ids), direction
+    return [(_field(k, ids), d) for k, d in key], None
+
+
+def encode_projection(projection: Optional[Dict], ids: bool) -> Optional[Dict]:
+    """Keep _id whenever the caller wants id, since that is where it is stored."""
+    if projection is None or not ids:
+        return projection
+    projection = dict(projection)
+    inclusive = any(v for k, v in projection.items() if k != "_id")
+    if inclusive:
+        if projection.pop(ID_FIELD, None):
+            projection["_id"] = 1
+    elif projection.get("_id") in (0, False):
+        del projection["_id"]
+    return projection
+
+
+def encode_index(keys, ids: bool):
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return [(_field(k, ids), d) for k, d in keys]
+
+
+def _path(path: str, ids: bool) -> str:
+    # Fields of a joined core document: "desafio.id" is stored as "desafio._id"
+    if path == ID_FIELD:
+        return "_id" if ids else path
+    if path.endswith("." + ID_FIELD):
+        return path[:-len(ID_FIELD)] + "_id"
+    return path
+
+
+def _expression(expr, ids: bool):
+    if isinstance(expr, str) and expr.startswith("$") and not expr.startswith("$$"):
+        return "$" + _path(expr[1:], ids)
+    if isinstance(expr, dict):
+        return {k: _expression(v, ids) for k, v in expr.items()}
+    if isinstance(expr, list):
+        return [_expression(v, ids) for v in expr]
+    return expr
+
+
+def _is_key_path(expr, ids: bool) -> bool:
+    if not isinstance(expr, str) or not expr.startswith("$") or expr.startswith("$$"):
+        return False
+    path = expr[1:]
+    if path.rsplit(".", 1)[-1] == ID_FIELD:
+        # A joined document's id is its binary _id; the own id only where it is stored as _id
+        return ids or "." in path
+    return _is_key(path)
+
+
+def _encode_expr(expr, ids: bool):
+    if isinstance(expr, dict):
+        encoded = {}
+        for op, args in expr.items():
+            if op in _EXPR_COMPARISONS and isinstance(args, list) and any(_is_key_path(a, ids) for a in args):
+                args = [a if _is_key_path(a, ids) else _encode_key_value(a) for a in args]
+            encoded[op] = _encode_expr(args, ids)
+        return encoded
+    if isinstance(expr, list):
+        return [_encode_expr(v, ids) for v in expr]
+    return _expression(expr, ids)
+
+
+def encode_pipeline(pipeline: List[Dict], ids: bool) -> List[Dict]:
+    encoded = []
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            spec = encode_filter(spec, ids)
+        elif name == "$lookup":
+            spec = dict(spec)
+            joined_ids = spec["from"] in ID_COLLECTIONS
+            if "localField" in spec:
+                spec["localField"] = _path(spec["localField"], ids)
+                spec["foreignField"] = _path(spec["foreignField"], joined_ids)
+            if "let" in spec:
+                spec["let"] = _expression(spec["let"], ids)
+            if "pipeline" in spec:
+                spec["pipeline"] = encode_pipeline(spec["pipeline"], joined_ids)
+        elif name == "$unionWith":
+            spec = dict(spec)
+            spec["pipeline"] = encode_pipeline(spec.get("pipeline", []), spec["coll"] in ID_COLLECTIONS)
+        elif name == "$project":
+            # {"id": 1} becomes a computed field, so the output keeps the name "id"
+            spec = {
+                k: ("$_id" if ids and k == ID_FIELD and v in (1, True) else _expression(v, ids))
+                for k, v in spec.items()
+            }
+        elif name == "$sort":
+            spec = {_field(k, ids): d for k, d in spec.items()}
+        else:
+            spec = _expression(spec, ids)
+        encoded.append({name: spec})
+    return encoded
+
+
+def encode_operation(op, ids: bool):
+    if isinstance(op, InsertOne):
+        return InsertOne(encode_document(op._doc, ids))
+    if isinstance(op, (UpdateOne, UpdateMany)):
+        return type(op)(encode_filter(op._filter, ids), encode_update(op._doc, ids), upsert=op._upsert,
+                        collation=op._collation, array_filters=op._array_filters, hint=op._hint)
+    if isinstance(op, ReplaceOne):
+        return ReplaceOne(encode_filter(op._filter, ids), encode_document(op._doc, ids), upsert=op._upsert,
+                          collation=op._collation, hint=op._hint)
+    if isinstance(op, (DeleteOne, DeleteMany)):
+        return type(op)(encode_filter(op._filter, ids), collation=op._collation, hint=op._hint)
+    return op
+
+
+class IdCodecCursor:
+    def __init__(self, cursor, ids: bool, rename_id: bool):
+        self._cursor = cursor
+        self._ids = ids
+        # Find results map _id back to id; aggregation rows keep their own _id (group keys)
+        self._rename_id = rename_id
+
+    def _decode(self, doc):
+        return decode_document(doc, self._ids) if self._rename_id else decode(doc)
+
+    def sort(self, key, direction=None):
+        key, direction = encode_sort(key, direction, self._ids)
+        self._cursor = self._cursor.sort(key, direction) if direction is not None else self._cursor.sort(key)
+        return self
+
+    def limit(self, limit: int):
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        self._cursor = self._cursor.max_time_ms(max_time_ms)
+        return self
+
+    async def to_list(self, length=None):
+        return [self._decode(doc) for doc in await self._cursor.to_list(length)]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        async for doc in self._cursor:
+            yield self._decode(doc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class IdCodecCollection:
+    """Collection proxy storing ids and foreign keys as binary UUIDs."""
+
+    def __init__(self, collection, ids: bool):
+        self._collection = collection
+        self._ids = ids
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        cursor = self._collection.find(encode_filter(filter, self._ids) or {}, encode_projection(projection, self._ids),
+                                       *args, **kwargs)
+        return IdCodecCursor(cursor, self._ids, rename_id=True)
+
+    async def find_one(self, filter=None, projection=None, *args, **kwargs):
+        doc = await self._collection.find_one(encode_filter(filter, self._ids), encode_projection(projection, self._ids),
+                                              *args, **kwargs)
+        return decode_document(doc, self._ids)
+
+    async def find_one_and_update(self, filter, update, projection=None, *args, **kwargs):
+        if "sort" in kwargs and kwargs["sort"] is not None:
+            kwargs["sort"] = encode_sort(kwargs["sort"], ids=self._ids)[0]
+        doc = await self._collection.find_one_and_update(
+            encode_filter(filter, self._ids), encode_update(update, self._ids), encode_projection(projection, self._ids),
+            *args, **kwargs
+        )
+        return decode_document(doc, self._ids)
+
+    async def count_documents(self, filter, *args, **kwargs):
+        return await self._collection.count_documents(encode_filter(filter, self._ids), *args, **kwargs)
+
+    async def distinct(self, key, filter=None, *args, **kwargs):
+        values = await self._collection.distinct(_field(key, self._ids), encode_filter(filter, self._ids), *args, **kwargs)
+        return decode(values)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        cursor = self._collection.aggregate(encode_pipeline(pipeline, self._ids), *args, **kwargs)
+        return IdCodecCursor(cursor, self._ids, rename_id=False)
+
+    async def insert_one(self, document, *args, **kwargs):
+        return await self._collection.insert_one(encode_document(document, self._ids), *args, **kwargs)
+
+    async def insert_many(self, documents, *args, **kwargs):
+        return await self._collection.insert_many([encode_document(d, self._ids) for d in documents], *args, **kwargs)
+
+    async def update_one(self, filter, update, *args, **kwargs):
+        return await self._collection.update_one(encode_filter(filter, self._ids), encode_update(update, self._ids),
+                                                 *args, **kwargs)
+
+    async def update_many(self, filter, update, *args, **kwargs):
+        return await self._collection.update_many(encode_filter(filter, self._ids), encode_update(update, self._ids),
+                                                  *args, **kwargs)
+
+    async def replace_one(self, filter, replacement, *args, **kwargs):
+        return await self._collection.replace_one(encode_filter(filter, self._ids),
+                                                  encode_document(replacement, self._ids), *args, **kwargs)
+
+    async def delete_one(self, filter, *args, **kwargs):
+        return await self._collection.delete_one(encode_filter(filter, self._ids), *args, **kwargs)
+
+    async def delete_many(self, filter, *args, **kwargs):
+        return await self._collection.delete_many(encode_filter(filter, self._ids), *args, **kwargs)
+
+    async def bulk_write(self, requests, *args, **kwargs):
+        return await self._collection.bulk_write([encode_operation(op, self._ids) for op in requests], *args, **kwargs)
+
+    async def create_index(self, keys, *args, **kwargs):
+        keys = encode_index(keys, self._ids)
+        if [k for k, _ in keys] == ["_id"]:
+            # The id is the primary key now; _id is always indexed and unique
+            return "_id_"
+        return await self._collection.create_index(keys, *args, **kwargs)
+
+    def with_options(self, *args, **kwargs):
+        return IdCodecCollection(self._collection.with_options(*args, **kwargs), self._ids)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class IdCodecDatabase:
+    """Wraps the database stack so the core collections go through IdCodecCollection."""
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        if name in FK_COLLECTIONS:
+            return self[name]
+        return getattr(self._database, name)
+
+    def __getitem__(self, name):
+        if name in FK_COLLECTIONS:
+            return IdCodecCollection(self._database[name], name in ID_COLLECTIONS)
+        return self._database[name]
+
+
+# Migration, run offline through migrate_ids.py against the raw Motor database
+
+async def _insert_ignoring_duplicates(collection, docs: List[Dict]):
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        if any(error["code"] != DUPLICATE_KEY for error in exc.details.get("writeErrors", [])):
+            raise
+
+
+async def _rekey(collection, filtro: Dict, convert, batch_size: int, skip_existing: bool = False) -> int:
+    """Replace every matching document by ``convert(doc)``, which gets a new _id.
+
+    _id cannot be updated in place, so each batch is inserted under the new
+    key and the old documents are then deleted. A run that stops between the
+    two steps is finished by the next one: copies that already exist are
+    skipped and only the deletes are repeated. ``filtro`` must pin _id to one
+    BSON type, since the walk resumes with $gt on _id.
+    """
+    moved = 0
+    last_id = None
+    while True:
+        page = filtro if last_id is None else {"$and": [filtro, {"_id": {"$gt": last_id}}]}
+        docs = await collection.find(page).sort("_id", 1).to_list(batch_size)
+        if not docs:
+            return moved
+        copies = [convert(doc) for doc in docs]
+        if skip_existing:
+            # New ObjectIds can't collide, so existing copies are found by id instead
+            existing = set(await collection.distinct(ID_FIELD, {ID_FIELD: {"$in": [c[ID_FIELD] for c in copies]}}))
+            copies = [c for c in copies if c[ID_FIELD] not in existing]
+        if copies:
+            await _insert_ignoring_duplicates(collection, copies)
+        await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved += len(docs)
+        last_id = docs[-1]["_id"]
+
+
+def _to_binary(doc: Dict) -> Dict:
+    return encode_document({k: v for k, v in doc.items() if k != "_id"}, True)
+
+
+def _to_strings(doc: Dict) -> Dict:
+    doc = decode(doc)
+    # Mongo assigns a fresh ObjectId, as for documents written before the migration
+    doc[ID_FIELD] = doc.pop("_id")
+    return doc
+
+
+async def _convert_foreign_keys(collection, to_binary: bool, batch_size: int) -> int:
+    tipo = "string" if to_binary else "binData"
+    filtro = {"$or": [{field: {"$type": tipo}} for field in FOREIGN_KEYS]}
+    updated = 0
+    last_id = None
+    while True:
+        page = filtro if last_id is None else {"$and": [filtro, {"_id": {"$gt": last_id}}]}
+        docs = await collection.find(page, {field: 1 for field in FOREIGN_KEYS}).sort("_id", 1).to_list(batch_size)
+        if not docs:
+            return updated
+        ops = []
+        for doc in docs:
+            campos = {field: encode_id(doc[field]) if to_binary else decode(doc[field])
+                      for field in FOREIGN_KEYS if field in doc}
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": campos}))
+        updated += (await collection.bulk_write(ops, ordered=False)).modified_count
+        last_id = docs[-1]["_id"]
+
+
+async def _drop_id_indexes(collection, field: str) -> List[str]:
+    """Indexes over ``field`` are rebuilt over the other key name at the next startup."""
+    dropped = []
+    async for index in collection.list_indexes():
+        if index["name"] != "_id_" and field in index["key"]:
+            await collection.drop_index(index["name"])
+            dropped.append(index["name"])
+    return dropped
+
+
+async def pending(raw_db) -> Dict[str, int]:
+    """Documents per collection still stored with string ids."""
+    counts = {}
+    for name in sorted(FK_COLLECTIONS):
+        filtro = {"$or": [{field: {"$type": "string"}} for field in FOREIGN_KEYS]}
+        if name in ID_COLLECTIONS:
+            filtro["$or"].append({ID_FIELD: {"$exists": True}})
+        counts[name] = await raw_db[name].count_documents(filtro)
+    return counts
+
+
+async def migrate(raw_db, batch_size: int = MIGRATION_BATCH) -> Dict[str, Dict]:
+    """Rewrite the core collections to binary _id and foreign keys."""
+    report = {}
+    for name in sorted(FK_COLLECTIONS):
+        collection = raw_db[name]
+        entry = {}
+        if name in ID_COLLECTIONS:
+            legacy = {"_id": {"$type": "objectId"}, ID_FIELD: {"$exists": True}}
+            entry["documentos"] = await _rekey(collection, legacy, _to_binary, batch_size)
+            entry["indices_removidos"] = await _drop_id_indexes(collection, ID_FIELD)
+        # Rekeyed documents were encoded whole; this catches matches_arquivo and leftovers
+        entry["chaves_estrangeiras"] = await _convert_foreign_keys(collection, True, batch_size)
+        report[name] = entry
+    return report
+
+
+async def revert(raw_db, batch_size: int = MIGRATION_BATCH) -> Dict[str, Dict]:
+    """Undo ``migrate``: string id fields and foreign keys, ObjectId _id."""
+    report = {}
+    for name in sorted(FK_COLLECTIONS):
+        collection = raw_db[name]
+        entry = {}
+        if name in ID_COLLECTIONS:
+            entry["documentos"] = 0
+            # Non-UUID ids were stored as string _ids, next to the binary ones
+            for tipo in ("string", "binData"):
+                migrated = {"_id": {"$type": tipo}, ID_FIELD: {"$exists": False}}
+                entry["documentos"] += await _rekey(collection, migrated, _to_strings, batch_size, skip_existing=True)
+            entry["indices_removidos"] = await _drop_id_indexes(collection, "_id")
+        entry["chaves_estrangeiras"] = await _convert_foreign_keys(collection, False, batch_size)
+        report[name] = entry
+    return report
@@ -0,0 +1,322 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # br is offered only when the brotli package is installed
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # same for zstd
+    zstandard = None
+
+from admission import resolve_route
+from metrics import registry
+
+# Response compression negotiated from Accept-Encoding. Small bodies, media
+# types that don't shrink and streamed responses (exports, attachments) are
+# sent as they are.
+#
+# The public list payloads in CACHED_ROUTES are additionally kept as bytes:
+# the first request renders them, later ones are answered from the cache
+# with a per-encoding variant compressed once, and If-None-Match against the
+# cached ETag gets a 304 without touching the handler. Writes that change
+# those lists call ``invalidate``; TTL bounds how stale another worker's
+# copy can get.
+
+ENCODING_GZIP = "gzip"
+ENCODING_BROTLI = "br"
+ENCODING_ZSTD = "zstd"
+
+# Server preference when the client weighs several encodings equally
+PREFERENCE = tuple(
+    encoding for encoding, available in (
+        (ENCODING_BROTLI, brotli is not None),
+        (ENCODING_ZSTD, zstandard is not None),
+        (ENCODING_GZIP, True),
+    ) if available
+)
+
+MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", "1024"))
+# Cached variants are recompressed after every invalidation, so they use the same levels:
+# gzip 9 takes about four times as long as 6 on desafio lists for ~6% fewer bytes
+LEVELS = {ENCODING_GZIP: 6, ENCODING_BROTLI: 5, ENCODING_ZSTD: 6}
+# Larger bodies are compressed off the event loop
+THREAD_THRESHOLD = 256 * 1024
+
+CACHED_ROUTES = {("GET", "/api/desafios"), ("GET", "/api/empresas")}
+CACHE_TTL = float(os.environ.get("PAYLOAD_CACHE_TTL_SECONDS", "60"))
+# Distinct query strings kept per route
+CACHE_VARIANTS = 8
+
+_COMPRESSIBLE = (b"application/json", b"text/", b"application/javascript", b"application/xml")
+
+registry.describe("compression_responses_total", "counter", "Responses sent compressed, by encoding")
+registry.describe("compression_input_bytes_total", "counter", "Uncompressed bytes of compressed responses")
+registry.describe("compression_output_bytes_total", "counter", "Bytes sent after compression")
+registry.describe("compression_cpu_seconds_total", "counter", "CPU time spent compressing")
+registry.describe("compression_skipped_total", "counter", "Responses sent uncompressed, by reason")
+registry.describe("payload_cache_requests_total", "counter", "Cached payload lookups, by route and result")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The preferred available encoding the client accepts, or None for identity."""
+    pesos: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        partes = [p.strip() for p in item.split(";")]
+        nome, q = partes[0].lower(), 1.0
+        for param in partes[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if nome:
+            pesos[nome] = q
+    melhor, melhor_q = None, 0.0
+    for encoding in PREFERENCE:
+        q = pesos.get(encoding, pesos.get("*", 0.0))
+        if q > melhor_q:
+            melhor, melhor_q = encoding, q
+    return melhor
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == ENCODING_BROTLI:
+        return brotli.compress(data, quality=level)
+    if encoding == ENCODING_ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    # mtime=0 keeps the output stable, so equal bodies compress to equal bytes
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+async def compress_measured(data: bytes, encoding: str, level: int) -> bytes:
+    def run():
+        inicio = time.thread_time()
+        out = compress(data, encoding, level)
+        return out, time.thread_time() - inicio
+
+    if len(data) >= THREAD_THRESHOLD:
+        out, cpu = await asyncio.to_thread(run)
+    else:
+        out, cpu = run()
+    registry.inc("compression_responses_total", encoding=encoding)
+    registry.inc("compression_input_bytes_total", len(data), encoding=encoding)
+    registry.inc("compression_output_bytes_total", len(out), encoding=encoding)
+    registry.inc("compression_cpu_seconds_total", cpu, encoding=encoding)
+    return out
+
+
+class CachedPayload:
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, versao: int):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.versao = versao
+        self.expira = time.monotonic() + CACHE_TTL
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants: Dict[str, bytes] = {}
+
+    def etag_for(self, encoding: Optional[str]) -> bytes:
+        # Each representation gets its own strong ETag; all share the body hash
+        return f'"{self.etag}-{encoding}"'.encode() if encoding else f'"{self.etag}"'.encode()
+
+    def matches(self, if_none_match: bytes) -> bool:
+        if if_none_match.strip() == b"*":
+            return True
+        for tag in if_none_match.split(b","):
+            tag = tag.strip().removeprefix(b"W/").strip(b'"')
+            if tag.split(b"-")[0] == self.etag.encode():
+                return True
+        return False
+
+
+class PayloadCache:
+    def __init__(self, routes=CACHED_ROUTES):
+        self.routes = set(routes)
+        self.versoes: Dict[str, int] = {rota: 0 for _, rota in self.routes}
+        self.entries: Dict[str, "OrderedDict[bytes, CachedPayload]"] = {rota: OrderedDict() for _, rota in self.routes}
+
+    def invalidate(self, *rotas: str):
+        for rota in rotas:
+            self.versoes[rota] += 1
+            self.entries[rota].clear()
+
+    def get(self, rota: str, query: bytes) -> Optional[CachedPayload]:
+        entry = self.entries[rota].get(query)
+        if entry is None or entry.versao != self.versoes[rota] or entry.expira <= time.monotonic():
+            registry.inc("payload_cache_requests_total", rota=rota, resultado="miss")
+            return None
+        self.entries[rota].move_to_end(query)
+        registry.inc("payload_cache_requests_total", rota=rota, resultado="hit")
+        return entry
+
+    def put(self, rota: str, query: bytes, entry: CachedPayload):
+        # A write that bumped the version while this response was rendering makes it stale
+        if entry.versao != self.versoes[rota]:
+            return
+        variants = self.entries[rota]
+        variants[query] = entry
+        variants.move_to_end(query)
+        while len(variants) > CACHE_VARIANTS:
+            variants.popitem(last=False)
+
+
+def _without(headers, *names: bytes) -> List[Tuple[bytes, bytes]]:
+    return [(k, v) for k, v in headers if k.lower() not in names]
+
+
+def _compressible(headers) -> bool:
+    content_type = dict((k.lower(), v) for k, v in headers).get(b"content-type", b"")
+    return content_type.startswith(_COMPRESSIBLE)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, router, cache: Optional[PayloadCache] = None, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.router = router
+        self.cache = cache
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"))
+
+        if self.cache is not None and scope["method"] == "GET":
+            rota = resolve_route(self.router, scope)
+            if ("GET", rota) in self.cache.routes:
+                await self._cached(scope, receive, send, rota, encoding, headers.get(b"if-none-match"))
+                return
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                if start is not None:
+                    # Streamed responses go out as they are produced
+                    registry.inc("compression_skipped_total", motivo="streaming")
+                    passthrough = True
+                    await send(start)
+                    await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+            await self._send_compressed(send, start, b"".join(chunks), encoding)
+
+        await self.app(scope, receive, compressing_send)
+
+    async def _send_compressed(self, send, start, body: bytes, encoding: Optional[str]):
+        response_headers = list(start.get("headers", []))
+        motivo = None
+        if any(k.lower() == b"content-encoding" for k, _ in response_headers):
+            motivo = "codificada"
+        elif not _compressible(response_headers):
+            motivo = "tipo"
+        elif len(body) < self.minimum_size:
+            motivo = "pequena"
+        if motivo is not None:
+            registry.inc("compression_skipped_total", motivo=motivo)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+        body = await compress_measured(body, encoding, LEVELS[encoding])
+        response_headers = _without(response_headers, b"content-length", b"etag", b"vary")
+        response_headers += [
+            (b"content-encoding", encoding.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        await send({**start, "headers": response_headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _cached(self, scope, receive, send, rota: str, encoding: Optional[str], if_none_match: Optional[bytes]):
+        query = scope.get("query_string", b"")
+        entry = self.cache.get(rota, query)
+        if entry is None:
+            entry = await self._render(scope, receive, send, rota, query, encoding)
+            if entry is None:
+                return
+        elif if_none_match is not None and entry.matches(if_none_match):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [(b"etag", entry.etag_for(encoding)), (b"vary", b"Accept-Encoding")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        body = entry.body
+        if encoding is not None and len(body) >= self.minimum_size:
+            variant = entry.variants.get(encoding)
+            if variant is None:
+                variant = entry.variants[encoding] = await compress_measured(body, encoding, LEVELS[encoding])
+            body = variant
+        else:
+            encoding = None
+        response_headers = list(entry.headers) + [
+            (b"content-length", str(len(body)).encode()),
+            (b"etag", entry.etag_for(encoding)),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        if encoding is not None:
+            response_headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": entry.status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _render(self, scope, receive, send, rota: str, query: bytes, encoding: Optional[str]) -> Optional[CachedPayload]:
+        """Run the handler and cache a successful response; other responses are forwarded as they are."""
+        versao = self.cache.versoes[rota]
+        start = None
+        chunks: List[bytes] = []
+        forwarded = False
+
+        async def capturing_send(message):
+            nonlocal start, forwarded
+            if message["type"] == "http.response.start":
+                start = message
+                if message["status"] != 200:
+                    forwarded = True
+                    await send(message)
+            elif message["type"] == "http.response.body" and not forwarded:
+                chunks.append(message.get("body", b""))
+            elif forwarded:
+                await send(message)
+
+        await self.app(scope, receive, capturing_send)
+        if forwarded or start is None:
+            return None
+        entry = CachedPayload(
+            200,
+            _without(start.get("headers", []), b"content-length", b"etag", b"vary", b"content-encoding"),
+            b"".join(chunks),
+            versao,
+        )
+        self.cache.put(rota, query, entry)
+        return entry
+
+
+payload_cache = PayloadCache()
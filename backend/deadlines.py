@@ -0,0 +1,200 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from metrics import registry
+
+DEFAULT_DEADLINE_MS = int(os.environ.get("REQUEST_DEADLINE_MS", "10000"))
+MAX_DEADLINE_MS = int(os.environ.get("REQUEST_DEADLINE_MAX_MS", "60000"))
+DEADLINE_HEADER = b"x-request-deadline-ms"
+# Request body buffered ahead of the handler; see DeadlineMiddleware
+BODY_BUFFER_BYTES = int(os.environ.get("REQUEST_BODY_BUFFER_BYTES", str(1 << 20)))
+
+# Absolute time.monotonic() deadline of the request being served, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+# Reads that accept maxTimeMS as a keyword argument; the wait is bounded on the client side too
+_MAX_TIME_KWARG_METHODS = {"find_one", "count_documents", "aggregate", "distinct"}
+# Writes that accept maxTimeMS: the server aborts them, so the outcome stays known
+_MAX_TIME_WRITE_METHODS = {"find_one_and_update", "find_one_and_delete", "find_one_and_replace"}
+# Writes without maxTimeMS. They only check the budget before they are sent: abandoning one
+# in flight would answer 503 while the server may still apply it, and a retry would duplicate it
+_WRITE_METHODS = {
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write", "create_index",
+}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining_ms() -> Optional[int]:
+    """Milliseconds left for the current request, None outside a request."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    remaining = int((deadline - time.monotonic()) * 1000)
+    if remaining <= 0:
+        registry.inc("request_deadline_exceeded_total", origem="orcamento")
+        raise DeadlineExceeded()
+    return remaining
+
+
+def clear_deadline():
+    """Lift the deadline for the rest of the current request (long-running streams)."""
+    _deadline.set(None)
+
+
+class DeadlineCollection:
+    """Motor collection proxy that applies the request budget to every operation."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name == "find":
+            return self._find
+        if name in _MAX_TIME_KWARG_METHODS:
+            # aggregate returns a cursor; its maxTimeMS applies when it is iterated
+            return self._with_max_time(attr, client_bounded=name != "aggregate")
+        if name in _MAX_TIME_WRITE_METHODS:
+            return self._with_max_time(attr, client_bounded=False)
+        if name in _WRITE_METHODS:
+            return self._checked(attr)
+        return attr
+
+    def _find(self, *args, **kwargs):
+        cursor = self._collection.find(*args, **kwargs)
+        budget = remaining_ms()
+        if budget is not None:
+            cursor = cursor.max_time_ms(budget)
+        return cursor
+
+    @staticmethod
+    def _with_max_time(method, client_bounded: bool):
+        def call(*args, **kwargs):
+            budget = remaining_ms()
+            if budget is not None:
+                kwargs.setdefault("maxTimeMS", budget)
+            result = method(*args, **kwargs)
+            return _bounded(result, budget) if client_bounded else result
+        return call
+
+    @staticmethod
+    def _checked(method):
+        def call(*args, **kwargs):
+            # Raises before anything is sent, so a 503 here never hides an applied write
+            remaining_ms()
+            return method(*args, **kwargs)
+        return call
+
+
+async def _bounded(awaitable, budget: Optional[int]):
+    if budget is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, budget / 1000.0)
+    except asyncio.TimeoutError:
+        registry.inc("request_deadline_exceeded_total", origem="cliente")
+        raise DeadlineExceeded()
+
+
+class DeadlineDatabase:
+    """Wraps a Motor database so handlers keep writing ``db.colecao.find(...)``."""
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if isinstance(attr, AsyncIOMotorCollection):
+            return DeadlineCollection(attr)
+        return attr
+
+    def __getitem__(self, name):
+        return DeadlineCollection(self._database[name])
+
+
+def _requested_budget(scope) -> int:
+    for name, value in scope.get("headers", []):
+        if name == DEADLINE_HEADER:
+            try:
+                return max(1, min(int(value), MAX_DEADLINE_MS))
+            except ValueError:
+                break
+    return DEFAULT_DEADLINE_MS
+
+
+class DeadlineMiddleware:
+    """Sets the per-request deadline and cancels the handler if the client goes away.
+
+    The request body is read ahead of the handler into a buffer of up to
+    BODY_BUFFER_BYTES, so a body the handler never reads is drained and
+    ``http.disconnect`` is still seen; larger uploads keep their
+    backpressure once the buffer is full. Cancelling stops the handler
+    only: a write already sent to Mongo still completes there.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _deadline.set(time.monotonic() + _requested_budget(scope) / 1000.0)
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = asyncio.Event()
+        room = asyncio.Event()
+        room.set()
+        buffered = 0
+
+        async def app_receive():
+            nonlocal buffered
+            if disconnected.is_set() and messages.empty():
+                return {"type": "http.disconnect"}
+            message = await messages.get()
+            buffered -= len(message.get("body", b""))
+            if buffered < BODY_BUFFER_BYTES:
+                room.set()
+            return message
+
+        app_task = asyncio.create_task(self.app(scope, app_receive, send))
+
+        async def pump():
+            nonlocal buffered
+            while True:
+                await room.wait()
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    messages.put_nowait(message)
+                    if not app_task.done():
+                        registry.inc("request_client_disconnect_total")
+                        app_task.cancel()
+                    return
+                buffered += len(message.get("body", b""))
+                if buffered >= BODY_BUFFER_BYTES:
+                    room.clear()
+                messages.put_nowait(message)
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not disconnected.is_set():
+                raise
+        finally:
+            pump_task.cancel()
+            _deadline.reset(token)
+
+
+registry.describe("request_deadline_exceeded_total", "counter", "Requests that ran out of deadline budget")
+registry.describe("request_client_disconnect_total", "counter", "Handlers cancelled after the client disconnected")
@@ -0,0 +1,141 @@
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateMany
+
+# Display names copied onto the documents that show them, so read paths
+# (matches, exports, "minhas respostas") need no joins. The owning
+# collection stays the source of truth; ``sync`` repairs the copies.
+
+BULK_CHUNK = 1000
+
+
+def desafio_fields(empresa_doc: dict) -> Dict:
+    return {"empresa_nome": empresa_doc["nome"]}
+
+
+def resposta_fields(desafio_doc: dict, formando_nome: str) -> Dict:
+    return {
+        "empresa_id": desafio_doc["empresa_id"],
+        "empresa_nome": desafio_doc.get("empresa_nome"),
+        "desafio_titulo": desafio_doc["titulo"],
+        "formando_nome": formando_nome,
+    }
+
+
+def avaliacao_fields(resposta_doc: dict, empresa_doc: dict, desafio_titulo: str,
+                     formando_nome: Optional[str]) -> Dict:
+    return {
+        "desafio_id": resposta_doc["desafio_id"],
+        "desafio_titulo": desafio_titulo,
+        "empresa_id": empresa_doc["id"],
+        "empresa_nome": empresa_doc["nome"],
+        "formando_id": resposta_doc["usuario_id"],
+        "formando_nome": formando_nome,
+    }
+
+
+async def formando_nomes(db, respostas: List[dict]) -> Dict[str, str]:
+    """Formando names for respostas, read from the embedded copy when present.
+
+    Respostas written before names were embedded fall back to one $in query.
+    """
+    nomes = {r["usuario_id"]: r["formando_nome"] for r in respostas if r.get("formando_nome")}
+    faltando = list({r["usuario_id"] for r in respostas} - set(nomes))
+    if faltando:
+        async for usuario in db.usuarios.find({"id": {"$in": faltando}}, {"_id": 0, "id": 1, "nome": 1}):
+            nomes[usuario["id"]] = usuario["nome"]
+    return nomes
+
+
+async def ensure_indexes(db):
+    # Filters used by the matches pipeline and by rename propagation
+    await db.avaliacoes.create_index([("formando_id", ASCENDING), ("empresa_id", ASCENDING)])
+    await db.avaliacoes.create_index([("desafio_id", ASCENDING)])
+    await db.respostas.create_index([("desafio_id", ASCENDING)])
+    await db.desafios.create_index([("empresa_id", ASCENDING)])
+
+
+def _changed(fields: Dict) -> Dict:
+    # Only touch documents whose copy differs, so a clean run writes nothing
+    return {"$or": [{field: {"$ne": value}} for field, value in fields.items()]}
+
+
+async def _apply(collection, ops: List[UpdateMany]) -> int:
+    modified = 0
+    for start in range(0, len(ops), BULK_CHUNK):
+        result = await collection.bulk_write(ops[start:start + BULK_CHUNK], ordered=False)
+        modified += result.modified_count
+    return modified
+
+
+async def sync(db) -> Dict[str, int]:
+    """Backfill missing copies and propagate renames from the owning documents.
+
+    Runs owner by owner: empresas onto desafios, then desafios and formandos
+    onto respostas and avaliacoes.
+    """
+    desafio_ops = []
+    async for empresa in db.empresas.find({}, {"_id": 0, "id": 1, "nome": 1}):
+        fields = {"empresa_nome": empresa["nome"]}
+        desafio_ops.append(UpdateMany({"empresa_id": empresa["id"], **_changed(fields)}, {"$set": fields}))
+    desafios_atualizados = await _apply(db.desafios, desafio_ops)
+
+    # Desafios now hold current empresa names and carry them downstream
+    resposta_ops, avaliacao_ops = [], []
+    async for desafio in db.desafios.find({}, {"_id": 0, "id": 1, "titulo": 1, "empresa_id": 1, "empresa_nome": 1}):
+        fields = {
+            "desafio_titulo": desafio["titulo"],
+            "empresa_id": desafio["empresa_id"],
+            "empresa_nome": desafio.get("empresa_nome"),
+        }
+        filtro = {"desafio_id": desafio["id"], **_changed(fields)}
+        resposta_ops.append(UpdateMany(filtro, {"$set": fields}))
+        avaliacao_ops.append(UpdateMany(filtro, {"$set": fields}))
+
+    async for usuario in db.usuarios.find({"tipo": "formando"}, {"_id": 0, "id": 1, "nome": 1}):
+        fields = {"formando_nome": usuario["nome"]}
+        resposta_ops.append(UpdateMany({"usuario_id": usuario["id"], **_changed(fields)}, {"$set": fields}))
+        avaliacao_ops.append(UpdateMany({"formando_id": usuario["id"], **_changed(fields)}, {"$set": fields}))
+
+    respostas_atualizadas = await _apply(db.respostas, resposta_ops)
+
+    # Avaliacoes written before this change carry only resposta_id; their
+    # owning ids come from the resposta before names can be propagated
+    legadas = 0
+    cursor = db.avaliacoes.find({"formando_id": {"$exists": False}}, {"_id": 0, "resposta_id": 1})
+    resposta_ids = [a["resposta_id"] async for a in cursor]
+    for start in range(0, len(resposta_ids), BULK_CHUNK):
+        ops = []
+        async for resposta in db.respostas.find(
+            {"id": {"$in": resposta_ids[start:start + BULK_CHUNK]}}, {"_id": 0, "id": 1, "desafio_id": 1, "usuario_id": 1}
+        ):
+            ops.append(UpdateMany(
+                {"resposta_id": resposta["id"]},
+                {"$set": {"desafio_id": resposta["desafio_id"], "formando_id": resposta["usuario_id"]}},
+            ))
+        legadas += await _apply(db.avaliacoes, ops)
+
+    avaliacoes_atualizadas = await _apply(db.avaliacoes, avaliacao_ops)
+
+    return {
+        "desafios_atualizados": desafios_atualizados,
+        "respostas_atualizadas": respostas_atualizadas,
+        "avaliacoes_atualizadas": avaliacoes_atualizadas + legadas,
+    }
+
+
+async def backfill(db) -> Optional[Dict[str, int]]:
+    """Run ``sync`` when documents written before names were embedded remain.
+
+    Exports and /me/bootstrap filter and label by the embedded copies, so
+    those documents would otherwise be missing from counts and show no names.
+    """
+    # Missing fields are indexed as null: index lookups once everything is filled
+    legado = (
+        await db.respostas.find_one({"empresa_id": None}, {"_id": 1})
+        or await db.avaliacoes.find_one({"$or": [{"empresa_id": None}, {"formando_id": None}]}, {"_id": 1})
+        or await db.desafios.find_one({"empresa_nome": None}, {"_id": 1})
+    )
+    if legado is None:
+        return None
+    return await sync(db)
@@ -0,0 +1,188 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import text_storage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+FORMATO_CSV = "csv"
+FORMATO_NDJSON = "ndjson"
+FORMATO_PARQUET = "parquet"
+FORMATOS = (FORMATO_CSV, FORMATO_NDJSON, FORMATO_PARQUET)
+
+MEDIA_TYPES = {
+    FORMATO_CSV: "text/csv; charset=utf-8",
+    FORMATO_NDJSON: "application/x-ndjson",
+    FORMATO_PARQUET: "application/vnd.apache.parquet",
+}
+
+COLUNAS = [
+    "resposta_id", "desafio_id", "desafio_titulo", "formando_id", "formando_nome",
+    "texto", "enviada_em", "nota", "comentario", "avaliado_em",
+]
+
+# Rows per chunk: bounds memory per export regardless of result size
+CHUNK_ROWS = 500
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def export_pipeline(match: Dict) -> List[Dict]:
+    return [
+        {"$match": match},
+        # Plain equality join: combining localField with a sub-pipeline needs MongoDB 5.0.
+        # The $project below keeps only the three avaliacao fields anyway.
+        {"$lookup": {"from": "avaliacoes", "localField": "id", "foreignField": "resposta_id", "as": "avaliacao"}},
+        {"$project": {
+            "_id": 0,
+            "resposta_id": "$id",
+            "desafio_id": 1,
+            # Display names are embedded on the resposta (see display_names)
+            "desafio_titulo": 1,
+            "formando_id": "$usuario_id",
+            "formando_nome": 1,
+            "texto": 1,
+            "texto_truncado": 1,
+            "enviada_em": 1,
+            "nota": {"$arrayElemAt": ["$avaliacao.nota", 0]},
+            "comentario": {"$arrayElemAt": ["$avaliacao.comentario", 0]},
+            "avaliado_em": {"$arrayElemAt": ["$avaliacao.avaliado_em", 0]},
+        }},
+    ]
+
+
+async def row_chunks(db, match: Dict) -> AsyncIterator[List[Dict]]:
+    cursor = db.respostas.aggregate(export_pipeline(match), batchSize=CHUNK_ROWS)
+    chunk: List[Dict] = []
+    async for row in cursor:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_ROWS:
+            yield await _with_full_text(db, chunk)
+            chunk = []
+    if chunk:
+        yield await _with_full_text(db, chunk)
+
+
+async def _with_full_text(db, chunk: List[Dict]) -> List[Dict]:
+    # Large bodies live compressed in a side collection; one $in per chunk
+    return await text_storage.expand(db, chunk, "texto", text_storage.KIND_RESPOSTA, id_field="resposta_id")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose buffered bytes are drained after each row group."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("resposta_id", pa.string()),
+        ("desafio_id", pa.string()),
+        ("desafio_titulo", pa.string()),
+        ("formando_id", pa.string()),
+        ("formando_nome", pa.string()),
+        ("texto", pa.string()),
+        ("enviada_em", pa.timestamp("ms")),
+        ("nota", pa.float64()),
+        ("comentario", pa.string()),
+        ("avaliado_em", pa.timestamp("ms")),
+    ])
+
+
+async def encode(db, match: Dict, formato: str) -> AsyncIterator[bytes]:
+    """Yield the export as encoded byte chunks, one per CHUNK_ROWS rows."""
+    if formato == FORMATO_CSV:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUNAS)
+        async for chunk in row_chunks(db, match):
+            for row in chunk:
+                writer.writerow([_csv_value(row.get(col)) for col in COLUNAS])
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    elif formato == FORMATO_NDJSON:
+        async for chunk in row_chunks(db, match):
+            lines = [json.dumps({col: row.get(col) for col in COLUNAS}, default=_json_default, ensure_ascii=False)
+                     for row in chunk]
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+    elif formato == FORMATO_PARQUET:
+        schema = _parquet_schema()
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        try:
+            async for chunk in row_chunks(db, match):
+                columns = {col: [row.get(col) for row in chunk] for col in COLUNAS}
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    else:
+        raise ValueError(f"Formato desconhecido: {formato}")
+
+
+async def write_to_file(db, match: Dict, formato: str, destino: Path) -> int:
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(destino, "wb") as handle:
+        async for data in encode(db, match, formato):
+            await asyncio.to_thread(handle.write, data)
+            written += len(data)
+    return written
+
+
+def export_filename(formato: str, prefix: Optional[str] = None) -> str:
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    return f"{prefix or 'respostas'}_{stamp}.{formato}"
@@ -0,0 +1,165 @@
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+# One histogram bucket per integer grade; bucket 10 only holds perfect 10s
+BUCKETS = 11
+
+ESCOPO_DESAFIO = "desafio"
+ESCOPO_EMPRESA = "empresa"
+ESCOPO_PLATAFORMA = "plataforma"
+
+PERCENTIS = (25, 50, 75, 90)
+
+# Rebuilds write here and are renamed over notas_rollup when complete
+REBUILD_COLLECTION = "notas_rollup_reconstrucao"
+REBUILD_BATCH = 1000
+
+
+def rollup_id(escopo: str, ref_id: Optional[str] = None) -> str:
+    return escopo if ref_id is None else f"{escopo}:{ref_id}"
+
+
+def bucket_for(nota: float) -> int:
+    return min(int(math.floor(nota)), BUCKETS - 1)
+
+
+def _scopes(desafio_id: str, empresa_id: str):
+    return [
+        (ESCOPO_DESAFIO, desafio_id),
+        (ESCOPO_EMPRESA, empresa_id),
+        (ESCOPO_PLATAFORMA, None),
+    ]
+
+
+def _increments(nota: float, count: int = 1) -> Dict[str, float]:
+    return {
+        "total": count,
+        "soma": nota * count,
+        "soma_quadrados": nota * nota * count,
+        f"histograma.{bucket_for(nota)}": count,
+    }
+
+
+def increments(nota: float, desafio_id: str, empresa_id: str) -> List[Tuple[str, str, Dict[str, float], Dict]]:
+    """(collection, _id, $inc, $setOnInsert) for every rollup a grade contributes to."""
+    inc = _increments(nota)
+    return [
+        ("notas_rollup", rollup_id(escopo, ref_id), inc, {"escopo": escopo, "ref_id": ref_id})
+        for escopo, ref_id in _scopes(desafio_id, empresa_id)
+    ]
+
+
+def _upsert(escopo: str, ref_id: Optional[str], inc: Dict[str, float]) -> UpdateOne:
+    return UpdateOne(
+        {"_id": rollup_id(escopo, ref_id)},
+        {"$inc": inc, "$setOnInsert": {"escopo": escopo, "ref_id": ref_id}},
+        upsert=True,
+    )
+
+
+def merged_rollup_updates(items: List[Tuple[float, str, str]]) -> List[UpdateOne]:
+    """One update per touched rollup for a batch of (nota, desafio_id, empresa_id)."""
+    merged: Dict[Tuple[str, Optional[str]], Dict[str, float]] = {}
+    for nota, desafio_id, empresa_id in items:
+        for scope in _scopes(desafio_id, empresa_id):
+            inc = merged.setdefault(scope, defaultdict(int))
+            for field, value in _increments(nota).items():
+                inc[field] += value
+    return [_upsert(escopo, ref_id, dict(inc)) for (escopo, ref_id), inc in merged.items()]
+
+
+def histogram_list(doc: Optional[dict]) -> List[int]:
+    histograma = (doc or {}).get("histograma", {})
+    return [int(histograma.get(str(i), 0)) for i in range(BUCKETS)]
+
+
+def percentile(histograma: List[int], p: float) -> Optional[float]:
+    total = sum(histograma)
+    if not total:
+        return None
+    target = total * p / 100.0
+    seen = 0
+    for bucket, count in enumerate(histograma):
+        if count and seen + count >= target:
+            # Assume grades are spread uniformly within a bucket
+            width = 0.0 if bucket == BUCKETS - 1 else 1.0
+            return round(bucket + width * (target - seen) / count, 2)
+        seen += count
+    return float(BUCKETS - 1)
+
+
+def summarize(doc: Optional[dict]) -> Dict:
+    doc = doc or {}
+    total = int(doc.get("total", 0))
+    histograma = histogram_list(doc)
+    if total:
+        media = doc["soma"] / total
+        variancia = max(doc["soma_quadrados"] / total - media * media, 0.0)
+    else:
+        media = variancia = 0.0
+    return {
+        "total": total,
+        "media": round(media, 2),
+        "variancia": round(variancia, 4),
+        "desvio_padrao": round(math.sqrt(variancia), 4),
+        "histograma": histograma,
+        "percentis": {f"p{p}": percentile(histograma, p) for p in PERCENTIS},
+    }
+
+
+async def get_rollup(db, escopo: str, ref_id: Optional[str] = None) -> Dict:
+    doc = await db.notas_rollup.find_one({"_id": rollup_id(escopo, ref_id)})
+    return summarize(doc)
+
+
+async def rebuild_rollups(db, marcar=None) -> int:
+    """Recompute every rollup from the hot and archived avaliacoes (backfill/repair).
+
+    The rollups are built in a scratch collection renamed over notas_rollup
+    at the end, so readers see the old figures until the new ones are
+    complete. ``marcar(collection, ids)`` is told which avaliacoes were
+    counted, see OutboxWorker.rebuild_projection.
+    """
+    sources = [
+        ("avaliacoes", [
+            {"$lookup": {"from": "respostas", "localField": "resposta_id", "foreignField": "id", "as": "resposta"}},
+            {"$unwind": "$resposta"},
+            {"$lookup": {"from": "desafios", "localField": "resposta.desafio_id", "foreignField": "id", "as": "desafio"}},
+            {"$unwind": "$desafio"},
+            {"$project": {"_id": 0, "id": 1, "nota": 1, "desafio_id": "$desafio.id", "empresa_id": "$desafio.empresa_id"}},
+        ]),
+        # Archived avaliacoes carry their owner ids, filled in when they were moved
+        ("avaliacoes_arquivo", [
+            {"$match": {"desafio_id": {"$ne": None}, "empresa_id": {"$ne": None}}},
+            {"$project": {"_id": 0, "id": 1, "nota": 1, "desafio_id": 1, "empresa_id": 1}},
+        ]),
+    ]
+    scratch = db[REBUILD_COLLECTION]
+    await scratch.drop()
+    processed = 0
+    for collection, pipeline in sources:
+        batch: List[Tuple[float, str, str]] = []
+        ids: List[str] = []
+        async for row in db[collection].aggregate(pipeline):
+            batch.append((row["nota"], row["desafio_id"], row["empresa_id"]))
+            ids.append(row["id"])
+            processed += 1
+            if len(batch) >= REBUILD_BATCH:
+                await _write_rebuild_batch(scratch, batch, ids, marcar)
+                batch, ids = [], []
+        await _write_rebuild_batch(scratch, batch, ids, marcar)
+    if processed:
+        await scratch.rename("notas_rollup", dropTarget=True)
+    else:
+        await db.notas_rollup.drop()
+    return processed
+
+
+async def _write_rebuild_batch(scratch, batch: List[Tuple[float, str, str]], ids: List[str], marcar):
+    if batch:
+        await scratch.bulk_write(merged_rollup_updates(batch), ordered=False)
+    if marcar is not None:
+        await marcar("avaliacoes", ids)
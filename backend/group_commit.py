@@ -0,0 +1,143 @@
+import asyncio
+import contextvars
+import logging
+from typing import List, Optional, Set, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteConcernError
+from pymongo.write_concern import WriteConcern
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+_STOP = object()
+
+
+def parse_write_concern(w: Optional[str], journal: Optional[str]) -> Optional[WriteConcern]:
+    if not w and not journal:
+        return None
+    kwargs = {}
+    if w:
+        kwargs["w"] = int(w) if w.isdigit() else w
+    if journal:
+        kwargs["j"] = journal.lower() == "true"
+    return WriteConcern(**kwargs)
+
+
+class GroupCommitWriter:
+    """Coalesces concurrent inserts into one insert_many per flush.
+
+    Callers ``await submit(doc)`` and get their own outcome: the document
+    back on success, or the per-document error (DuplicateKeyError for a
+    unique index violation). A flush happens when ``max_batch`` documents
+    are queued or ``max_delay`` seconds after the first one arrived. Up to
+    ``max_flushes`` batches are in flight at once, so one slow insert_many
+    does not hold up the batches queued behind it.
+    """
+
+    def __init__(self, collection, max_batch: int = 100, max_delay: float = 0.005,
+                 write_concern: Optional[WriteConcern] = None, name: str = "respostas", max_flushes: int = 4):
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=write_concern)
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_flushes = max(max_flushes, 1)
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    def start(self):
+        """Start the background task; called at startup, and lazily by the first submit otherwise."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            # A fresh context: a task created inside a request would inherit its ContextVars, deadline included
+            self._task = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run())
+
+    async def submit(self, doc: dict) -> dict:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((doc, future))
+        return await future
+
+    async def _collect(self) -> Tuple[List[Tuple[dict, asyncio.Future]], bool]:
+        """Next batch to flush, and whether the writer was asked to stop."""
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        flush_at = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = flush_at - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_flushes)
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._collect()
+            if batch:
+                await slots.acquire()
+                flush = asyncio.get_running_loop().create_task(self._flush(batch))
+                self._flushes.add(flush)
+                flush.add_done_callback(self._flushes.discard)
+                flush.add_done_callback(lambda _: slots.release())
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        docs = [doc for doc, _ in batch]
+        errors = {}
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            for error in exc.details.get("writeErrors", []):
+                if error.get("code") == DUPLICATE_KEY:
+                    errors[error["index"]] = DuplicateKeyError(error.get("errmsg", "duplicate key"), DUPLICATE_KEY, error)
+                else:
+                    errors[error["index"]] = exc
+            concern_errors = exc.details.get("writeConcernErrors", [])
+            if concern_errors:
+                # Written but not acknowledged as the write concern requires: not a success
+                first = concern_errors[0]
+                concern_error = WriteConcernError(first.get("errmsg", "write concern error"), first.get("code"), first)
+                for index in range(len(batch)):
+                    errors.setdefault(index, concern_error)
+        except Exception as exc:
+            logger.exception("Falha no group commit de %s", self.name)
+            errors = {i: exc for i in range(len(batch))}
+
+        registry.inc("group_commit_flushes_total", colecao=self.name)
+        registry.inc("group_commit_documents_total", len(batch), colecao=self.name)
+        for index, (doc, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in errors:
+                future.set_exception(errors[index])
+            else:
+                future.set_result(doc)
+
+    async def close(self):
+        """Flush everything queued so far and stop the background task."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+
+registry.describe("group_commit_flushes_total", "counter", "insert_many calls issued by group commit writers")
+registry.describe("group_commit_documents_total", "counter", "Documents written through group commit writers")
@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from admission import resolve_route
+from metrics import registry
+
+# Idempotency-Key support for the creation endpoints. The first response for
+# a key is stored (LRU in front of a TTL collection) and replayed for
+# retries; a retry that arrives while the original is still running waits
+# for it instead of hashing the password or re-validating again.
+#
+# Keys are scoped by route and Authorization header, and bound to a hash of
+# the request body: reusing a key for a different request is rejected.
+
+HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+
+ROUTES = {
+    ("POST", "/api/register"),
+    ("POST", "/api/desafios"),
+    ("POST", "/api/respostas"),
+    ("POST", "/api/avaliacoes"),
+}
+
+TTL = timedelta(hours=int(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24")))
+CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# A pending key older than this belongs to a request that died with its worker
+LOCK_TTL = timedelta(seconds=60)
+MAX_KEY_LENGTH = 255
+# Larger bodies are passed through without idempotency
+MAX_BODY_BYTES = 1024 * 1024
+POLL_INTERVAL = 0.05
+
+ESTADO_PENDENTE = "pendente"
+ESTADO_CONCLUIDO = "concluido"
+
+# Response headers worth replaying; length and framing are recomputed
+_REPLAYED_HEADERS = {b"content-type", b"location", b"retry-after"}
+
+registry.describe("idempotency_replay_total", "counter", "Responses replayed for a repeated Idempotency-Key")
+registry.describe("idempotency_wait_total", "counter", "Retries that waited for the original request to finish")
+
+
+class KeyMismatch(Exception):
+    pass
+
+
+class KeyBusy(Exception):
+    pass
+
+
+class IdempotencyStore:
+    def __init__(self, collection=None, capacity: int = CACHE_SIZE, ttl: timedelta = TTL):
+        self.collection = collection
+        self.capacity = capacity
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def ensure_indexes(self):
+        # Stored responses are removed by Mongo's TTL monitor
+        await self.collection.create_index([("expira_em", ASCENDING)], expireAfterSeconds=0)
+
+    def _cached(self, key: str) -> Optional[Dict]:
+        record = self._cache.get(key)
+        if record is None:
+            return None
+        if record["expira_em"] <= datetime.utcnow():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return record
+
+    def _remember(self, key: str, record: Dict):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _check(record: Dict, fingerprint: str) -> Dict:
+        if record["fingerprint"] != fingerprint:
+            raise KeyMismatch()
+        return record
+
+    async def begin(self, key: str, fingerprint: str, timeout: float) -> Optional[Dict]:
+        """The stored response for ``key``, or None once the caller owns the key and must run.
+
+        Raises KeyMismatch when the key was used for another request and
+        KeyBusy when the original is still running after ``timeout`` seconds.
+        """
+        limite = time.monotonic() + timeout
+        while True:
+            record = self._cached(key)
+            if record is not None:
+                return self._check(record, fingerprint)
+
+            waiting = self._inflight.get(key)
+            if waiting is not None:
+                registry.inc("idempotency_wait_total")
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiting), max(limite - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    raise KeyBusy()
+                continue
+
+            if self.collection is None or await self._claim(key, fingerprint):
+                self._inflight[key] = asyncio.get_running_loop().create_future()
+                return None
+
+            # Claimed by another worker: finished, or still running there
+            doc = await self.collection.find_one({"_id": key})
+            if doc is None:
+                continue
+            if doc["fingerprint"] != fingerprint:
+                raise KeyMismatch()
+            if doc["estado"] == ESTADO_CONCLUIDO:
+                record = self._record(doc)
+                self._remember(key, record)
+                return record
+            if doc["expira_em"] <= datetime.utcnow():
+                # Stale claim left by a crashed worker
+                await self.collection.delete_one({"_id": key, "estado": ESTADO_PENDENTE, "expira_em": doc["expira_em"]})
+                continue
+            if time.monotonic() >= limite:
+                raise KeyBusy()
+            registry.inc("idempotency_wait_total")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _claim(self, key: str, fingerprint: str) -> bool:
+        try:
+            await self.collection.insert_one({
+                "_id": key,
+                "fingerprint": fingerprint,
+                "estado": ESTADO_PENDENTE,
+                "expira_em": datetime.utcnow() + LOCK_TTL,
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    @staticmethod
+    def _record(doc: Dict) -> Dict:
+        return {
+            "fingerprint": doc["fingerprint"],
+            "status": doc["status"],
+            "headers": [(bytes(k), bytes(v)) for k, v in doc["headers"]],
+            "body": bytes(doc["body"]),
+            "expira_em": doc["expira_em"],
+        }
+
+    async def complete(self, key: str, fingerprint: str, status: int, headers, body: bytes):
+        record = {
+            "fingerprint": fingerprint,
+            "status": status,
+            "headers": headers,
+            "body": body,
+            "expira_em": datetime.utcnow() + self.ttl,
+        }
+        self._remember(key, record)
+        try:
+            if self.collection is not None:
+                await self.collection.update_one(
+                    {"_id": key},
+                    {"$set": {"estado": ESTADO_CONCLUIDO, **{k: v for k, v in record.items() if k != "headers"},
+                              "headers": [list(h) for h in headers]}},
+                )
+        finally:
+            self._release(key)
+
+    async def abort(self, key: str):
+        """Forget a claim whose request failed, so a retry runs it again."""
+        try:
+            if self.collection is not None:
+                await self.collection.delete_one({"_id": key, "estado": ESTADO_PENDENTE})
+        finally:
+            self._release(key)
+
+    def _release(self, key: str):
+        waiting = self._inflight.pop(key, None)
+        if waiting is not None and not waiting.done():
+            waiting.set_result(None)
+
+
+def scoped_key(method: str, route: str, authorization: bytes, key: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (method.encode(), route.encode(), authorization, key):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+async def _send_json(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _replay(send, record: Dict):
+    registry.inc("idempotency_replay_total")
+    body = record["body"]
+    await send({
+        "type": "http.response.start",
+        "status": record["status"],
+        "headers": list(record["headers"]) + [(b"content-length", str(len(body)).encode()), REPLAYED_HEADER],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> Tuple[Optional[bytes], list]:
+    """The whole request body, or None past MAX_BODY_BYTES, plus the messages read."""
+    messages, size = [], 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            return None, messages
+        size += len(message.get("body", b""))
+        if size > MAX_BODY_BYTES:
+            return None, messages
+        if not message.get("more_body", False):
+            return b"".join(m.get("body", b"") for m in messages), messages
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store: IdempotencyStore, router, wait_timeout: float = 30.0):
+        self.app = app
+        self.store = store
+        self.router = router
+        self.wait_timeout = wait_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(HEADER)
+        route = resolve_route(self.router, scope) if idempotency_key is not None else None
+        if (scope["method"], route) not in ROUTES:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, "Idempotency-Key inválida")
+            return
+
+        body, messages = await _read_body(receive)
+        pending = list(messages)
+
+        async def replay_receive():
+            if pending:
+                return pending.pop(0)
+            return await receive()
+
+        if body is None:
+            await self.app(scope, replay_receive, send)
+            return
+
+        key = scoped_key(scope["method"], route, headers.get(b"authorization", b""), idempotency_key)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        try:
+            record = await self.store.begin(key, fingerprint, self.wait_timeout)
+        except KeyMismatch:
+            await _send_json(send, 422, "Idempotency-Key já usada com outra requisição")
+            return
+        except KeyBusy:
+            await _send_json(send, 409, "Requisição com esta Idempotency-Key ainda em andamento")
+            return
+        if record is not None:
+            await _replay(send, record)
+            return
+
+        response = {"status": None, "headers": [], "body": []}
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [(k, v) for k, v in message.get("headers", []) if k.lower() in _REPLAYED_HEADERS]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, replay_receive, capturing_send)
+            # Server errors are not stored: the retry should run again
+            if response["status"] is not None and response["status"] < 500:
+                await self.store.complete(key, fingerprint, response["status"], response["headers"], b"".join(response["body"]))
+                completed = True
+        finally:
+            if not completed:
+                await asyncio.shield(self.store.abort(key))
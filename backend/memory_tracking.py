@@ -0,0 +1,220 @@
+import asyncio
+import os
+import sys
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from admission import resolve_route
+from metrics import registry
+
+# Diagnostic mode: tracemalloc runs for the whole process and every request
+# records how far traced memory grew above its starting point (pico), what
+# it left behind (retido) and, for one request in SNAPSHOT_EVERY per route,
+# the allocation sites alive when the response starts, which is when the
+# handler's documents, models and encoded body all coexist.
+#
+# tracemalloc counters are process-wide, so tracked requests run one at a
+# time: the numbers are exact per request at the cost of throughput. A
+# request holds the lock until its body is handed to the server. Streamed
+# bodies (exports, attachments) are measured up to their first chunk, so a
+# long stream does not block the requests behind it.
+
+SNAPSHOT_EVERY = int(os.environ.get("MEMORY_TRACKING_SNAPSHOT_EVERY", "10"))
+TOP_SITES = 10
+# Sites kept per route between reports
+MAX_SITES = 50
+ROTA_DESCONHECIDA = "desconhecida"
+
+# Filtering whole snapshots walks every trace in Python; the few diffed sites are filtered instead
+_IGNORED_SITES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>")
+
+registry.describe("request_memory_peak_bytes_total", "counter", "Traced memory growth of tracked requests, summed per route")
+registry.describe("request_memory_tracked_total", "counter", "Requests measured by the memory tracker")
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _rss_peak(rss: Optional[int]) -> Optional[int]:
+    """ru_maxrss is sampled by the kernel and can lag the current RSS; the peak is never below it."""
+    valores = [v for v in (rss, _peak_rss_bytes()) if v is not None]
+    return max(valores) if valores else None
+
+
+class MemoryTracker:
+    def __init__(self, snapshot_every: int = SNAPSHOT_EVERY):
+        self.snapshot_every = max(snapshot_every, 1)
+        self.routes: Dict[str, Dict] = {}
+        self.sites: Dict[str, Counter] = {}
+        self.traced_peak = 0
+        # Tracked requests hold it from begin() to end(), see MemoryTrackingMiddleware
+        self.lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            # Only the allocating line is reported, deeper tracebacks would just cost more per malloc
+            tracemalloc.start(1)
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def reset(self):
+        self.routes.clear()
+        self.sites.clear()
+        self.traced_peak = 0
+
+    def _stats(self, rota: str) -> Dict:
+        stats = self.routes.get(rota)
+        if stats is None:
+            stats = self.routes[rota] = {
+                "requisicoes": 0,
+                "amostras_sites": 0,
+                "pico_bytes_total": 0,
+                "pico_bytes_max": 0,
+                "retido_bytes_total": 0,
+                "resposta_bytes_max": 0,
+            }
+        return stats
+
+    def begin(self, rota: str) -> Dict:
+        stats = self._stats(rota)
+        sampled = stats["requisicoes"] % self.snapshot_every == 0
+        # The previous request's peak is folded into the process peak before resetting it
+        self.traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        return {
+            "rota": rota,
+            "inicio": tracemalloc.get_traced_memory()[0],
+            "resposta": None,
+            "snapshot": tracemalloc.take_snapshot() if sampled else None,
+        }
+
+    def response_started(self, state: Dict):
+        if state["resposta"] is not None:
+            return
+        state["resposta"] = tracemalloc.get_traced_memory()[0] - state["inicio"]
+        before = state.pop("snapshot")
+        if before is None:
+            return
+        sites = self.sites.setdefault(state["rota"], Counter())
+        for diff in tracemalloc.take_snapshot().compare_to(before, "lineno"):
+            frame = diff.traceback[0]
+            if diff.size_diff > 0 and frame.filename not in _IGNORED_SITES:
+                sites[f"{frame.filename}:{frame.lineno}"] += diff.size_diff
+        # Keep the heaviest sites only, the counter would otherwise grow with every code path
+        if len(sites) > MAX_SITES:
+            self.sites[state["rota"]] = Counter(dict(sites.most_common(MAX_SITES)))
+        self._stats(state["rota"])["amostras_sites"] += 1
+
+    def end(self, state: Dict):
+        current, peak = tracemalloc.get_traced_memory()
+        pico = max(peak - state["inicio"], 0)
+        stats = self._stats(state["rota"])
+        stats["requisicoes"] += 1
+        stats["pico_bytes_total"] += pico
+        stats["pico_bytes_max"] = max(stats["pico_bytes_max"], pico)
+        stats["retido_bytes_total"] += current - state["inicio"]
+        stats["resposta_bytes_max"] = max(stats["resposta_bytes_max"], state["resposta"] or 0)
+        registry.inc("request_memory_peak_bytes_total", pico, rota=state["rota"])
+        registry.inc("request_memory_tracked_total", rota=state["rota"])
+
+    def report(self) -> Dict[str, Dict]:
+        rotas = {}
+        for rota, stats in self.routes.items():
+            n = max(stats["requisicoes"], 1)
+            rotas[rota] = {
+                **stats,
+                "pico_bytes_medio": round(stats["pico_bytes_total"] / n),
+                "retido_bytes_medio": round(stats["retido_bytes_total"] / n),
+                # Bytes alive at response start per sampled request
+                "sites": [
+                    {"site": site, "bytes_medio": round(size / max(stats["amostras_sites"], 1))}
+                    for site, size in self.sites.get(rota, Counter()).most_common(TOP_SITES)
+                ],
+            }
+        return dict(sorted(rotas.items(), key=lambda item: -item[1]["pico_bytes_max"]))
+
+    def process(self) -> Dict:
+        traced, peak = tracemalloc.get_traced_memory() if self.active else (0, 0)
+        rss = _rss_bytes()
+        return {
+            "rss_bytes": rss,
+            "rss_pico_bytes": _rss_peak(rss),
+            "tracemalloc_bytes": traced,
+            "tracemalloc_pico_bytes": max(self.traced_peak, peak),
+        }
+
+
+registry.gauge(
+    "process_resident_memory_peak_bytes",
+    "Peak resident set size of the process",
+    lambda: [({}, float(_rss_peak(_rss_bytes()) or 0))],
+)
+
+
+class MemoryTrackingMiddleware:
+    def __init__(self, app, tracker: MemoryTracker, router):
+        self.app = app
+        self.tracker = tracker
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracker.active:
+            await self.app(scope, receive, send)
+            return
+        # Unmatched paths share one label, so scanners can't grow the report without bound
+        rota = f"{scope['method']} {resolve_route(self.router, scope) or ROTA_DESCONHECIDA}"
+        state = None
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            try:
+                if state is not None:
+                    self.tracker.end(state)
+            finally:
+                self.tracker.lock.release()
+
+        async def tracking_send(message):
+            if message["type"] == "http.response.start":
+                self.tracker.response_started(state)
+            elif message["type"] == "http.response.body":
+                # Whole body or first streamed chunk: released before a slow client can block the send
+                finish()
+            await send(message)
+
+        await self.tracker.lock.acquire()
+        try:
+            state = self.tracker.begin(rota)
+            await self.app(scope, receive, tracking_send)
+        finally:
+            finish()
+
+
+memory_tracker = MemoryTracker()
@@ -0,0 +1,59 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+class Registry:
+    """Minimal in-process metrics registry rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Callable[[], List[Tuple[Dict[str, str], float]]]] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self._counters[name][_label_key(labels)] += value
+
+    def gauge(self, name: str, help_text: str, collect: Callable[[], List[Tuple[Dict[str, str], float]]]):
+        """Register a gauge whose samples are collected lazily at scrape time."""
+        self.describe(name, "gauge", help_text)
+        self._gauges[name] = collect
+
+    def snapshot(self) -> Dict[str, List[dict]]:
+        result: Dict[str, List[dict]] = {}
+        with self._lock:
+            for name, series in self._counters.items():
+                result[name] = [{"labels": dict(key), "value": value} for key, value in series.items()]
+        for name, collect in self._gauges.items():
+            result[name] = [{"labels": labels, "value": value} for labels, value in collect()]
+        return result
+
+    def render(self) -> str:
+        lines = []
+        for name, samples in sorted(self.snapshot().items()):
+            kind, help_text = self._help.get(name, ("counter", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                lines.append(f"{name}{_format_labels(_label_key(sample['labels']))} {sample['value']}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
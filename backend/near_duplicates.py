@@ -0,0 +1,178 @@
+import hashlib
+import random
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 64 permutations split into 16 bands of 4 rows: pairs with Jaccard
+# similarity around 0.5 or more are likely to share at least one band
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+# 63-bit values so signatures fit in signed BSON int64
+HASH_BITS = 63
+MAX_HASH = (1 << HASH_BITS) - 1
+
+# Each permutation XORs the shingle hash with a random mask, about three
+# times cheaper in Python than affine (a*h+b) % p permutations with
+# comparable estimation error. Fixed seed so signatures stored in Mongo
+# stay comparable across restarts.
+_rng = random.Random(20250101)
+PERMUTATION_MASKS = [_rng.getrandbits(HASH_BITS) for _ in range(NUM_PERM)]
+
+WORD_RE = re.compile(r"\w+")
+
+# Signature of a text without shingles (empty or whitespace only): it says
+# nothing about similarity, so such respostas are never indexed
+EMPTY_SIGNATURE = [MAX_HASH] * NUM_PERM
+
+
+def shingles(text: str) -> set:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    words = WORD_RE.findall(text)
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _hash_shingle(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little") & MAX_HASH
+
+
+def minhash_signature(text: str) -> List[int]:
+    hashes = [_hash_shingle(s) for s in shingles(text)]
+    if not hashes:
+        return list(EMPTY_SIGNATURE)
+    return [min([h ^ mask for h in hashes]) for mask in PERMUTATION_MASKS]
+
+
+def estimated_similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class MinHashLSH:
+    """Banded LSH index over the MinHash signatures of one desafio's respostas."""
+
+    def __init__(self):
+        self.buckets: List[Dict[Tuple[int, ...], List[str]]] = [defaultdict(list) for _ in range(BANDS)]
+        self.signatures: Dict[str, List[int]] = {}
+        # Respostas read from the collection, indexed or not; compared with the current count
+        self.source_count = 0
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def insert(self, key: str, signature: Sequence[int]):
+        if key in self.signatures or list(signature) == EMPTY_SIGNATURE:
+            return
+        self.signatures[key] = list(signature)
+        for band in range(BANDS):
+            start = band * ROWS
+            self.buckets[band][tuple(signature[start:start + ROWS])].append(key)
+
+    def remove(self, key: str):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band in range(BANDS):
+            start = band * ROWS
+            band_key = tuple(signature[start:start + ROWS])
+            keys = self.buckets[band].get(band_key, [])
+            if key in keys:
+                keys.remove(key)
+            if not keys:
+                self.buckets[band].pop(band_key, None)
+
+    def candidate_pairs(self) -> set:
+        pairs = set()
+        for table in self.buckets:
+            for keys in table.values():
+                if len(keys) < 2:
+                    continue
+                for i in range(len(keys)):
+                    for j in range(i + 1, len(keys)):
+                        a, b = keys[i], keys[j]
+                        pairs.add((a, b) if a < b else (b, a))
+        return pairs
+
+    def clusters(self, threshold: float) -> List[Tuple[List[str], float]]:
+        # Union-find over verified candidate pairs only
+        parent: Dict[str, str] = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        best: Dict[Tuple[str, str], float] = {}
+        for a, b in self.candidate_pairs():
+            sim = estimated_similarity(self.signatures[a], self.signatures[b])
+            if sim >= threshold:
+                best[(a, b)] = sim
+                root_a, root_b = find(a), find(b)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for key in {k for pair in best for k in pair}:
+            groups[find(key)].append(key)
+        group_sims: Dict[str, float] = defaultdict(float)
+        for (a, _), sim in best.items():
+            root = find(a)
+            group_sims[root] = max(group_sims[root], sim)
+
+        result = [(sorted(members), group_sims[root]) for root, members in groups.items()]
+        result.sort(key=lambda item: (-len(item[0]), -item[1]))
+        return result
+
+
+class DesafioLSHRegistry:
+    """Lazily built LSH index per desafio, kept current by create_resposta.
+
+    Respostas written by other workers, or archived with their desafio,
+    change the desafio's count in the collection; a cached index whose
+    count no longer matches is rebuilt.
+    """
+
+    def __init__(self, max_desafios: int = 256):
+        self.max_desafios = max_desafios
+        self.indexes: Dict[str, MinHashLSH] = {}
+
+    async def get(self, db, desafio_id: str) -> MinHashLSH:
+        total = await db.respostas.count_documents({"desafio_id": desafio_id})
+        index = self.indexes.get(desafio_id)
+        if index is not None and index.source_count == total:
+            return index
+        index = MinHashLSH()
+        cursor = db.respostas.find({"desafio_id": desafio_id}, {"_id": 0, "id": 1, "texto": 1, "minhash": 1})
+        async for doc in cursor:
+            # Respostas stored before signatures existed are hashed on the fly
+            index.insert(doc["id"], doc.get("minhash") or minhash_signature(doc["texto"]))
+            index.source_count += 1
+        self.indexes.pop(desafio_id, None)
+        if len(self.indexes) >= self.max_desafios:
+            self.indexes.pop(next(iter(self.indexes)))
+        self.indexes[desafio_id] = index
+        return index
+
+    def add(self, desafio_id: str, resposta_id: str, signature: Sequence[int]):
+        index: Optional[MinHashLSH] = self.indexes.get(desafio_id)
+        if index is not None and resposta_id not in index.signatures:
+            index.insert(resposta_id, signature)
+            index.source_count += 1
+
+
+def build_index(items: Iterable[Tuple[str, Sequence[int]]]) -> MinHashLSH:
+    index = MinHashLSH()
+    for key, signature in items:
+        index.insert(key, signature)
+    return index
+
+
+lsh_registry = DesafioLSHRegistry()
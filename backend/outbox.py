@@ -0,0 +1,441 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import activity_rollups
+import archival
+import grade_analytics
+from metrics import registry
+
+# Derived data (activity and grade rollups) is no longer updated inline by
+# the write paths. They append a compact event to the "outbox" collection
+# and a background worker applies events in batches.
+#
+# Without multi-document transactions the event is written right before its
+# entity, and the worker only applies events whose entity exists: an event
+# whose entity insert failed is discarded once it is older than
+# ORPHAN_GRACE. Each batch ("lote") is recorded on the rollup documents it
+# updates, so retrying a batch after a crash never counts it twice.
+#
+# Full rebuilds of a projection run under a fence (``rebuild_projection``):
+# workers stop claiming, in-flight batches drain, and every pending event
+# whose entity the rebuild counted is marked to skip that projection.
+# Events for entities written after the rebuild read past them are applied
+# normally once the fence is lifted.
+
+logger = logging.getLogger(__name__)
+
+EVENTO_USUARIO_REGISTRADO = "usuario_registrado"
+EVENTO_DESAFIO_CRIADO = "desafio_criado"
+EVENTO_RESPOSTA_CRIADA = "resposta_criada"
+EVENTO_AVALIACAO_CRIADA = "avaliacao_criada"
+
+# Collection holding the entity an event describes, looked up by its "id"
+ENTIDADES = {
+    EVENTO_USUARIO_REGISTRADO: "usuarios",
+    EVENTO_DESAFIO_CRIADO: "desafios",
+    EVENTO_RESPOSTA_CRIADA: "respostas",
+    EVENTO_AVALIACAO_CRIADA: "avaliacoes",
+}
+
+METRICAS = {
+    EVENTO_USUARIO_REGISTRADO: activity_rollups.METRICA_REGISTROS,
+    EVENTO_DESAFIO_CRIADO: activity_rollups.METRICA_DESAFIOS,
+    EVENTO_RESPOSTA_CRIADA: activity_rollups.METRICA_RESPOSTAS,
+    EVENTO_AVALIACAO_CRIADA: activity_rollups.METRICA_AVALIACOES,
+}
+
+ESTADO_PENDENTE = "pendente"
+ESTADO_PROCESSANDO = "processando"
+ESTADO_APLICADO = "aplicado"
+ESTADO_FALHOU = "falhou"
+ESTADO_DESCARTADO = "descartado"
+
+BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "500"))
+POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_SECONDS", "1"))
+# A batch still processing after its lease belongs to a worker that died
+LEASE = timedelta(seconds=60)
+ORPHAN_GRACE = timedelta(minutes=5)
+MAX_TENTATIVAS = 5
+# Applied and discarded events are kept this long for replays, then expire
+RETENCAO = timedelta(days=7)
+# Batch ids remembered per rollup document
+LOTES_RECENTES = 100
+# A rebuild renews its fence on every source batch; a fence left by a crashed rebuild lapses
+FENCE_LEASE = timedelta(minutes=5)
+FENCE_POLL = 0.2
+LAG_INTERVAL = 5.0
+BULK_CHUNK = 1000
+DUPLICATE_KEY = 11000
+
+registry.describe("outbox_events_applied_total", "counter", "Outbox events applied to the projections")
+registry.describe("outbox_apply_delay_seconds_total", "counter", "Time from event append to application, summed")
+registry.describe("outbox_events_discarded_total", "counter", "Outbox events whose entity was never written")
+registry.describe("outbox_batch_failures_total", "counter", "Outbox batches whose projection updates failed")
+
+
+def new_event(tipo: str, dados: Dict) -> Dict:
+    return {
+        "_id": str(uuid.uuid4()),
+        "tipo": tipo,
+        "dados": dados,
+        "estado": ESTADO_PENDENTE,
+        "lote": None,
+        "tentativas": 0,
+        "criado_em": datetime.utcnow(),
+    }
+
+
+def _atividade(evento: Dict):
+    dados = evento["dados"]
+    return activity_rollups.increments(
+        METRICAS[evento["tipo"]], dados["em"], tipo=dados.get("tipo"), empresa_id=dados.get("empresa_id")
+    )
+
+
+def _notas(evento: Dict):
+    if evento["tipo"] != EVENTO_AVALIACAO_CRIADA:
+        return []
+    dados = evento["dados"]
+    return grade_analytics.increments(dados["nota"], dados["desafio_id"], dados["empresa_id"])
+
+
+PROJECAO_ATIVIDADE = "atividade"
+PROJECAO_NOTAS = "notas"
+
+PROJECOES = {
+    PROJECAO_ATIVIDADE: _atividade,
+    PROJECAO_NOTAS: _notas,
+}
+
+
+# Event tipo per entity collection, for rebuilds reporting what they counted
+TIPOS_POR_ENTIDADE = {collection: tipo for tipo, collection in ENTIDADES.items()}
+
+
+def projection_updates(eventos: List[Dict], lote: str) -> Dict[str, List[UpdateOne]]:
+    """One guarded upsert per touched rollup document, grouped by collection."""
+    merged: Dict[Tuple[str, str], Tuple[Dict[str, float], Dict]] = {}
+    for evento in eventos:
+        for nome, projecao in PROJECOES.items():
+            # Already counted by a rebuild of that projection
+            if nome in evento.get("ignorar", ()):
+                continue
+            for collection, doc_id, inc, on_insert in projecao(evento):
+                acumulado, _ = merged.setdefault((collection, doc_id), (defaultdict(int), on_insert))
+                for campo, valor in inc.items():
+                    acumulado[campo] += valor
+    updates: Dict[str, List[UpdateOne]] = defaultdict(list)
+    for (collection, doc_id), (inc, on_insert) in merged.items():
+        updates[collection].append(UpdateOne(
+            # A document already holding this lote was updated by an earlier attempt:
+            # the filter misses and the upsert fails with a duplicate _id instead
+            {"_id": doc_id, "lotes": {"$ne": lote}},
+            {
+                "$inc": dict(inc),
+                "$setOnInsert": on_insert,
+                "$push": {"lotes": {"$each": [lote], "$slice": -LOTES_RECENTES}},
+            },
+            upsert=True,
+        ))
+    return updates
+
+
+class OutboxWorker:
+    def __init__(self, db, batch_size: int = BATCH_SIZE, poll_interval: float = POLL_INTERVAL):
+        self.db = db
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lag_seconds = 0.0
+        self.pendentes = 0
+        self.falhos = 0
+        self._lag_checked = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Held while a batch is processed, so a fence set in this process waits for it
+        self._lock = asyncio.Lock()
+
+    @property
+    def collection(self):
+        return self.db.outbox
+
+    @property
+    def fences(self):
+        return self.db.outbox_fences
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("estado", ASCENDING), ("criado_em", ASCENDING)])
+        await self.collection.create_index([("lote", ASCENDING)])
+        # Only applied and discarded events carry expira_em
+        await self.collection.create_index([("expira_em", ASCENDING)], expireAfterSeconds=0)
+        await self.fences.create_index([("ate", ASCENDING)], expireAfterSeconds=0)
+
+    async def emit(self, tipo: str, dados: Dict):
+        await self.collection.insert_one(new_event(tipo, dados))
+        self._wake.set()
+
+    async def emit_many(self, eventos: List[Tuple[str, Dict]]):
+        if eventos:
+            await self.collection.insert_many([new_event(tipo, dados) for tipo, dados in eventos], ordered=False)
+            self._wake.set()
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                async with self._lock:
+                    progresso = await self.process_batch()
+                if time.monotonic() - self._lag_checked >= LAG_INTERVAL:
+                    await self.refresh_lag()
+            except Exception:
+                logger.exception("Falha ao processar outbox")
+                progresso = 0
+            if not progresso:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    async def _claim(self) -> Tuple[Optional[str], List[Dict]]:
+        if await self._fenced():
+            return None, []
+        agora = datetime.utcnow()
+        stale = await self.collection.find_one_and_update(
+            {"estado": ESTADO_PROCESSANDO, "lease_ate": {"$lte": agora}},
+            {"$set": {"lease_ate": agora + LEASE}},
+            projection={"lote": 1},
+        )
+        if stale is not None:
+            # Retried with the same lote, so rollups it already reached are skipped
+            lote = stale["lote"]
+            await self.collection.update_many(
+                {"lote": lote, "estado": ESTADO_PROCESSANDO}, {"$set": {"lease_ate": agora + LEASE}}
+            )
+        else:
+            cursor = self.collection.find({"estado": ESTADO_PENDENTE}, {"_id": 1}).sort("criado_em", 1)
+            ids = [doc["_id"] for doc in await cursor.to_list(self.batch_size)]
+            if not ids:
+                return None, []
+            lote = str(uuid.uuid4())
+            await self.collection.update_many(
+                {"_id": {"$in": ids}, "estado": ESTADO_PENDENTE},
+                {"$set": {"estado": ESTADO_PROCESSANDO, "lote": lote, "lease_ate": agora + LEASE}},
+            )
+        if await self._fenced():
+            # Checked after claiming, while a fence is set before draining: either
+            # the rebuild sees this batch in flight or the batch sees its fence.
+            # The lote is kept, so the retry skips rollups this batch might already have reached.
+            await self.collection.update_many(
+                {"lote": lote, "estado": ESTADO_PROCESSANDO}, {"$set": {"lease_ate": agora}}
+            )
+            return None, []
+        eventos = await self.collection.find({"lote": lote, "estado": ESTADO_PROCESSANDO}).to_list(None)
+        return lote, eventos
+
+    async def _fenced(self) -> bool:
+        return await self.fences.find_one({"ate": {"$gt": datetime.utcnow()}}, {"_id": 1}) is not None
+
+    async def _existing(self, eventos: List[Dict]) -> set:
+        ids_por_colecao: Dict[str, List[str]] = defaultdict(list)
+        for evento in eventos:
+            ids_por_colecao[ENTIDADES[evento["tipo"]]].append(evento["dados"]["id"])
+        existentes = set()
+        for collection, ids in ids_por_colecao.items():
+            encontrados = set(await self.db[collection].distinct("id", {"id": {"$in": ids}}))
+            faltando = [i for i in ids if i not in encontrados]
+            if faltando and collection in archival.ARQUIVO:
+                # Archived before its event was applied: the entity exists, just not in the hot collection
+                arquivo = self.db[archival.ARQUIVO[collection]]
+                encontrados.update(await arquivo.distinct("id", {"id": {"$in": faltando}}))
+            existentes.update((collection, entidade_id) for entidade_id in encontrados)
+        return existentes
+
+    async def _apply(self, updates: Dict[str, List[UpdateOne]]):
+        for collection, ops in updates.items():
+            for start in range(0, len(ops), BULK_CHUNK):
+                try:
+                    await self.db[collection].bulk_write(ops[start:start + BULK_CHUNK], ordered=False)
+                except BulkWriteError as exc:
+                    details = exc.details
+                    if details.get("writeConcernErrors") or any(
+                        error["code"] != DUPLICATE_KEY for error in details.get("writeErrors", [])
+                    ):
+                        raise
+
+    async def process_batch(self) -> int:
+        """Claim and apply one batch; returns how many events were settled."""
+        lote, eventos = await self._claim()
+        if not eventos:
+            return 0
+
+        agora = datetime.utcnow()
+        existentes = await self._existing(eventos)
+        prontos, aguardando, orfaos = [], [], []
+        for evento in eventos:
+            if (ENTIDADES[evento["tipo"]], evento["dados"]["id"]) in existentes:
+                prontos.append(evento)
+            elif agora - evento["criado_em"] > ORPHAN_GRACE:
+                orfaos.append(evento)
+            else:
+                aguardando.append(evento)
+
+        if aguardando:
+            # Entity insert not visible yet (e.g. queued in the group commit writer)
+            await self.collection.update_many(
+                {"_id": {"$in": [e["_id"] for e in aguardando]}, "lote": lote},
+                {"$set": {"estado": ESTADO_PENDENTE, "lote": None}, "$unset": {"lease_ate": ""}},
+            )
+        if orfaos:
+            await self.collection.update_many(
+                {"_id": {"$in": [e["_id"] for e in orfaos]}, "lote": lote},
+                {"$set": {"estado": ESTADO_DESCARTADO, "expira_em": agora + RETENCAO}, "$unset": {"lease_ate": ""}},
+            )
+            registry.inc("outbox_events_discarded_total", len(orfaos))
+        if not prontos:
+            return len(orfaos)
+
+        try:
+            await self._apply(projection_updates(prontos, lote))
+        except Exception as exc:
+            await self._fail(lote, exc)
+            raise
+
+        aplicado_em = datetime.utcnow()
+        await self.collection.update_many(
+            {"_id": {"$in": [e["_id"] for e in prontos]}, "lote": lote},
+            {
+                "$set": {"estado": ESTADO_APLICADO, "aplicado_em": aplicado_em, "expira_em": aplicado_em + RETENCAO},
+                "$unset": {"lease_ate": "", "erro": ""},
+            },
+        )
+        for evento in prontos:
+            registry.inc("outbox_events_applied_total", tipo=evento["tipo"])
+            registry.inc("outbox_apply_delay_seconds_total", (aplicado_em - evento["criado_em"]).total_seconds())
+        return len(prontos) + len(orfaos)
+
+    async def _fail(self, lote: str, exc: Exception):
+        registry.inc("outbox_batch_failures_total")
+        # The lote stays claimed and is retried whole once the lease runs out
+        await self.collection.update_many(
+            {"lote": lote, "estado": ESTADO_PROCESSANDO}, {"$inc": {"tentativas": 1}, "$set": {"erro": str(exc)}}
+        )
+        await self.collection.update_many(
+            {"lote": lote, "estado": ESTADO_PROCESSANDO, "tentativas": {"$gte": MAX_TENTATIVAS}},
+            {"$set": {"estado": ESTADO_FALHOU}, "$unset": {"lease_ate": ""}},
+        )
+
+    async def rebuild_projection(self, projecao: str, rebuild):
+        """Run ``rebuild(marcar)`` for one projection with every worker fenced off.
+
+        The rebuild calls ``marcar(collection, ids)`` for each batch of
+        source entities it counted; their unapplied events then skip that
+        projection, so nothing is counted twice or lost while it runs.
+        """
+        fence_id = str(uuid.uuid4())
+        await self.fences.insert_one({"_id": fence_id, "projecao": projecao, "ate": datetime.utcnow() + FENCE_LEASE})
+        try:
+            async with self._lock:
+                await self._drain()
+
+                async def marcar(collection: str, ids: List[str]):
+                    await self.fences.update_one({"_id": fence_id}, {"$set": {"ate": datetime.utcnow() + FENCE_LEASE}})
+                    if ids:
+                        await self.collection.update_many(
+                            {
+                                "estado": {"$in": [ESTADO_PENDENTE, ESTADO_PROCESSANDO]},
+                                "tipo": TIPOS_POR_ENTIDADE[collection],
+                                "dados.id": {"$in": ids},
+                            },
+                            {"$addToSet": {"ignorar": projecao}},
+                        )
+
+                return await rebuild(marcar)
+        finally:
+            await self.fences.delete_one({"_id": fence_id})
+            self._wake.set()
+
+    async def _drain(self):
+        """Wait for batches other processes claimed before the fence; dead workers' leases just run out."""
+        limite = time.monotonic() + LEASE.total_seconds()
+        while time.monotonic() < limite:
+            ativos = {"estado": ESTADO_PROCESSANDO, "lease_ate": {"$gt": datetime.utcnow()}}
+            if await self.collection.count_documents(ativos) == 0:
+                return
+            await asyncio.sleep(FENCE_POLL)
+
+    async def refresh_lag(self):
+        self._lag_checked = time.monotonic()
+        ativos = {"estado": {"$in": [ESTADO_PENDENTE, ESTADO_PROCESSANDO]}}
+        oldest = await self.collection.find(ativos, {"_id": 0, "criado_em": 1}).sort("criado_em", 1).to_list(1)
+        self.lag_seconds = (datetime.utcnow() - oldest[0]["criado_em"]).total_seconds() if oldest else 0.0
+        self.pendentes = await self.collection.count_documents(ativos)
+        self.falhos = await self.collection.count_documents({"estado": ESTADO_FALHOU})
+
+    async def status(self, limite_falhos: int = 20) -> Dict:
+        await self.refresh_lag()
+        por_estado = {
+            row["_id"]: row["n"]
+            for row in await self.collection.aggregate([{"$group": {"_id": "$estado", "n": {"$sum": 1}}}]).to_list(None)
+        }
+        falhos = await self.collection.find(
+            {"estado": ESTADO_FALHOU}, {"_id": 1, "tipo": 1, "criado_em": 1, "tentativas": 1, "erro": 1}
+        ).sort("criado_em", 1).to_list(limite_falhos)
+        return {
+            "ativo": self._task is not None,
+            "atraso_segundos": round(self.lag_seconds, 3),
+            "por_estado": por_estado,
+            "falhos": [{"id": f.pop("_id"), **f} for f in falhos],
+        }
+
+    async def replay(self, desde: Optional[datetime] = None) -> Dict[str, int]:
+        """Re-queue failed events and, with ``desde``, applied events created since then.
+
+        Failed events keep their lote, so rollups they already reached are
+        not counted twice. Applied events get new lotes and are counted
+        again: replay them only after clearing or restoring the projections.
+        """
+        agora = datetime.utcnow()
+        falhos = await self.collection.update_many(
+            {"estado": ESTADO_FALHOU},
+            {"$set": {"estado": ESTADO_PROCESSANDO, "lease_ate": agora, "tentativas": 0}},
+        )
+        resultado = {"falhos": falhos.modified_count, "aplicados": 0}
+        if desde is not None:
+            aplicados = await self.collection.update_many(
+                {"estado": ESTADO_APLICADO, "criado_em": {"$gte": desde}},
+                {
+                    "$set": {"estado": ESTADO_PENDENTE, "lote": None, "tentativas": 0},
+                    "$unset": {"aplicado_em": "", "expira_em": ""},
+                },
+            )
+            resultado["aplicados"] = aplicados.modified_count
+        self._wake.set()
+        return resultado
+
+    def register_metrics(self):
+        registry.gauge("outbox_lag_seconds", "Age of the oldest outbox event not yet applied",
+                       lambda: [({}, self.lag_seconds)])
+        registry.gauge("outbox_pending_events", "Outbox events waiting to be applied",
+                       lambda: [({}, float(self.pendentes))])
+        registry.gauge("outbox_failed_events", "Outbox events that exhausted their retries",
+                       lambda: [({}, float(self.falhos))])
@@ -0,0 +1,207 @@
+import asyncio
+import hmac
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from admission import resolve_route
+
+# On-demand wall-clock sampling of single requests. A sampler thread only
+# runs while at least one request is being profiled; every tick it records
+# where the profiled request is: the interpreter stack when its task holds
+# the event loop (bcrypt, validation, JSON encoding...), or the chain of
+# awaiting coroutines when it is parked (Motor round trips, locks).
+
+PROFILE_HEADER = b"x-profile"
+
+INTERVAL_MS = float(os.environ.get("PROFILING_INTERVAL_MS", "5"))
+CAPACITY = int(os.environ.get("PROFILING_BUFFER", "50"))
+TOP_FRAMES = 15
+
+WAITING = "[aguardando]"
+
+
+def _label(code) -> str:
+    path = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def _thread_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        # Everything above the task step is event loop machinery
+        if code.co_name == "_run" and code.co_filename.endswith(("asyncio/events.py", "asyncio\\events.py")):
+            break
+        stack.append(_label(code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            if isinstance(awaitable, asyncio.Future):
+                stack.append(f"[{type(awaitable).__name__}]")
+            break
+        stack.append(_label(frame.f_code))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return stack
+
+
+class ActiveProfile:
+    def __init__(self, meta: Dict):
+        self.meta = meta
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.stacks: Counter = Counter()
+        self.cpu = 0
+        self.waiting = 0
+
+    def sample(self, frames: Dict[int, object]):
+        if asyncio.current_task(self.loop) is self.task:
+            stack = _thread_stack(frames.get(self.thread_id))
+            self.cpu += 1
+        else:
+            stack = _task_stack(self.task) + [WAITING]
+            self.waiting += 1
+        if stack:
+            self.stacks[tuple(stack)] += 1
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float = INTERVAL_MS, capacity: int = CAPACITY):
+        self.interval = interval_ms / 1000.0
+        self.fracao = 0.0
+        self.token = secrets.token_urlsafe(16)
+        self.profiles: Deque[Dict] = deque(maxlen=capacity)
+        self._active: Dict[int, ActiveProfile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._rng = random.Random()
+
+    def reason(self, scope) -> Optional[str]:
+        """Why this request should be profiled, or None (the common, free path)."""
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                if hmac.compare_digest(value, self.token.encode()):
+                    return "cabecalho"
+                break
+        if self.fracao > 0 and self._rng.random() < self.fracao:
+            return "amostragem"
+        return None
+
+    def renew_token(self) -> str:
+        self.token = secrets.token_urlsafe(16)
+        return self.token
+
+    def start(self, meta: Dict) -> ActiveProfile:
+        active = ActiveProfile(meta)
+        with self._lock:
+            self._active[id(active)] = active
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return active
+
+    def stop(self, active: ActiveProfile, status: Optional[int]):
+        with self._lock:
+            self._active.pop(id(active), None)
+        duracao = time.perf_counter() - active.started
+        folded = Counter()
+        for stack, count in active.stacks.items():
+            folded[stack[-1]] += count
+        self.profiles.appendleft({
+            **active.meta,
+            "status": status,
+            "duracao_ms": round(duracao * 1000, 2),
+            "intervalo_ms": self.interval * 1000,
+            "amostras": active.cpu + active.waiting,
+            "amostras_cpu": active.cpu,
+            "amostras_espera": active.waiting,
+            "topo": [{"frame": frame, "amostras": count} for frame, count in folded.most_common(TOP_FRAMES)],
+            "_stacks": active.stacks,
+        })
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                actives = list(self._active.values())
+                if not actives:
+                    # Nothing left to profile: the thread ends until the next capture
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for active in actives:
+                try:
+                    active.sample(frames)
+                except Exception:
+                    pass
+
+    def list(self) -> List[Dict]:
+        return [{k: v for k, v in profile.items() if k != "_stacks"} for profile in self.profiles]
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        for profile in self.profiles:
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+
+def collapsed(profile: Dict) -> str:
+    """Brendan Gregg's folded stack format, readable by flamegraph.pl and speedscope."""
+    lines = [";".join(stack) + f" {count}" for stack, count in profile["_stacks"].most_common()]
+    return "\n".join(lines) + "\n"
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: SamplingProfiler, router):
+        self.app = app
+        self.profiler = profiler
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        motivo = self.profiler.reason(scope)
+        if motivo is None:
+            await self.app(scope, receive, send)
+            return
+
+        status: List[Optional[int]] = [None]
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        active = self.profiler.start({
+            "id": uuid.uuid4().hex[:12],
+            "metodo": scope["method"],
+            "rota": resolve_route(self.router, scope) or scope["path"],
+            "path": scope["path"],
+            "motivo": motivo,
+            "inicio": datetime.utcnow(),
+        })
+        try:
+            await self.app(scope, receive, capture_send)
+        finally:
+            self.profiler.stop(active, status[0])
+
+
+profiler = SamplingProfiler()
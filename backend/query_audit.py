@@ -0,0 +1,339 @@
+import asyncio
+import contextvars
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from admission import resolve_route
+from deadlines import DeadlineCollection
+from metrics import registry
+
+# Diagnostic mode: every query shape issued while handling a route is
+# explained once (executionStats) in the background and summarised per
+# route, so a missing index shows up as a COLLSCAN before production does.
+
+SEM_ROTA = "(sem rota)"
+
+_route: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("query_audit_route", default=None)
+
+# Plan branches that were considered but not executed
+_SKIPPED_KEYS = {"rejectedPlans", "allPlansExecution"}
+
+registry.describe("query_collscan_total", "counter", "Query shapes whose plan scans a whole collection")
+
+
+def query_shape(value):
+    """The value with every literal replaced by its type name, for grouping queries."""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(v, dict) for v in value):
+            return [query_shape(v) for v in value]
+        return "lista"
+    return type(value).__name__
+
+
+def analyze(explain: dict) -> Dict:
+    """Collection scans, indexes, $lookup strategies and doc counts from explain output.
+
+    Handles both the classic engine (``$lookup`` stages with collectionScans)
+    and the slot-based engine (``EQ_LOOKUP`` stages with a join strategy).
+    """
+    stages: List[str] = []
+    indices: List[str] = []
+    lookups: List[Dict] = []
+    totals = {"examinados": 0, "retornados": 0, "collscan": False}
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        stage = node.get("stage")
+        if isinstance(stage, str):
+            if stage not in stages:
+                stages.append(stage)
+            if stage == "COLLSCAN":
+                totals["collscan"] = True
+            if stage == "EQ_LOOKUP":
+                lookups.append({
+                    "de": node.get("foreignCollection"),
+                    "estrategia": node.get("strategy"),
+                    "indice": node.get("indexName"),
+                })
+        index_name = node.get("indexName")
+        if isinstance(index_name, str) and index_name not in indices:
+            indices.append(index_name)
+        lookup = node.get("$lookup")
+        if isinstance(lookup, dict):
+            scans = node.get("collectionScans", 0) or 0
+            lookups.append({
+                "de": lookup.get("from"),
+                "estrategia": "classica",
+                "collection_scans": scans,
+                "indices": node.get("indexesUsed", []),
+                "docs_examinados": node.get("totalDocsExamined"),
+            })
+            if scans:
+                totals["collscan"] = True
+        stats = node.get("executionStats")
+        if isinstance(stats, dict):
+            totals["examinados"] += stats.get("totalDocsExamined", 0) or 0
+            totals["retornados"] += stats.get("nReturned", 0) or 0
+        for key, child in node.items():
+            if key not in _SKIPPED_KEYS and isinstance(child, (dict, list)):
+                walk(child)
+
+    walk(explain)
+    return {
+        "collscan": totals["collscan"],
+        "estagios": stages,
+        "indices": indices,
+        "lookups": lookups,
+        "docs_examinados": totals["examinados"],
+        "docs_retornados": totals["retornados"],
+        "razao_examinados": round(totals["examinados"] / max(totals["retornados"], 1), 2),
+    }
+
+
+class QueryAuditor:
+    def __init__(self):
+        self.records: Dict[Tuple[str, str, str, str], Dict] = {}
+        self._pending: set = set()
+
+    def observe(self, database, colecao: str, operacao: str, comando: Dict, filtro: Optional[Dict]):
+        rota = _route.get() or SEM_ROTA
+        formato = json.dumps(query_shape(comando), sort_keys=True, default=str)
+        key = (rota, colecao, operacao, formato)
+        record = self.records.get(key)
+        if record is not None:
+            record["chamadas"] += 1
+            return
+        self.records[key] = {
+            "rota": rota,
+            "colecao": colecao,
+            "operacao": operacao,
+            "formato": query_shape(comando),
+            # Unfiltered reads scan by design and are not flagged
+            "sem_filtro": not filtro,
+            "chamadas": 1,
+            "explicado_em": None,
+        }
+        task = asyncio.get_running_loop().create_task(self._explain(database, key, comando))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _explain(self, database, key, comando: Dict):
+        record = self.records[key]
+        try:
+            result = await database.command({"explain": comando, "verbosity": "executionStats"})
+            record.update(analyze(result))
+            if record["collscan"] and not record["sem_filtro"]:
+                registry.inc("query_collscan_total", rota=record["rota"], colecao=record["colecao"])
+        except Exception as exc:
+            record["erro"] = str(exc)
+        record["explicado_em"] = datetime.utcnow()
+
+    async def drain(self):
+        """Wait for explains still running in the background."""
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def reset(self):
+        self.records.clear()
+
+    def report(self) -> Dict[str, List[Dict]]:
+        rotas: Dict[str, List[Dict]] = {}
+        for record in self.records.values():
+            rotas.setdefault(record["rota"], []).append(record)
+        for records in rotas.values():
+            records.sort(key=lambda r: (not r.get("collscan", False), -r.get("razao_examinados", 0)))
+        return dict(sorted(rotas.items()))
+
+
+def collection_scans(report: Dict[str, List[Dict]], allow: Iterable[str] = ()) -> List[Dict]:
+    """Filtered query shapes whose plan scans a collection, outside the allowed routes."""
+    allowed = set(allow)
+    return [
+        record
+        for rota, records in report.items() if rota not in allowed
+        for record in records
+        if record.get("collscan") and not record.get("sem_filtro")
+    ]
+
+
+def assert_no_collection_scans(report: Dict[str, List[Dict]], allow: Iterable[str] = ()):
+    scans = collection_scans(report, allow)
+    if scans:
+        linhas = [f"{r['rota']}: {r['operacao']} em {r['colecao']} {json.dumps(r['formato'])}" for r in scans]
+        raise AssertionError("Consultas com COLLSCAN:\n" + "\n".join(linhas))
+
+
+class _AuditedCursor:
+    """Find cursor proxy that explains the query with its final sort and limit."""
+
+    def __init__(self, cursor, fire):
+        self._cursor = cursor
+        self._fire = fire
+        self._sort = None
+        self._limit = 0
+        self._fired = False
+
+    def sort(self, key, direction=None):
+        self._cursor = self._cursor.sort(key, direction) if direction is not None else self._cursor.sort(key)
+        self._sort = {key: direction or 1} if isinstance(key, str) else dict(key)
+        return self
+
+    def limit(self, limit: int):
+        self._cursor = self._cursor.limit(limit)
+        self._limit = limit
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        self._cursor = self._cursor.max_time_ms(max_time_ms)
+        return self
+
+    def _observe(self):
+        if not self._fired:
+            self._fired = True
+            self._fire(self._sort, self._limit)
+
+    def to_list(self, length=None):
+        self._observe()
+        return self._cursor.to_list(length)
+
+    def __aiter__(self):
+        self._observe()
+        return self._cursor.__aiter__()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class AuditedCollection:
+    def __init__(self, collection, name: str, auditor: QueryAuditor, explain_database):
+        self._collection = collection
+        self._name = name
+        self._auditor = auditor
+        self._explain_database = explain_database
+
+    def _observe(self, operacao: str, comando: Dict, filtro: Optional[Dict]):
+        self._auditor.observe(self._explain_database, self._name, operacao, comando, filtro)
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        cursor = self._collection.find(filter, projection, *args, **kwargs)
+
+        def fire(sort, limit):
+            comando = {"find": self._name, "filter": filter or {}}
+            if projection:
+                comando["projection"] = projection
+            if sort:
+                comando["sort"] = sort
+            if limit:
+                comando["limit"] = limit
+            self._observe("find", comando, filter)
+
+        return _AuditedCursor(cursor, fire)
+
+    def find_one(self, filter=None, projection=None, *args, **kwargs):
+        comando = {"find": self._name, "filter": filter or {}, "limit": 1}
+        if projection:
+            comando["projection"] = projection
+        self._observe("find_one", comando, filter)
+        return self._collection.find_one(filter, projection, *args, **kwargs)
+
+    def count_documents(self, filter, *args, **kwargs):
+        pipeline = [{"$match": filter}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]
+        self._observe("count_documents", {"aggregate": self._name, "pipeline": pipeline, "cursor": {}}, filter)
+        return self._collection.count_documents(filter, *args, **kwargs)
+
+    def distinct(self, key, filter=None, *args, **kwargs):
+        self._observe("distinct", {"distinct": self._name, "key": key, "query": filter or {}}, filter)
+        return self._collection.distinct(key, filter, *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        first = pipeline[0].get("$match") if pipeline else None
+        self._observe("aggregate", {"aggregate": self._name, "pipeline": pipeline, "cursor": {}}, first)
+        return self._collection.aggregate(pipeline, *args, **kwargs)
+
+    def _update(self, operacao: str, filter, update, multi: bool, upsert: bool):
+        comando = {"update": self._name, "updates": [{"q": filter, "u": update, "multi": multi, "upsert": upsert}]}
+        self._observe(operacao, comando, filter)
+
+    def update_one(self, filter, update, upsert=False, *args, **kwargs):
+        self._update("update_one", filter, update, False, upsert)
+        return self._collection.update_one(filter, update, upsert, *args, **kwargs)
+
+    def update_many(self, filter, update, upsert=False, *args, **kwargs):
+        self._update("update_many", filter, update, True, upsert)
+        return self._collection.update_many(filter, update, upsert, *args, **kwargs)
+
+    def replace_one(self, filter, replacement, upsert=False, *args, **kwargs):
+        self._update("replace_one", filter, replacement, False, upsert)
+        return self._collection.replace_one(filter, replacement, upsert, *args, **kwargs)
+
+    def find_one_and_update(self, filter, update, *args, **kwargs):
+        self._observe("find_one_and_update", {"findAndModify": self._name, "query": filter, "update": update}, filter)
+        return self._collection.find_one_and_update(filter, update, *args, **kwargs)
+
+    def _delete(self, operacao: str, filter, limit: int):
+        self._observe(operacao, {"delete": self._name, "deletes": [{"q": filter, "limit": limit}]}, filter)
+
+    def delete_one(self, filter, *args, **kwargs):
+        self._delete("delete_one", filter, 1)
+        return self._collection.delete_one(filter, *args, **kwargs)
+
+    def delete_many(self, filter, *args, **kwargs):
+        self._delete("delete_many", filter, 0)
+        return self._collection.delete_many(filter, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class AuditedDatabase:
+    """Database wrapper that reports every collection call to the auditor.
+
+    Explains run on ``explain_database`` (the raw Motor database) so they
+    are neither audited themselves nor bound by the request deadline.
+    """
+
+    def __init__(self, database, auditor: QueryAuditor, explain_database):
+        self._database = database
+        self._auditor = auditor
+        self._explain_database = explain_database
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if isinstance(attr, (AsyncIOMotorCollection, DeadlineCollection)):
+            return AuditedCollection(attr, name, self._auditor, self._explain_database)
+        return attr
+
+    def __getitem__(self, name):
+        return AuditedCollection(self._database[name], name, self._auditor, self._explain_database)
+
+
+class QueryAuditMiddleware:
+    """Tags the request's queries with its route template."""
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = resolve_route(self.router, scope) or scope["path"]
+        token = _route.set(f"{scope['method']} {path}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _route.reset(token)
+
+
+query_auditor = QueryAuditor()
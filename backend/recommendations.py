@@ -0,0 +1,173 @@
+import asyncio
+import math
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import archival
+import text_storage
+
+# Very common Portuguese words that carry no signal for matching desafios
+STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "como", "da", "das", "de", "do", "dos", "e",
+    "ela", "ele", "em", "entre", "era", "essa", "esse", "esta", "este", "eu",
+    "foi", "ha", "isso", "isto", "ja", "mais", "mas", "me", "mesmo", "na",
+    "nas", "nao", "no", "nos", "o", "os", "ou", "para", "pela", "pelo", "por",
+    "qual", "que", "se", "sem", "ser", "seu", "sua", "tem", "um", "uma", "voce",
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Weight used for respostas that have not been graded yet (nota 0-10 scale)
+NOTA_NEUTRA = 5.0
+
+# Seconds between checks of the index against the desafios collection
+VERSION_CHECK_INTERVAL = 10.0
+
+
+def tokenize(text: str) -> List[str]:
+    # Lowercase and strip accents so "inovação" and "inovacao" match
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in TOKEN_RE.findall(text) if len(t) > 2 and t not in STOPWORDS]
+
+
+def term_frequencies(text: str) -> Dict[str, float]:
+    counts: Dict[str, float] = defaultdict(float)
+    for token in tokenize(text):
+        counts[token] += 1.0
+    # Sublinear tf keeps long descriptions from dominating
+    return {term: 1.0 + math.log(count) for term, count in counts.items()}
+
+
+class TfidfIndex:
+    """Sparse TF-IDF matrix over desafio descriptions.
+
+    Rows are stored as an inverted index (term -> {desafio_id: tf}) so a
+    query only touches the postings of the terms it contains. The index is
+    built in batch from the open desafios and extended incrementally by
+    ``add`` whenever a desafio is created; closed desafios are dropped with
+    ``remove``. Other workers create and close desafios too, so the index
+    also remembers the version of the collection it was built from and is
+    rebuilt when that changes.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.doc_terms: Dict[str, Dict[str, float]] = {}
+        self.doc_norms: Dict[str, float] = {}
+        self.built = False
+        self.version: Optional[Tuple[int, Optional[object]]] = None
+        self._checked = 0.0
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log((1 + len(self.doc_terms)) / (1 + df)) + 1.0
+
+    def _norm(self, terms: Dict[str, float]) -> float:
+        return math.sqrt(sum((tf * self.idf(term)) ** 2 for term, tf in terms.items())) or 1.0
+
+    def add(self, desafio_id: str, text: str):
+        if desafio_id in self.doc_terms:
+            self.remove(desafio_id)
+        terms = term_frequencies(text)
+        self.doc_terms[desafio_id] = terms
+        for term, tf in terms.items():
+            self.postings[term][desafio_id] = tf
+        # Norms of existing rows drift slightly as idf changes; they are
+        # refreshed on the next full rebuild
+        self.doc_norms[desafio_id] = self._norm(terms)
+
+    def remove(self, desafio_id: str):
+        terms = self.doc_terms.pop(desafio_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            bucket = self.postings.get(term)
+            if bucket is not None:
+                bucket.pop(desafio_id, None)
+                if not bucket:
+                    del self.postings[term]
+        self.doc_norms.pop(desafio_id, None)
+
+    def build(self, docs: Iterable[Tuple[str, str]]):
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        for desafio_id, text in docs:
+            terms = term_frequencies(text)
+            self.doc_terms[desafio_id] = terms
+            for term, tf in terms.items():
+                self.postings[term][desafio_id] = tf
+        self.doc_norms = {doc_id: self._norm(terms) for doc_id, terms in self.doc_terms.items()}
+        self.built = True
+
+    @staticmethod
+    async def collection_version(db) -> Tuple[int, Optional[object]]:
+        """(open desafios, newest criado_em): moves on any create, close, expiry or archive."""
+        abertos = await db.desafios.count_documents(archival.open_filter())
+        newest = await db.desafios.find({}, {"_id": 0, "criado_em": 1}).sort("criado_em", -1).to_list(1)
+        return abertos, newest[0].get("criado_em") if newest else None
+
+    async def ensure_built(self, db):
+        if self.built and time.monotonic() - self._checked < VERSION_CHECK_INTERVAL:
+            return
+        async with self._lock:
+            if self.built and time.monotonic() - self._checked < VERSION_CHECK_INTERVAL:
+                return
+            version = await self.collection_version(db)
+            self._checked = time.monotonic()
+            if self.built and version == self.version:
+                return
+            cursor = db.desafios.find(
+                archival.open_filter(), {"_id": 0, "id": 1, "titulo": 1, "descricao": 1, "descricao_truncada": 1}
+            )
+            desafios = await text_storage.expand(db, [d async for d in cursor], "descricao", text_storage.KIND_DESAFIO)
+            self.build((d["id"], desafio_text(d)) for d in desafios)
+            self.version = version
+
+    def query_vector(self, weighted_texts: Iterable[Tuple[str, float]]) -> Dict[str, float]:
+        # Combine the formando's respostas into one profile vector,
+        # each resposta weighted by its nota
+        profile: Dict[str, float] = defaultdict(float)
+        for text, weight in weighted_texts:
+            if weight <= 0:
+                continue
+            for term, tf in term_frequencies(text).items():
+                if term in self.postings:
+                    profile[term] += weight * tf * self.idf(term)
+        norm = math.sqrt(sum(v * v for v in profile.values()))
+        if not norm:
+            return {}
+        return {term: value / norm for term, value in profile.items()}
+
+    def top_n(self, vector: Dict[str, float], n: int, exclude: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        exclude = exclude or set()
+        scores: Dict[str, float] = defaultdict(float)
+        for term, q_weight in vector.items():
+            idf = self.idf(term)
+            for desafio_id, tf in self.postings.get(term, {}).items():
+                if desafio_id not in exclude:
+                    scores[desafio_id] += q_weight * tf * idf
+        ranked = sorted(
+            ((doc_id, score / self.doc_norms[doc_id]) for doc_id, score in scores.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return ranked[:n]
+
+
+def desafio_text(desafio: dict) -> str:
+    return f"{desafio.get('titulo', '')} {desafio.get('descricao', '')}"
+
+
+def nota_weight(nota: Optional[float]) -> float:
+    return (NOTA_NEUTRA if nota is None else nota) / 10.0
+
+
+desafio_index = TfidfIndex()
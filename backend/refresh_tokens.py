@@ -0,0 +1,123 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# A token presented again this soon after its rotation is a concurrent refresh
+# (two tabs racing), not a leak: it gets the same successor back
+GRACE_SECONDS = int(os.environ.get("REFRESH_TOKEN_GRACE_SECONDS", "30"))
+
+
+def hash_token(token: str) -> str:
+    # Refresh tokens are 256-bit random values, so a fast hash is enough:
+    # there is no low-entropy secret for an attacker to brute force
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def successor_token(token: str, chave: str) -> str:
+    # Deriving it needs both the presented token (held by the client) and the
+    # random key stored on its record, so neither a stolen old token nor a
+    # database read alone yields a usable successor
+    digest = hmac.new(chave.encode(), token.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+async def ensure_indexes(db):
+    # Expired tokens are removed by Mongo's TTL monitor
+    await db.refresh_tokens.create_index([("expira_em", ASCENDING)], expireAfterSeconds=0)
+    await db.refresh_tokens.create_index([("familia", ASCENDING)])
+
+
+async def issue(db, usuario: dict, expire_days: int, familia: Optional[str] = None,
+                token: Optional[str] = None) -> str:
+    """Store a new refresh token for the user and return its plain value."""
+    token = token or new_token()
+    agora = datetime.utcnow()
+    await db.refresh_tokens.insert_one({
+        "_id": hash_token(token),
+        "usuario_id": usuario["id"],
+        "user_type": usuario["tipo"],
+        "user_name": usuario["nome"],
+        "familia": familia or str(uuid.uuid4()),
+        "revogado": False,
+        "criado_em": agora,
+        "expira_em": agora + timedelta(days=expire_days),
+    })
+    return token
+
+
+async def rotate(db, token: str, expire_days: int, grace_seconds: int = GRACE_SECONDS) -> Optional[dict]:
+    """Consume a refresh token and return its record, or None if it is not usable.
+
+    The token is marked as revoked in the same indexed update that reads it,
+    so it can only be exchanged once. Presenting it again within
+    ``grace_seconds`` returns the same successor; any later reuse means it
+    leaked and the whole token family is revoked.
+    """
+    token_hash = hash_token(token)
+    agora = datetime.utcnow()
+    chave = new_token()
+    record = await db.refresh_tokens.find_one_and_update(
+        {"_id": token_hash, "revogado": False, "expira_em": {"$gt": agora}},
+        {"$set": {"revogado": True, "usado_em": agora, "chave_sucessor": chave}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if record is None:
+        reused = await db.refresh_tokens.find_one({"_id": token_hash, "revogado": True})
+        if reused is None:
+            return None
+        sucessor = await _grace_successor(db, reused, token, agora, grace_seconds, expire_days)
+        if sucessor is None:
+            await revoke_family(db, reused["familia"])
+            return None
+        return {**reused, "novo_token": sucessor}
+
+    record["novo_token"] = await _store_successor(db, record, successor_token(token, chave), expire_days)
+    return record
+
+
+async def _store_successor(db, record: dict, sucessor: str, expire_days: int) -> str:
+    # Stored by whichever of the racing requests gets there first
+    usuario = {"id": record["usuario_id"], "tipo": record["user_type"], "nome": record["user_name"]}
+    try:
+        await issue(db, usuario, expire_days, familia=record["familia"], token=sucessor)
+    except DuplicateKeyError:
+        pass
+    return sucessor
+
+
+async def _grace_successor(db, record: dict, token: str, agora: datetime, grace_seconds: int,
+                           expire_days: int) -> Optional[str]:
+    # Revoked by logout or reuse detection rather than by rotation: no grace
+    if "chave_sucessor" not in record or agora - record["usado_em"] > timedelta(seconds=grace_seconds):
+        return None
+    sucessor = successor_token(token, record["chave_sucessor"])
+    existing = await db.refresh_tokens.find_one({"_id": hash_token(sucessor)}, {"revogado": 1})
+    if existing is None:
+        # The winning request has not stored it yet
+        return await _store_successor(db, record, sucessor, expire_days)
+    # A successor already rotated or revoked is not handed out again
+    return None if existing["revogado"] else sucessor
+
+
+async def revoke(db, token: str):
+    record = await db.refresh_tokens.find_one_and_update(
+        {"_id": hash_token(token)}, {"$set": {"revogado": True}}
+    )
+    if record:
+        await revoke_family(db, record["familia"])
+
+
+async def revoke_family(db, familia: str):
+    await db.refresh_tokens.update_many({"familia": familia}, {"$set": {"revogado": True}})
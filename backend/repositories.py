@@ -0,0 +1,381 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+import archival
+import text_storage
+import user_listing
+
+# Data access for the core collections. Handlers talk to a ``Repositories``
+# bundle instead of the Motor database, so the app (and the benchmarks) can
+# run against the indexed in-memory backend without MongoDB.
+#
+# Filters are plain equality documents ({"campo": valor, ...}); operator
+# queries stay inside the backend-specific methods.
+#
+# Reads cover the hot collections; ``incluir_arquivados`` also reads the
+# archive collections filled by archival.archive_closed (Mongo only, the
+# memory backend never archives).
+
+BACKEND_MONGO = "mongo"
+BACKEND_MEMORY = "memory"
+BACKENDS = (BACKEND_MONGO, BACKEND_MEMORY)
+
+Sort = Optional[Tuple[str, int]]
+
+
+def _projection(fields: Optional[Iterable[str]], exclude: Iterable[str] = ()) -> Dict:
+    if fields is not None:
+        return {"_id": 0, **{field: 1 for field in fields}}
+    return {"_id": 0, **{field: 0 for field in exclude}}
+
+
+def _sort_key(field: str):
+    # Missing values sort first ascending, as in Mongo
+    return lambda doc: (doc.get(field) is not None, doc.get(field))
+
+
+class MotorRepository:
+    """Equality finds, counts and inserts over one Motor collection."""
+
+    # Internal fields never returned to handlers
+    hidden: Tuple[str, ...] = ()
+
+    def __init__(self, db, collection_name: str):
+        self.db = db
+        self.collection_name = collection_name
+        self.archive_name = archival.ARQUIVO.get(collection_name)
+
+    @property
+    def collection(self):
+        # Looked up per call so the deadline-aware database wrapper applies
+        return self.db[self.collection_name]
+
+    def _collections(self, incluir_arquivados: bool) -> list:
+        if incluir_arquivados and self.archive_name:
+            return [self.collection, self.db[self.archive_name]]
+        return [self.collection]
+
+    async def find_one(self, filtro: Dict, incluir_arquivados: bool = False) -> Optional[dict]:
+        for collection in self._collections(incluir_arquivados):
+            doc = await collection.find_one(filtro, _projection(None, self.hidden))
+            if doc is not None:
+                return doc
+        return None
+
+    async def find(self, filtro: Optional[Dict] = None, sort: Sort = None, limit: int = 1000,
+                   fields: Optional[List[str]] = None, incluir_arquivados: bool = False) -> List[dict]:
+        collections = self._collections(incluir_arquivados)
+        merge = sort is not None and len(collections) > 1
+        # The merge below needs the sort field even when the caller didn't ask for it
+        extra = merge and fields is not None and sort[0] not in fields
+        projection = _projection([*fields, sort[0]] if extra else fields, self.hidden)
+        docs: List[dict] = []
+        for collection in collections:
+            cursor = collection.find(filtro or {}, projection)
+            if sort is not None:
+                cursor = cursor.sort(*sort)
+            docs.extend(await cursor.to_list(limit))
+        if merge:
+            # Each collection came back sorted; merge them before cutting to the limit
+            docs.sort(key=_sort_key(sort[0]), reverse=sort[1] < 0)
+        docs = docs[:limit]
+        if extra:
+            for doc in docs:
+                doc.pop(sort[0], None)
+        return docs
+
+    async def count(self, filtro: Optional[Dict] = None, incluir_arquivados: bool = False) -> int:
+        total = 0
+        for collection in self._collections(incluir_arquivados):
+            total += await collection.count_documents(filtro or {})
+        return total
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one(dict(doc))
+
+    async def update(self, doc_id: str, campos: Dict) -> bool:
+        result = await self.collection.update_one({"id": doc_id}, {"$set": campos})
+        return result.matched_count > 0
+
+
+class MotorUsuarioRepository(MotorRepository):
+    def __init__(self, db):
+        super().__init__(db, "usuarios")
+
+    async def list_page(self, consulta: user_listing.Consulta) -> Tuple[List[dict], Optional[str]]:
+        cursor = self.collection.find(consulta.mongo_filter(), _projection(None, self.hidden))
+        cursor = cursor.sort(consulta.mongo_sort()).limit(consulta.limite + 1)
+        return consulta.page(await cursor.to_list(consulta.limite + 1))
+
+
+class MotorEmpresaRepository(MotorRepository):
+    def __init__(self, db):
+        super().__init__(db, "empresas")
+
+
+class MotorDesafioRepository(MotorRepository):
+    def __init__(self, db):
+        super().__init__(db, "desafios")
+
+    async def insert(self, doc: dict):
+        # Long descriptions are stored compressed aside; the document keeps an excerpt
+        doc = dict(doc)
+        await text_storage.store_side(self.db, text_storage.split_body(doc, "descricao", text_storage.KIND_DESAFIO))
+        await self.collection.insert_one(doc)
+
+    async def get_full(self, desafio_id: str, incluir_arquivados: bool = False) -> Optional[dict]:
+        doc = await self.find_one({"id": desafio_id}, incluir_arquivados)
+        if doc is not None:
+            await text_storage.expand(self.db, [doc], "descricao", text_storage.KIND_DESAFIO)
+        return doc
+
+
+class MotorRespostaRepository(MotorRepository):
+    hidden = ("minhash",)
+
+    def __init__(self, db, writer=None):
+        super().__init__(db, "respostas")
+        self.writer = writer
+
+    async def insert(self, doc: dict):
+        """Insert a resposta; raises DuplicateKeyError for a second answer to the same desafio."""
+        doc = dict(doc)
+        await text_storage.store_side(self.db, text_storage.split_body(doc, "texto", text_storage.KIND_RESPOSTA))
+        if self.writer is not None:
+            await self.writer.submit(doc)
+        else:
+            await self.collection.insert_one(doc)
+
+    async def get_full(self, resposta_id: str, incluir_arquivados: bool = False) -> Optional[dict]:
+        doc = await self.find_one({"id": resposta_id}, incluir_arquivados)
+        if doc is not None:
+            await text_storage.expand(self.db, [doc], "texto", text_storage.KIND_RESPOSTA)
+        return doc
+
+
+class MotorAvaliacaoRepository(MotorRepository):
+    def __init__(self, db):
+        super().__init__(db, "avaliacoes")
+
+    async def matches(self, nota_minima: float, limit: int = 1000, incluir_arquivados: bool = False) -> List[dict]:
+        # Avaliacoes carry the owning ids and display names, so no $lookup is needed
+        pipeline = [
+            {"$match": {"formando_id": {"$ne": None}, "empresa_id": {"$ne": None}}},
+            {"$project": {
+                "_id": 0, "formando_id": 1, "empresa_id": 1, "formando_nome": 1, "empresa_nome": 1,
+                "desafio_titulo": 1, "soma": "$nota", "total": {"$literal": 1},
+            }},
+        ]
+        if incluir_arquivados:
+            # Archived desafios contribute through their compact per-formando rows
+            pipeline.append({"$unionWith": {
+                "coll": archival.MATCHES_ARQUIVO,
+                "pipeline": [{"$project": {
+                    "_id": 0, "formando_id": 1, "empresa_id": 1, "formando_nome": 1, "empresa_nome": 1,
+                    "desafio_titulo": 1, "soma": 1, "total": 1,
+                }}],
+            }})
+        pipeline += [
+            {"$group": {
+                "_id": {"formando_id": "$formando_id", "empresa_id": "$empresa_id"},
+                "formando_nome": {"$first": "$formando_nome"},
+                "empresa_nome": {"$first": "$empresa_nome"},
+                "soma": {"$sum": "$soma"},
+                "total_respostas": {"$sum": "$total"},
+                "desafios": {"$addToSet": "$desafio_titulo"},
+            }},
+            {"$addFields": {"nota_media": {"$divide": ["$soma", "$total_respostas"]}}},
+            {"$match": {"nota_media": {"$gte": nota_minima}}},
+            {"$sort": {"nota_media": -1}},
+            {"$project": {"soma": 0}},
+        ]
+        rows = await self.collection.aggregate(pipeline).to_list(limit)
+        return [{**row.pop("_id"), **row} for row in rows]
+
+
+class MemoryRepository:
+    """Dict-backed collection with hash indexes on the fields handlers filter by.
+
+    Documents are keyed by their ``id``; each indexed field maps a value to
+    the ids holding it, kept in insertion order so results match Mongo's
+    natural order.
+    """
+
+    indexed: Tuple[str, ...] = ()
+    hidden: Tuple[str, ...] = ()
+
+    def __init__(self):
+        self.docs: Dict[str, dict] = {}
+        self.indexes: Dict[str, Dict[object, Dict[str, None]]] = {field: defaultdict(dict) for field in self.indexed}
+
+    def _candidates(self, filtro: Dict) -> Iterable[dict]:
+        for value in filtro.values():
+            if isinstance(value, dict):
+                raise ValueError("Backend em memória só aceita filtros de igualdade")
+        if "id" in filtro:
+            doc = self.docs.get(filtro["id"])
+            return [doc] if doc is not None else []
+        postings = [self.indexes[field].get(value, {}) for field, value in filtro.items() if field in self.indexes]
+        if postings:
+            return [self.docs[doc_id] for doc_id in min(postings, key=len)]
+        return self.docs.values()
+
+    def _matching(self, filtro: Dict) -> List[dict]:
+        return [doc for doc in self._candidates(filtro) if all(doc.get(k) == v for k, v in filtro.items())]
+
+    def _copy(self, doc: dict, fields: Optional[List[str]] = None) -> dict:
+        if fields is not None:
+            return {field: doc[field] for field in fields if field in doc}
+        return {k: v for k, v in doc.items() if k not in self.hidden}
+
+    async def find_one(self, filtro: Dict, incluir_arquivados: bool = False) -> Optional[dict]:
+        for doc in self._matching(filtro):
+            return self._copy(doc)
+        return None
+
+    async def find(self, filtro: Optional[Dict] = None, sort: Sort = None, limit: int = 1000,
+                   fields: Optional[List[str]] = None, incluir_arquivados: bool = False) -> List[dict]:
+        docs = self._matching(filtro or {})
+        if sort is not None:
+            field, direction = sort
+            docs = sorted(docs, key=_sort_key(field), reverse=direction < 0)
+        return [self._copy(doc, fields) for doc in docs[:limit]]
+
+    async def count(self, filtro: Optional[Dict] = None, incluir_arquivados: bool = False) -> int:
+        if not filtro:
+            return len(self.docs)
+        if len(filtro) == 1:
+            field, value = next(iter(filtro.items()))
+            if field in self.indexes and not isinstance(value, dict):
+                return len(self.indexes[field].get(value, ()))
+        return len(self._matching(filtro))
+
+    def _check_unique(self, doc: dict):
+        if doc["id"] in self.docs:
+            raise DuplicateKeyError(f"id duplicado: {doc['id']}")
+
+    async def insert(self, doc: dict):
+        self._check_unique(doc)
+        doc = dict(doc)
+        self.docs[doc["id"]] = doc
+        for field, index in self.indexes.items():
+            index[doc.get(field)][doc["id"]] = None
+
+    async def update(self, doc_id: str, campos: Dict) -> bool:
+        doc = self.docs.get(doc_id)
+        if doc is None:
+            return False
+        for field, value in campos.items():
+            if field in self.indexes:
+                self.indexes[field][doc.get(field)].pop(doc_id, None)
+                self.indexes[field][value][doc_id] = None
+            doc[field] = value
+        return True
+
+
+class MemoryUsuarioRepository(MemoryRepository):
+    indexed = ("email", "tipo")
+
+    async def list_page(self, consulta: user_listing.Consulta) -> Tuple[List[dict], Optional[str]]:
+        docs = self._matching({"tipo": consulta.tipo} if consulta.tipo is not None else {})
+        docs = sorted((doc for doc in docs if consulta.accepts(doc)), key=consulta.sort_key, reverse=consulta.direcao < 0)
+        return consulta.page(self._copy(doc) for doc in docs[:consulta.limite + 1])
+
+
+class MemoryEmpresaRepository(MemoryRepository):
+    indexed = ("usuario_id", "cnpj")
+
+
+class MemoryDesafioRepository(MemoryRepository):
+    indexed = ("empresa_id",)
+
+    async def get_full(self, desafio_id: str, incluir_arquivados: bool = False) -> Optional[dict]:
+        # Bodies are kept whole in memory, nothing to expand
+        return await self.find_one({"id": desafio_id})
+
+
+class MemoryRespostaRepository(MemoryRepository):
+    indexed = ("usuario_id", "desafio_id", "empresa_id")
+    hidden = ("minhash",)
+
+    def _check_unique(self, doc: dict):
+        # Same contract as the unique (usuario_id, desafio_id) index in Mongo
+        super()._check_unique(doc)
+        if self._matching({"usuario_id": doc["usuario_id"], "desafio_id": doc["desafio_id"]}):
+            raise DuplicateKeyError("Resposta duplicada para o desafio")
+
+    async def get_full(self, resposta_id: str, incluir_arquivados: bool = False) -> Optional[dict]:
+        return await self.find_one({"id": resposta_id})
+
+
+class MemoryAvaliacaoRepository(MemoryRepository):
+    indexed = ("resposta_id", "desafio_id", "empresa_id", "formando_id")
+
+    def _check_unique(self, doc: dict):
+        # Same contract as the unique resposta_id index in Mongo
+        super()._check_unique(doc)
+        if self._matching({"resposta_id": doc["resposta_id"]}):
+            raise DuplicateKeyError("Resposta já avaliada")
+
+    async def matches(self, nota_minima: float, limit: int = 1000, incluir_arquivados: bool = False) -> List[dict]:
+        grupos: Dict[Tuple[str, str], dict] = {}
+        for doc in self.docs.values():
+            if doc.get("formando_id") is None or doc.get("empresa_id") is None:
+                continue
+            chave = (doc["formando_id"], doc["empresa_id"])
+            grupo = grupos.get(chave)
+            if grupo is None:
+                grupo = grupos[chave] = {
+                    "formando_id": doc["formando_id"],
+                    "empresa_id": doc["empresa_id"],
+                    "formando_nome": doc.get("formando_nome"),
+                    "empresa_nome": doc.get("empresa_nome"),
+                    "soma": 0.0,
+                    "total_respostas": 0,
+                    "desafios": [],
+                }
+            grupo["soma"] += doc["nota"]
+            grupo["total_respostas"] += 1
+            if doc.get("desafio_titulo") not in grupo["desafios"]:
+                grupo["desafios"].append(doc.get("desafio_titulo"))
+        resultado = []
+        for grupo in grupos.values():
+            grupo["nota_media"] = grupo.pop("soma") / grupo["total_respostas"]
+            if grupo["nota_media"] >= nota_minima:
+                resultado.append(grupo)
+        resultado.sort(key=lambda g: g["nota_media"], reverse=True)
+        return resultado[:limit]
+
+
+class Repositories:
+    def __init__(self, backend: str, usuarios, empresas, desafios, respostas, avaliacoes):
+        self.backend = backend
+        self.usuarios = usuarios
+        self.empresas = empresas
+        self.desafios = desafios
+        self.respostas = respostas
+        self.avaliacoes = avaliacoes
+
+
+def motor_repositories(db, resposta_writer=None) -> Repositories:
+    return Repositories(
+        BACKEND_MONGO,
+        usuarios=MotorUsuarioRepository(db),
+        empresas=MotorEmpresaRepository(db),
+        desafios=MotorDesafioRepository(db),
+        respostas=MotorRespostaRepository(db, writer=resposta_writer),
+        avaliacoes=MotorAvaliacaoRepository(db),
+    )
+
+
+def memory_repositories() -> Repositories:
+    return Repositories(
+        BACKEND_MEMORY,
+        usuarios=MemoryUsuarioRepository(),
+        empresas=MemoryEmpresaRepository(),
+        desafios=MemoryDesafioRepository(),
+        respostas=MemoryRespostaRepository(),
+        avaliacoes=MemoryAvaliacaoRepository(),
+    )
@@ -1,31 +1,140 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ExecutionTimeout
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
 from datetime import datetime, timedelta
 import jwt
 from passlib.context import CryptContext
 import re
+from urllib.parse import quote
+from recommendations import desafio_index, desafio_text, nota_weight
+from near_duplicates import lsh_registry, minhash_signature
+import grade_analytics
+import activity_rollups
+import exports
+import refresh_tokens
+import text_storage
+import attachments
+import display_names
+import session_bootstrap
+import repositories
+import archival
+import user_listing
+from token_verification import KeyRing, VerifiedTokenCache
+from admission import AdmissionMiddleware, Rejected, admission_controller
+from metrics import registry as metrics_registry
+from deadlines import DeadlineDatabase, DeadlineExceeded, DeadlineMiddleware, clear_deadline
+from group_commit import GroupCommitWriter, parse_write_concern
+from query_audit import AuditedDatabase, QueryAuditMiddleware, query_auditor
+import profiling
+import compression
+import binary_ids
+from memory_tracking import MemoryTrackingMiddleware, memory_tracker
+from idempotency import IdempotencyMiddleware, IdempotencyStore
+import outbox
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
+# DATA_BACKEND=memory runs the core API on the in-memory repositories, without MongoDB
+DATA_BACKEND = os.environ.get('DATA_BACKEND', repositories.BACKEND_MONGO)
+if DATA_BACKEND not in repositories.BACKENDS:
+    raise RuntimeError(f"DATA_BACKEND inválido: {DATA_BACKEND}")
+MONGO_BACKEND = DATA_BACKEND == repositories.BACKEND_MONGO
+
+# MongoDB connection (Motor connects lazily, so memory mode never touches it)
+mongo_url = os.environ['MONGO_URL'] if MONGO_BACKEND else os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+raw_db = client[os.environ['DB_NAME'] if MONGO_BACKEND else os.environ.get('DB_NAME', 'inovation')]
+# Every collection call gets the request's remaining deadline as maxTimeMS
+db = DeadlineDatabase(raw_db)
+
+# Diagnostic mode: explain every query shape per route, see /api/admin/planos-consulta
+QUERY_AUDIT = MONGO_BACKEND and os.environ.get('QUERY_AUDIT', 'false').lower() == 'true'
+if QUERY_AUDIT:
+    db = AuditedDatabase(db, query_auditor, raw_db)
+
+# Core collections keyed by binary UUID _id with binary foreign keys; run migrate_ids.py first on existing data
+BINARY_IDS = MONGO_BACKEND and os.environ.get('BINARY_IDS', 'false').lower() == 'true'
+if BINARY_IDS:
+    db = binary_ids.IdCodecDatabase(db)
+
+# On-demand request profiling (X-Profile header or sampled fraction), see /api/admin/perfis
+PROFILING = os.environ.get('PROFILING', 'true').lower() == 'true'
+profiling.profiler.fracao = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+
+# Diagnostic mode: per-route tracemalloc peaks and allocation sites, see /api/admin/memoria
+MEMORY_TRACKING = os.environ.get('MEMORY_TRACKING', 'false').lower() == 'true'
+if MEMORY_TRACKING:
+    memory_tracker.start()
+
+# gzip/br/zstd responses; the public desafio and empresa lists are also served from precompressed bytes
+COMPRESSION = os.environ.get('COMPRESSION', 'true').lower() == 'true'
+payload_cache = compression.payload_cache
+
+# Idempotency-Key replay for the creation endpoints, stored on the raw database outside the request deadline
+idempotency_store = IdempotencyStore(raw_db.idempotencia if MONGO_BACKEND else None)
+
+# Derived rollups are applied from the outbox by a background worker, see /api/admin/outbox
+outbox_worker = outbox.OutboxWorker(db)
+user_counters = user_listing.UserCounters()
+if MONGO_BACKEND:
+    outbox_worker.register_metrics()
+
+# Closed desafios older than this are moved to the archive collections, see /api/admin/arquivamento
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '30'))
+
+# Large admin exports written to disk instead of streamed back
+EXPORT_DIR = Path(os.environ.get('EXPORT_DIR', ROOT_DIR / 'exports'))
+
+MAX_AVALIACOES_LOTE = 500
+DUPLICATE_KEY = 11000
+# Recommendation candidates fetched per slot, to make up for closed desafios still in the index
+RECOMENDACOES_SOBRA = 2
+
+# Optional group commit for resposta inserts during submission spikes
+RESPOSTA_GROUP_COMMIT = os.environ.get('RESPOSTA_GROUP_COMMIT', 'false').lower() == 'true'
+resposta_writer = GroupCommitWriter(
+    binary_ids.IdCodecCollection(raw_db.respostas, ids=True) if BINARY_IDS else raw_db.respostas,
+    max_batch=int(os.environ.get('RESPOSTA_GROUP_COMMIT_MAX_BATCH', '100')),
+    max_delay=int(os.environ.get('RESPOSTA_GROUP_COMMIT_MAX_DELAY_MS', '5')) / 1000.0,
+    max_flushes=int(os.environ.get('RESPOSTA_GROUP_COMMIT_MAX_FLUSHES', '4')),
+    write_concern=parse_write_concern(os.environ.get('RESPOSTA_WRITE_CONCERN_W'), os.environ.get('RESPOSTA_WRITE_CONCERN_J'))
+) if RESPOSTA_GROUP_COMMIT and MONGO_BACKEND else None
+
+# Core collections go through the repositories
+repos = (
+    repositories.motor_repositories(db, resposta_writer=resposta_writer) if MONGO_BACKEND
+    else repositories.memory_repositories()
+)
+
+# Optional shared secret for scraping /api/metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Resposta attachments: streamed to GridFS (default) or a local object directory
+ATTACHMENT_STORAGE = os.environ.get('ATTACHMENT_STORAGE', attachments.STORAGE_GRIDFS)
+attachment_storages = {
+    attachments.STORAGE_GRIDFS: attachments.GridFSStorage(raw_db),
+    attachments.STORAGE_LOCAL: attachments.LocalStorage(Path(os.environ.get('ATTACHMENT_DIR', ROOT_DIR / 'anexos'))),
+}
 
 # Security
 SECRET_KEY = "tcc_inovation_secret_key_2025"
-ALGORITHM = "HS256"
+# JWT_KEYS="kid1:secret1,kid2:secret2" enables rotation; JWT_ACTIVE_KID picks the signing key
+jwt_keyring = KeyRing.from_env(os.environ.get('JWT_KEYS'), os.environ.get('JWT_ACTIVE_KID'), SECRET_KEY)
+token_cache = VerifiedTokenCache(jwt_keyring, maxsize=int(os.environ.get('JWT_CACHE_SIZE', '10000')))
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', '30'))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
@@ -74,11 +183,17 @@ class Desafio(BaseModel):
     titulo: str
     descricao: str
     empresa_id: str
+    empresa_nome: Optional[str] = None
     criado_em: datetime = Field(default_factory=datetime.utcnow)
+    descricao_truncada: bool = False
+    status: str = archival.STATUS_ABERTO
+    prazo: Optional[datetime] = None
+    encerrado_em: Optional[datetime] = None
 
 class DesafioCreate(BaseModel):
     titulo: str
     descricao: str
+    prazo: Optional[datetime] = None
 
 class Resposta(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -86,29 +201,114 @@ class Resposta(BaseModel):
     desafio_id: str
     texto: str
     enviada_em: datetime = Field(default_factory=datetime.utcnow)
+    texto_truncado: bool = False
+    # Display copies kept in sync by display_names.sync
+    empresa_id: Optional[str] = None
+    empresa_nome: Optional[str] = None
+    desafio_titulo: Optional[str] = None
+    formando_nome: Optional[str] = None
+
+class DesafioRecomendado(Desafio):
+    similaridade: float
 
 class RespostaCreate(BaseModel):
     desafio_id: str
     texto: str
 
+class Anexo(BaseModel):
+    id: str
+    resposta_id: str
+    nome_arquivo: str
+    content_type: str
+    tamanho: int
+    sha256: str
+    enviado_em: datetime
+
+class ClusterDuplicatas(BaseModel):
+    resposta_ids: List[str]
+    usuario_ids: List[str]
+    similaridade: float
+
 class Avaliacao(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     resposta_id: str
     nota: float
     comentario: Optional[str] = None
     avaliado_em: datetime = Field(default_factory=datetime.utcnow)
+    # Owning ids and display copies so matches need no joins
+    desafio_id: Optional[str] = None
+    desafio_titulo: Optional[str] = None
+    empresa_id: Optional[str] = None
+    empresa_nome: Optional[str] = None
+    formando_id: Optional[str] = None
+    formando_nome: Optional[str] = None
 
 class AvaliacaoCreate(BaseModel):
     resposta_id: str
     nota: float
     comentario: Optional[str] = None
 
+class AvaliacaoLoteCreate(BaseModel):
+    avaliacoes: List[AvaliacaoCreate]
+
+class AvaliacaoLoteItem(BaseModel):
+    resposta_id: str
+    status: str  # criada, nota_invalida, duplicada_no_lote, nao_encontrada, sem_permissao, ja_avaliada
+    detalhe: Optional[str] = None
+    avaliacao: Optional[Avaliacao] = None
+
+class NotasAnalytics(BaseModel):
+    escopo: str
+    ref_id: Optional[str] = None
+    total: int
+    media: float
+    variancia: float
+    desvio_padrao: float
+    histograma: List[int]
+    percentis: Dict[str, Optional[float]]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
     user_type: str
     user_id: str
     user_name: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class AtividadeRecente(BaseModel):
+    tipo: str  # resposta, avaliacao
+    resposta_id: str
+    desafio_id: Optional[str] = None
+    desafio_titulo: Optional[str] = None
+    formando_nome: Optional[str] = None
+    empresa_nome: Optional[str] = None
+    nota: Optional[float] = None
+    em: datetime
+
+class SessionBootstrap(BaseModel):
+    usuario: Usuario
+    empresa: Optional[Empresa] = None
+    total_desafios: int
+    total_respostas: int
+    total_avaliacoes: int
+    avaliacoes_pendentes: int
+    atividade_recente: List[AtividadeRecente]
+
+class ProfilingConfig(BaseModel):
+    fracao: float = Field(ge=0, le=1)
+    renovar_token: bool = False
+
+class OutboxReplay(BaseModel):
+    desde: Optional[datetime] = None
+
+class UsuarioPagina(BaseModel):
+    usuarios: List[Usuario]
+    # Cached totals per tipo and "todos"; the filtered range itself is not counted
+    totais: Dict[str, int]
+    proximo_cursor: Optional[str] = None
 
 class MatchResult(BaseModel):
     formando_id: str
@@ -130,7 +330,7 @@ def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_keyring.encode(to_encode)
     return encoded_jwt
 
 def validate_cnpj(cnpj: str) -> bool:
@@ -138,16 +338,43 @@ def validate_cnpj(cnpj: str) -> bool:
     cnpj = re.sub(r'[^0-9]', '', cnpj)
     return len(cnpj) == 14
 
+def require_mongo():
+    # Rollups, exports, attachments and the like have no in-memory implementation
+    if not MONGO_BACKEND:
+        raise HTTPException(status_code=503, detail="Recurso disponível apenas com o backend MongoDB")
+
+def check_account_rate(email: str, request: Request):
+    # Per-account limit on top of the per-IP limit applied by the middleware
+    try:
+        admission_controller.check_user(email, admission_controller.client_ip(request.scope))
+    except Rejected as rejected:
+        raise HTTPException(
+            status_code=rejected.status_code,
+            detail=rejected.detail,
+            headers={"Retry-After": rejected.retry_after_header}
+        )
+
+async def emit_event(evento: str, **dados):
+    # Appended before the entity is written; the worker skips events whose entity never appears
+    if MONGO_BACKEND:
+        await outbox_worker.emit(evento, dados)
+
+async def issue_refresh_token(user_doc: dict) -> Optional[str]:
+    # Sessions on the memory backend last until the access token expires
+    if MONGO_BACKEND:
+        return await refresh_tokens.issue(db, user_doc, REFRESH_TOKEN_EXPIRE_DAYS)
+    return None
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_cache.decode(credentials.credentials)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Token inválido")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Token inválido")
     
-    user = await db.usuarios.find_one({"id": user_id})
+    user = await repos.usuarios.find_one({"id": user_id})
     if user is None:
         raise HTTPException(status_code=401, detail="Usuário não encontrado")
     
@@ -159,9 +386,11 @@ async def root():
     return {"message": "TCC Inovation API - Conectando formandos e empresas!", "version": "1.0", "status": "active"}
 
 @api_router.post("/register", response_model=Token)
-async def register(user_data: UsuarioCreate):
+async def register(user_data: UsuarioCreate, request: Request):
+    check_account_rate(user_data.email, request)
+    
     # Check if user exists
-    existing_user = await db.usuarios.find_one({"email": user_data.email})
+    existing_user = await repos.usuarios.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email já cadastrado")
     
@@ -182,22 +411,29 @@ async def register(user_data: UsuarioCreate):
     # Save to database with senha_hash
     user_to_save = user.dict()
     user_to_save["senha_hash"] = user_dict["senha_hash"]
-    await db.usuarios.insert_one(user_to_save)
+    user_to_save.update(user_listing.search_fields(user_to_save))
+    await emit_event(outbox.EVENTO_USUARIO_REGISTRADO, id=user.id, tipo=user.tipo, em=user.criado_em)
+    await repos.usuarios.insert(user_to_save)
+    user_counters.bump(user.tipo)
     
     # Create access token
     access_token = create_access_token(data={"sub": user.id})
+    refresh_token = await issue_refresh_token(user_to_save)
     
     return Token(
         access_token=access_token,
         token_type="bearer",
         user_type=user.tipo,
         user_id=user.id,
-        user_name=user.nome
+        user_name=user.nome,
+        refresh_token=refresh_token
     )
 
 @api_router.post("/login", response_model=Token)
-async def login(login_data: UsuarioLogin):
-    user_doc = await db.usuarios.find_one({"email": login_data.email})
+async def login(login_data: UsuarioLogin, request: Request):
+    check_account_rate(login_data.email, request)
+    
+    user_doc = await repos.usuarios.find_one({"email": login_data.email})
     if not user_doc:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
@@ -206,19 +442,70 @@ async def login(login_data: UsuarioLogin):
     
     user = Usuario(**user_doc)
     access_token = create_access_token(data={"sub": user.id})
+    refresh_token = await issue_refresh_token(user_doc)
     
     return Token(
         access_token=access_token,
         token_type="bearer",
         user_type=user.tipo,
         user_id=user.id,
-        user_name=user.nome
+        user_name=user.nome,
+        refresh_token=refresh_token
     )
 
+@api_router.post("/token/refresh", response_model=Token, dependencies=[Depends(require_mongo)])
+async def refresh_access_token(refresh_data: RefreshTokenRequest):
+    # No password check here: one indexed update on the hashed token
+    record = await refresh_tokens.rotate(db, refresh_data.refresh_token, REFRESH_TOKEN_EXPIRE_DAYS)
+    if record is None:
+        raise HTTPException(status_code=401, detail="Refresh token inválido ou expirado")
+    
+    # The record only identifies the user; tipo and nome may have changed since it was issued
+    user_doc = await repos.usuarios.find_one({"id": record["usuario_id"]})
+    if user_doc is None:
+        await refresh_tokens.revoke_family(db, record["familia"])
+        raise HTTPException(status_code=401, detail="Usuário não encontrado")
+    
+    user = Usuario(**user_doc)
+    access_token = create_access_token(data={"sub": user.id})
+    
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user_type=user.tipo,
+        user_id=user.id,
+        user_name=user.nome,
+        refresh_token=record["novo_token"]
+    )
+
+@api_router.post("/logout", dependencies=[Depends(require_mongo)])
+async def logout(refresh_data: RefreshTokenRequest):
+    await refresh_tokens.revoke(db, refresh_data.refresh_token)
+    return {"message": "Sessão encerrada"}
+
 @api_router.get("/profile", response_model=Usuario)
 async def get_profile(current_user: Usuario = Depends(get_current_user)):
     return current_user
 
+@api_router.get("/me/bootstrap", response_model=SessionBootstrap)
+async def get_session_bootstrap(current_user: Usuario = Depends(get_current_user)):
+    # Everything the first page needs in one round-trip; counts and recent
+    # activity are gathered concurrently
+    empresa_doc = None
+    if current_user.tipo == UserType.EMPRESA:
+        empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+        resumo = await session_bootstrap.empresa_summary(repos, empresa_doc)
+    elif current_user.tipo == UserType.FORMANDO:
+        resumo = await session_bootstrap.formando_summary(repos, current_user.id)
+    else:
+        resumo = await session_bootstrap.admin_summary(repos)
+    
+    return SessionBootstrap(
+        usuario=current_user,
+        empresa=Empresa(**empresa_doc) if empresa_doc else None,
+        **resumo
+    )
+
 # Company Routes
 @api_router.post("/empresas", response_model=Empresa)
 async def create_empresa(empresa_data: EmpresaCreate, current_user: Usuario = Depends(get_current_user)):
@@ -226,7 +513,7 @@ async def create_empresa(empresa_data: EmpresaCreate, current_user: Usuario = De
         raise HTTPException(status_code=403, detail="Apenas empresas podem criar perfil empresarial")
     
     # Check if user already has a company
-    existing_empresa = await db.empresas.find_one({"usuario_id": current_user.id})
+    existing_empresa = await repos.empresas.find_one({"usuario_id": current_user.id})
     if existing_empresa:
         raise HTTPException(status_code=400, detail="Usuário já possui uma empresa cadastrada")
     
@@ -235,7 +522,7 @@ async def create_empresa(empresa_data: EmpresaCreate, current_user: Usuario = De
         raise HTTPException(status_code=400, detail="CNPJ inválido")
     
     # Check if CNPJ already exists
-    existing_cnpj = await db.empresas.find_one({"cnpj": empresa_data.cnpj})
+    existing_cnpj = await repos.empresas.find_one({"cnpj": empresa_data.cnpj})
     if existing_cnpj:
         raise HTTPException(status_code=400, detail="CNPJ já cadastrado")
     
@@ -243,12 +530,13 @@ async def create_empresa(empresa_data: EmpresaCreate, current_user: Usuario = De
     empresa_dict["usuario_id"] = current_user.id
     empresa = Empresa(**empresa_dict)
     
-    await db.empresas.insert_one(empresa.dict())
+    await repos.empresas.insert(empresa.dict())
+    payload_cache.invalidate("/api/empresas")
     return empresa
 
 @api_router.get("/empresas", response_model=List[Empresa])
 async def get_empresas():
-    empresas = await db.empresas.find().to_list(1000)
+    empresas = await repos.empresas.find()
     return [Empresa(**empresa) for empresa in empresas]
 
 @api_router.get("/empresas/me", response_model=Empresa)
@@ -256,7 +544,7 @@ async def get_my_empresa(current_user: Usuario = Depends(get_current_user)):
     if current_user.tipo != UserType.EMPRESA:
         raise HTTPException(status_code=403, detail="Apenas empresas podem acessar este endpoint")
     
-    empresa_doc = await db.empresas.find_one({"usuario_id": current_user.id})
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
     if not empresa_doc:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
     
@@ -269,34 +557,125 @@ async def create_desafio(desafio_data: DesafioCreate, current_user: Usuario = De
         raise HTTPException(status_code=403, detail="Apenas empresas podem criar desafios")
     
     # Get company
-    empresa_doc = await db.empresas.find_one({"usuario_id": current_user.id})
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
     if not empresa_doc:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
     
+    if desafio_data.prazo is not None and desafio_data.prazo <= datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Prazo deve ser uma data futura")
+    
     desafio_dict = desafio_data.dict()
     desafio_dict["empresa_id"] = empresa_doc["id"]
+    desafio_dict.update(display_names.desafio_fields(empresa_doc))
     desafio = Desafio(**desafio_dict)
     
-    await db.desafios.insert_one(desafio.dict())
+    await emit_event(outbox.EVENTO_DESAFIO_CRIADO, id=desafio.id, empresa_id=desafio.empresa_id, em=desafio.criado_em)
+    await repos.desafios.insert(desafio.dict())
+    payload_cache.invalidate("/api/desafios")
+    if desafio_index.built:
+        desafio_index.add(desafio.id, desafio_text(desafio.dict()))
     return desafio
 
 @api_router.get("/desafios", response_model=List[Desafio])
-async def get_desafios():
-    desafios = await db.desafios.find().to_list(1000)
+async def get_desafios(incluir_arquivados: bool = False):
+    desafios = await repos.desafios.find(incluir_arquivados=incluir_arquivados)
     return [Desafio(**desafio) for desafio in desafios]
 
 @api_router.get("/desafios/empresa", response_model=List[Desafio])
-async def get_empresa_desafios(current_user: Usuario = Depends(get_current_user)):
+async def get_empresa_desafios(incluir_arquivados: bool = False, current_user: Usuario = Depends(get_current_user)):
     if current_user.tipo != UserType.EMPRESA:
         raise HTTPException(status_code=403, detail="Apenas empresas podem acessar este endpoint")
     
-    empresa_doc = await db.empresas.find_one({"usuario_id": current_user.id})
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
     if not empresa_doc:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
     
-    desafios = await db.desafios.find({"empresa_id": empresa_doc["id"]}).to_list(1000)
+    desafios = await repos.desafios.find({"empresa_id": empresa_doc["id"]}, incluir_arquivados=incluir_arquivados)
     return [Desafio(**desafio) for desafio in desafios]
 
+@api_router.get("/desafios/recomendados", response_model=List[DesafioRecomendado], dependencies=[Depends(require_mongo)])
+async def get_desafios_recomendados(limite: int = 10, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.FORMANDO:
+        raise HTTPException(status_code=403, detail="Apenas formandos podem receber recomendações")
+    limite = max(1, min(limite, 50))
+    
+    await desafio_index.ensure_built(db)
+    
+    respostas = await db.respostas.find(
+        {"usuario_id": current_user.id}, {"_id": 0, "id": 1, "desafio_id": 1, "texto": 1, "texto_truncado": 1}
+    ).to_list(1000)
+    respostas = await text_storage.expand(db, respostas, "texto", text_storage.KIND_RESPOSTA)
+    respondidos = {r["desafio_id"] for r in respostas}
+    
+    # Weight each previous answer by the grade it received
+    avaliacoes = await db.avaliacoes.find(
+        {"resposta_id": {"$in": [r["id"] for r in respostas]}}, {"_id": 0, "resposta_id": 1, "nota": 1}
+    ).to_list(1000)
+    notas = {a["resposta_id"]: a["nota"] for a in avaliacoes}
+    
+    vector = desafio_index.query_vector((r["texto"], nota_weight(notas.get(r["id"]))) for r in respostas)
+    agora = datetime.utcnow()
+    
+    # Candidates are over-fetched: desafios past their prazo or archived since the
+    # index was built resolve to no open document and are dropped from the index
+    scores: Dict[str, float] = {}
+    docs = []
+    vistos = set(respondidos)
+    while len(docs) < limite:
+        ranked = desafio_index.top_n(vector, limite * RECOMENDACOES_SOBRA, exclude=vistos)
+        if not ranked:
+            break
+        scores.update(ranked)
+        ids = [desafio_id for desafio_id, _ in ranked]
+        abertos = await db.desafios.find({"id": {"$in": ids}, **archival.open_filter(agora)}).to_list(len(ids))
+        encontrados = {d["id"] for d in abertos}
+        for desafio_id in ids:
+            if desafio_id not in encontrados:
+                desafio_index.remove(desafio_id)
+        docs.extend(abertos)
+        vistos.update(ids)
+        if len(ranked) < limite * RECOMENDACOES_SOBRA:
+            break
+    docs.sort(key=lambda d: scores[d["id"]], reverse=True)
+    docs = docs[:limite]
+    
+    if not docs:
+        # Cold start: no graded history yet, suggest the newest open desafios
+        docs = await db.desafios.find(
+            {"id": {"$nin": list(respondidos)}, **archival.open_filter(agora)}
+        ).sort("criado_em", -1).to_list(limite)
+    
+    return [DesafioRecomendado(**doc, similaridade=round(scores.get(doc["id"], 0.0), 4)) for doc in docs]
+
+@api_router.get("/desafios/{desafio_id}", response_model=Desafio)
+async def get_desafio(desafio_id: str, incluir_arquivados: bool = False):
+    desafio_doc = await repos.desafios.get_full(desafio_id, incluir_arquivados)
+    if not desafio_doc:
+        raise HTTPException(status_code=404, detail="Desafio não encontrado")
+    
+    return Desafio(**desafio_doc)
+
+@api_router.post("/desafios/{desafio_id}/encerrar", response_model=Desafio)
+async def encerrar_desafio(desafio_id: str, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.EMPRESA:
+        raise HTTPException(status_code=403, detail="Apenas empresas podem encerrar desafios")
+    
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+    if not empresa_doc:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+    
+    desafio_doc = await repos.desafios.find_one({"id": desafio_id, "empresa_id": empresa_doc["id"]})
+    if not desafio_doc:
+        raise HTTPException(status_code=404, detail="Desafio não encontrado ou não pertence à sua empresa")
+    if desafio_doc.get("status") == archival.STATUS_ENCERRADO:
+        raise HTTPException(status_code=400, detail="Desafio já encerrado")
+    
+    campos = {"status": archival.STATUS_ENCERRADO, "encerrado_em": datetime.utcnow()}
+    await repos.desafios.update(desafio_id, campos)
+    desafio_index.remove(desafio_id)
+    payload_cache.invalidate("/api/desafios")
+    return Desafio(**{**desafio_doc, **campos})
+
 # Response Routes
 @api_router.post("/respostas", response_model=Resposta)
 async def create_resposta(resposta_data: RespostaCreate, current_user: Usuario = Depends(get_current_user)):
@@ -304,12 +683,14 @@ async def create_resposta(resposta_data: RespostaCreate, current_user: Usuario =
         raise HTTPException(status_code=403, detail="Apenas formandos podem enviar respostas")
     
     # Check if challenge exists
-    desafio_doc = await db.desafios.find_one({"id": resposta_data.desafio_id})
+    desafio_doc = await repos.desafios.find_one({"id": resposta_data.desafio_id})
     if not desafio_doc:
         raise HTTPException(status_code=404, detail="Desafio não encontrado")
+    if archival.encerrado(desafio_doc):
+        raise HTTPException(status_code=400, detail="Desafio encerrado")
     
     # Check if user already answered this challenge
-    existing_resposta = await db.respostas.find_one({
+    existing_resposta = await repos.respostas.find_one({
         "usuario_id": current_user.id,
         "desafio_id": resposta_data.desafio_id
     })
@@ -318,36 +699,239 @@ async def create_resposta(resposta_data: RespostaCreate, current_user: Usuario =
     
     resposta_dict = resposta_data.dict()
     resposta_dict["usuario_id"] = current_user.id
+    resposta_dict.update(display_names.resposta_fields(desafio_doc, current_user.nome))
     resposta = Resposta(**resposta_dict)
     
-    await db.respostas.insert_one(resposta.dict())
+    # MinHash signature is stored alongside the resposta for duplicate detection
+    resposta_doc = resposta.dict()
+    resposta_doc["minhash"] = minhash_signature(resposta.texto)
+    await emit_event(outbox.EVENTO_RESPOSTA_CRIADA, id=resposta.id, empresa_id=desafio_doc["empresa_id"], em=resposta.enviada_em)
+    try:
+        await repos.respostas.insert(resposta_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Você já respondeu este desafio")
+    lsh_registry.add(resposta.desafio_id, resposta.id, resposta_doc["minhash"])
     return resposta
 
 @api_router.get("/respostas/desafio/{desafio_id}", response_model=List[Resposta])
-async def get_respostas_desafio(desafio_id: str, current_user: Usuario = Depends(get_current_user)):
+async def get_respostas_desafio(desafio_id: str, incluir_arquivados: bool = False, current_user: Usuario = Depends(get_current_user)):
     if current_user.tipo != UserType.EMPRESA:
         raise HTTPException(status_code=403, detail="Apenas empresas podem ver respostas")
     
     # Check if challenge belongs to user's company
-    empresa_doc = await db.empresas.find_one({"usuario_id": current_user.id})
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
     if not empresa_doc:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
     
-    desafio_doc = await db.desafios.find_one({"id": desafio_id, "empresa_id": empresa_doc["id"]})
+    desafio_doc = await repos.desafios.find_one({"id": desafio_id, "empresa_id": empresa_doc["id"]}, incluir_arquivados)
     if not desafio_doc:
         raise HTTPException(status_code=404, detail="Desafio não encontrado ou não pertence à sua empresa")
     
-    respostas = await db.respostas.find({"desafio_id": desafio_id}).to_list(1000)
+    respostas = await repos.respostas.find({"desafio_id": desafio_id}, incluir_arquivados=incluir_arquivados)
     return [Resposta(**resposta) for resposta in respostas]
 
+@api_router.get("/respostas/desafio/{desafio_id}/duplicadas", response_model=List[ClusterDuplicatas], dependencies=[Depends(require_mongo)])
+async def get_respostas_duplicadas(desafio_id: str, limiar: float = 0.8, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.EMPRESA:
+        raise HTTPException(status_code=403, detail="Apenas empresas podem ver respostas")
+    
+    if limiar <= 0 or limiar > 1:
+        raise HTTPException(status_code=400, detail="Limiar deve estar entre 0 e 1")
+    
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+    if not empresa_doc:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+    
+    desafio_doc = await repos.desafios.find_one({"id": desafio_id, "empresa_id": empresa_doc["id"]})
+    if not desafio_doc:
+        raise HTTPException(status_code=404, detail="Desafio não encontrado ou não pertence à sua empresa")
+    
+    index = await lsh_registry.get(db, desafio_id)
+    clusters = index.clusters(limiar)
+    if not clusters:
+        return []
+    
+    ids = [resposta_id for members, _ in clusters for resposta_id in members]
+    autores = await db.respostas.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "usuario_id": 1}).to_list(len(ids))
+    autor_por_resposta = {r["id"]: r["usuario_id"] for r in autores}
+    ausentes = [resposta_id for resposta_id in ids if resposta_id not in autor_por_resposta]
+    if ausentes:
+        # Archived or removed after the index was read
+        for resposta_id in ausentes:
+            index.remove(resposta_id)
+        clusters = index.clusters(limiar)
+    
+    return [
+        ClusterDuplicatas(
+            resposta_ids=members,
+            usuario_ids=[autor_por_resposta[m] for m in members],
+            similaridade=round(sim, 4)
+        )
+        for members, sim in clusters
+    ]
+
 @api_router.get("/respostas/me", response_model=List[Resposta])
-async def get_my_respostas(current_user: Usuario = Depends(get_current_user)):
+async def get_my_respostas(incluir_arquivados: bool = False, current_user: Usuario = Depends(get_current_user)):
     if current_user.tipo != UserType.FORMANDO:
         raise HTTPException(status_code=403, detail="Apenas formandos podem acessar este endpoint")
     
-    respostas = await db.respostas.find({"usuario_id": current_user.id}).to_list(1000)
+    respostas = await repos.respostas.find({"usuario_id": current_user.id}, incluir_arquivados=incluir_arquivados)
     return [Resposta(**resposta) for resposta in respostas]
 
+@api_router.get("/export/respostas", dependencies=[Depends(require_mongo)])
+async def export_respostas(
+    formato: str = exports.FORMATO_CSV,
+    desafio_id: Optional[str] = None,
+    arquivo: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+):
+    if formato not in exports.FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato inválido")
+    if formato == exports.FORMATO_PARQUET and not exports.parquet_available():
+        raise HTTPException(status_code=501, detail="Exportação parquet indisponível: instale pyarrow")
+    
+    if current_user.tipo == UserType.EMPRESA:
+        if arquivo:
+            raise HTTPException(status_code=403, detail="Apenas administradores podem exportar para arquivo")
+        empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+        if not empresa_doc:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        desafio_filter = {"empresa_id": empresa_doc["id"]}
+        if desafio_id:
+            desafio_filter["id"] = desafio_id
+        desafio_ids = await db.desafios.distinct("id", desafio_filter)
+        if desafio_id and not desafio_ids:
+            raise HTTPException(status_code=404, detail="Desafio não encontrado ou não pertence à sua empresa")
+        match = {"desafio_id": {"$in": desafio_ids}}
+    elif current_user.tipo == UserType.ADMIN:
+        match = {"desafio_id": desafio_id} if desafio_id else {}
+    else:
+        raise HTTPException(status_code=403, detail="Apenas empresas e administradores podem exportar respostas")
+    
+    # Exports are long-running by design; the longa admission class bounds them instead
+    clear_deadline()
+    filename = exports.export_filename(formato)
+    if arquivo:
+        destino = EXPORT_DIR / filename
+        tamanho = await exports.write_to_file(db, match, formato, destino)
+        return {"arquivo": str(destino), "bytes": tamanho}
+    
+    return StreamingResponse(
+        exports.encode(db, match, formato),
+        media_type=exports.MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def get_resposta_for_viewer(resposta_id: str, current_user: Usuario, full_text: bool = False,
+                                  incluir_arquivados: bool = False) -> dict:
+    if full_text:
+        resposta_doc = await repos.respostas.get_full(resposta_id, incluir_arquivados)
+    else:
+        resposta_doc = await repos.respostas.find_one({"id": resposta_id}, incluir_arquivados)
+    if not resposta_doc:
+        raise HTTPException(status_code=404, detail="Resposta não encontrada")
+    
+    if current_user.tipo == UserType.FORMANDO:
+        if resposta_doc["usuario_id"] != current_user.id:
+            raise HTTPException(status_code=403, detail="Você não pode ver esta resposta")
+    elif current_user.tipo == UserType.EMPRESA:
+        empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+        if not empresa_doc:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        desafio_doc = await repos.desafios.find_one(
+            {"id": resposta_doc["desafio_id"], "empresa_id": empresa_doc["id"]}, incluir_arquivados
+        )
+        if not desafio_doc:
+            raise HTTPException(status_code=403, detail="Você não pode ver esta resposta")
+    
+    return resposta_doc
+
+@api_router.get("/respostas/{resposta_id}", response_model=Resposta)
+async def get_resposta(resposta_id: str, incluir_arquivados: bool = False, current_user: Usuario = Depends(get_current_user)):
+    resposta_doc = await get_resposta_for_viewer(resposta_id, current_user, full_text=True, incluir_arquivados=incluir_arquivados)
+    return Resposta(**resposta_doc)
+
+# Attachment Routes
+@api_router.post("/respostas/{resposta_id}/anexos", response_model=List[Anexo], dependencies=[Depends(require_mongo)])
+async def upload_anexos(resposta_id: str, request: Request, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.FORMANDO:
+        raise HTTPException(status_code=403, detail="Apenas formandos podem anexar arquivos")
+    
+    resposta_doc = await db.respostas.find_one({"id": resposta_id, "usuario_id": current_user.id}, {"_id": 0, "id": 1})
+    if not resposta_doc:
+        raise HTTPException(status_code=404, detail="Resposta não encontrada")
+    
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Envie os arquivos como multipart/form-data")
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > attachments.MAX_BYTES * attachments.MAX_FILES_PER_UPLOAD:
+        raise HTTPException(status_code=413, detail="Envio excede o tamanho máximo")
+    
+    # Upload time depends on the client's bandwidth, not on the database
+    clear_deadline()
+    storage = attachment_storages[ATTACHMENT_STORAGE]
+    try:
+        armazenados = await attachments.receive_multipart(content_type, request.stream(), storage)
+    except attachments.AttachmentError as error:
+        raise HTTPException(status_code=error.status_code, detail=error.detail)
+    
+    if not armazenados:
+        raise HTTPException(status_code=400, detail="Nenhum arquivo enviado")
+    
+    docs = [attachments.new_metadata(resposta_id, current_user.id, ATTACHMENT_STORAGE, item) for item in armazenados]
+    try:
+        await db.anexos.insert_many(docs)
+    except BaseException:
+        # Without their metadata the stored files can never be listed or deleted
+        await db.anexos.delete_many({"id": {"$in": [doc["id"] for doc in docs]}})
+        for item in armazenados:
+            await storage.delete(item["storage_key"])
+        raise
+    return [Anexo(**doc) for doc in docs]
+
+@api_router.get("/respostas/{resposta_id}/anexos", response_model=List[Anexo], dependencies=[Depends(require_mongo)])
+async def get_anexos_resposta(resposta_id: str, current_user: Usuario = Depends(get_current_user)):
+    await get_resposta_for_viewer(resposta_id, current_user)
+    
+    anexos = await db.anexos.find({"resposta_id": resposta_id}).to_list(100)
+    return [Anexo(**anexo) for anexo in anexos]
+
+@api_router.get("/anexos/{anexo_id}", dependencies=[Depends(require_mongo)])
+async def download_anexo(anexo_id: str, range: Optional[str] = Header(None), current_user: Usuario = Depends(get_current_user)):
+    anexo_doc = await db.anexos.find_one({"id": anexo_id})
+    if not anexo_doc:
+        raise HTTPException(status_code=404, detail="Anexo não encontrado")
+    
+    await get_resposta_for_viewer(anexo_doc["resposta_id"], current_user)
+    
+    tamanho = anexo_doc["tamanho"]
+    try:
+        intervalo = attachments.parse_range(range, tamanho)
+    except attachments.AttachmentError as error:
+        raise HTTPException(status_code=error.status_code, detail=error.detail, headers={"Content-Range": f"bytes */{tamanho}"})
+    
+    inicio, fim = intervalo or (0, tamanho - 1)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(max(fim - inicio + 1, 0)),
+        "ETag": f'"{anexo_doc["sha256"]}"',
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(anexo_doc['nome_arquivo'])}",
+        # The content type is the one the uploader declared; never let the browser sniff another
+        "X-Content-Type-Options": "nosniff",
+    }
+    if intervalo:
+        headers["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+    
+    clear_deadline()
+    storage = attachment_storages[anexo_doc["storage"]]
+    return StreamingResponse(
+        storage.read(anexo_doc["storage_key"], inicio, fim - inicio + 1),
+        status_code=206 if intervalo else 200,
+        media_type=anexo_doc["content_type"],
+        headers=headers
+    )
+
 # Evaluation Routes
 @api_router.post("/avaliacoes", response_model=Avaliacao)
 async def create_avaliacao(avaliacao_data: AvaliacaoCreate, current_user: Usuario = Depends(get_current_user)):
@@ -355,15 +939,15 @@ async def create_avaliacao(avaliacao_data: AvaliacaoCreate, current_user: Usuari
         raise HTTPException(status_code=403, detail="Apenas empresas podem avaliar respostas")
     
     # Check if response exists and belongs to company's challenge
-    resposta_doc = await db.respostas.find_one({"id": avaliacao_data.resposta_id})
+    resposta_doc = await repos.respostas.find_one({"id": avaliacao_data.resposta_id})
     if not resposta_doc:
         raise HTTPException(status_code=404, detail="Resposta não encontrada")
     
-    empresa_doc = await db.empresas.find_one({"usuario_id": current_user.id})
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
     if not empresa_doc:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
     
-    desafio_doc = await db.desafios.find_one({
+    desafio_doc = await repos.desafios.find_one({
         "id": resposta_doc["desafio_id"],
         "empresa_id": empresa_doc["id"]
     })
@@ -371,7 +955,7 @@ async def create_avaliacao(avaliacao_data: AvaliacaoCreate, current_user: Usuari
         raise HTTPException(status_code=403, detail="Você não pode avaliar esta resposta")
     
     # Check if already evaluated
-    existing_avaliacao = await db.avaliacoes.find_one({"resposta_id": avaliacao_data.resposta_id})
+    existing_avaliacao = await repos.avaliacoes.find_one({"resposta_id": avaliacao_data.resposta_id})
     if existing_avaliacao:
         raise HTTPException(status_code=400, detail="Resposta já foi avaliada")
     
@@ -379,96 +963,192 @@ async def create_avaliacao(avaliacao_data: AvaliacaoCreate, current_user: Usuari
     if avaliacao_data.nota < 0 or avaliacao_data.nota > 10:
         raise HTTPException(status_code=400, detail="Nota deve estar entre 0 e 10")
     
-    avaliacao = Avaliacao(**avaliacao_data.dict())
-    await db.avaliacoes.insert_one(avaliacao.dict())
+    formando_nome = resposta_doc.get("formando_nome")
+    if formando_nome is None:
+        # Respostas written before names were embedded
+        formando_doc = await repos.usuarios.find_one({"id": resposta_doc["usuario_id"]})
+        formando_nome = formando_doc["nome"] if formando_doc else None
+    avaliacao = Avaliacao(
+        **avaliacao_data.dict(),
+        **display_names.avaliacao_fields(resposta_doc, empresa_doc, desafio_doc["titulo"], formando_nome)
+    )
+    await emit_event(
+        outbox.EVENTO_AVALIACAO_CRIADA,
+        id=avaliacao.id, nota=avaliacao.nota, desafio_id=desafio_doc["id"], empresa_id=empresa_doc["id"], em=avaliacao.avaliado_em
+    )
+    try:
+        await repos.avaliacoes.insert(avaliacao.dict())
+    except DuplicateKeyError:
+        # Graded concurrently since the check above; the unique resposta_id index decides
+        raise HTTPException(status_code=400, detail="Resposta já foi avaliada")
     return avaliacao
 
+@api_router.post("/avaliacoes/lote", response_model=List[AvaliacaoLoteItem], dependencies=[Depends(require_mongo)])
+async def create_avaliacoes_lote(lote: AvaliacaoLoteCreate, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.EMPRESA:
+        raise HTTPException(status_code=403, detail="Apenas empresas podem avaliar respostas")
+    
+    if len(lote.avaliacoes) > MAX_AVALIACOES_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_AVALIACOES_LOTE} avaliações por lote")
+    
+    empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+    if not empresa_doc:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+    
+    resultados = {}
+    pendentes = {}
+    repetidos = set()
+    for indice, item in enumerate(lote.avaliacoes):
+        if item.resposta_id in pendentes or item.resposta_id in resultados:
+            repetidos.add(indice)
+        elif item.nota < 0 or item.nota > 10:
+            resultados[item.resposta_id] = AvaliacaoLoteItem(
+                resposta_id=item.resposta_id, status="nota_invalida", detalhe="Nota deve estar entre 0 e 10"
+            )
+        else:
+            pendentes[item.resposta_id] = item
+    
+    # Ownership for the whole batch: one $in query joined to the empresa's desafios
+    respostas = await db.respostas.aggregate([
+        {"$match": {"id": {"$in": list(pendentes)}}},
+        # let/$expr form: localField together with a pipeline needs MongoDB 5.0
+        {"$lookup": {
+            "from": "desafios",
+            "let": {"desafio_id": "$desafio_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$id", "$$desafio_id"]}, "empresa_id": empresa_doc["id"]}},
+                {"$project": {"_id": 0, "id": 1, "titulo": 1}}
+            ],
+            "as": "desafio"
+        }},
+        {"$project": {
+            "_id": 0, "id": 1, "desafio_id": 1, "usuario_id": 1, "formando_nome": 1,
+            "desafio_titulo": {"$arrayElemAt": ["$desafio.titulo", 0]},
+            "proprio": {"$gt": [{"$size": "$desafio"}, 0]}
+        }}
+    ]).to_list(len(pendentes) or 1)
+    encontradas = {r["id"]: r for r in respostas}
+    nomes = await display_names.formando_nomes(db, [r for r in respostas if r["proprio"]])
+    
+    # Already graded ones: one existence query
+    ja_avaliadas = set(await db.avaliacoes.distinct("resposta_id", {"resposta_id": {"$in": list(pendentes)}}))
+    
+    novas = []
+    for resposta_id, item in pendentes.items():
+        resposta_doc = encontradas.get(resposta_id)
+        if resposta_doc is None:
+            resultados[resposta_id] = AvaliacaoLoteItem(resposta_id=resposta_id, status="nao_encontrada", detalhe="Resposta não encontrada")
+        elif not resposta_doc["proprio"]:
+            resultados[resposta_id] = AvaliacaoLoteItem(resposta_id=resposta_id, status="sem_permissao", detalhe="Você não pode avaliar esta resposta")
+        elif resposta_id in ja_avaliadas:
+            resultados[resposta_id] = AvaliacaoLoteItem(resposta_id=resposta_id, status="ja_avaliada", detalhe="Resposta já foi avaliada")
+        else:
+            avaliacao = Avaliacao(**item.dict(), **display_names.avaliacao_fields(
+                resposta_doc, empresa_doc, resposta_doc["desafio_titulo"], nomes.get(resposta_doc["usuario_id"])
+            ))
+            novas.append((avaliacao, resposta_doc["desafio_id"]))
+            resultados[resposta_id] = AvaliacaoLoteItem(resposta_id=resposta_id, status="criada", avaliacao=avaliacao)
+    
+    if novas:
+        await outbox_worker.emit_many([
+            (outbox.EVENTO_AVALIACAO_CRIADA, {
+                "id": a.id, "nota": a.nota, "desafio_id": desafio_id, "empresa_id": empresa_doc["id"], "em": a.avaliado_em,
+            })
+            for a, desafio_id in novas
+        ])
+        try:
+            await db.avaliacoes.bulk_write([InsertOne(avaliacao.dict()) for avaliacao, _ in novas], ordered=False)
+        except BulkWriteError as exc:
+            # Respostas graded concurrently since the distinct above hit the unique resposta_id index
+            erros = exc.details.get("writeErrors", [])
+            if exc.details.get("writeConcernErrors") or any(e["code"] != DUPLICATE_KEY for e in erros):
+                raise
+            for erro in erros:
+                resposta_id = novas[erro["index"]][0].resposta_id
+                resultados[resposta_id] = AvaliacaoLoteItem(resposta_id=resposta_id, status="ja_avaliada", detalhe="Resposta já foi avaliada")
+    
+    return [
+        AvaliacaoLoteItem(resposta_id=item.resposta_id, status="duplicada_no_lote", detalhe="Resposta repetida no lote")
+        if indice in repetidos else resultados[item.resposta_id]
+        for indice, item in enumerate(lote.avaliacoes)
+    ]
+
 @api_router.get("/avaliacoes/resposta/{resposta_id}", response_model=Avaliacao)
-async def get_avaliacao_resposta(resposta_id: str):
-    avaliacao_doc = await db.avaliacoes.find_one({"resposta_id": resposta_id})
+async def get_avaliacao_resposta(resposta_id: str, incluir_arquivados: bool = False):
+    avaliacao_doc = await repos.avaliacoes.find_one({"resposta_id": resposta_id}, incluir_arquivados)
     if not avaliacao_doc:
         raise HTTPException(status_code=404, detail="Avaliação não encontrada")
     
     return Avaliacao(**avaliacao_doc)
 
+# Analytics Routes
+@api_router.get("/analytics/notas/desafio/{desafio_id}", response_model=NotasAnalytics, dependencies=[Depends(require_mongo)])
+async def get_notas_desafio(desafio_id: str, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo == UserType.EMPRESA:
+        empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+        if not empresa_doc:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        desafio_doc = await repos.desafios.find_one({"id": desafio_id, "empresa_id": empresa_doc["id"]})
+        if not desafio_doc:
+            raise HTTPException(status_code=404, detail="Desafio não encontrado ou não pertence à sua empresa")
+    elif current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas empresas e administradores podem ver estatísticas")
+    
+    resumo = await grade_analytics.get_rollup(db, grade_analytics.ESCOPO_DESAFIO, desafio_id)
+    return NotasAnalytics(escopo=grade_analytics.ESCOPO_DESAFIO, ref_id=desafio_id, **resumo)
+
+@api_router.get("/analytics/notas/empresa", response_model=NotasAnalytics, dependencies=[Depends(require_mongo)])
+async def get_notas_empresa(empresa_id: Optional[str] = None, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo == UserType.EMPRESA:
+        empresa_doc = await repos.empresas.find_one({"usuario_id": current_user.id})
+        if not empresa_doc:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        empresa_id = empresa_doc["id"]
+    elif current_user.tipo == UserType.ADMIN:
+        if not empresa_id:
+            raise HTTPException(status_code=400, detail="Informe empresa_id")
+    else:
+        raise HTTPException(status_code=403, detail="Apenas empresas e administradores podem ver estatísticas")
+    
+    resumo = await grade_analytics.get_rollup(db, grade_analytics.ESCOPO_EMPRESA, empresa_id)
+    return NotasAnalytics(escopo=grade_analytics.ESCOPO_EMPRESA, ref_id=empresa_id, **resumo)
+
+@api_router.get("/analytics/notas/plataforma", response_model=NotasAnalytics, dependencies=[Depends(require_mongo)])
+async def get_notas_plataforma(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    resumo = await grade_analytics.get_rollup(db, grade_analytics.ESCOPO_PLATAFORMA)
+    return NotasAnalytics(escopo=grade_analytics.ESCOPO_PLATAFORMA, **resumo)
+
+@api_router.post("/admin/analytics/notas/rebuild", dependencies=[Depends(require_mongo)])
+async def rebuild_notas_analytics(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    # A full re-aggregation that holds the outbox fence; let it finish. Events are
+    # not applied meanwhile, so none is lost or counted twice
+    clear_deadline()
+    processadas = await outbox_worker.rebuild_projection(
+        outbox.PROJECAO_NOTAS, lambda marcar: grade_analytics.rebuild_rollups(db, marcar)
+    )
+    return {"avaliacoes_processadas": processadas}
+
 # Matching Routes
 @api_router.get("/matches", response_model=List[MatchResult])
-async def get_matches(current_user: Usuario = Depends(get_current_user)):
-    # Aggregate pipeline to calculate matches
-    pipeline = [
-        {
-            "$lookup": {
-                "from": "avaliacoes",
-                "localField": "id",
-                "foreignField": "resposta_id",
-                "as": "avaliacao"
-            }
-        },
-        {
-            "$match": {
-                "avaliacao": {"$ne": []}
-            }
-        },
-        {
-            "$lookup": {
-                "from": "usuarios",
-                "localField": "usuario_id",
-                "foreignField": "id",
-                "as": "formando"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "desafios",
-                "localField": "desafio_id",
-                "foreignField": "id",
-                "as": "desafio"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "empresas",
-                "localField": "desafio.empresa_id",
-                "foreignField": "id",
-                "as": "empresa"
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "formando_id": "$usuario_id",
-                    "empresa_id": {"$arrayElemAt": ["$empresa.id", 0]}
-                },
-                "formando_nome": {"$first": {"$arrayElemAt": ["$formando.nome", 0]}},
-                "empresa_nome": {"$first": {"$arrayElemAt": ["$empresa.nome", 0]}},
-                "nota_media": {"$avg": {"$arrayElemAt": ["$avaliacao.nota", 0]}},
-                "total_respostas": {"$sum": 1},
-                "desafios": {"$addToSet": {"$arrayElemAt": ["$desafio.titulo", 0]}}
-            }
-        },
-        {
-            "$match": {
-                "nota_media": {"$gte": 7.0}  # Only show good matches (grade >= 7)
-            }
-        },
-        {
-            "$sort": {
-                "nota_media": -1
-            }
-        }
-    ]
-    
-    matches_cursor = db.respostas.aggregate(pipeline)
-    matches = await matches_cursor.to_list(1000)
+async def get_matches(incluir_arquivados: bool = False, current_user: Usuario = Depends(get_current_user)):
+    # Only show good matches (grade >= 7)
+    matches = await repos.avaliacoes.matches(nota_minima=7.0, incluir_arquivados=incluir_arquivados)
     
     results = []
     for match in matches:
+        titulos = [titulo for titulo in match["desafios"] if titulo]
         results.append(MatchResult(
-            formando_id=match["_id"]["formando_id"],
-            formando_nome=match["formando_nome"],
-            empresa_id=match["_id"]["empresa_id"],
-            empresa_nome=match["empresa_nome"],
-            desafio_titulo=match["desafios"][0] if match["desafios"] else "Múltiplos desafios",
+            formando_id=match["formando_id"],
+            formando_nome=match["formando_nome"] or "",
+            empresa_id=match["empresa_id"],
+            empresa_nome=match["empresa_nome"] or "",
+            desafio_titulo=titulos[0] if titulos else "Múltiplos desafios",
             nota_media=round(match["nota_media"], 2),
             total_respostas=match["total_respostas"]
         ))
@@ -476,25 +1156,46 @@ async def get_matches(current_user: Usuario = Depends(get_current_user)):
     return results
 
 # Admin Routes
-@api_router.get("/admin/usuarios", response_model=List[Usuario])
-async def get_all_usuarios(current_user: Usuario = Depends(get_current_user)):
+@api_router.get("/admin/usuarios", response_model=UsuarioPagina)
+async def get_all_usuarios(
+    tipo: Optional[str] = None,
+    nome: Optional[str] = None,
+    email: Optional[str] = None,
+    criado_de: Optional[datetime] = None,
+    criado_ate: Optional[datetime] = None,
+    ordem: Optional[str] = None,
+    direcao: int = 1,
+    cursor: Optional[str] = None,
+    limite: int = 50,
+    current_user: Usuario = Depends(get_current_user)
+):
     if current_user.tipo != UserType.ADMIN:
         raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
     
-    usuarios = await db.usuarios.find().to_list(1000)
-    return [Usuario(**usuario) for usuario in usuarios]
+    try:
+        consulta = user_listing.Consulta(tipo, nome, email, criado_de, criado_ate, ordem, direcao, cursor, limite)
+    except user_listing.ListagemInvalida as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    
+    usuarios, proximo_cursor = await repos.usuarios.list_page(consulta)
+    return UsuarioPagina(
+        usuarios=[Usuario(**usuario) for usuario in usuarios],
+        totais=await user_counters.totals(repos.usuarios),
+        proximo_cursor=proximo_cursor
+    )
 
 @api_router.get("/admin/stats")
 async def get_admin_stats(current_user: Usuario = Depends(get_current_user)):
     if current_user.tipo != UserType.ADMIN:
         raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
     
-    total_usuarios = await db.usuarios.count_documents({})
-    total_empresas = await db.empresas.count_documents({})
-    total_formandos = await db.usuarios.count_documents({"tipo": UserType.FORMANDO})
-    total_desafios = await db.desafios.count_documents({})
-    total_respostas = await db.respostas.count_documents({})
-    total_avaliacoes = await db.avaliacoes.count_documents({})
+    totais_usuarios = await user_counters.totals(repos.usuarios)
+    total_usuarios = totais_usuarios["todos"]
+    total_empresas = await repos.empresas.count()
+    total_formandos = totais_usuarios[UserType.FORMANDO]
+    total_desafios = await repos.desafios.count()
+    total_respostas = await repos.respostas.count()
+    total_avaliacoes = await repos.avaliacoes.count()
     
     return {
         "total_usuarios": total_usuarios,
@@ -505,9 +1206,200 @@ async def get_admin_stats(current_user: Usuario = Depends(get_current_user)):
         "total_avaliacoes": total_avaliacoes
     }
 
+@api_router.get("/admin/atividade", dependencies=[Depends(require_mongo)])
+async def get_admin_atividade(
+    metrica: str,
+    inicio: datetime,
+    fim: Optional[datetime] = None,
+    granularidade: str = activity_rollups.GRANULARIDADE_DIA,
+    dimensao: Optional[str] = None,
+    current_user: Usuario = Depends(get_current_user)
+):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    if metrica not in activity_rollups.METRICAS:
+        raise HTTPException(status_code=400, detail="Métrica inválida")
+    if granularidade not in activity_rollups.GRANULARIDADES:
+        raise HTTPException(status_code=400, detail="Granularidade inválida")
+    if dimensao is not None and dimensao not in activity_rollups.DIMENSOES:
+        raise HTTPException(status_code=400, detail="Dimensão inválida")
+    
+    inicio = activity_rollups.naive_utc(inicio)
+    fim = activity_rollups.naive_utc(fim) if fim else datetime.utcnow()
+    if fim < inicio:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    
+    return await activity_rollups.query_series(db, metrica, inicio, fim, granularidade, dimensao)
+
+@api_router.post("/admin/atividade/backfill", dependencies=[Depends(require_mongo)])
+async def backfill_admin_atividade(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    # Re-aggregates every source collection under the outbox fence, however long that takes
+    clear_deadline()
+    return await outbox_worker.rebuild_projection(
+        outbox.PROJECAO_ATIVIDADE, lambda marcar: activity_rollups.backfill(db, marcar=marcar)
+    )
+
+@api_router.post("/admin/consistencia/nomes", dependencies=[Depends(require_mongo)])
+async def sync_display_names(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    # Backfills and rename propagation can touch every document
+    clear_deadline()
+    resultado = await display_names.sync(db)
+    payload_cache.invalidate("/api/desafios")
+    return resultado
+
+@api_router.post("/admin/arquivamento", dependencies=[Depends(require_mongo)])
+async def archive_desafios(dias: Optional[int] = None, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    dias = ARCHIVE_AFTER_DAYS if dias is None else dias
+    if dias < 0:
+        raise HTTPException(status_code=400, detail="Número de dias inválido")
+    
+    # Moves every eligible desafio in batches, however long that takes
+    clear_deadline()
+    resultado = await archival.archive_closed(db, timedelta(days=dias))
+    payload_cache.invalidate("/api/desafios")
+    return resultado
+
+@api_router.get("/admin/outbox", dependencies=[Depends(require_mongo)])
+async def get_outbox_status(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    return await outbox_worker.status()
+
+@api_router.post("/admin/outbox/replay", dependencies=[Depends(require_mongo)])
+async def replay_outbox(replay: OutboxReplay, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    return await outbox_worker.replay(replay.desde)
+
+@api_router.get("/admin/planos-consulta", dependencies=[Depends(require_mongo)])
+async def get_query_plans(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    if not QUERY_AUDIT:
+        return {"ativo": False, "rotas": {}}
+    await query_auditor.drain()
+    return {"ativo": True, "rotas": query_auditor.report()}
+
+@api_router.delete("/admin/planos-consulta", dependencies=[Depends(require_mongo)])
+async def reset_query_plans(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    await query_auditor.drain()
+    query_auditor.reset()
+    return {"message": "Planos de consulta descartados"}
+
+@api_router.get("/admin/memoria")
+async def get_memory_report(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    return {
+        "ativo": memory_tracker.active,
+        "processo": memory_tracker.process(),
+        "rotas": memory_tracker.report(),
+    }
+
+@api_router.delete("/admin/memoria")
+async def reset_memory_report(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    memory_tracker.reset()
+    return {"message": "Medições de memória descartadas"}
+
+def _profiling_status() -> dict:
+    return {
+        "ativo": PROFILING,
+        "fracao": profiling.profiler.fracao,
+        "intervalo_ms": profiling.profiler.interval * 1000,
+        "capacidade": profiling.profiler.profiles.maxlen,
+        "cabecalho": "X-Profile",
+        "token": profiling.profiler.token,
+    }
+
+@api_router.get("/admin/perfis/config")
+async def get_profiling_config(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    return _profiling_status()
+
+@api_router.put("/admin/perfis/config")
+async def update_profiling_config(config: ProfilingConfig, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    profiling.profiler.fracao = config.fracao
+    if config.renovar_token:
+        profiling.profiler.renew_token()
+    return _profiling_status()
+
+@api_router.get("/admin/perfis")
+async def list_profiles(current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    return profiling.profiler.list()
+
+@api_router.get("/admin/perfis/{perfil_id}", response_class=PlainTextResponse)
+async def download_profile(perfil_id: str, current_user: Usuario = Depends(get_current_user)):
+    if current_user.tipo != UserType.ADMIN:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem acessar este endpoint")
+    
+    perfil = profiling.profiler.get(perfil_id)
+    if not perfil:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return PlainTextResponse(
+        profiling.collapsed(perfil),
+        headers={"Content-Disposition": f'attachment; filename="perfil_{perfil_id}.folded"'}
+    )
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(x_metrics_token: Optional[str] = Header(None)):
+    if METRICS_TOKEN and x_metrics_token != METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="Token de métricas inválido")
+    return metrics_registry.render()
+
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store, router=app.router)
+if PROFILING:
+    # Inside the deadline middleware, so it samples the task running the handler
+    app.add_middleware(profiling.ProfilingMiddleware, profiler=profiling.profiler, router=app.router)
+app.add_middleware(DeadlineMiddleware)
+if QUERY_AUDIT:
+    app.add_middleware(QueryAuditMiddleware, router=app.router)
+if MEMORY_TRACKING:
+    # Outside the deadline middleware: waiting for the tracker's turn does not spend the budget
+    app.add_middleware(MemoryTrackingMiddleware, tracker=memory_tracker, router=app.router)
+if COMPRESSION:
+    # Inside admission control, so cached payloads still count against the limits
+    app.add_middleware(compression.CompressionMiddleware, router=app.router, cache=payload_cache)
+app.add_middleware(AdmissionMiddleware, controller=admission_controller, router=app.router)
+
+@app.exception_handler(DeadlineExceeded)
+@app.exception_handler(ExecutionTimeout)
+async def deadline_exceeded_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Tempo limite da requisição excedido"},
+        headers={"Retry-After": "1"}
+    )
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -523,6 +1415,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def ensure_unique_index(collection, field: str):
+    """Replace the non-unique index on ``field``; it has the same key, which blocks creating both."""
+    antigos = []
+    async for index in collection.list_indexes():
+        if list(index["key"].items()) == [(field, ASCENDING)]:
+            if index.get("unique"):
+                return
+            antigos.append(index["name"])
+    # Scanned once, until the unique index exists
+    duplicado = await collection.aggregate([
+        {"$group": {"_id": f"${field}", "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+        {"$limit": 1},
+    ]).to_list(1)
+    if duplicado:
+        logger.error("Índice único em %s.%s não criado: valor repetido %r", collection.name, field, duplicado[0]["_id"])
+        await collection.create_index([(field, ASCENDING)])
+        return
+    for nome in antigos:
+        await collection.drop_index(nome)
+    await collection.create_index([(field, ASCENDING)], unique=True)
+
+@app.on_event("startup")
+async def create_indexes():
+    if not MONGO_BACKEND:
+        logger.info("Backend de dados em memória: MongoDB não será usado")
+        return
+    try:
+        await activity_rollups.ensure_indexes(db)
+        await refresh_tokens.ensure_indexes(db)
+        await display_names.ensure_indexes(db)
+        await idempotency_store.ensure_indexes()
+        await outbox_worker.ensure_indexes()
+        await archival.ensure_indexes(db)
+        # Lookups by public id and the login/ownership filters used by every route
+        await db.usuarios.create_index([("id", ASCENDING)])
+        await db.usuarios.create_index([("email", ASCENDING)])
+        # Compound (tipo, campo, id) indexes behind every admin listing filter/sort
+        await user_listing.ensure_indexes(db)
+        await user_listing.backfill(db)
+        await db.empresas.create_index([("id", ASCENDING)])
+        await db.empresas.create_index([("usuario_id", ASCENDING)])
+        await db.empresas.create_index([("cnpj", ASCENDING)])
+        await db.desafios.create_index([("id", ASCENDING)])
+        await db.respostas.create_index([("id", ASCENDING)])
+        # One avaliacao per resposta, also for concurrent single and batch grading
+        await ensure_unique_index(db.avaliacoes, "resposta_id")
+        await db.anexos.create_index([("id", ASCENDING)])
+        # Per-owner counts and recent activity for /me/bootstrap
+        await db.respostas.create_index([("empresa_id", ASCENDING), ("enviada_em", ASCENDING)])
+        await db.respostas.create_index([("usuario_id", ASCENDING), ("enviada_em", ASCENDING)])
+        await db.avaliacoes.create_index([("empresa_id", ASCENDING), ("avaliado_em", ASCENDING)])
+        await db.avaliacoes.create_index([("formando_id", ASCENDING), ("avaliado_em", ASCENDING)])
+        # One resposta per formando and desafio, also enforced for concurrent submissions
+        await db.respostas.create_index([("usuario_id", ASCENDING), ("desafio_id", ASCENDING)], unique=True)
+        await db.anexos.create_index([("resposta_id", ASCENDING)])
+        # After the indexes above, which the legacy checks use
+        resultado = await display_names.backfill(db)
+        if resultado is not None:
+            logger.info("Nomes embutidos preenchidos: %s", resultado)
+    except Exception:
+        logger.exception("Falha ao criar índices")
+
+@app.on_event("startup")
+async def start_outbox_worker():
+    if MONGO_BACKEND:
+        outbox_worker.start()
+    if resposta_writer is not None:
+        resposta_writer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await outbox_worker.stop()
+    if resposta_writer is not None:
+        await resposta_writer.close()
     client.close()
\ No newline at end of file
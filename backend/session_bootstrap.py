@@ -0,0 +1,96 @@
+import asyncio
+from typing import Dict, List, Optional
+
+# Everything a page needs on first paint, gathered concurrently for the
+# caller's role from the repositories. Counts and activity read the ids and
+# names embedded by display_names, so none of the queries joins; documents
+# written before those copies existed are filled in at startup by
+# display_names.backfill.
+
+ATIVIDADE_LIMITE = 5
+
+ATIVIDADE_RESPOSTA = "resposta"
+ATIVIDADE_AVALIACAO = "avaliacao"
+
+_RESPOSTA_FIELDS = ["id", "desafio_id", "desafio_titulo", "formando_nome", "empresa_nome", "enviada_em"]
+_AVALIACAO_FIELDS = ["resposta_id", "desafio_id", "desafio_titulo", "formando_nome", "empresa_nome", "nota", "avaliado_em"]
+
+
+def _latest(repository, filtro: Dict, fields: List[str], campo_data: str):
+    return repository.find(filtro, sort=(campo_data, -1), limit=ATIVIDADE_LIMITE, fields=fields)
+
+
+def _atividade(respostas: List[dict], avaliacoes: List[dict]) -> List[Dict]:
+    itens = [
+        {
+            "tipo": ATIVIDADE_RESPOSTA,
+            "resposta_id": r["id"],
+            "desafio_id": r["desafio_id"],
+            "desafio_titulo": r.get("desafio_titulo"),
+            "formando_nome": r.get("formando_nome"),
+            "empresa_nome": r.get("empresa_nome"),
+            "em": r["enviada_em"],
+        }
+        for r in respostas
+    ] + [
+        {
+            "tipo": ATIVIDADE_AVALIACAO,
+            "resposta_id": a["resposta_id"],
+            "desafio_id": a.get("desafio_id"),
+            "desafio_titulo": a.get("desafio_titulo"),
+            "formando_nome": a.get("formando_nome"),
+            "empresa_nome": a.get("empresa_nome"),
+            "nota": a["nota"],
+            "em": a["avaliado_em"],
+        }
+        for a in avaliacoes
+    ]
+    itens.sort(key=lambda item: item["em"], reverse=True)
+    return itens[:ATIVIDADE_LIMITE]
+
+
+async def _summary(repos, desafios_filtro: Dict, respostas_filtro: Dict, avaliacoes_filtro: Dict) -> Dict:
+    total_desafios, total_respostas, total_avaliacoes, respostas, avaliacoes = await asyncio.gather(
+        repos.desafios.count(desafios_filtro),
+        repos.respostas.count(respostas_filtro),
+        repos.avaliacoes.count(avaliacoes_filtro),
+        _latest(repos.respostas, respostas_filtro, _RESPOSTA_FIELDS, "enviada_em"),
+        _latest(repos.avaliacoes, avaliacoes_filtro, _AVALIACAO_FIELDS, "avaliado_em"),
+    )
+    return {
+        "total_desafios": total_desafios,
+        "total_respostas": total_respostas,
+        "total_avaliacoes": total_avaliacoes,
+        # Every avaliacao belongs to exactly one resposta
+        "avaliacoes_pendentes": max(total_respostas - total_avaliacoes, 0),
+        "atividade_recente": _atividade(respostas, avaliacoes),
+    }
+
+
+def _empty() -> Dict:
+    return {
+        "total_desafios": 0,
+        "total_respostas": 0,
+        "total_avaliacoes": 0,
+        "avaliacoes_pendentes": 0,
+        "atividade_recente": [],
+    }
+
+
+async def empresa_summary(repos, empresa_doc: Optional[dict]) -> Dict:
+    # An empresa user that has not created its profile yet has nothing to count
+    if empresa_doc is None:
+        return _empty()
+    empresa_id = empresa_doc["id"]
+    return await _summary(repos, {"empresa_id": empresa_id}, {"empresa_id": empresa_id}, {"empresa_id": empresa_id})
+
+
+async def formando_summary(repos, usuario_id: str) -> Dict:
+    resumo = await _summary(repos, {}, {"usuario_id": usuario_id}, {"formando_id": usuario_id})
+    # For formandos total_desafios counts the ones still open to answer
+    resumo["total_desafios"] = max(resumo["total_desafios"] - resumo["total_respostas"], 0)
+    return resumo
+
+
+async def admin_summary(repos) -> Dict:
+    return await _summary(repos, {}, {}, {})
@@ -0,0 +1,95 @@
+import os
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from bson import Binary
+
+try:
+    import zstandard
+except ImportError:  # zlib from the standard library is the fallback codec
+    zstandard = None
+
+# Bodies larger than this many UTF-8 bytes are moved to the side collection
+COMPRESS_THRESHOLD = int(os.environ.get("TEXT_COMPRESS_THRESHOLD", "2048"))
+EXCERPT_CHARS = int(os.environ.get("TEXT_EXCERPT_CHARS", "300"))
+
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+KIND_RESPOSTA = "resposta"
+KIND_DESAFIO = "desafio"
+
+# Inline flag marking that the stored field only holds the excerpt
+TRUNCATION_FLAGS = {
+    "texto": "texto_truncado",
+    "descricao": "descricao_truncada",
+}
+
+SIDE_COLLECTION = "textos_completos"
+
+
+def excerpt(text: str, limit: int = EXCERPT_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    if space > limit * 0.6:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+def compress(text: str, codec: str = DEFAULT_CODEC) -> bytes:
+    data = text.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data: bytes, codec: str) -> str:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Texto comprimido com zstd, mas zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def side_id(kind: str, owner_id: str) -> str:
+    return f"{kind}:{owner_id}"
+
+
+def split_body(doc: dict, field: str, kind: str) -> Optional[dict]:
+    """Replace a large body in ``doc`` with its excerpt and return the side document.
+
+    Returns None (and leaves ``doc`` untouched) for bodies under the threshold.
+    """
+    text = doc[field]
+    if len(text.encode("utf-8")) <= COMPRESS_THRESHOLD:
+        return None
+    doc[field] = excerpt(text)
+    doc[TRUNCATION_FLAGS[field]] = True
+    return {
+        "_id": side_id(kind, doc["id"]),
+        "codec": DEFAULT_CODEC,
+        "tamanho": len(text),
+        "dados": Binary(compress(text)),
+    }
+
+
+async def store_side(db, side_doc: Optional[dict]):
+    # Written before the owning document, so a truncated document always has its body
+    if side_doc is not None:
+        await db[SIDE_COLLECTION].replace_one({"_id": side_doc["_id"]}, side_doc, upsert=True)
+
+
+async def expand(db, docs: Iterable[dict], field: str, kind: str, id_field: str = "id") -> List[dict]:
+    """Restore full bodies in place for truncated docs with one $in query."""
+    docs = list(docs)
+    flag = TRUNCATION_FLAGS[field]
+    truncated: Dict[str, dict] = {side_id(kind, d[id_field]): d for d in docs if d.get(flag)}
+    if truncated:
+        async for side_doc in db[SIDE_COLLECTION].find({"_id": {"$in": list(truncated)}}):
+            owner = truncated[side_doc["_id"]]
+            owner[field] = decompress(side_doc["dados"], side_doc["codec"])
+            owner[flag] = False
+    return docs
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import jwt
+
+ALGORITHM = "HS256"
+
+
+class KeyRing:
+    """Signing keys by kid. New tokens use the active key, any listed key verifies."""
+
+    def __init__(self, keys: Dict[str, str], active_kid: str):
+        if active_kid not in keys:
+            raise ValueError(f"Chave JWT ativa '{active_kid}' não configurada")
+        self.keys = dict(keys)
+        self.active_kid = active_kid
+
+    @classmethod
+    def from_env(cls, spec: Optional[str], active_kid: Optional[str], fallback_secret: str) -> "KeyRing":
+        # spec format: "kid1:secret1,kid2:secret2"
+        keys: Dict[str, str] = {}
+        for item in (spec or "").split(","):
+            if ":" in item:
+                kid, secret = item.split(":", 1)
+                keys[kid.strip()] = secret.strip()
+        if not keys:
+            keys = {"default": fallback_secret}
+        return cls(keys, active_kid or next(iter(keys)))
+
+    @property
+    def active_secret(self) -> str:
+        return self.keys[self.active_kid]
+
+    def encode(self, claims: dict) -> str:
+        return jwt.encode(claims, self.active_secret, algorithm=ALGORITHM, headers={"kid": self.active_kid})
+
+    def decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is not None:
+            secret = self.keys.get(kid)
+            if secret is None:
+                raise jwt.InvalidKeyError("Chave desconhecida")
+            return jwt.decode(token, secret, algorithms=[ALGORITHM])
+        # Tokens issued before kids were introduced: try every active key
+        for secret in self.keys.values():
+            try:
+                return jwt.decode(token, secret, algorithms=[ALGORITHM])
+            except jwt.InvalidSignatureError:
+                continue
+        raise jwt.InvalidSignatureError("Assinatura inválida")
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of token -> verified claims.
+
+    Entries expire at the token's own ``exp``. The key ring is read from the
+    environment once per process, so rotating or revoking a key means a
+    restart, which also starts an empty cache. Callers get their own copy of
+    the claims and cannot alter the cached ones.
+    """
+
+    def __init__(self, keyring: KeyRing, maxsize: int = 10000):
+        self.keyring = keyring
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, token: str) -> dict:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                claims, exp = entry
+                if exp > now:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return dict(claims)
+                del self._entries[token]
+
+        self.misses += 1
+        claims = self.keyring.decode(token)
+        exp = claims.get("exp")
+        if exp is None:
+            return claims
+
+        with self._lock:
+            self._entries[token] = (dict(claims), float(exp))
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return claims
+
+    def __len__(self):
+        return len(self._entries)
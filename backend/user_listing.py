@@ -0,0 +1,210 @@
+import base64
+import json
+import re
+import time
+import unicodedata
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+# Server-side admin user listing. Every supported combination of filters and
+# sort is served by one (tipo, campo, id) or (campo, id) index: the optional
+# tipo is an equality prefix, and the prefix search or date range applies to
+# the sort field itself, so Mongo walks one index range in order and stops
+# after a page. Pages continue from an opaque keyset cursor (last value, id)
+# instead of skip, and totals come from cached per-tipo counters rather than
+# a count of the filtered range.
+
+ORDEM_CRIADO_EM = "criado_em"
+ORDEM_NOME = "nome"
+ORDEM_EMAIL = "email"
+
+# Sort key exposed by the API -> stored field
+CAMPOS_ORDEM = {
+    ORDEM_CRIADO_EM: "criado_em",
+    ORDEM_NOME: "nome_busca",
+    ORDEM_EMAIL: "email_busca",
+}
+
+TIPOS = ("admin", "empresa", "formando")
+
+MAX_LIMITE = 200
+COUNTS_TTL = 30.0
+BACKFILL_CHUNK = 1000
+
+
+class ListagemInvalida(ValueError):
+    pass
+
+
+def normalize(texto: str) -> str:
+    """Accent- and case-insensitive form of a name, used for prefix search and sorting."""
+    decomposed = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def search_fields(usuario_doc: dict) -> Dict:
+    # Emails are stored as submitted; searching and sorting use a lowercased copy
+    return {"nome_busca": normalize(usuario_doc["nome"]), "email_busca": normalize_email(usuario_doc["email"])}
+
+
+def encode_cursor(campo: str, valor, doc_id: str) -> str:
+    if isinstance(valor, datetime):
+        valor = {"$date": valor.isoformat()}
+    raw = json.dumps([campo, valor, doc_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, campo: str) -> Tuple[object, str]:
+    """The (value, id) to resume after; cursors are only valid for the sort they came from."""
+    try:
+        cursor_campo, valor, doc_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(valor, dict):
+            valor = datetime.fromisoformat(valor["$date"])
+        if cursor_campo != campo or not isinstance(doc_id, str):
+            raise ValueError(cursor_campo)
+    except (ValueError, TypeError, KeyError):
+        raise ListagemInvalida("Cursor inválido")
+    return valor, doc_id
+
+
+class Consulta:
+    """A validated listing request: which index range to walk and where to resume."""
+
+    def __init__(self, tipo: Optional[str] = None, nome: Optional[str] = None, email: Optional[str] = None,
+                 criado_de: Optional[datetime] = None, criado_ate: Optional[datetime] = None,
+                 ordem: Optional[str] = None, direcao: int = 1, cursor: Optional[str] = None, limite: int = 50):
+        if tipo is not None and tipo not in TIPOS:
+            raise ListagemInvalida("Tipo de usuário inválido")
+        if nome and email:
+            raise ListagemInvalida("Busque por nome ou por email, não ambos")
+        prefixo_ordem = ORDEM_NOME if nome else ORDEM_EMAIL if email else None
+        periodo = criado_de is not None or criado_ate is not None
+        ordem = ordem or prefixo_ordem or ORDEM_CRIADO_EM
+        if ordem not in CAMPOS_ORDEM:
+            raise ListagemInvalida("Ordenação inválida")
+        # The range must be on the sort field, otherwise no single index serves the page
+        if (prefixo_ordem and (periodo or ordem != prefixo_ordem)) or (periodo and ordem != ORDEM_CRIADO_EM):
+            raise ListagemInvalida("Combinação de filtros e ordenação não suportada")
+        if direcao not in (1, -1):
+            raise ListagemInvalida("Direção inválida")
+        if not 1 <= limite <= MAX_LIMITE:
+            raise ListagemInvalida(f"Limite deve estar entre 1 e {MAX_LIMITE}")
+
+        self.tipo = tipo
+        self.campo = CAMPOS_ORDEM[ordem]
+        self.prefixo = normalize(nome) if nome else normalize_email(email) if email else None
+        self.criado_de = criado_de
+        self.criado_ate = criado_ate
+        self.direcao = direcao
+        self.apos = decode_cursor(cursor, self.campo) if cursor else None
+        self.limite = limite
+
+    def accepts(self, doc: dict) -> bool:
+        """The same predicate as ``mongo_filter``, for the in-memory backend."""
+        valor = doc.get(self.campo)
+        if self.tipo is not None and doc.get("tipo") != self.tipo:
+            return False
+        if self.prefixo is not None and not (isinstance(valor, str) and valor.startswith(self.prefixo)):
+            return False
+        if self.criado_de is not None and not doc["criado_em"] >= self.criado_de:
+            return False
+        if self.criado_ate is not None and not doc["criado_em"] < self.criado_ate:
+            return False
+        if self.apos is not None:
+            chave, ultima = self.sort_key(doc), ((self.apos[0] is not None, self.apos[0]), self.apos[1])
+            return chave > ultima if self.direcao > 0 else chave < ultima
+        return True
+
+    def sort_key(self, doc: dict):
+        # Missing values sort first ascending, as in Mongo
+        valor = doc.get(self.campo)
+        return (valor is not None, valor), doc["id"]
+
+    def mongo_filter(self) -> Dict:
+        condicoes = []
+        if self.tipo is not None:
+            condicoes.append({"tipo": self.tipo})
+        if self.prefixo is not None:
+            # Anchored, case-sensitive regex on normalized values: an index range scan
+            condicoes.append({self.campo: {"$regex": "^" + re.escape(self.prefixo)}})
+        periodo = {}
+        if self.criado_de is not None:
+            periodo["$gte"] = self.criado_de
+        if self.criado_ate is not None:
+            periodo["$lt"] = self.criado_ate
+        if periodo:
+            condicoes.append({"criado_em": periodo})
+        if self.apos is not None:
+            valor, doc_id = self.apos
+            op = "$gt" if self.direcao > 0 else "$lt"
+            condicoes.append({"$or": [
+                {self.campo: {op: valor}},
+                {self.campo: valor, "id": {op: doc_id}},
+            ]})
+        if not condicoes:
+            return {}
+        return condicoes[0] if len(condicoes) == 1 else {"$and": condicoes}
+
+    def mongo_sort(self):
+        return [(self.campo, self.direcao), ("id", self.direcao)]
+
+    def page(self, docs) -> Tuple[list, Optional[str]]:
+        """Cut the limite + 1 fetched documents to a page and its next cursor."""
+        docs = list(docs)
+        if len(docs) <= self.limite:
+            return docs, None
+        docs = docs[:self.limite]
+        return docs, encode_cursor(self.campo, docs[-1].get(self.campo), docs[-1]["id"])
+
+
+class UserCounters:
+    """Per-tipo user totals, recounted at most every ``ttl`` seconds.
+
+    Registrations handled by this process bump the cached values, so a new
+    account shows up in its own admin's totals without waiting for the TTL.
+    """
+
+    def __init__(self, ttl: float = COUNTS_TTL):
+        self.ttl = ttl
+        self._counts: Optional[Dict[str, int]] = None
+        self._expira = 0.0
+
+    async def totals(self, repo) -> Dict[str, int]:
+        if self._counts is None or time.monotonic() >= self._expira:
+            self._counts = {tipo: await repo.count({"tipo": tipo}) for tipo in TIPOS}
+            self._expira = time.monotonic() + self.ttl
+        return {**self._counts, "todos": sum(self._counts.values())}
+
+    def bump(self, tipo: str):
+        if self._counts is not None and tipo in self._counts:
+            self._counts[tipo] += 1
+
+
+async def ensure_indexes(db):
+    for campo in CAMPOS_ORDEM.values():
+        await db.usuarios.create_index([(campo, ASCENDING), ("id", ASCENDING)])
+        await db.usuarios.create_index([("tipo", ASCENDING), (campo, ASCENDING), ("id", ASCENDING)])
+
+
+async def backfill(db) -> int:
+    """Add the search fields to usuarios created before they existed."""
+    atualizados = 0
+    # Missing fields are indexed as null, so these are index lookups once everything is filled
+    cursor = db.usuarios.find(
+        {"$or": [{"nome_busca": None}, {"email_busca": None}]}, {"_id": 0, "id": 1, "nome": 1, "email": 1}
+    )
+    ops = []
+    async for usuario in cursor:
+        ops.append(UpdateOne({"id": usuario["id"]}, {"$set": search_fields(usuario)}))
+        if len(ops) >= BACKFILL_CHUNK:
+            atualizados += (await db.usuarios.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        atualizados += (await db.usuarios.bulk_write(ops, ordered=False)).modified_count
+    return atualizados
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for TCC Inovation backend subsystems
+Runs in-process against synthetic data, no MongoDB or server required
+
+Usage: python backend_benchmark.py <benchmark> [--n N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+VOCABULARY = (
+    "sistema dados cliente aplicativo mobile rede modelo processo energia custo "
+    "logistica rota entrega estoque venda previsao algoritmo sensor plataforma "
+    "usuario interface seguranca nuvem servidor banco integracao api teste "
+    "automacao relatorio painel indicador produtividade qualidade sustentavel"
+).split()
+
+
+def synthetic_text(rng: random.Random, words: int = 60) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def timed(label: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"   {label}: {elapsed * 1000:.1f} ms")
+    return result, elapsed
+
+
+def bench_duplicatas(n: int):
+    """MinHash signatures + LSH clustering over n synthetic respostas"""
+    from near_duplicates import build_index, minhash_signature
+
+    rng = random.Random(42)
+    originals = [synthetic_text(rng) for _ in range(n // 10)]
+    textos = []
+    for i in range(n):
+        if i % 10 == 0:
+            # Every tenth answer is a light edit of an earlier one
+            words = rng.choice(originals).split()
+            words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+            textos.append(" ".join(words))
+        else:
+            textos.append(synthetic_text(rng))
+
+    print(f"🔎 Duplicatas: {n} respostas sintéticas")
+    signatures, elapsed = timed("assinaturas MinHash", lambda: [minhash_signature(t) for t in textos])
+    print(f"   por resposta: {elapsed / n * 1e6:.0f} µs")
+    index, _ = timed("indexação LSH", build_index, ((str(i), s) for i, s in enumerate(signatures)))
+    clusters, _ = timed("clusters (limiar 0.8)", index.clusters, 0.8)
+    print(f"   clusters encontrados: {len(clusters)}")
+    print(f"   comparações evitadas: {n * (n - 1) // 2 - len(index.candidate_pairs())} de {n * (n - 1) // 2}")
+
+
+def bench_auth(n: int):
+    """Per-request token verification: jwt.decode every time vs verified-token cache"""
+    from datetime import datetime, timedelta
+    from token_verification import KeyRing, VerifiedTokenCache
+
+    keyring = KeyRing({"k1": "segredo-antigo-" + "a" * 32, "k2": "segredo-novo-" + "b" * 32}, "k2")
+    tokens = [
+        keyring.encode({"sub": f"user-{i}", "exp": datetime.utcnow() + timedelta(minutes=30)})
+        for i in range(100)
+    ]
+    requests = [tokens[i % len(tokens)] for i in range(n)]
+
+    print(f"🔐 Autenticação: {n} requisições, {len(tokens)} sessões ativas")
+    _, before = timed("jwt.decode a cada requisição", lambda: [keyring.decode(t) for t in requests])
+    cache = VerifiedTokenCache(keyring)
+    _, after = timed("cache de tokens verificados", lambda: [cache.decode(t) for t in requests])
+    print(f"   por requisição: {before / n * 1e6:.1f} µs -> {after / n * 1e6:.1f} µs")
+    print(f"   hits: {cache.hits}, misses: {cache.misses}")
+
+
+def bench_group_commit(n: int):
+    """Concurrent resposta inserts: one insert_one each vs group-commit insert_many"""
+    import asyncio
+    from group_commit import GroupCommitWriter
+
+    # Simulated collection: each round trip costs ROUND_TRIP plus PER_DOC per document,
+    # and the connection pool allows POOL concurrent operations
+    ROUND_TRIP, PER_DOC, POOL = 0.002, 0.00002, 10
+
+    class SimulatedCollection:
+        def __init__(self):
+            self.pool = asyncio.Semaphore(POOL)
+            self.round_trips = 0
+
+        async def insert_one(self, doc):
+            async with self.pool:
+                self.round_trips += 1
+                await asyncio.sleep(ROUND_TRIP + PER_DOC)
+
+        async def insert_many(self, docs, ordered=True):
+            async with self.pool:
+                self.round_trips += 1
+                await asyncio.sleep(ROUND_TRIP + PER_DOC * len(docs))
+
+    docs = [{"id": str(i), "texto": "resposta"} for i in range(n)]
+
+    async def run_individual():
+        collection = SimulatedCollection()
+        await asyncio.gather(*(collection.insert_one(doc) for doc in docs))
+        return collection.round_trips
+
+    async def run_grouped():
+        collection = SimulatedCollection()
+        writer = GroupCommitWriter(collection, max_batch=100, max_delay=0.005)
+        await asyncio.gather(*(writer.submit(doc) for doc in docs))
+        await writer.close()
+        return collection.round_trips
+
+    print(f"📝 Group commit: {n} respostas simultâneas (round trip simulado de {ROUND_TRIP * 1000:.0f} ms, pool {POOL})")
+    trips, before = timed("insert_one por resposta", lambda: asyncio.run(run_individual()))
+    print(f"   round trips: {trips}, vazão: {n / before:.0f} respostas/s")
+    trips, after = timed("group commit (lote 100, 5 ms)", lambda: asyncio.run(run_grouped()))
+    print(f"   round trips: {trips}, vazão: {n / after:.0f} respostas/s")
+
+
+def bench_repositorios(n: int):
+    """Core queries against the indexed in-memory repositories (the DATA_BACKEND=memory app)"""
+    import asyncio
+    from datetime import datetime, timedelta
+    from repositories import memory_repositories
+
+    rng = random.Random(42)
+    repos = memory_repositories()
+    formandos = [f"formando-{i}" for i in range(max(n // 20, 1))]
+    empresas = [f"empresa-{i}" for i in range(50)]
+    inicio = datetime(2026, 1, 1)
+
+    async def populate():
+        for i in range(n):
+            formando, empresa = rng.choice(formandos), rng.choice(empresas)
+            desafio_id = f"desafio-{i}"
+            momento = inicio + timedelta(seconds=i)
+            await repos.respostas.insert({
+                "id": f"resposta-{i}", "usuario_id": formando, "desafio_id": desafio_id, "empresa_id": empresa,
+                "texto": "resposta", "enviada_em": momento,
+            })
+            await repos.avaliacoes.insert({
+                "id": f"avaliacao-{i}", "resposta_id": f"resposta-{i}", "desafio_id": desafio_id,
+                "desafio_titulo": f"Desafio {i}", "empresa_id": empresa, "empresa_nome": empresa,
+                "formando_id": formando, "formando_nome": formando, "nota": rng.uniform(0, 10), "avaliado_em": momento,
+            })
+
+    async def lookups():
+        for formando in formandos:
+            await repos.respostas.find({"usuario_id": formando}, sort=("enviada_em", -1), limit=5)
+        for empresa in empresas:
+            await repos.respostas.count({"empresa_id": empresa})
+
+    print(f"🗃️  Repositórios em memória: {n} respostas e avaliações, {len(formandos)} formandos")
+    _, elapsed = timed("inserção", lambda: asyncio.run(populate()))
+    print(f"   por documento: {elapsed / (2 * n) * 1e6:.1f} µs")
+    _, elapsed = timed("consultas indexadas", lambda: asyncio.run(lookups()))
+    print(f"   por consulta: {elapsed / (len(formandos) + len(empresas)) * 1e6:.1f} µs")
+    matches, _ = timed("matches (nota >= 7)", lambda: asyncio.run(repos.avaliacoes.matches(7.0)))
+    print(f"   pares formando/empresa: {len(matches)}")
+
+
+def bench_memoria(n: int):
+    """Per-route traced memory of the list handlers, through the app on the memory backend"""
+    import asyncio
+    import os
+    from datetime import datetime
+
+    os.environ.update(DATA_BACKEND="memory", MEMORY_TRACKING="true", MEMORY_TRACKING_SNAPSHOT_EVERY="1")
+    import server
+    from fastapi.testclient import TestClient
+
+    rng = random.Random(42)
+    admin = server.Usuario(email="admin@benchmark.com", nome="Admin", tipo=server.UserType.ADMIN)
+
+    async def populate():
+        await server.repos.usuarios.insert({**admin.dict(), "senha_hash": "-"})
+        for i in range(n):
+            usuario = server.Usuario(email=f"formando{i}@benchmark.com", nome=f"Formando {i}", tipo=server.UserType.FORMANDO)
+            await server.repos.usuarios.insert({**usuario.dict(), "senha_hash": "-"})
+            await server.repos.desafios.insert({
+                "id": f"desafio-{i}", "titulo": f"Desafio {i}", "descricao": synthetic_text(rng, 200),
+                "empresa_id": "empresa-0", "empresa_nome": "Empresa", "criado_em": datetime(2026, 1, 1),
+            })
+
+    asyncio.run(populate())
+    headers = {"Authorization": f"Bearer {server.create_access_token(data={'sub': admin.id})}"}
+    rotas = [("GET /api/admin/usuarios", "/api/admin/usuarios"), ("GET /api/desafios", "/api/desafios")]
+
+    print(f"🧠 Memória por rota: {n} usuários e desafios (listas limitadas a 1000)")
+    with TestClient(server.app) as client:
+        for label, path in rotas:
+            # Timings are meaningless under tracemalloc, only the memory report is printed
+            for _ in range(3):
+                client.get(path, headers=headers).raise_for_status()
+    report = server.memory_tracker.report()
+    for label, _ in rotas:
+        stats = report[label]
+        print(f"   {label}: pico {stats['pico_bytes_max'] / 1024:.0f} KiB, "
+              f"retido médio {stats['retido_bytes_medio'] / 1024:.1f} KiB")
+        for site in stats["sites"][:3]:
+            print(f"      {site['bytes_medio'] / 1024:8.0f} KiB  {site['site']}")
+    processo = server.memory_tracker.process()
+    print(f"   RSS pico do processo: {(processo['rss_pico_bytes'] or 0) / 2 ** 20:.0f} MiB")
+
+
+def bench_compressao(n: int):
+    """GET /api/desafios: uncompressed vs per-response gzip vs cached precompressed bytes"""
+    import asyncio
+    import os
+    from datetime import datetime
+
+    os.environ.update(DATA_BACKEND="memory")
+    import server
+    from fastapi.testclient import TestClient
+
+    rng = random.Random(42)
+
+    async def populate():
+        for i in range(n):
+            await server.repos.desafios.insert({
+                "id": f"desafio-{i}", "titulo": f"Desafio {i}", "descricao": synthetic_text(rng, 80),
+                "empresa_id": "empresa-0", "empresa_nome": "Empresa", "criado_em": datetime(2026, 1, 1),
+            })
+
+    asyncio.run(populate())
+    requests = 50
+
+    def run(client, accept_encoding, invalidate):
+        size = 0
+        for _ in range(requests):
+            if invalidate:
+                server.payload_cache.invalidate("/api/desafios")
+            response = client.get("/api/desafios", headers={"Accept-Encoding": accept_encoding})
+            size = int(response.headers["content-length"])
+        return size
+
+    print(f"🗜️  Compressão: GET /api/desafios com {min(n, 1000)} desafios, {requests} requisições")
+    with TestClient(server.app) as client:
+        for label, accept_encoding, invalidate in (
+            ("sem compressão, cache invalidado", "identity", True),
+            ("gzip, cache invalidado (renderiza e comprime)", "gzip", True),
+            ("gzip pré-comprimido em cache", "gzip", False),
+        ):
+            size, elapsed = timed(label, run, client, accept_encoding, invalidate)
+            print(f"      {size / 1024:.0f} KiB por resposta, {elapsed / requests * 1000:.2f} ms por requisição")
+
+
+BENCHMARKS = {
+    "duplicatas": (bench_duplicatas, 50_000),
+    "auth": (bench_auth, 100_000),
+    "group_commit": (bench_group_commit, 5_000),
+    "repositorios": (bench_repositorios, 100_000),
+    "memoria": (bench_memoria, 2_000),
+    "compressao": (bench_compressao, 1_000),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do backend TCC Inovation")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--n", type=int, default=None, help="tamanho do conjunto sintético")
+    args = parser.parse_args()
+
+    fn, default_n = BENCHMARKS[args.benchmark]
+    fn(args.n or default_n)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -477,17 +477,25 @@ class TCCInovationAPITester:
         )
         
         if success2:
-            print(f"   📊 Total usuários listados: {len(users)}")
-            # Show user type distribution
-            user_types = {}
-            for user in users:
-                user_type = user.get('tipo', 'unknown')
-                user_types[user_type] = user_types.get(user_type, 0) + 1
-            
-            for user_type, count in user_types.items():
-                print(f"      - {user_type}: {count}")
+            print(f"   📊 Total usuários listados: {len(users['usuarios'])} de {users['totais']['todos']}")
+            # Show user type distribution from the cached totals
+            for user_type, count in users['totais'].items():
+                if user_type != 'todos':
+                    print(f"      - {user_type}: {count}")
+        
+        # Filtered, sorted page
+        success3, page = self.run_test(
+            "Listar formandos por nome",
+            "GET",
+            "admin/usuarios?tipo=formando&ordem=nome&limite=5",
+            200,
+            user_type="admin"
+        )
+        if success3 and any(user['tipo'] != 'formando' for user in page['usuarios']):
+            print("   ❌ Filtro por tipo retornou outros tipos")
+            success3 = False
         
-        return success and success2
+        return success and success2 and success3
 
     def test_error_scenarios(self):
         """Test error scenarios and edge cases"""
@@ -94,7 +94,7 @@ const Login = () => {
         user_id: response.data.user_id,
         user_name: response.data.user_name,
         user_type: response.data.user_type
-      });
+      }, response.data.refresh_token);
       
       navigate('/dashboard');
     } catch (err) {
@@ -191,10 +191,8 @@ const Login = () => {
 
 // Dashboard Component
 const Dashboard = () => {
-  const { user } = useAuth();
+  const { user, session, refreshSession } = useAuth();
   const [stats, setStats] = useState(null);
-  const [empresa, setEmpresa] = useState(null);
-  const [showEmpresaForm, setShowEmpresaForm] = useState(false);
 
   useEffect(() => {
     loadDashboardData();
@@ -205,21 +203,16 @@ const Dashboard = () => {
       if (user.user_type === 'admin') {
         const response = await axios.get(`${API}/admin/stats`);
         setStats(response.data);
-      } else if (user.user_type === 'empresa') {
-        try {
-          const response = await axios.get(`${API}/empresas/me`);
-          setEmpresa(response.data);
-        } catch (err) {
-          if (err.response?.status === 404) {
-            setShowEmpresaForm(true);
-          }
-        }
       }
     } catch (err) {
       console.error('Erro ao carregar dados do dashboard:', err);
     }
   };
 
+  // Empresa profile and counts come from the session bootstrap
+  const empresa = session?.empresa;
+  const showEmpresaForm = user.user_type === 'empresa' && session !== null && !empresa;
+
   if (user.user_type === 'admin') {
     return (
       <div className="max-w-6xl mx-auto p-6">
@@ -263,10 +256,7 @@ const Dashboard = () => {
         <h1 className="text-3xl font-bold mb-6">Dashboard da Empresa</h1>
         
         {showEmpresaForm ? (
-          <EmpresaForm onSuccess={() => {
-            setShowEmpresaForm(false);
-            loadDashboardData();
-          }} />
+          <EmpresaForm onSuccess={refreshSession} />
         ) : empresa ? (
           <div className="bg-white p-6 rounded-lg shadow-md">
             <h2 className="text-xl font-semibold mb-4">Informações da Empresa</h2>
@@ -284,6 +274,7 @@ const Dashboard = () => {
                 <p className="text-lg">{empresa.descricao}</p>
               </div>
             </div>
+            <ResumoSessao session={session} />
           </div>
         ) : (
           <div className="text-center">
@@ -302,6 +293,7 @@ const Dashboard = () => {
         <p className="text-gray-600">
           Explore os desafios disponíveis e demonstre suas habilidades para as empresas parceiras.
         </p>
+        {session && <ResumoSessao session={session} />}
         <div className="mt-4">
           <Link 
             to="/desafios-disponiveis"
@@ -315,6 +307,24 @@ const Dashboard = () => {
   );
 };
 
+// Counts shown on the empresa and formando dashboards
+const ResumoSessao = ({ session }) => (
+  <div className="grid grid-cols-3 gap-4 mt-6">
+    <div className="bg-gray-50 p-4 rounded">
+      <p className="text-sm text-gray-600">{session.usuario.tipo === 'empresa' ? 'Desafios' : 'Desafios abertos'}</p>
+      <p className="text-2xl font-bold text-blue-600">{session.total_desafios}</p>
+    </div>
+    <div className="bg-gray-50 p-4 rounded">
+      <p className="text-sm text-gray-600">Respostas</p>
+      <p className="text-2xl font-bold text-green-600">{session.total_respostas}</p>
+    </div>
+    <div className="bg-gray-50 p-4 rounded">
+      <p className="text-sm text-gray-600">Aguardando avaliação</p>
+      <p className="text-2xl font-bold text-orange-600">{session.avaliacoes_pendentes}</p>
+    </div>
+  </div>
+);
+
 // Company Form Component
 const EmpresaForm = ({ onSuccess }) => {
   const [formData, setFormData] = useState({
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { TextoCompleto } from './TextoCompleto';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -168,29 +169,56 @@ const AdminOverview = () => {
 // Users management component
 const AdminUsers = () => {
   const [users, setUsers] = useState([]);
+  const [totais, setTotais] = useState({});
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filter, setFilter] = useState('all');
+  const [search, setSearch] = useState('');
+  const [ordem, setOrdem] = useState('criado_em');
 
   useEffect(() => {
-    loadUsers();
-  }, []);
+    // Debounce typing so each keystroke doesn't hit the server
+    const timer = setTimeout(() => loadUsers(), 300);
+    return () => clearTimeout(timer);
+  }, [filter, search, ordem]);
+
+  const buildParams = (cursor) => {
+    const params = { limite: 50 };
+    if (filter !== 'all') params.tipo = filter;
+    const termo = search.trim();
+    if (termo) {
+      // Prefix search runs on the field the list is sorted by
+      if (termo.includes('@')) {
+        params.email = termo;
+        params.ordem = 'email';
+      } else {
+        params.nome = termo;
+        params.ordem = 'nome';
+      }
+    } else {
+      params.ordem = ordem;
+      if (ordem === 'criado_em') params.direcao = -1;
+    }
+    if (cursor) params.cursor = cursor;
+    return params;
+  };
 
-  const loadUsers = async () => {
+  const loadUsers = async (cursor = null) => {
+    if (cursor) setLoadingMore(true);
     try {
-      const response = await axios.get(`${API}/admin/usuarios`);
-      setUsers(response.data);
+      const response = await axios.get(`${API}/admin/usuarios`, { params: buildParams(cursor) });
+      setUsers(prev => (cursor ? [...prev, ...response.data.usuarios] : response.data.usuarios));
+      setTotais(response.data.totais);
+      setNextCursor(response.data.proximo_cursor);
     } catch (err) {
       console.error('Erro ao carregar usuários:', err);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
-  const getFilteredUsers = () => {
-    if (filter === 'all') return users;
-    return users.filter(user => user.tipo === filter);
-  };
-
   const getUserTypeLabel = (tipo) => {
     const types = {
       'admin': { label: 'Administrador', color: 'red' },
@@ -204,19 +232,17 @@ const AdminUsers = () => {
     return <div className="text-center p-6">Carregando usuários...</div>;
   }
 
-  const filteredUsers = getFilteredUsers();
-
   return (
     <div>
       {/* Filter Buttons */}
-      <div className="flex space-x-2 mb-6">
+      <div className="flex space-x-2 mb-4">
         <button
           onClick={() => setFilter('all')}
           className={`px-4 py-2 rounded ${
             filter === 'all' ? 'bg-blue-600 text-white' : 'bg-gray-200 text-gray-700 hover:bg-gray-300'
           }`}
         >
-          Todos ({users.length})
+          Todos ({totais.todos || 0})
         </button>
         <button
           onClick={() => setFilter('admin')}
@@ -224,7 +250,7 @@ const AdminUsers = () => {
             filter === 'admin' ? 'bg-blue-600 text-white' : 'bg-gray-200 text-gray-700 hover:bg-gray-300'
           }`}
         >
-          Admins ({users.filter(u => u.tipo === 'admin').length})
+          Admins ({totais.admin || 0})
         </button>
         <button
           onClick={() => setFilter('empresa')}
@@ -232,7 +258,7 @@ const AdminUsers = () => {
             filter === 'empresa' ? 'bg-blue-600 text-white' : 'bg-gray-200 text-gray-700 hover:bg-gray-300'
           }`}
         >
-          Empresas ({users.filter(u => u.tipo === 'empresa').length})
+          Empresas ({totais.empresa || 0})
         </button>
         <button
           onClick={() => setFilter('formando')}
@@ -240,10 +266,31 @@ const AdminUsers = () => {
             filter === 'formando' ? 'bg-blue-600 text-white' : 'bg-gray-200 text-gray-700 hover:bg-gray-300'
           }`}
         >
-          Formandos ({users.filter(u => u.tipo === 'formando').length})
+          Formandos ({totais.formando || 0})
         </button>
       </div>
 
+      {/* Search and Sort */}
+      <div className="flex space-x-2 mb-6">
+        <input
+          type="text"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+          placeholder="Buscar por nome ou email..."
+          className="flex-1 px-4 py-2 border border-gray-300 rounded focus:outline-none focus:ring-2 focus:ring-blue-500"
+        />
+        <select
+          value={ordem}
+          onChange={(e) => setOrdem(e.target.value)}
+          disabled={search.trim() !== ''}
+          className="px-4 py-2 border border-gray-300 rounded"
+        >
+          <option value="criado_em">Mais recentes</option>
+          <option value="nome">Nome</option>
+          <option value="email">Email</option>
+        </select>
+      </div>
+
       {/* Users Table */}
       <div className="bg-white rounded-lg shadow-md overflow-hidden">
         <table className="min-w-full divide-y divide-gray-200">
@@ -267,7 +314,7 @@ const AdminUsers = () => {
             </tr>
           </thead>
           <tbody className="bg-white divide-y divide-gray-200">
-            {filteredUsers.map(user => {
+            {users.map(user => {
               const typeInfo = getUserTypeLabel(user.tipo);
               return (
                 <tr key={user.id} className="hover:bg-gray-50">
@@ -300,11 +347,23 @@ const AdminUsers = () => {
         </table>
       </div>
 
-      {filteredUsers.length === 0 && (
+      {users.length === 0 && (
         <div className="text-center text-gray-500 p-8">
           <p>Nenhum usuário encontrado com os filtros selecionados.</p>
         </div>
       )}
+
+      {nextCursor && (
+        <div className="text-center mt-4">
+          <button
+            onClick={() => loadUsers(nextCursor)}
+            disabled={loadingMore}
+            className="px-4 py-2 rounded bg-gray-200 text-gray-700 hover:bg-gray-300"
+          >
+            {loadingMore ? 'Carregando...' : 'Carregar mais'}
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -441,7 +500,13 @@ const AdminChallenges = () => {
                 </div>
               </div>
               
-              <p className="text-gray-700">{desafio.descricao}</p>
+              <TextoCompleto
+                texto={desafio.descricao}
+                truncado={desafio.descricao_truncada}
+                endpoint={`/desafios/${desafio.id}`}
+                campo="descricao"
+                className="text-gray-700"
+              />
             </div>
           );
         })}
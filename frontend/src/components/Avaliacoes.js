@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { TextoCompleto } from './TextoCompleto';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -164,7 +165,13 @@ const RespostaParaAvaliar = ({ resposta }) => {
 
       <div className="mb-4">
         <h4 className="font-semibold mb-2">Resposta:</h4>
-        <p className="text-gray-700 bg-gray-50 p-4 rounded">{resposta.texto}</p>
+        <TextoCompleto
+          texto={resposta.texto}
+          truncado={resposta.texto_truncado}
+          endpoint={`/respostas/${resposta.id}`}
+          campo="texto"
+          className="text-gray-700 bg-gray-50 p-4 rounded"
+        />
       </div>
 
       {avaliacao && (
@@ -295,8 +302,6 @@ const AvaliacaoForm = ({ respostaId, onCancel, onSuccess }) => {
 // Component for students to view their responses and evaluations
 export const MinhasRespostas = () => {
   const [respostas, setRespostas] = useState([]);
-  const [desafios, setDesafios] = useState({});
-  const [empresas, setEmpresas] = useState({});
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -305,26 +310,9 @@ export const MinhasRespostas = () => {
 
   const loadRespostas = async () => {
     try {
-      const [respostasResponse, desafiosResponse, empresasResponse] = await Promise.all([
-        axios.get(`${API}/respostas/me`),
-        axios.get(`${API}/desafios`),
-        axios.get(`${API}/empresas`)
-      ]);
-
-      setRespostas(respostasResponse.data);
-
-      // Create maps for easy lookup
-      const desafiosMap = {};
-      desafiosResponse.data.forEach(desafio => {
-        desafiosMap[desafio.id] = desafio;
-      });
-      setDesafios(desafiosMap);
-
-      const empresasMap = {};
-      empresasResponse.data.forEach(empresa => {
-        empresasMap[empresa.id] = empresa;
-      });
-      setEmpresas(empresasMap);
+      // Respostas carry the desafio title and empresa name
+      const response = await axios.get(`${API}/respostas/me`);
+      setRespostas(response.data);
     } catch (err) {
       console.error('Erro ao carregar respostas:', err);
     } finally {
@@ -341,19 +329,9 @@ export const MinhasRespostas = () => {
       <h1 className="text-3xl font-bold mb-6">Minhas Respostas</h1>
 
       <div className="space-y-6">
-        {respostas.map(resposta => {
-          const desafio = desafios[resposta.desafio_id];
-          const empresa = desafio ? empresas[desafio.empresa_id] : null;
-          
-          return (
-            <MinhaRespostaCard
-              key={resposta.id}
-              resposta={resposta}
-              desafio={desafio}
-              empresa={empresa}
-            />
-          );
-        })}
+        {respostas.map(resposta => (
+          <MinhaRespostaCard key={resposta.id} resposta={resposta} />
+        ))}
       </div>
 
       {respostas.length === 0 && (
@@ -367,7 +345,7 @@ export const MinhasRespostas = () => {
 };
 
 // Component for individual student response display
-const MinhaRespostaCard = ({ resposta, desafio, empresa }) => {
+const MinhaRespostaCard = ({ resposta }) => {
   const [avaliacao, setAvaliacao] = useState(null);
   const [loading, setLoading] = useState(true);
 
@@ -413,8 +391,8 @@ const MinhaRespostaCard = ({ resposta, desafio, empresa }) => {
     <div className="bg-white p-6 rounded-lg shadow-md">
       <div className="flex justify-between items-start mb-4">
         <div>
-          <h3 className="text-xl font-semibold">{desafio?.titulo || 'Desafio não encontrado'}</h3>
-          <p className="text-blue-600 font-medium">{empresa?.nome || 'Empresa não encontrada'}</p>
+          <h3 className="text-xl font-semibold">{resposta.desafio_titulo || 'Desafio não encontrado'}</h3>
+          <p className="text-blue-600 font-medium">{resposta.empresa_nome || 'Empresa não encontrada'}</p>
           <p className="text-gray-600 text-sm">
             Enviado em {new Date(resposta.enviada_em).toLocaleDateString('pt-BR')}
           </p>
@@ -424,7 +402,13 @@ const MinhaRespostaCard = ({ resposta, desafio, empresa }) => {
 
       <div className="mb-4">
         <h4 className="font-semibold mb-2">Sua Resposta:</h4>
-        <p className="text-gray-700 bg-gray-50 p-4 rounded">{resposta.texto}</p>
+        <TextoCompleto
+          texto={resposta.texto}
+          truncado={resposta.texto_truncado}
+          endpoint={`/respostas/${resposta.id}`}
+          campo="texto"
+          className="text-gray-700 bg-gray-50 p-4 rounded"
+        />
       </div>
 
       {avaliacao && (
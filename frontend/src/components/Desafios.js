@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import axios from 'axios';
+import { TextoCompleto } from './TextoCompleto';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -246,7 +247,13 @@ const DesafioCard = ({ desafio }) => {
         </button>
       </div>
       
-      <p className="text-gray-700 mb-4">{desafio.descricao}</p>
+      <TextoCompleto
+        texto={desafio.descricao}
+        truncado={desafio.descricao_truncada}
+        endpoint={`/desafios/${desafio.id}`}
+        campo="descricao"
+        className="text-gray-700 mb-4"
+      />
 
       {showRespostas && (
         <div className="mt-4 border-t pt-4">
@@ -275,7 +282,7 @@ const DesafioDisponivelCard = ({ desafio, empresa }) => {
       <div className="flex justify-between items-start mb-4">
         <div>
           <h3 className="text-xl font-semibold">{desafio.titulo}</h3>
-          <p className="text-blue-600 font-medium">{empresa?.nome}</p>
+          <p className="text-blue-600 font-medium">{desafio.empresa_nome || empresa?.nome}</p>
           <p className="text-gray-600 text-sm">
             Publicado em {new Date(desafio.criado_em).toLocaleDateString('pt-BR')}
           </p>
@@ -288,7 +295,13 @@ const DesafioDisponivelCard = ({ desafio, empresa }) => {
         </button>
       </div>
       
-      <p className="text-gray-700 mb-4">{desafio.descricao}</p>
+      <TextoCompleto
+        texto={desafio.descricao}
+        truncado={desafio.descricao_truncada}
+        endpoint={`/desafios/${desafio.id}`}
+        campo="descricao"
+        className="text-gray-700 mb-4"
+      />
 
       {empresa && (
         <div className="bg-gray-50 p-4 rounded mb-4">
@@ -382,7 +395,13 @@ const RespostaCard = ({ resposta }) => {
           Enviado em {new Date(resposta.enviada_em).toLocaleDateString('pt-BR')}
         </p>
       </div>
-      <p className="text-gray-800">{resposta.texto}</p>
+      <TextoCompleto
+        texto={resposta.texto}
+        truncado={resposta.texto_truncado}
+        endpoint={`/respostas/${resposta.id}`}
+        campo="texto"
+        className="text-gray-800"
+      />
     </div>
   );
 };
\ No newline at end of file
@@ -0,0 +1,38 @@
+import React, { useState } from 'react';
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+// Shows the excerpt returned by list endpoints and fetches the full text on demand
+export const TextoCompleto = ({ texto, truncado, endpoint, campo, className }) => {
+  const [completo, setCompleto] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  const carregarCompleto = async () => {
+    setLoading(true);
+    try {
+      const response = await axios.get(`${API}${endpoint}`);
+      setCompleto(response.data[campo]);
+    } catch (err) {
+      console.error('Erro ao carregar texto completo:', err);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  return (
+    <div className={className}>
+      <p className="whitespace-pre-line">{completo ?? texto}</p>
+      {truncado && completo === null && (
+        <button
+          onClick={carregarCompleto}
+          disabled={loading}
+          className="mt-2 text-sm text-blue-600 hover:text-blue-800 disabled:opacity-50"
+        >
+          {loading ? 'Carregando...' : 'Ler texto completo'}
+        </button>
+      )}
+    </div>
+  );
+};
@@ -3,6 +3,32 @@ import axios from 'axios';
 
 const AuthContext = createContext();
 
+const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+
+// Single in-flight refresh shared by every request that got a 401
+let refreshPromise = null;
+
+const refreshAccessToken = async () => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) {
+    throw new Error('Sem refresh token');
+  }
+  if (!refreshPromise) {
+    refreshPromise = axios
+      .post(`${API}/token/refresh`, { refresh_token: refreshToken })
+      .then((response) => {
+        localStorage.setItem('token', response.data.access_token);
+        localStorage.setItem('refresh_token', response.data.refresh_token);
+        axios.defaults.headers.common['Authorization'] = `Bearer ${response.data.access_token}`;
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 export const useAuth = () => {
   const context = useContext(AuthContext);
   if (!context) {
@@ -13,8 +39,21 @@ export const useAuth = () => {
 
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
+  const [session, setSession] = useState(null);
   const [loading, setLoading] = useState(true);
 
+  // Profile, empresa, counts and recent activity in a single request
+  const refreshSession = async () => {
+    try {
+      const response = await axios.get(`${API}/me/bootstrap`);
+      setSession(response.data);
+      return response.data;
+    } catch (err) {
+      console.error('Erro ao carregar sessão:', err);
+      return null;
+    }
+  };
+
   useEffect(() => {
     const token = localStorage.getItem('token');
     const userData = localStorage.getItem('user');
@@ -22,26 +61,70 @@ export const AuthProvider = ({ children }) => {
     if (token && userData) {
       setUser(JSON.parse(userData));
       axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
+      refreshSession();
     }
     setLoading(false);
   }, []);
 
-  const login = (token, userData) => {
+  useEffect(() => {
+    // Renew the access token silently when the API rejects it as expired
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        if (
+          error.response?.status !== 401 ||
+          !original ||
+          original._retry ||
+          original.url?.includes('/token/refresh') ||
+          original.url?.includes('/login')
+        ) {
+          return Promise.reject(error);
+        }
+        original._retry = true;
+        try {
+          const token = await refreshAccessToken();
+          original.headers['Authorization'] = `Bearer ${token}`;
+          return axios(original);
+        } catch (refreshError) {
+          clearSession();
+          return Promise.reject(error);
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
+  const clearSession = () => {
+    localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
+    localStorage.removeItem('user');
+    delete axios.defaults.headers.common['Authorization'];
+    setUser(null);
+    setSession(null);
+  };
+
+  const login = (token, userData, refreshToken) => {
     localStorage.setItem('token', token);
+    if (refreshToken) {
+      localStorage.setItem('refresh_token', refreshToken);
+    }
     localStorage.setItem('user', JSON.stringify(userData));
     axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
     setUser(userData);
+    refreshSession();
   };
 
   const logout = () => {
-    localStorage.removeItem('token');
-    localStorage.removeItem('user');
-    delete axios.defaults.headers.common['Authorization'];
-    setUser(null);
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      axios.post(`${API}/logout`, { refresh_token: refreshToken }).catch(() => {});
+    }
+    clearSession();
   };
 
   return (
-    <AuthContext.Provider value={{ user, login, logout, loading }}>
+    <AuthContext.Provider value={{ user, session, refreshSession, login, logout, loading }}>
       {children}
     </AuthContext.Provider>
   );
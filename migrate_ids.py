@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Binary id migration for TCC Inovation
+Rewrites the core collections from ObjectId _id plus an "id" string to the
+UUID itself as a binary _id, with binary foreign keys (see backend/binary_ids.py)
+
+Stop the API (or every writer) first, migrate, then restart it with
+BINARY_IDS=true. Runs are resumable; --reverter undoes the migration.
+
+Reads MONGO_URL and DB_NAME from the environment or backend/.env
+
+Usage: python migrate_ids.py [--verificar | --reverter] [--lote N]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import binary_ids  # noqa: E402
+
+
+async def run(args) -> int:
+    load_dotenv(Path(__file__).parent / "backend" / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+
+    print("🆔 Migração de ids binários")
+    print(f"📍 Banco: {os.environ['DB_NAME']}")
+    print("=" * 60)
+
+    antes = await binary_ids.pending(db)
+    print("📊 Documentos com ids em texto:")
+    for nome, total in antes.items():
+        print(f"   {nome}: {total}")
+    if args.verificar:
+        return 0
+
+    if args.reverter:
+        print("\n↩️  Revertendo para ids em texto...")
+        relatorio = await binary_ids.revert(db, args.lote)
+    else:
+        print("\n🔄 Migrando para ids binários...")
+        relatorio = await binary_ids.migrate(db, args.lote)
+    for nome, entrada in relatorio.items():
+        detalhes = ", ".join(f"{chave}: {valor}" for chave, valor in entrada.items())
+        print(f"   {nome}: {detalhes}")
+
+    if not args.reverter:
+        # Ids that are not UUIDs stay as strings by design, so a non-zero count here is not an error
+        depois = await binary_ids.pending(db)
+        print("\n📊 Restantes (ids que não são UUID permanecem em texto):")
+        for nome, total in depois.items():
+            print(f"   {nome}: {total}")
+    print("\n✅ Concluído. Os índices removidos são recriados na próxima inicialização da API.")
+    client.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migração de ids binários do TCC Inovation")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--verificar", action="store_true", help="apenas conta os documentos pendentes")
+    modo.add_argument("--reverter", action="store_true", help="volta para ObjectId e ids em texto")
+    parser.add_argument("--lote", type=int, default=binary_ids.MIGRATION_BATCH, help="documentos por lote")
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check for TCC Inovation backend
+Seeds a small dataset through the API and fails if any filtered query
+of the exercised routes is planned as a collection scan
+
+Requires a local server started with QUERY_AUDIT=true, e.g.:
+    QUERY_AUDIT=true uvicorn server:app --port 8001   (from backend/)
+
+Usage: python query_plan_test.py [base_url]
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from query_audit import collection_scans  # noqa: E402
+
+# Routes whose scans are expected on a tiny dataset or by design
+ALLOWED_SCANS = {
+    "GET /api/desafios/recomendados",  # cold start lists the newest desafios with $nin
+}
+
+FORMANDOS = 5
+DESAFIOS = 4
+
+
+class QueryPlanTester:
+    def __init__(self, base_url: str = "http://localhost:8001/api"):
+        self.base_url = base_url
+        self.stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        self.tokens = {}
+
+        print("🧭 Auditoria de planos de consulta")
+        print(f"📍 Base URL: {self.base_url}")
+        print("=" * 60)
+
+    def call(self, method: str, endpoint: str, token: str = None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = requests.request(method, f"{self.base_url}/{endpoint}", headers=headers, timeout=30, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {endpoint}: {response.status_code} {response.text}")
+        return response.json()
+
+    def register(self, tipo: str, nome: str) -> dict:
+        return self.call("POST", "register", json={
+            "email": f"{nome.lower()}_{self.stamp}@auditoria.com",
+            "nome": nome,
+            "senha": "auditoria123",
+            "tipo": tipo,
+        })
+
+    def seed(self):
+        print("\n🌱 Semeando dados")
+        admin = self.register("admin", "Admin")
+        empresa = self.register("empresa", "Empresa")
+        formandos = [self.register("formando", f"Formando{i}") for i in range(FORMANDOS)]
+        self.tokens = {"admin": admin["access_token"], "empresa": empresa["access_token"], "formando": formandos[0]["access_token"]}
+
+        cnpj = self.stamp[-14:].rjust(14, "0")
+        self.call("POST", "empresas", self.tokens["empresa"], json={"nome": "Empresa Auditoria", "cnpj": cnpj, "descricao": "Seed"})
+        self.desafios = [
+            self.call("POST", "desafios", self.tokens["empresa"], json={"titulo": f"Desafio {i}", "descricao": "sistema de dados " * 20})
+            for i in range(DESAFIOS)
+        ]
+        self.respostas = []
+        for formando in formandos:
+            for desafio in self.desafios:
+                self.respostas.append(self.call("POST", "respostas", formando["access_token"], json={
+                    "desafio_id": desafio["id"], "texto": f"resposta de {formando['user_name']} para {desafio['titulo']}",
+                }))
+        for resposta in self.respostas[: len(self.respostas) // 2]:
+            self.call("POST", "avaliacoes", self.tokens["empresa"], json={"resposta_id": resposta["id"], "nota": 8})
+        print(f"   {len(self.desafios)} desafios, {len(self.respostas)} respostas")
+
+    def exercise(self):
+        print("\n🚦 Exercitando rotas")
+        self.call("DELETE", "admin/planos-consulta", self.tokens["admin"])
+        desafio_id = self.desafios[0]["id"]
+        resposta_id = self.respostas[0]["id"]
+        pendentes = [{"resposta_id": r["id"], "nota": 7} for r in self.respostas[len(self.respostas) // 2:][:3]]
+        rotas = [
+            ("GET", "profile", "formando"),
+            ("GET", "me/bootstrap", "empresa"),
+            ("GET", "me/bootstrap", "formando"),
+            ("GET", "empresas/me", "empresa"),
+            ("GET", "desafios/empresa", "empresa"),
+            ("GET", f"desafios/{desafio_id}", "formando"),
+            ("GET", "desafios/recomendados", "formando"),
+            ("GET", f"respostas/desafio/{desafio_id}", "empresa"),
+            ("GET", f"respostas/desafio/{desafio_id}/duplicadas", "empresa"),
+            ("GET", "respostas/me", "formando"),
+            ("GET", f"respostas/{resposta_id}", "formando"),
+            ("GET", f"avaliacoes/resposta/{resposta_id}", "formando"),
+            ("GET", "matches", "empresa"),
+            ("GET", f"analytics/notas/desafio/{desafio_id}", "empresa"),
+            ("GET", "analytics/notas/empresa", "empresa"),
+            ("GET", "export/respostas?formato=ndjson", "empresa"),
+        ]
+        for method, endpoint, user in rotas:
+            self.call(method, endpoint, self.tokens[user])
+            print(f"   ✔ {method} /{endpoint}")
+        self.call("POST", "avaliacoes/lote", self.tokens["empresa"], json={"avaliacoes": pendentes})
+        print("   ✔ POST /avaliacoes/lote")
+
+    def check(self) -> int:
+        report = self.call("GET", "admin/planos-consulta", self.tokens["admin"])
+        if not report["ativo"]:
+            print("\n⚠️  Servidor sem QUERY_AUDIT=true, nada a verificar")
+            return 1
+
+        print("\n📊 Planos por rota")
+        for rota, records in report["rotas"].items():
+            for record in records:
+                marca = "❌" if record.get("collscan") and not record.get("sem_filtro") else "✅"
+                print(f"   {marca} {rota} {record['operacao']} {record['colecao']}: "
+                      f"{' > '.join(record.get('estagios', []))} (examinados/retornados {record.get('razao_examinados')})")
+                for lookup in record.get("lookups", []):
+                    print(f"      $lookup {lookup.get('de')}: {lookup.get('estrategia')}")
+
+        scans = collection_scans(report["rotas"], allow=ALLOWED_SCANS)
+        if scans:
+            print(f"\n⚠️  {len(scans)} consulta(s) filtrada(s) com COLLSCAN")
+            return 1
+        print("\n🎉 Nenhuma consulta filtrada faz COLLSCAN")
+        return 0
+
+    def run(self) -> int:
+        self.seed()
+        self.exercise()
+        return self.check()
+
+
+def main():
+    tester = QueryPlanTester(*sys.argv[1:2])
+    return tester.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from tests.support import run
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# The API under test runs on the in-memory backend; Mongo-only paths use fakes
+os.environ.setdefault("DATA_BACKEND", "memory")
+
+# Imported before any test closes its event loop: Motor binds GridFS buckets to the current loop
+import server as server_module  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    from passlib.context import CryptContext
+
+    # bcrypt is slow and not needed to exercise the routes
+    server_module.pwd_context = CryptContext(schemes=["pbkdf2_sha256"])
+    return server_module
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(server):
+    def make(tipo: str = "formando") -> tuple:
+        user_id = str(uuid.uuid4())
+        run(server.repos.usuarios.insert({
+            "id": user_id,
+            "nome": f"Usuário {user_id[:8]}",
+            "email": f"{user_id[:8]}@teste.com",
+            "tipo": tipo,
+            "senha_hash": server.get_password_hash("123456"),
+            "criado_em": datetime.utcnow(),
+        }))
+        token = server.create_access_token({"sub": user_id})
+        return user_id, {"Authorization": f"Bearer {token}"}
+
+    return make
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
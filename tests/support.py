@@ -0,0 +1,92 @@
+import asyncio
+
+
+def run(coro):
+    """Run a coroutine from a synchronous test (the TestClient owns its own loop)."""
+    return asyncio.run(coro)
+
+
+class MotorLikeCursor:
+    """The slice of Motor's cursor API the backend uses, over a synchronous cursor or list."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, key, direction=None):
+        self.cursor = self.cursor.sort(key, direction) if direction is not None else self.cursor.sort(key)
+        return self
+
+    def limit(self, limit):
+        self.cursor = self.cursor.limit(limit)
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    async def to_list(self, length=None):
+        docs = list(self.cursor)
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.cursor:
+            yield doc
+
+
+class MotorLikeCollection:
+    def __init__(self, collection, database):
+        self.collection = collection
+        self.database = database
+        self.name = collection.name
+
+    def find(self, *args, **kwargs):
+        return MotorLikeCursor(self.collection.find(*args, **kwargs))
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        return MotorLikeCursor(self.collection.aggregate(pipeline))
+
+    def list_indexes(self):
+        return MotorLikeCursor(list(self.collection.list_indexes()))
+
+    def with_options(self, *args, **kwargs):
+        return self
+
+    async def rename(self, new_name, dropTarget=False, **kwargs):
+        if dropTarget:
+            self.database.mongo.drop_collection(new_name)
+        self.collection.rename(new_name)
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class MotorLikeDatabase:
+    """A mongomock database behind Motor's async interface."""
+
+    def __init__(self, mongo=None):
+        if mongo is None:
+            import mongomock
+
+            mongo = mongomock.MongoClient().db
+        self.mongo = mongo
+
+    def __getitem__(self, name):
+        return MotorLikeCollection(self.mongo[name], self)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self, *args, **kwargs):
+        return self.mongo.list_collection_names(*args, **kwargs)
+
+    async def drop_collection(self, name):
+        self.mongo.drop_collection(name)
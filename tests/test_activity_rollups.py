@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+import activity_rollups
+from tests.support import MotorLikeDatabase, run
+
+INICIO = datetime(2026, 3, 2, 10, 30)
+
+
+@pytest.fixture
+def rollup_db():
+    import outbox
+
+    # Counted the way production counts them: through the outbox worker
+    database = MotorLikeDatabase()
+    for hora in range(3):
+        database.mongo.respostas.insert_one({"id": f"r{hora}", "desafio_id": "d1"})
+        database.mongo.outbox.insert_one(outbox.new_event(outbox.EVENTO_RESPOSTA_CRIADA, {
+            "id": f"r{hora}", "empresa_id": "e1", "em": INICIO + timedelta(hours=hora),
+        }))
+    assert run(outbox.OutboxWorker(database).process_batch()) == 3
+    return database
+
+
+@pytest.fixture
+def admin_api(server, client, make_user, rollup_db, monkeypatch):
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+    monkeypatch.setattr(server, "db", rollup_db)
+    _, headers = make_user("admin")
+    return client, headers
+
+
+def test_naive_utc_converts_offsets():
+    assert activity_rollups.naive_utc(datetime(2026, 3, 2, 13, 0, tzinfo=timezone(timedelta(hours=3)))) == \
+        datetime(2026, 3, 2, 10, 0)
+    assert activity_rollups.naive_utc(INICIO) is INICIO
+
+
+def test_query_series_with_aware_bounds(rollup_db):
+    inicio = datetime(2026, 3, 2, 10, 0, tzinfo=timezone.utc)
+    serie = run(activity_rollups.query_series(
+        rollup_db, activity_rollups.METRICA_RESPOSTAS, inicio, inicio + timedelta(hours=3),
+        activity_rollups.GRANULARIDADE_HORA,
+    ))
+    assert serie["labels"][0] == "2026-03-02T10:00:00"
+    assert serie["series"][0]["dados"] == [1, 1, 1, 0]
+
+
+@pytest.mark.parametrize("inicio", ["2026-03-02T10:00:00Z", "2026-03-02T07:00:00-03:00"])
+def test_atividade_accepts_zulu_and_offset_inicio(admin_api, inicio):
+    client, headers = admin_api
+    response = client.get("/api/admin/atividade", headers=headers, params={
+        "metrica": activity_rollups.METRICA_RESPOSTAS, "inicio": inicio, "granularidade": "hora",
+    })
+    assert response.status_code == 200
+    assert response.json()["series"][0]["dados"][:3] == [1, 1, 1]
+
+
+def test_atividade_aware_fim_before_inicio(admin_api):
+    client, headers = admin_api
+    response = client.get("/api/admin/atividade", headers=headers, params={
+        "metrica": activity_rollups.METRICA_RESPOSTAS,
+        "inicio": "2026-03-02T10:00:00Z",
+        "fim": "2026-03-02T09:00:00+00:00",
+    })
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def source_db():
+    import archival
+
+    database = MotorLikeDatabase()
+    mongo = database.mongo
+    mongo.usuarios.insert_one({"id": "u1", "tipo": "formando", "criado_em": INICIO})
+    mongo.desafios.insert_one({"id": "d1", "empresa_id": "e1", "criado_em": INICIO})
+    mongo[archival.ARQUIVO["desafios"]].insert_one({"id": "d0", "empresa_id": "e1", "criado_em": INICIO})
+    mongo.respostas.insert_one({"id": "r1", "desafio_id": "d1", "enviada_em": INICIO})
+    mongo[archival.ARQUIVO["respostas"]].insert_one({"id": "r0", "desafio_id": "d0", "enviada_em": INICIO})
+    mongo[archival.ARQUIVO["avaliacoes"]].insert_one({"id": "a0", "resposta_id": "r0", "avaliado_em": INICIO})
+    mongo.atividade_diaria.insert_one({"_id": "registros|antigo", "metrica": "registros", "total": 99})
+    return database
+
+
+def daily_total(database, metrica: str) -> int:
+    doc = database.mongo.atividade_diaria.find_one({"metrica": metrica, "periodo": datetime(2026, 3, 2)})
+    return doc["total"] if doc else 0
+
+
+def test_backfill_counts_archives_and_swaps(source_db):
+    processed = run(activity_rollups.backfill(source_db))
+    assert processed == {"registros": 1, "desafios": 2, "respostas": 2, "avaliacoes": 1}
+    assert daily_total(source_db, activity_rollups.METRICA_RESPOSTAS) == 2
+    avaliacoes = source_db.mongo.atividade_horaria.find_one({"metrica": activity_rollups.METRICA_AVALIACOES})
+    assert avaliacoes["por_empresa"] == {"e1": 1}
+    assert source_db.mongo.atividade_diaria.find_one({"_id": "registros|antigo"}) is None
+    nomes = source_db.mongo.list_collection_names()
+    assert not [nome for nome in nomes if nome.endswith(activity_rollups.REBUILD_SUFFIX)]
+    assert any(index["key"].get("periodo") for index in source_db.mongo.atividade_diaria.list_indexes())
+
+
+def test_fenced_backfill_skips_counted_events_only(source_db):
+    import outbox
+
+    worker = outbox.OutboxWorker(source_db)
+    contado = outbox.new_event(outbox.EVENTO_RESPOSTA_CRIADA, {"id": "r1", "em": INICIO})
+    tardio = outbox.new_event(outbox.EVENTO_RESPOSTA_CRIADA, {"id": "r2", "em": INICIO})
+    source_db.mongo.outbox.insert_many([contado, tardio])
+
+    run(worker.rebuild_projection(outbox.PROJECAO_ATIVIDADE,
+                                  lambda marcar: activity_rollups.backfill(source_db, marcar=marcar)))
+    assert daily_total(source_db, activity_rollups.METRICA_RESPOSTAS) == 2
+
+    source_db.mongo.respostas.insert_one({"id": "r2", "desafio_id": "d1", "enviada_em": INICIO})
+    assert run(worker.process_batch()) == 2
+    assert daily_total(source_db, activity_rollups.METRICA_RESPOSTAS) == 3
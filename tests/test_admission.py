@@ -0,0 +1,74 @@
+import pytest
+
+import admission
+from admission import AdmissionController, Rejected, TokenBucketLimiter
+
+
+def test_cost_classes_name_real_routes(server):
+    paths = {(method, route.path) for route in server.app.routes for method in getattr(route, "methods", ())}
+    assert set(admission.ROUTE_COST_CLASSES) <= paths
+
+
+@pytest.mark.parametrize("rota", [
+    ("POST", "/api/avaliacoes/lote"),
+    ("GET", "/api/matches"),
+    ("GET", "/api/admin/usuarios"),
+])
+def test_heavy_routes_are_pesada(rota):
+    assert admission.ROUTE_COST_CLASSES[rota] == admission.CLASSE_PESADA
+
+
+@pytest.mark.parametrize("rota", [
+    ("GET", "/api/export/respostas"),
+    ("POST", "/api/respostas/{resposta_id}/anexos"),
+    ("POST", "/api/admin/atividade/backfill"),
+    ("POST", "/api/admin/analytics/notas/rebuild"),
+    ("POST", "/api/admin/arquivamento"),
+    ("POST", "/api/admin/consistencia/nomes"),
+    ("POST", "/api/admin/outbox/replay"),
+])
+def test_unbounded_jobs_are_longa(rota):
+    assert admission.ROUTE_COST_CLASSES[rota] == admission.CLASSE_LONGA
+
+
+def test_bootstrap_is_not_queued_behind_heavy_work():
+    assert ("GET", "/api/me/bootstrap") not in admission.ROUTE_COST_CLASSES
+
+
+def test_account_bucket_is_per_ip():
+    controller = AdmissionController()
+    controller.user_limiter = TokenBucketLimiter("usuario", 10, 2)
+    for _ in range(2):
+        controller.check_user("Vitima@Teste.com", "10.0.0.1")
+    with pytest.raises(Rejected):
+        controller.check_user("vitima@teste.com", "10.0.0.1")
+    # The owner, from another address, is not locked out by the flood
+    controller.check_user("vitima@teste.com", "10.0.0.2")
+
+
+def test_attempts_spread_over_many_ips_still_drain_the_account():
+    controller = AdmissionController()
+    controller.account_limiter = TokenBucketLimiter("conta", 10, 3)
+    for i in range(3):
+        controller.check_user("vitima@teste.com", f"10.0.0.{i}")
+    with pytest.raises(Rejected):
+        controller.check_user("Vitima@teste.com", "10.0.0.99")
+    controller.check_user("outra@teste.com", "10.0.0.99")
+
+
+@pytest.fixture
+def limited(server, monkeypatch):
+    monkeypatch.setattr(server.admission_controller, "user_limiter", TokenBucketLimiter("usuario", 1, 2))
+    monkeypatch.setattr(server.admission_controller, "account_limiter", TokenBucketLimiter("conta", 600, 100))
+    monkeypatch.setattr(server.admission_controller, "ip_limiter", TokenBucketLimiter("ip", 600, 100))
+
+
+@pytest.mark.parametrize("rota, corpo", [
+    ("/api/login", {"email": "alvo@teste.com", "senha": "errada"}),
+    ("/api/register", {"nome": "Alvo", "email": "alvo2@teste.com", "senha": "123456", "tipo": "desconhecido"}),
+])
+def test_login_and_register_are_limited_per_account(client, limited, rota, corpo):
+    status = [client.post(rota, json=corpo).status_code for _ in range(3)]
+    assert status[-1] == 429
+    assert 429 not in status[:2]
+    assert client.post(rota, json={**corpo, "email": "outro@teste.com"}).status_code != 429
@@ -0,0 +1,168 @@
+import hashlib
+import uuid
+from datetime import datetime
+
+import pytest
+
+import attachments
+from tests.support import MotorLikeDatabase, run
+
+CONTEUDO = bytes(range(256)) * 1024
+
+
+class FakeGridOut:
+    """Mirrors AsyncIOMotorGridOut: seek is synchronous, read is a coroutine."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+
+    def seek(self, pos: int) -> int:
+        self.position = pos
+        return pos
+
+    async def read(self, size: int = -1) -> bytes:
+        end = len(self.data) if size < 0 else self.position + size
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+
+class FakeBucket:
+    def __init__(self):
+        self.files = {}
+
+    async def open_download_stream(self, file_id):
+        return FakeGridOut(self.files[file_id])
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one(self, filtro, *args, **kwargs):
+        return next((dict(doc) for doc in self.docs if all(doc.get(k) == v for k, v in filtro.items())), None)
+
+
+class FakeDatabase:
+    def __init__(self, anexos):
+        self.anexos = FakeCollection(anexos)
+
+
+@pytest.fixture
+def anexo(server, client, make_user, monkeypatch):
+    from bson import ObjectId
+
+    storage = attachments.GridFSStorage(server.raw_db)
+    storage.bucket = FakeBucket()
+    file_id = ObjectId()
+    storage.bucket.files[file_id] = CONTEUDO
+    monkeypatch.setitem(server.attachment_storages, attachments.STORAGE_GRIDFS, storage)
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+
+    formando_id, headers = make_user("formando")
+    resposta_id = str(uuid.uuid4())
+    run(server.repos.respostas.insert({
+        "id": resposta_id, "desafio_id": str(uuid.uuid4()), "usuario_id": formando_id,
+        "empresa_id": str(uuid.uuid4()), "texto": "resposta", "enviada_em": datetime.utcnow(),
+    }))
+    doc = attachments.new_metadata(resposta_id, formando_id, attachments.STORAGE_GRIDFS, {
+        "nome_arquivo": "relatório.pdf",
+        "content_type": "text/html",
+        "tamanho": len(CONTEUDO),
+        "sha256": hashlib.sha256(CONTEUDO).hexdigest(),
+        "storage_key": str(file_id),
+    })
+    monkeypatch.setattr(server, "db", FakeDatabase([doc]))
+    return doc, headers
+
+
+def test_gridfs_download_whole_file(client, anexo):
+    doc, headers = anexo
+    response = client.get(f"/api/anexos/{doc['id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.content == CONTEUDO
+    assert response.headers["content-length"] == str(len(CONTEUDO))
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert "content-range" not in response.headers
+
+
+def test_gridfs_download_open_ended_range(client, anexo):
+    doc, headers = anexo
+    inicio = len(CONTEUDO) - 70000
+    response = client.get(f"/api/anexos/{doc['id']}", headers={**headers, "Range": f"bytes={inicio}-"})
+    assert response.status_code == 206
+    assert response.content == CONTEUDO[inicio:]
+    assert response.headers["content-range"] == f"bytes {inicio}-{len(CONTEUDO) - 1}/{len(CONTEUDO)}"
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+
+def test_gridfs_download_unsatisfiable_range(client, anexo):
+    doc, headers = anexo
+    response = client.get(f"/api/anexos/{doc['id']}", headers={**headers, "Range": f"bytes={len(CONTEUDO)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTEUDO)}"
+
+
+def multipart_body(boundary: str, arquivos) -> bytes:
+    partes = []
+    for nome, conteudo in arquivos:
+        partes.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="arquivos"; filename="{nome}"\r\n'
+            f"Content-Type: application/pdf\r\n\r\n".encode() + conteudo + b"\r\n"
+        )
+    return b"".join(partes) + f"--{boundary}--\r\n".encode()
+
+
+async def chunks(data: bytes, size: int = 1000):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def stored_files(root) -> list:
+    return [path for path in root.rglob("*") if path.is_file()]
+
+
+def test_multipart_streams_files_into_storage(tmp_path):
+    storage = attachments.LocalStorage(tmp_path)
+    body = multipart_body("limite", [("a.pdf", CONTEUDO[:5000]), ("b.pdf", b"pequeno")])
+    armazenados = run(attachments.receive_multipart("multipart/form-data; boundary=limite", chunks(body), storage))
+    assert [(a["nome_arquivo"], a["tamanho"]) for a in armazenados] == [("a.pdf", 5000), ("b.pdf", 7)]
+    assert armazenados[0]["sha256"] == hashlib.sha256(CONTEUDO[:5000]).hexdigest()
+    assert len(stored_files(tmp_path)) == 2
+
+
+def test_malformed_multipart_is_a_400_and_leaves_no_files(tmp_path):
+    storage = attachments.LocalStorage(tmp_path)
+    # The first part is complete and stored before the parser hits the garbage
+    body = multipart_body("limite", [("a.pdf", b"conteudo")])[:-len("--limite--\r\n")] + b"--limiteXX lixo"
+    with pytest.raises(attachments.AttachmentError) as error:
+        run(attachments.receive_multipart("multipart/form-data; boundary=limite", chunks(body, 7), storage))
+    assert error.value.status_code == 400
+    assert stored_files(tmp_path) == []
+
+
+def test_failed_metadata_insert_deletes_the_stored_files(server, client, make_user, monkeypatch, tmp_path):
+    pytest.importorskip("mongomock")
+
+    class FailingDatabase(MotorLikeDatabase):
+        def __getitem__(self, name):
+            collection = super().__getitem__(name)
+            if name == "anexos":
+                async def insert_many(docs, **kwargs):
+                    raise RuntimeError("falha de escrita")
+                collection.insert_many = insert_many
+            return collection
+
+    formando_id, headers = make_user("formando")
+    database = FailingDatabase()
+    database.mongo.respostas.insert_one({"id": "r1", "usuario_id": formando_id})
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+    monkeypatch.setitem(server.attachment_storages, server.ATTACHMENT_STORAGE, attachments.LocalStorage(tmp_path))
+
+    body = multipart_body("limite", [("a.pdf", b"um"), ("b.pdf", b"dois")])
+    with pytest.raises(RuntimeError):
+        client.post("/api/respostas/r1/anexos", content=body,
+                    headers={**headers, "Content-Type": "multipart/form-data; boundary=limite"})
+    assert stored_files(tmp_path) == []
@@ -0,0 +1,110 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from tests.support import run
+
+
+@pytest.fixture
+def graded_setup(server, make_user):
+    empresa_user, headers = make_user("empresa")
+    formando_id, _ = make_user("formando")
+    empresa_id, desafio_id = str(uuid.uuid4()), str(uuid.uuid4())
+    run(server.repos.empresas.insert({"id": empresa_id, "usuario_id": empresa_user, "nome": "Empresa", "cnpj": "11222333000181"}))
+    desafio = {"id": desafio_id, "empresa_id": empresa_id, "empresa_nome": "Empresa", "titulo": "Desafio",
+               "descricao": "descrição", "criado_em": datetime.utcnow()}
+    run(server.repos.desafios.insert(desafio))
+    resposta = {"id": str(uuid.uuid4()), "desafio_id": desafio_id, "usuario_id": formando_id, "empresa_id": empresa_id,
+                "formando_nome": "Formando", "texto": "resposta", "enviada_em": datetime.utcnow()}
+    run(server.repos.respostas.insert(resposta))
+    return headers, empresa_id, desafio, resposta
+
+
+def test_concurrent_single_grading_is_rejected(server, client, graded_setup, monkeypatch):
+    headers, empresa_id, desafio, resposta = graded_setup
+    run(server.repos.avaliacoes.insert({"id": str(uuid.uuid4()), "resposta_id": resposta["id"], "nota": 7.0}))
+
+    # The other request's avaliacao lands after this one's existence check
+    async def not_found_yet(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(server.repos.avaliacoes, "find_one", not_found_yet)
+    response = client.post("/api/avaliacoes", headers=headers, json={"resposta_id": resposta["id"], "nota": 9.0})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Resposta já foi avaliada"
+
+
+mongomock = pytest.importorskip("mongomock")
+
+from tests.support import MotorLikeDatabase  # noqa: E402
+
+
+class AsyncList:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+class RacingDatabase(MotorLikeDatabase):
+    """The batch's distinct misses avaliacoes another request writes right after it."""
+
+    def __getitem__(self, name):
+        collection = super().__getitem__(name)
+        if name == "avaliacoes":
+            async def distinct(*args, **kwargs):
+                return []
+            collection.distinct = distinct
+        if name == "respostas":
+            # mongomock has no $lookup with a pipeline: join the batch's ownership by hand
+            def aggregate(pipeline, **kwargs):
+                ids = pipeline[0]["$match"]["id"]["$in"]
+                docs = []
+                for resposta in self.mongo.respostas.find({"id": {"$in": ids}}, {"_id": 0}):
+                    desafio = self.mongo.desafios.find_one({"id": resposta["desafio_id"]})
+                    docs.append({**resposta, "desafio_titulo": desafio["titulo"], "proprio": True})
+                return AsyncList(docs)
+            collection.aggregate = aggregate
+        return collection
+
+
+def test_concurrent_batch_grading_reports_ja_avaliada(server, client, graded_setup, monkeypatch):
+    headers, empresa_id, desafio, resposta = graded_setup
+    database = RacingDatabase()
+    database.mongo.avaliacoes.create_index("resposta_id", unique=True)
+    database.mongo.desafios.insert_one(dict(desafio))
+    outra = {**resposta, "id": str(uuid.uuid4()), "usuario_id": str(uuid.uuid4())}
+    database.mongo.respostas.insert_many([dict(resposta), dict(outra)])
+    database.mongo.avaliacoes.insert_one({"id": str(uuid.uuid4()), "resposta_id": resposta["id"], "nota": 7.0})
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server.outbox_worker, "db", database)
+
+    response = client.post("/api/avaliacoes/lote", headers=headers, json={"avaliacoes": [
+        {"resposta_id": resposta["id"], "nota": 9.0},
+        {"resposta_id": outra["id"], "nota": 8.0},
+    ]})
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == ["ja_avaliada", "criada"]
+    assert database.mongo.avaliacoes.count_documents({"resposta_id": resposta["id"]}) == 1
+
+
+def test_unique_index_replaces_the_plain_one(server):
+    database = MotorLikeDatabase()
+    database.mongo.avaliacoes.create_index("resposta_id")
+    database.mongo.avaliacoes.insert_one({"resposta_id": "r1"})
+    run(server.ensure_unique_index(database.avaliacoes, "resposta_id"))
+    run(server.ensure_unique_index(database.avaliacoes, "resposta_id"))
+    indexes = [i for i in database.mongo.avaliacoes.list_indexes() if "resposta_id" in i["key"]]
+    assert len(indexes) == 1 and indexes[0]["unique"]
+
+
+def test_unique_index_waits_for_duplicates_to_be_resolved(server):
+    database = MotorLikeDatabase()
+    database.mongo.avaliacoes.create_index("resposta_id")
+    database.mongo.avaliacoes.insert_many([{"resposta_id": "r1"}, {"resposta_id": "r1"}])
+    run(server.ensure_unique_index(database.avaliacoes, "resposta_id"))
+    indexes = [i for i in database.mongo.avaliacoes.list_indexes() if "resposta_id" in i["key"]]
+    assert len(indexes) == 1 and not indexes[0].get("unique")
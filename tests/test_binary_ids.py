@@ -0,0 +1,222 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+from bson.binary import Binary
+from bson.objectid import ObjectId
+
+import archival
+import binary_ids
+import grade_analytics
+import repositories
+import user_listing
+from tests.support import MotorLikeDatabase
+
+pytestmark = pytest.mark.anyio
+
+T0 = datetime(2026, 1, 1)
+
+
+def new_id() -> str:
+    return str(uuid.uuid4())
+
+
+def test_filter_encodes_dotted_foreign_keys_and_elem_match():
+    usuario = new_id()
+    encoded = binary_ids.encode_filter({
+        "resposta.usuario_id": usuario,
+        "avaliacoes": {"$elemMatch": {"formando_id": {"$in": [usuario]}}},
+        "titulo": usuario,
+    }, True)
+    assert encoded["resposta.usuario_id"] == Binary.from_uuid(uuid.UUID(usuario))
+    assert encoded["avaliacoes"]["$elemMatch"]["formando_id"]["$in"] == [Binary.from_uuid(uuid.UUID(usuario))]
+    # Not an id field: stored as written
+    assert encoded["titulo"] == usuario
+
+
+def test_filter_encodes_expr_paths_and_compared_literals():
+    desafio, outro = new_id(), new_id()
+    encoded = binary_ids.encode_filter({"$expr": {"$and": [
+        {"$eq": ["$desafio_id", desafio]},
+        {"$in": ["$id", [outro]]},
+        {"$eq": ["$$desafio_id", "$desafio.id"]},
+        {"$eq": ["$titulo", desafio]},
+    ]}}, True)
+    eq_fk, in_id, eq_join, eq_plain = encoded["$expr"]["$and"]
+    assert eq_fk == {"$eq": ["$desafio_id", Binary.from_uuid(uuid.UUID(desafio))]}
+    assert in_id == {"$in": ["$_id", [Binary.from_uuid(uuid.UUID(outro))]]}
+    assert eq_join == {"$eq": ["$$desafio_id", "$desafio._id"]}
+    assert eq_plain == {"$eq": ["$titulo", desafio]}
+
+
+def test_update_encodes_array_operators():
+    usuario, outro = new_id(), new_id()
+    encoded = binary_ids.encode_update({
+        "$push": {"avaliadores": {"$each": [{"usuario_id": usuario}], "$slice": -5}},
+        "$addToSet": {"historico.usuario_id": outro},
+        "$pull": {"convites": {"usuario_id": outro}, "membros.usuario_id": {"$in": [usuario]}},
+        "$inc": {"total": 1},
+    }, True)
+    binario = Binary.from_uuid(uuid.UUID(usuario))
+    assert encoded["$push"]["avaliadores"] == {"$each": [{"usuario_id": binario}], "$slice": -5}
+    assert encoded["$addToSet"]["historico.usuario_id"] == Binary.from_uuid(uuid.UUID(outro))
+    assert encoded["$pull"]["convites"] == {"usuario_id": Binary.from_uuid(uuid.UUID(outro))}
+    assert encoded["$pull"]["membros.usuario_id"] == {"$in": [binario]}
+    assert encoded["$inc"] == {"total": 1}
+
+
+def test_update_rejects_unsupported_operators():
+    with pytest.raises(ValueError):
+        binary_ids.encode_update({"$bit": {"flags": {"and": 1}}}, True)
+
+
+def test_embedded_foreign_keys_round_trip():
+    usuario = new_id()
+    doc = {"id": new_id(), "participantes": [{"usuario_id": usuario, "papel": "autor"}]}
+    stored = binary_ids.encode_document(doc, True)
+    assert stored["participantes"][0]["usuario_id"] == Binary.from_uuid(uuid.UUID(usuario))
+    assert binary_ids.decode_document(stored, True) == doc
+
+
+@pytest.fixture
+def raw():
+    return MotorLikeDatabase()
+
+
+@pytest.fixture
+def world(raw):
+    """Four formandos who answered one empresa's desafio, each graded."""
+    return {
+        "usuarios": [new_id() for _ in range(4)],
+        "respostas": [new_id() for _ in range(4)],
+        "empresa": new_id(),
+        "desafio": new_id(),
+    }
+
+
+async def populate(repos, world):
+    usuarios, respostas = world["usuarios"], world["respostas"]
+    for i, usuario in enumerate(usuarios):
+        await repos.usuarios.insert({"id": usuario, "nome": f"Nome {i}", "email": f"u{i}@x.com", "tipo": "formando",
+                                     "criado_em": T0, "nome_busca": f"nome {i}"})
+    await repos.empresas.insert({"id": world["empresa"], "usuario_id": usuarios[0], "nome": "Emp"})
+    await repos.desafios.insert({"id": world["desafio"], "empresa_id": world["empresa"], "titulo": "T", "descricao": "x",
+                                 "empresa_nome": "Emp", "criado_em": T0, "status": "aberto"})
+    for i, (usuario, resposta) in enumerate(zip(usuarios, respostas)):
+        await repos.respostas.insert({"id": resposta, "desafio_id": world["desafio"], "usuario_id": usuario,
+                                      "empresa_id": world["empresa"], "texto": "t", "enviada_em": T0 + timedelta(i)})
+        await repos.avaliacoes.insert({
+            "id": new_id(), "resposta_id": resposta, "desafio_id": world["desafio"], "desafio_titulo": "T",
+            "empresa_id": world["empresa"], "empresa_nome": "Emp", "formando_id": usuario,
+            "formando_nome": f"Nome {i}", "nota": 8.0 + i * 0.1,
+        })
+
+
+async def test_repositories_store_binary_and_read_strings(raw, world):
+    db = binary_ids.IdCodecDatabase(raw)
+    repos = repositories.motor_repositories(db)
+    await populate(repos, world)
+    respostas, usuarios, desafio = world["respostas"], world["usuarios"], world["desafio"]
+
+    stored = raw.mongo.respostas.find_one({"_id": Binary.from_uuid(uuid.UUID(respostas[0]))})
+    assert isinstance(stored["desafio_id"], Binary) and "id" not in stored
+
+    doc = await repos.respostas.find_one({"id": respostas[0]})
+    assert doc["id"] == respostas[0] and doc["desafio_id"] == desafio and "_id" not in doc
+    listed = await repos.respostas.find({"desafio_id": desafio}, sort=("enviada_em", -1))
+    assert [r["id"] for r in listed] == respostas[::-1]
+    assert await repos.respostas.find({"id": respostas[1]}, fields=["id", "usuario_id"]) == [
+        {"id": respostas[1], "usuario_id": usuarios[1]}
+    ]
+    assert await repos.respostas.count({"empresa_id": world["empresa"]}) == 4
+    assert sorted(await db.respostas.distinct("id", {"id": {"$in": respostas[:2]}})) == sorted(respostas[:2])
+
+    matches = await repos.avaliacoes.matches(7.0)
+    assert all(m["formando_id"] in usuarios and m["empresa_id"] == world["empresa"] for m in matches)
+    assert await repos.desafios.update(desafio, {"status": "x"})
+    assert (await repos.desafios.find_one({"id": desafio}))["status"] == "x"
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = await repos.usuarios.list_page(user_listing.Consulta(limite=3, cursor=cursor))
+        seen += [u["id"] for u in page]
+        if not cursor:
+            break
+    assert seen == sorted(usuarios)
+
+
+async def test_pipelines_join_on_binary_ids(raw, world):
+    db = binary_ids.IdCodecDatabase(raw)
+    await populate(repositories.motor_repositories(db), world)
+
+    rows = await db.respostas.aggregate([
+        {"$match": {"id": {"$in": world["respostas"][:2]}}},
+        {"$lookup": {"from": "desafios", "localField": "desafio_id", "foreignField": "id", "as": "desafio"}},
+        {"$project": {"_id": 0, "id": 1, "desafio_id": 1, "dono": {"$arrayElemAt": ["$desafio.empresa_id", 0]}}},
+    ]).to_list(None)
+    assert sorted(r["id"] for r in rows) == sorted(world["respostas"][:2])
+    assert all(r["desafio_id"] == world["desafio"] and r["dono"] == world["empresa"] for r in rows)
+
+    assert await grade_analytics.rebuild_rollups(db) == 4
+    rollup = raw.mongo.notas_rollup.find_one({"_id": grade_analytics.rollup_id("empresa", world["empresa"])})
+    assert grade_analytics.summarize(rollup)["total"] == 4
+
+    assert await db.usuarios.create_index([("id", 1)]) == "_id_"
+    assert await db.usuarios.create_index([("tipo", 1), ("id", 1)]) == "tipo_1__id_1"
+
+
+async def test_archived_documents_keep_binary_keys(raw, world):
+    db = binary_ids.IdCodecDatabase(raw)
+    repos = repositories.motor_repositories(db)
+    await populate(repos, world)
+    raw.mongo.desafios.update_one({}, {"$set": {"status": "encerrado", "encerrado_em": T0}})
+
+    assert await archival.archive_closed(db, timedelta(days=1)) == {"desafios": 1, "respostas": 4, "avaliacoes": 4}
+    assert (await repos.respostas.find_one({"id": world["respostas"][0]}, True))["id"] == world["respostas"][0]
+    assert isinstance(raw.mongo.matches_arquivo.find_one()["formando_id"], Binary)
+
+
+async def test_migrate_revert_round_trip(raw, world):
+    db = binary_ids.IdCodecDatabase(raw)
+    repos = repositories.motor_repositories(db)
+    await populate(repos, world)
+    raw.mongo.desafios.update_one({}, {"$set": {"status": "encerrado", "encerrado_em": T0}})
+    await archival.archive_closed(db, timedelta(days=1))
+    await db.usuarios.create_index([("tipo", 1), ("id", 1)])
+
+    reverted = await binary_ids.revert(raw)
+    assert reverted["usuarios"] == {"documentos": 4, "indices_removidos": ["tipo_1__id_1"], "chaves_estrangeiras": 0}
+    legacy = raw.mongo.usuarios.find_one()
+    assert isinstance(legacy["_id"], ObjectId) and legacy["id"] in world["usuarios"]
+    assert raw.mongo.usuarios.count_documents({}) == 4
+    assert (await binary_ids.pending(raw))["respostas_arquivo"] == 4
+
+    migrated = await binary_ids.migrate(raw)
+    assert migrated["usuarios"]["documentos"] == 4 and migrated["matches_arquivo"]["chaves_estrangeiras"] == 4
+    # A second run finds nothing left to convert
+    again = await binary_ids.migrate(raw)
+    assert all(not entry.get("documentos") and not entry["chaves_estrangeiras"] for entry in again.values())
+    assert set((await binary_ids.pending(raw)).values()) == {0}
+    assert raw.mongo.usuarios.count_documents({}) == 4
+
+    assert (await repos.usuarios.find_one({"id": world["usuarios"][2]}))["nome"] == "Nome 2"
+    arquivada = await repos.respostas.find_one({"id": world["respostas"][3]}, True)
+    assert arquivada["usuario_id"] == world["usuarios"][3]
+
+
+def test_correlated_lookup_encodes_the_sub_pipeline():
+    empresa = str(uuid.uuid4())
+    [stage] = binary_ids.encode_pipeline([{"$lookup": {
+        "from": "desafios",
+        "let": {"desafio_id": "$desafio_id"},
+        "pipeline": [{"$match": {"$expr": {"$eq": ["$id", "$$desafio_id"]}, "empresa_id": empresa}}],
+        "as": "desafio",
+    }}], ids=True)
+    lookup = stage["$lookup"]
+    assert lookup["let"] == {"desafio_id": "$desafio_id"}
+    [match] = lookup["pipeline"]
+    assert match["$match"]["$expr"] == {"$eq": ["$_id", "$$desafio_id"]}
+    assert match["$match"]["empresa_id"] == Binary.from_uuid(uuid.UUID(empresa))
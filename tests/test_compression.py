@@ -0,0 +1,157 @@
+import gzip
+import json
+
+import pytest
+from starlette.responses import JSONResponse
+from starlette.routing import Route, Router
+
+import compression
+from compression import CompressionMiddleware, PayloadCache
+
+pytestmark = pytest.mark.anyio
+
+ROTA = "/api/desafios"
+
+
+def make_app(cache=None, size=4096, status=200):
+    calls = []
+
+    async def desafios(request):
+        calls.append(request.url.query)
+        return JSONResponse({"itens": "x" * size}, status_code=status)
+
+    router = Router(routes=[Route(ROTA, desafios), Route("/api/outra", desafios)])
+    return CompressionMiddleware(router, router, cache=cache), calls
+
+
+async def request(app, path=ROTA, method="GET", query=b"", **headers):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "scheme": "http",
+        "query_string": query,
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+        "server": ("teste", 80),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    body = b"".join(m.get("body", b"") for m in sent[1:] if m["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), body
+
+
+def test_negotiate_honours_weights_and_availability():
+    assert compression.negotiate("gzip") == "gzip"
+    assert compression.negotiate("gzip;q=0, identity") is None
+    assert compression.negotiate("") is None
+    assert compression.negotiate("*") == compression.PREFERENCE[0]
+    # Encodings whose package is missing are never chosen
+    assert compression.negotiate("gzip;q=0.5, unknown") == "gzip"
+
+
+async def test_large_json_is_gzipped_and_small_is_not():
+    app, _ = make_app()
+    status, headers, body = await request(app, path="/api/outra", accept_encoding="gzip")
+    assert status == 200
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"content-length"] == str(len(body)).encode()
+    assert json.loads(gzip.decompress(body))["itens"] == "x" * 4096
+
+    app, _ = make_app(size=10)
+    _, headers, body = await request(app, path="/api/outra", accept_encoding="gzip")
+    assert b"content-encoding" not in headers
+    assert json.loads(body)["itens"] == "x" * 10
+
+
+@pytest.mark.parametrize("encoding,package", [("br", "brotli"), ("zstd", "zstandard")])
+async def test_optional_encodings_round_trip(encoding, package):
+    module = pytest.importorskip(package)
+    app, _ = make_app()
+    _, headers, body = await request(app, path="/api/outra", accept_encoding=encoding)
+    assert headers[b"content-encoding"] == encoding.encode()
+    if encoding == "br":
+        raw = module.decompress(body)
+    else:
+        raw = module.ZstdDecompressor().decompress(body)
+    assert json.loads(raw)["itens"] == "x" * 4096
+
+
+async def test_cached_route_renders_once_per_query():
+    app, calls = make_app(cache=PayloadCache())
+    first = await request(app, accept_encoding="gzip")
+    second = await request(app, accept_encoding="gzip")
+    assert first == second
+    assert calls == [""]
+    await request(app, query=b"page=2")
+    assert calls == ["", "page=2"]
+
+
+async def test_matching_if_none_match_gets_304_without_the_handler():
+    app, calls = make_app(cache=PayloadCache())
+    _, headers, _ = await request(app, accept_encoding="gzip")
+    etag = headers[b"etag"]
+    assert etag.endswith(b'-gzip"')
+
+    # The tag of any representation matches; the 304 carries the one negotiated now
+    status, headers, body = await request(app, if_none_match=etag.decode())
+    assert (status, body) == (304, b"")
+    assert b"-" not in headers[b"etag"]
+    assert calls == [""]
+
+    status, _, _ = await request(app, if_none_match='"outra-coisa"')
+    assert status == 200
+
+
+async def test_invalidate_drops_entries():
+    cache = PayloadCache()
+    app, calls = make_app(cache=cache)
+    _, headers, _ = await request(app)
+    cache.invalidate(ROTA)
+    status, _, _ = await request(app, if_none_match=headers[b"etag"].decode())
+    # A miss renders the full response even when the body happens to be unchanged
+    assert calls == ["", ""]
+    assert status == 200
+
+
+async def test_response_rendered_across_an_invalidation_is_not_cached():
+    cache = PayloadCache()
+    entry = compression.CachedPayload(200, [], b"antigo", cache.versoes[ROTA])
+    cache.invalidate(ROTA)
+    cache.put(ROTA, b"", entry)
+    assert cache.get(ROTA, b"") is None
+
+
+async def test_expired_entries_miss(monkeypatch):
+    cache = PayloadCache()
+    cache.put(ROTA, b"", compression.CachedPayload(200, [], b"corpo", cache.versoes[ROTA]))
+    assert cache.get(ROTA, b"") is not None
+    monkeypatch.setattr(compression.time, "monotonic", lambda: float("inf"))
+    assert cache.get(ROTA, b"") is None
+
+
+async def test_errors_are_forwarded_and_not_cached():
+    cache = PayloadCache()
+    app, calls = make_app(cache=cache, status=500)
+    status, _, _ = await request(app)
+    assert status == 500
+    await request(app)
+    assert calls == ["", ""]
+    assert not cache.entries[ROTA]
+
+
+def test_variants_per_route_are_bounded():
+    cache = PayloadCache()
+    for i in range(compression.CACHE_VARIANTS + 2):
+        cache.put(ROTA, str(i).encode(), compression.CachedPayload(200, [], b"c", cache.versoes[ROTA]))
+    assert len(cache.entries[ROTA]) == compression.CACHE_VARIANTS
+    assert b"0" not in cache.entries[ROTA]
@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+
+import deadlines
+from deadlines import DeadlineCollection, DeadlineExceeded, DeadlineMiddleware
+
+pytestmark = pytest.mark.anyio
+
+
+class SlowCollection:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = []
+
+    async def _op(self, name, kwargs):
+        self.calls.append((name, kwargs))
+        await asyncio.sleep(self.delay)
+        return name
+
+    def find_one(self, *args, **kwargs):
+        return self._op("find_one", kwargs)
+
+    def insert_one(self, *args, **kwargs):
+        return self._op("insert_one", kwargs)
+
+    def find_one_and_update(self, *args, **kwargs):
+        return self._op("find_one_and_update", kwargs)
+
+
+def budget(ms: float):
+    # Each async test runs in its own context, so the deadline does not leak into other tests
+    deadlines._deadline.set(time.monotonic() + ms / 1000.0)
+
+
+async def test_reads_are_bounded():
+    budget(20)
+    collection = SlowCollection(0.5)
+    with pytest.raises(DeadlineExceeded):
+        await DeadlineCollection(collection).find_one({})
+    assert 0 < collection.calls[0][1]["maxTimeMS"] <= 20
+
+
+async def test_sent_writes_are_never_abandoned():
+    budget(20)
+    collection = SlowCollection(0.05)
+    # Outlives the budget: the outcome must be the real one, not a 503 over an applied write
+    assert await DeadlineCollection(collection).insert_one({}) == "insert_one"
+    assert collection.calls == [("insert_one", {})]
+
+
+async def test_writes_past_the_deadline_are_not_sent():
+    budget(-1)
+    collection = SlowCollection(0)
+    with pytest.raises(DeadlineExceeded):
+        await DeadlineCollection(collection).insert_one({})
+    assert collection.calls == []
+
+
+async def test_find_and_modify_is_aborted_by_the_server():
+    budget(20)
+    collection = SlowCollection(0.05)
+    assert await DeadlineCollection(collection).find_one_and_update({}, {}) == "find_one_and_update"
+    assert 0 < collection.calls[0][1]["maxTimeMS"] <= 20
+
+
+async def test_no_budget_outside_requests():
+    assert deadlines.remaining_ms() is None
+
+
+def scripted_receive(*messages):
+    queue = list(messages)
+
+    async def receive():
+        if queue:
+            return queue.pop(0)
+        await asyncio.sleep(3600)
+
+    return receive
+
+
+async def noop_send(message):
+    pass
+
+
+async def test_disconnect_reaches_handler_that_never_reads_the_body():
+    cancelled = asyncio.Event()
+
+    async def app(scope, receive, send):
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    receive = scripted_receive(
+        {"type": "http.request", "body": b"a" * 10, "more_body": True},
+        {"type": "http.request", "body": b"b" * 10, "more_body": False},
+        {"type": "http.disconnect"},
+    )
+    await asyncio.wait_for(DeadlineMiddleware(app)({"type": "http", "headers": []}, receive, noop_send), 1)
+    assert cancelled.is_set()
+
+
+async def test_large_bodies_keep_backpressure(monkeypatch):
+    monkeypatch.setattr(deadlines, "BODY_BUFFER_BYTES", 10)
+    lidos = []
+    pedidos = 0
+    corpo = [{"type": "http.request", "body": bytes([i]) * 10, "more_body": i < 3} for i in range(4)]
+
+    async def receive():
+        nonlocal pedidos
+        pedidos += 1
+        if corpo:
+            return corpo.pop(0)
+        await asyncio.sleep(3600)
+
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.02)
+        # Only one chunk was read ahead while the handler was busy
+        lidos.append(pedidos)
+        while True:
+            message = await receive()
+            lidos.append(message["body"][:1])
+            if not message["more_body"]:
+                return
+
+    await asyncio.wait_for(DeadlineMiddleware(app)({"type": "http", "headers": []}, receive, noop_send), 1)
+    assert lidos == [1, b"\x00", b"\x01", b"\x02", b"\x03"]
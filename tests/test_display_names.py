@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pytest
+
+import display_names
+from tests.support import MotorLikeDatabase
+
+pytestmark = pytest.mark.anyio
+
+AGORA = datetime(2024, 5, 1)
+
+
+@pytest.fixture
+def legacy_db():
+    """Documents as written before display names were embedded."""
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    mongo = database.mongo
+    mongo.usuarios.insert_many([
+        {"id": "f1", "nome": "Ana", "tipo": "formando"},
+        {"id": "e1", "nome": "Dona", "tipo": "empresa"},
+    ])
+    mongo.empresas.insert_one({"id": "emp1", "usuario_id": "e1", "nome": "Acme"})
+    mongo.desafios.insert_one({"id": "d1", "empresa_id": "emp1", "titulo": "Desafio"})
+    mongo.respostas.insert_one({"id": "r1", "desafio_id": "d1", "usuario_id": "f1", "enviada_em": AGORA})
+    mongo.avaliacoes.insert_one({"id": "a1", "resposta_id": "r1", "nota": 7.0, "avaliado_em": AGORA})
+    return database
+
+
+def strip(doc):
+    return {k: v for k, v in doc.items() if k != "_id"}
+
+
+async def test_backfill_fills_legacy_documents(legacy_db):
+    resultado = await display_names.backfill(legacy_db)
+    # Counts are per update applied: the desafio copy and the formando copy each touch r1
+    assert resultado == {"desafios_atualizados": 1, "respostas_atualizadas": 2, "avaliacoes_atualizadas": 3}
+
+    mongo = legacy_db.mongo
+    assert mongo.desafios.find_one({"id": "d1"})["empresa_nome"] == "Acme"
+    resposta = mongo.respostas.find_one({"id": "r1"})
+    assert (resposta["empresa_id"], resposta["empresa_nome"]) == ("emp1", "Acme")
+    assert (resposta["desafio_titulo"], resposta["formando_nome"]) == ("Desafio", "Ana")
+    avaliacao = strip(mongo.avaliacoes.find_one({"id": "a1"}))
+    assert avaliacao == {
+        "id": "a1", "resposta_id": "r1", "nota": 7.0, "avaliado_em": AGORA,
+        "desafio_id": "d1", "formando_id": "f1", "formando_nome": "Ana",
+        "desafio_titulo": "Desafio", "empresa_id": "emp1", "empresa_nome": "Acme",
+    }
+
+
+async def test_backfill_is_skipped_once_everything_is_filled(legacy_db):
+    await display_names.backfill(legacy_db)
+    assert await display_names.backfill(legacy_db) is None
+    # A forced sync over clean data writes nothing either
+    assert await display_names.sync(legacy_db) == {
+        "desafios_atualizados": 0, "respostas_atualizadas": 0, "avaliacoes_atualizadas": 0,
+    }
+
+
+async def test_sync_propagates_renames(legacy_db):
+    await display_names.sync(legacy_db)
+    mongo = legacy_db.mongo
+    mongo.empresas.update_one({"id": "emp1"}, {"$set": {"nome": "Acme S.A."}})
+    mongo.usuarios.update_one({"id": "f1"}, {"$set": {"nome": "Ana Maria"}})
+    mongo.desafios.update_one({"id": "d1"}, {"$set": {"titulo": "Novo título"}})
+
+    await display_names.sync(legacy_db)
+    for colecao in (mongo.respostas, mongo.avaliacoes):
+        doc = colecao.find_one({})
+        assert (doc["empresa_nome"], doc["formando_nome"], doc["desafio_titulo"]) == ("Acme S.A.", "Ana Maria", "Novo título")
+
+
+async def test_formando_nomes_falls_back_to_usuarios(legacy_db):
+    respostas = [
+        {"usuario_id": "f1"},
+        {"usuario_id": "f2", "formando_nome": "Embutido"},
+    ]
+    assert await display_names.formando_nomes(legacy_db, respostas) == {"f1": "Ana", "f2": "Embutido"}
+
+
+def test_field_builders():
+    desafio = {"id": "d1", "empresa_id": "emp1", "empresa_nome": "Acme", "titulo": "T"}
+    assert display_names.desafio_fields({"nome": "Acme"}) == {"empresa_nome": "Acme"}
+    assert display_names.resposta_fields(desafio, "Ana") == {
+        "empresa_id": "emp1", "empresa_nome": "Acme", "desafio_titulo": "T", "formando_nome": "Ana",
+    }
+    resposta = {"desafio_id": "d1", "usuario_id": "f1"}
+    assert display_names.avaliacao_fields(resposta, {"id": "emp1", "nome": "Acme"}, "T", "Ana") == {
+        "desafio_id": "d1", "desafio_titulo": "T", "empresa_id": "emp1", "empresa_nome": "Acme",
+        "formando_id": "f1", "formando_nome": "Ana",
+    }
@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+import exports
+import text_storage
+from tests.support import MotorLikeDatabase, run
+
+pytestmark = pytest.mark.anyio
+
+ENVIADA = datetime(2024, 5, 1, 12, 0)
+
+
+@pytest.fixture
+def database():
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    respostas = []
+    for i in range(3):
+        respostas.append({
+            "id": f"r{i}",
+            "desafio_id": "d1",
+            "desafio_titulo": "Desafio",
+            "usuario_id": f"u{i}",
+            "formando_nome": f"Formando {i}",
+            "texto": f"texto {i}",
+            "enviada_em": ENVIADA,
+        })
+    database.mongo.respostas.insert_many(respostas)
+    database.mongo.avaliacoes.insert_one({
+        "id": "a0", "resposta_id": "r0", "nota": 8.5, "comentario": "bom", "avaliado_em": ENVIADA,
+    })
+    return database
+
+
+async def collect(database, formato, match=None):
+    return b"".join([chunk async for chunk in exports.encode(database, match or {}, formato)])
+
+
+async def test_csv_has_header_joined_avaliacao_and_empty_missing_values(database):
+    rows = list(csv.reader(io.StringIO((await collect(database, exports.FORMATO_CSV)).decode("utf-8"))))
+    assert rows[0] == exports.COLUNAS
+    por_id = {row[0]: dict(zip(exports.COLUNAS, row)) for row in rows[1:]}
+    assert set(por_id) == {"r0", "r1", "r2"}
+    assert (por_id["r0"]["nota"], por_id["r0"]["comentario"]) == ("8.5", "bom")
+    assert por_id["r0"]["avaliado_em"] == ENVIADA.isoformat()
+    assert por_id["r1"]["nota"] == ""
+    assert por_id["r1"]["formando_id"] == "u1"
+
+
+async def test_ndjson_filters_by_match(database):
+    data = await collect(database, exports.FORMATO_NDJSON, {"id": {"$in": ["r0", "r2"]}})
+    linhas = [json.loads(linha) for linha in data.decode("utf-8").splitlines()]
+    assert sorted(linha["resposta_id"] for linha in linhas) == ["r0", "r2"]
+    assert all(list(linha) == exports.COLUNAS for linha in linhas)
+
+
+async def test_rows_are_chunked(database, monkeypatch):
+    monkeypatch.setattr(exports, "CHUNK_ROWS", 2)
+    chunks = [chunk async for chunk in exports.row_chunks(database, {})]
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+
+
+async def test_truncated_texts_are_exported_in_full(database):
+    texto = "palavra " * 1000
+    doc = {"id": str(uuid.uuid4()), "texto": texto}
+    side = text_storage.split_body(doc, "texto", text_storage.KIND_RESPOSTA)
+    await text_storage.store_side(database, side)
+    database.mongo.respostas.insert_one({**doc, "desafio_id": "d2", "usuario_id": "u9", "enviada_em": ENVIADA})
+
+    data = await collect(database, exports.FORMATO_NDJSON, {"desafio_id": "d2"})
+    assert json.loads(data)["texto"] == texto
+
+
+async def test_parquet_round_trips(database):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(await collect(database, exports.FORMATO_PARQUET)))
+    assert table.column_names == exports.COLUNAS
+    linhas = {row["resposta_id"]: row for row in table.to_pylist()}
+    assert linhas["r0"]["nota"] == 8.5
+    assert linhas["r2"]["nota"] is None
+
+
+async def test_unknown_format_is_rejected(database):
+    with pytest.raises(ValueError):
+        await collect(database, "xml")
+
+
+def test_route_exports_only_the_empresas_desafios(server, client, make_user, monkeypatch):
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    user_id, headers = make_user("empresa")
+    empresa_id = str(uuid.uuid4())
+    run(server.repos.empresas.insert({"id": empresa_id, "usuario_id": user_id, "nome": "Empresa"}))
+    database.mongo.desafios.insert_many([
+        {"id": "proprio", "empresa_id": empresa_id, "titulo": "Próprio"},
+        {"id": "alheio", "empresa_id": str(uuid.uuid4()), "titulo": "Alheio"},
+    ])
+    database.mongo.respostas.insert_many([
+        {"id": "r-proprio", "desafio_id": "proprio", "usuario_id": "u1", "texto": "a", "enviada_em": ENVIADA},
+        {"id": "r-alheio", "desafio_id": "alheio", "usuario_id": "u2", "texto": "b", "enviada_em": ENVIADA},
+    ])
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+    monkeypatch.setattr(server, "db", database)
+
+    response = client.get("/api/export/respostas?formato=ndjson", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == exports.MEDIA_TYPES[exports.FORMATO_NDJSON]
+    assert [json.loads(linha)["resposta_id"] for linha in response.text.splitlines()] == ["r-proprio"]
+
+    assert client.get("/api/export/respostas?formato=ndjson&desafio_id=alheio", headers=headers).status_code == 404
+    assert client.get("/api/export/respostas?formato=xml", headers=headers).status_code == 400
+    assert client.get("/api/export/respostas?arquivo=true", headers=headers).status_code == 403
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+import grade_analytics
+import outbox
+from tests.support import MotorLikeDatabase
+
+pytestmark = pytest.mark.anyio
+
+AGORA = datetime(2026, 5, 4, 12, 0)
+
+
+@pytest.fixture
+def database():
+    database = MotorLikeDatabase()
+    mongo = database.mongo
+    mongo.desafios.insert_one({"id": "d1", "empresa_id": "e1"})
+    mongo.respostas.insert_one({"id": "r1", "desafio_id": "d1"})
+    mongo.avaliacoes.insert_one({"id": "a1", "resposta_id": "r1", "nota": 8.0, "avaliado_em": AGORA})
+    # Moved by archival with its owner ids filled in
+    mongo.avaliacoes_arquivo.insert_one({
+        "id": "a0", "resposta_id": "r0", "nota": 6.0, "desafio_id": "d0", "empresa_id": "e1", "avaliado_em": AGORA,
+    })
+    # Left over from before: a rebuild replaces it whole
+    mongo.notas_rollup.insert_one({"_id": "desafio:antigo", "total": 99})
+    return database
+
+
+def avaliacao_event(avaliacao_id: str, nota: float, desafio_id: str) -> dict:
+    evento = outbox.new_event(outbox.EVENTO_AVALIACAO_CRIADA, {
+        "id": avaliacao_id, "nota": nota, "desafio_id": desafio_id, "empresa_id": "e1", "em": AGORA,
+    })
+    evento["criado_em"] = datetime.utcnow()
+    return evento
+
+
+async def plataforma(database) -> dict:
+    return await grade_analytics.get_rollup(database, grade_analytics.ESCOPO_PLATAFORMA)
+
+
+async def test_rebuild_counts_archived_avaliacoes_and_swaps(database):
+    assert await grade_analytics.rebuild_rollups(database) == 2
+    assert (await plataforma(database))["total"] == 2
+    assert (await grade_analytics.get_rollup(database, grade_analytics.ESCOPO_DESAFIO, "d0"))["media"] == 6.0
+    assert database.mongo.notas_rollup.find_one({"_id": "desafio:antigo"}) is None
+    assert grade_analytics.REBUILD_COLLECTION not in database.mongo.list_collection_names()
+
+
+async def test_rebuild_under_fence_neither_loses_nor_double_counts(database):
+    worker = outbox.OutboxWorker(database)
+    # a1 is already stored, so the rebuild counts it; a2's entity only lands after the rebuild
+    database.mongo.outbox.insert_many([avaliacao_event("a1", 8.0, "d1"), avaliacao_event("a2", 4.0, "d1")])
+
+    async def rebuild(marcar):
+        assert await worker.process_batch() == 0, "fenced workers claim nothing"
+        return await grade_analytics.rebuild_rollups(database, marcar)
+
+    assert await worker.rebuild_projection(outbox.PROJECAO_NOTAS, rebuild) == 2
+    ignorados = database.mongo.outbox.find_one({"dados.id": "a1"})
+    assert ignorados["ignorar"] == [outbox.PROJECAO_NOTAS]
+
+    database.mongo.avaliacoes.insert_one({"id": "a2", "resposta_id": "r1", "nota": 4.0, "avaliado_em": AGORA})
+    assert await worker.process_batch() == 2
+    resumo = await plataforma(database)
+    assert resumo["total"] == 3
+    assert resumo["media"] == 6.0
+    # The other projection still gets both events
+    atividade = database.mongo.atividade_diaria.find_one()
+    assert atividade["total"] == 2
+    assert database.mongo.outbox_fences.count_documents({}) == 0
+
+
+async def test_batch_claimed_as_fence_lands_is_released_with_its_lote(database):
+    worker = outbox.OutboxWorker(database)
+    database.mongo.outbox.insert_one(avaliacao_event("a1", 8.0, "d1"))
+    fenced = [False, True]
+
+    async def racing_fence():
+        return fenced.pop(0)
+
+    worker._fenced = racing_fence
+    assert await worker.process_batch() == 0
+    evento = database.mongo.outbox.find_one()
+    assert evento["estado"] == outbox.ESTADO_PROCESSANDO
+    assert evento["lote"] is not None
+    assert evento["lease_ate"] <= datetime.utcnow()
+
+
+async def test_lapsed_fence_does_not_block(database):
+    worker = outbox.OutboxWorker(database)
+    database.mongo.outbox_fences.insert_one({"_id": "x", "ate": datetime.utcnow() - timedelta(seconds=1)})
+    database.mongo.outbox.insert_one(avaliacao_event("a1", 8.0, "d1"))
+    assert await worker.process_batch() == 1
@@ -0,0 +1,90 @@
+import asyncio
+import contextvars
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteConcernError
+
+from group_commit import GroupCommitWriter
+
+pytestmark = pytest.mark.anyio
+
+pedido = contextvars.ContextVar("pedido", default=None)
+
+
+class FakeCollection:
+    def __init__(self, erro=None):
+        self.lotes = []
+        self.contextos = []
+        self.erro = erro
+        self.liberar = {}
+
+    async def insert_many(self, docs, ordered=True):
+        self.lotes.append([d["id"] for d in docs])
+        self.contextos.append(pedido.get())
+        espera = self.liberar.get(docs[0]["id"])
+        if espera is not None:
+            await espera.wait()
+        if self.erro is not None:
+            raise self.erro
+
+
+async def test_concurrent_submits_share_one_insert():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(collection, max_batch=10, max_delay=0.01)
+    docs = await asyncio.gather(*(writer.submit({"id": i}) for i in range(3)))
+    await writer.close()
+    assert [d["id"] for d in docs] == [0, 1, 2]
+    assert collection.lotes == [[0, 1, 2]]
+
+
+async def test_duplicate_fails_only_its_own_submit():
+    collection = FakeCollection(BulkWriteError({
+        "writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}], "writeConcernErrors": [],
+    }))
+    writer = GroupCommitWriter(collection, max_batch=10, max_delay=0.01)
+    resultados = await asyncio.gather(*(writer.submit({"id": i}) for i in range(3)), return_exceptions=True)
+    await writer.close()
+    assert isinstance(resultados[1], DuplicateKeyError)
+    assert resultados[0] == {"id": 0} and resultados[2] == {"id": 2}
+
+
+async def test_write_concern_errors_fail_every_submit():
+    collection = FakeCollection(BulkWriteError({
+        "writeErrors": [], "writeConcernErrors": [{"code": 64, "errmsg": "waiting for replication timed out"}],
+    }))
+    writer = GroupCommitWriter(collection, max_batch=10, max_delay=0.01)
+    resultados = await asyncio.gather(*(writer.submit({"id": i}) for i in range(2)), return_exceptions=True)
+    await writer.close()
+    assert all(isinstance(r, WriteConcernError) for r in resultados)
+
+
+async def test_slow_flush_does_not_stall_the_next_batch():
+    collection = FakeCollection()
+    collection.liberar[0] = asyncio.Event()
+    writer = GroupCommitWriter(collection, max_batch=1, max_delay=0.01, max_flushes=2)
+    lento = asyncio.ensure_future(writer.submit({"id": 0}))
+    await asyncio.sleep(0.01)
+    assert await asyncio.wait_for(writer.submit({"id": 1}), 1) == {"id": 1}
+    assert not lento.done()
+    collection.liberar[0].set()
+    assert await lento == {"id": 0}
+    await writer.close()
+
+
+async def test_background_task_does_not_inherit_the_first_request_context():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(collection, max_batch=10, max_delay=0.01)
+    pedido.set("primeiro pedido")
+    await writer.submit({"id": 0})
+    await writer.close()
+    assert collection.contextos == [None]
+
+
+async def test_close_flushes_what_is_queued():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(collection, max_batch=10, max_delay=10)
+    writer.start()
+    pendente = asyncio.ensure_future(writer.submit({"id": 0}))
+    await asyncio.sleep(0)
+    await writer.close()
+    assert await pendente == {"id": 0}
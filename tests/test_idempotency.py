@@ -0,0 +1,131 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import idempotency
+from idempotency import IdempotencyStore, KeyBusy, KeyMismatch
+from tests.support import run
+
+pytestmark = pytest.mark.anyio
+
+HEADERS = [(b"content-type", b"application/json")]
+
+
+async def test_completed_key_replays_and_rejects_other_bodies():
+    store = IdempotencyStore()
+    assert await store.begin("k", "corpo-a", 1) is None
+    await store.complete("k", "corpo-a", 201, HEADERS, b'{"id": 1}')
+    record = await store.begin("k", "corpo-a", 1)
+    assert (record["status"], record["body"]) == (201, b'{"id": 1}')
+    with pytest.raises(KeyMismatch):
+        await store.begin("k", "corpo-b", 1)
+
+
+async def test_retry_waits_for_the_original_in_this_process():
+    store = IdempotencyStore()
+    assert await store.begin("k", "corpo", 1) is None
+    retry = asyncio.ensure_future(store.begin("k", "corpo", 1))
+    await asyncio.sleep(0.01)
+    assert not retry.done()
+    await store.complete("k", "corpo", 200, HEADERS, b"ok")
+    assert (await retry)["body"] == b"ok"
+
+
+async def test_retry_gives_up_while_the_original_still_runs():
+    store = IdempotencyStore()
+    assert await store.begin("k", "corpo", 1) is None
+    with pytest.raises(KeyBusy):
+        await store.begin("k", "corpo", 0.01)
+
+
+async def test_aborted_key_runs_again():
+    store = IdempotencyStore()
+    assert await store.begin("k", "corpo", 1) is None
+    await store.abort("k")
+    assert await store.begin("k", "corpo", 1) is None
+
+
+def test_lru_is_bounded():
+    store = IdempotencyStore(capacity=2)
+
+    async def fill():
+        for key in ("a", "b", "c"):
+            await store.begin(key, "f", 1)
+            await store.complete(key, "f", 200, HEADERS, key.encode())
+
+    run(fill())
+    assert list(store._cache) == ["b", "c"]
+
+
+def test_keys_are_scoped_by_route_and_caller():
+    base = idempotency.scoped_key("POST", "/api/desafios", b"Bearer a", b"k")
+    assert base != idempotency.scoped_key("POST", "/api/respostas", b"Bearer a", b"k")
+    assert base != idempotency.scoped_key("POST", "/api/desafios", b"Bearer b", b"k")
+
+
+mongomock = pytest.importorskip("mongomock")
+
+from tests.support import MotorLikeDatabase  # noqa: E402
+
+
+@pytest.fixture
+def collection():
+    return MotorLikeDatabase().idempotencia
+
+
+async def test_key_claimed_by_another_worker_is_polled_until_done(collection, monkeypatch):
+    monkeypatch.setattr(idempotency, "POLL_INTERVAL", 0.01)
+    original, outro = IdempotencyStore(collection), IdempotencyStore(collection)
+    assert await original.begin("k", "corpo", 1) is None
+    retry = asyncio.ensure_future(outro.begin("k", "corpo", 1))
+    await asyncio.sleep(0.03)
+    assert not retry.done()
+    await original.complete("k", "corpo", 201, HEADERS, b"criado")
+    record = await retry
+    assert (record["status"], record["headers"], record["body"]) == (201, HEADERS, b"criado")
+    with pytest.raises(KeyMismatch):
+        await outro.begin("k", "outro-corpo", 1)
+
+
+async def test_busy_in_another_worker(collection, monkeypatch):
+    monkeypatch.setattr(idempotency, "POLL_INTERVAL", 0.01)
+    assert await IdempotencyStore(collection).begin("k", "corpo", 1) is None
+    with pytest.raises(KeyBusy):
+        await IdempotencyStore(collection).begin("k", "corpo", 0.02)
+
+
+async def test_stale_claim_of_a_crashed_worker_is_taken_over(collection):
+    collection.collection.insert_one({
+        "_id": "k", "fingerprint": "corpo", "estado": idempotency.ESTADO_PENDENTE,
+        "expira_em": datetime.utcnow() - timedelta(seconds=1),
+    })
+    assert await IdempotencyStore(collection).begin("k", "corpo", 1) is None
+    assert collection.collection.find_one({"_id": "k"})["expira_em"] > datetime.utcnow()
+
+
+@pytest.fixture
+def empresa_headers(server, make_user):
+    user_id, headers = make_user("empresa")
+    run(server.repos.empresas.insert({"id": str(uuid.uuid4()), "usuario_id": user_id, "nome": "Empresa",
+                                      "cnpj": "11222333000181", "descricao": "d"}))
+    return headers
+
+
+def test_route_replays_the_first_response(server, client, empresa_headers):
+    headers = {**empresa_headers, "Idempotency-Key": "criar-1"}
+    corpo = {"titulo": "Desafio", "descricao": "descrição"}
+    primeira = client.post("/api/desafios", headers=headers, json=corpo)
+    segunda = client.post("/api/desafios", headers=headers, json=corpo)
+    assert primeira.status_code == segunda.status_code == 200
+    assert segunda.json() == primeira.json()
+    assert segunda.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in primeira.headers
+    assert client.post("/api/desafios", headers=headers, json={**corpo, "titulo": "Outro"}).status_code == 422
+
+
+def test_route_rejects_an_empty_key(client, empresa_headers):
+    response = client.post("/api/desafios", headers={**empresa_headers, "Idempotency-Key": ""},
+                           json={"titulo": "t", "descricao": "d"})
+    assert response.status_code == 400
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route, Router
+
+import memory_tracking
+
+
+def test_rss_peak_is_never_below_current_rss(monkeypatch):
+    # ru_maxrss lags behind a process that just grew
+    monkeypatch.setattr(memory_tracking, "_rss_bytes", lambda: 300)
+    monkeypatch.setattr(memory_tracking, "_peak_rss_bytes", lambda: 200)
+    processo = memory_tracking.MemoryTracker().process()
+    assert processo["rss_bytes"] == 300
+    assert processo["rss_pico_bytes"] == 300
+
+
+def test_rss_peak_without_proc(monkeypatch):
+    monkeypatch.setattr(memory_tracking, "_rss_bytes", lambda: None)
+    monkeypatch.setattr(memory_tracking, "_peak_rss_bytes", lambda: 200)
+    assert memory_tracking.MemoryTracker().process()["rss_pico_bytes"] == 200
+    monkeypatch.setattr(memory_tracking, "_peak_rss_bytes", lambda: None)
+    assert memory_tracking.MemoryTracker().process()["rss_pico_bytes"] is None
+
+
+@pytest.fixture
+def tracker():
+    tracker = memory_tracking.MemoryTracker(snapshot_every=1)
+    # tracemalloc may already run for the whole process (MEMORY_TRACKING)
+    ja_ativo = tracker.active
+    tracker.start()
+    yield tracker
+    if not ja_ativo:
+        tracker.stop()
+
+
+def scope(path: str) -> dict:
+    return {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "root_path": "",
+        "scheme": "http", "query_string": b"", "headers": [], "server": ("teste", 80),
+    }
+
+
+def receiver():
+    mensagens = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if mensagens:
+            return mensagens.pop()
+        # The client stays connected; StreamingResponse listens for the disconnect
+        await asyncio.Event().wait()
+
+    return receive
+
+
+async def discard(message):
+    pass
+
+
+def streaming_app(liberar: asyncio.Event):
+    async def stream(request):
+        async def chunks():
+            yield b"primeiro"
+            await liberar.wait()
+            yield b"ultimo"
+        return StreamingResponse(chunks())
+
+    async def item(request):
+        return PlainTextResponse("ok")
+
+    return Router(routes=[Route("/stream", stream), Route("/item", item)])
+
+
+@pytest.mark.anyio
+async def test_streamed_response_releases_the_lock_after_its_first_chunk(tracker):
+    liberar = asyncio.Event()
+    router = streaming_app(liberar)
+    app = memory_tracking.MemoryTrackingMiddleware(router, tracker, router)
+
+    streaming = asyncio.ensure_future(app(scope("/stream"), receiver(), discard))
+    await asyncio.sleep(0.01)
+    # The stream is still open, yet another tracked request runs to completion
+    await asyncio.wait_for(app(scope("/item"), receiver(), discard), 1)
+    assert not streaming.done()
+    liberar.set()
+    await streaming
+
+    assert not tracker.lock.locked()
+    assert tracker.report()["GET /stream"]["requisicoes"] == 1
+    assert tracker.report()["GET /item"]["requisicoes"] == 1
+
+
+@pytest.mark.anyio
+async def test_failing_handler_releases_the_lock(tracker):
+    async def falha(scope, receive, send):
+        raise RuntimeError("falhou")
+
+    app = memory_tracking.MemoryTrackingMiddleware(falha, tracker, Router(routes=[]))
+    with pytest.raises(RuntimeError):
+        await app(scope("/x"), receiver(), discard)
+    assert not tracker.lock.locked()
+
+
+@pytest.mark.anyio
+async def test_unmatched_paths_share_one_label(tracker):
+    router = streaming_app(asyncio.Event())
+    app = memory_tracking.MemoryTrackingMiddleware(router, tracker, router)
+    for path in ("/wp-admin", "/.env", "/item"):
+        await app(scope(path), receiver(), discard)
+    assert set(tracker.report()) == {"GET /item", f"GET {memory_tracking.ROTA_DESCONHECIDA}"}
+    assert tracker.report()[f"GET {memory_tracking.ROTA_DESCONHECIDA}"]["requisicoes"] == 2
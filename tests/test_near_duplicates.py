@@ -0,0 +1,95 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from near_duplicates import DesafioLSHRegistry, MinHashLSH, minhash_signature
+from tests.support import run
+
+TEXTO = "a plataforma usa rotas otimizadas para reduzir o custo das entregas urbanas em grandes cidades"
+
+
+def test_texts_without_shingles_are_not_clustered():
+    index = MinHashLSH()
+    for key, texto in [("vazia", ""), ("espacos", "   \n "), ("pontuacao", "?!"), ("a", TEXTO), ("b", TEXTO)]:
+        index.insert(key, minhash_signature(texto))
+    assert set(index.signatures) == {"a", "b"}
+    assert index.clusters(0.8) == [(["a", "b"], 1.0)]
+
+
+def test_removed_keys_leave_no_candidates():
+    index = MinHashLSH()
+    for key in ("a", "b", "c"):
+        index.insert(key, minhash_signature(TEXTO))
+    index.remove("b")
+    index.remove("c")
+    assert index.candidate_pairs() == set()
+    assert index.clusters(0.5) == []
+
+
+mongomock = pytest.importorskip("mongomock")
+
+from tests.support import MotorLikeDatabase  # noqa: E402
+
+
+def add_resposta(database, desafio_id: str, texto: str = TEXTO) -> str:
+    resposta_id = str(uuid.uuid4())
+    database.mongo.respostas.insert_one({
+        "id": resposta_id, "desafio_id": desafio_id, "usuario_id": f"u-{resposta_id[:8]}", "texto": texto,
+    })
+    return resposta_id
+
+
+def test_registry_sees_respostas_written_by_other_workers():
+    database = MotorLikeDatabase()
+    registry = DesafioLSHRegistry()
+    primeira = add_resposta(database, "d1")
+    assert set(run(registry.get(database, "d1")).signatures) == {primeira}
+
+    # Written by another worker: this registry's add() never ran
+    segunda = add_resposta(database, "d1")
+    assert set(run(registry.get(database, "d1")).signatures) == {primeira, segunda}
+
+    # Archived with its desafio
+    database.mongo.respostas.delete_many({"desafio_id": "d1"})
+    assert len(run(registry.get(database, "d1"))) == 0
+
+
+def test_local_add_keeps_the_cached_index():
+    database = MotorLikeDatabase()
+    registry = DesafioLSHRegistry()
+    add_resposta(database, "d1")
+    index = run(registry.get(database, "d1"))
+    nova = add_resposta(database, "d1", "")
+    registry.add("d1", nova, minhash_signature(""))
+    assert run(registry.get(database, "d1")) is index
+
+
+@pytest.fixture
+def api(server, client, make_user, monkeypatch):
+    database = MotorLikeDatabase()
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "lsh_registry", DesafioLSHRegistry())
+    empresa_user, headers = make_user("empresa")
+    empresa_id, desafio_id = str(uuid.uuid4()), str(uuid.uuid4())
+    run(server.repos.empresas.insert({"id": empresa_id, "usuario_id": empresa_user, "nome": "Empresa"}))
+    run(server.repos.desafios.insert({"id": desafio_id, "empresa_id": empresa_id, "titulo": "Desafio",
+                                      "descricao": "descrição", "criado_em": datetime.utcnow()}))
+    return client, headers, database, desafio_id
+
+
+def test_route_drops_respostas_gone_from_the_collection(api):
+    client, headers, database, desafio_id = api
+    ids = [add_resposta(database, desafio_id) for _ in range(3)]
+    add_resposta(database, desafio_id, "")
+    add_resposta(database, desafio_id, "   ")
+    url = f"/api/respostas/desafio/{desafio_id}/duplicadas"
+    assert [sorted(c["resposta_ids"]) for c in client.get(url, headers=headers).json()] == [sorted(ids)]
+
+    # One leaves while another arrives, so the count alone does not move
+    database.mongo.respostas.delete_one({"id": ids[0]})
+    add_resposta(database, desafio_id, "outro texto sem nenhuma relação com o anterior")
+    clusters = client.get(url, headers=headers).json()
+    assert [sorted(c["resposta_ids"]) for c in clusters] == [sorted(ids[1:])]
+    assert all(clusters[0]["usuario_ids"])
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+import grade_analytics
+import outbox
+from tests.support import MotorLikeDatabase
+
+pytestmark = pytest.mark.anyio
+
+AGORA = datetime(2026, 5, 4, 12, 0)
+
+
+@pytest.fixture
+def database():
+    return MotorLikeDatabase()
+
+
+def avaliacao_event(avaliacao_id: str, nota: float = 8.0, idade: timedelta = timedelta(0)) -> dict:
+    evento = outbox.new_event(outbox.EVENTO_AVALIACAO_CRIADA, {
+        "id": avaliacao_id, "nota": nota, "desafio_id": "d1", "empresa_id": "e1", "em": AGORA,
+    })
+    evento["criado_em"] = datetime.utcnow() - idade
+    return evento
+
+
+def store_avaliacoes(database, *ids):
+    database.mongo.avaliacoes.insert_many([{"id": i, "resposta_id": f"r-{i}", "nota": 8.0} for i in ids])
+
+
+async def notas_total(database) -> int:
+    return (await grade_analytics.get_rollup(database, grade_analytics.ESCOPO_PLATAFORMA))["total"]
+
+
+def atividade_total(database) -> int:
+    return database.mongo.atividade_diaria.find_one()["total"]
+
+
+def estados(database) -> dict:
+    return {e["dados"]["id"]: e["estado"] for e in database.mongo.outbox.find()}
+
+
+async def test_claims_one_batch_of_the_oldest_events(database):
+    worker = outbox.OutboxWorker(database, batch_size=2)
+    store_avaliacoes(database, "a1", "a2", "a3")
+    database.mongo.outbox.insert_many([
+        avaliacao_event("a1", idade=timedelta(seconds=3)),
+        avaliacao_event("a2", idade=timedelta(seconds=2)),
+        avaliacao_event("a3", idade=timedelta(seconds=1)),
+    ])
+
+    assert await worker.process_batch() == 2
+    assert estados(database) == {"a1": "aplicado", "a2": "aplicado", "a3": "pendente"}
+    assert len(database.mongo.outbox.distinct("lote", {"estado": "aplicado"})) == 1
+    assert await notas_total(database) == 2
+
+    assert await worker.process_batch() == 1
+    assert await worker.process_batch() == 0
+    assert await notas_total(database) == 3
+
+
+async def test_stale_lease_is_reclaimed_with_its_lote(database):
+    worker = outbox.OutboxWorker(database)
+    store_avaliacoes(database, "a1")
+    evento = avaliacao_event("a1")
+    # Claimed by a worker that died before applying anything
+    evento.update(estado=outbox.ESTADO_PROCESSANDO, lote="lote-morto", lease_ate=datetime.utcnow() - timedelta(seconds=1))
+    database.mongo.outbox.insert_one(evento)
+
+    assert await worker.process_batch() == 1
+    aplicado = database.mongo.outbox.find_one()
+    assert aplicado["estado"] == outbox.ESTADO_APLICADO and aplicado["lote"] == "lote-morto"
+    assert await notas_total(database) == 1
+
+
+async def test_live_lease_is_left_to_its_worker(database):
+    worker = outbox.OutboxWorker(database)
+    store_avaliacoes(database, "a1")
+    evento = avaliacao_event("a1")
+    evento.update(estado=outbox.ESTADO_PROCESSANDO, lote="lote-vivo", lease_ate=datetime.utcnow() + outbox.LEASE)
+    database.mongo.outbox.insert_one(evento)
+
+    assert await worker.process_batch() == 0
+    assert estados(database) == {"a1": outbox.ESTADO_PROCESSANDO}
+
+
+async def test_retry_of_a_partially_applied_batch_counts_once(database):
+    worker = outbox.OutboxWorker(database)
+    store_avaliacoes(database, "a1", "a2")
+    eventos = [avaliacao_event("a1", 8.0), avaliacao_event("a2", 6.0)]
+    for evento in eventos:
+        evento.update(estado=outbox.ESTADO_PROCESSANDO, lote="lote-1", lease_ate=datetime.utcnow() - timedelta(seconds=1))
+    database.mongo.outbox.insert_many(eventos)
+    # The worker crashed after the grade rollups were written, before the activity ones
+    updates = outbox.projection_updates(eventos, "lote-1")
+    await worker._apply({"notas_rollup": updates["notas_rollup"]})
+    assert await notas_total(database) == 2
+
+    assert await worker.process_batch() == 2
+    resumo = await grade_analytics.get_rollup(database, grade_analytics.ESCOPO_PLATAFORMA)
+    assert resumo["total"] == 2 and resumo["media"] == 7.0
+    assert atividade_total(database) == 2
+    assert set(estados(database).values()) == {outbox.ESTADO_APLICADO}
+
+
+async def test_orphans_are_discarded_after_the_grace_period(database):
+    worker = outbox.OutboxWorker(database)
+    store_avaliacoes(database, "a1")
+    database.mongo.outbox.insert_many([
+        avaliacao_event("a1"),
+        # Entity insert failed long ago / may still be on its way
+        avaliacao_event("orfa", idade=outbox.ORPHAN_GRACE + timedelta(seconds=1)),
+        avaliacao_event("recente"),
+    ])
+
+    assert await worker.process_batch() == 2
+    assert estados(database) == {"a1": "aplicado", "orfa": "descartado", "recente": "pendente"}
+    descartado = database.mongo.outbox.find_one({"dados.id": "orfa"})
+    assert "expira_em" in descartado and "lease_ate" not in descartado
+    assert database.mongo.outbox.find_one({"dados.id": "recente"})["lote"] is None
+    assert await notas_total(database) == 1
+
+
+async def test_archived_entities_still_count(database):
+    worker = outbox.OutboxWorker(database)
+    # Archival moved the avaliacao before the worker got to its event
+    database.mongo.avaliacoes_arquivo.insert_one({"id": "a1", "resposta_id": "r1", "nota": 8.0})
+    database.mongo.outbox.insert_one(avaliacao_event("a1", idade=outbox.ORPHAN_GRACE + timedelta(seconds=1)))
+
+    assert await worker.process_batch() == 1
+    assert estados(database) == {"a1": outbox.ESTADO_APLICADO}
+    assert await notas_total(database) == 1
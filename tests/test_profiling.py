@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route, Router
+
+import profiling
+from profiling import ProfilingMiddleware, SamplingProfiler
+
+pytestmark = pytest.mark.anyio
+
+
+def busy_wait(segundos: float):
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        pass
+
+
+async def item(request):
+    busy_wait(0.03)
+    await asyncio.sleep(0.03)
+    return PlainTextResponse("ok", status_code=201)
+
+
+def make_app(profiler):
+    router = Router(routes=[Route("/api/itens/{item_id}", item)])
+    return ProfilingMiddleware(router, profiler, router)
+
+
+async def call(app, headers=()):
+    scope = {
+        "type": "http", "method": "GET", "path": "/api/itens/7", "raw_path": b"/api/itens/7",
+        "root_path": "", "scheme": "http", "query_string": b"", "headers": list(headers), "server": ("teste", 80),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"]
+
+
+def test_reason_requires_the_current_token():
+    profiler = SamplingProfiler()
+    assert profiler.reason({"headers": []}) is None
+    assert profiler.reason({"headers": [(profiling.PROFILE_HEADER, profiler.token.encode())]}) == "cabecalho"
+    antigo = profiler.token
+    profiler.renew_token()
+    assert profiler.reason({"headers": [(profiling.PROFILE_HEADER, antigo.encode())]}) is None
+
+
+def test_reason_samples_the_configured_fraction():
+    profiler = SamplingProfiler()
+    profiler.fracao = 1.0
+    assert profiler.reason({"headers": []}) == "amostragem"
+    profiler.fracao = 0.0
+    assert profiler.reason({"headers": []}) is None
+
+
+async def test_unprofiled_requests_record_nothing():
+    profiler = SamplingProfiler(interval_ms=1)
+    assert await call(make_app(profiler)) == 201
+    assert profiler.list() == []
+    assert profiler._thread is None
+
+
+async def test_profiled_request_records_cpu_and_waiting_samples():
+    profiler = SamplingProfiler(interval_ms=1)
+    status = await call(make_app(profiler), [(profiling.PROFILE_HEADER, profiler.token.encode())])
+    assert status == 201
+
+    [perfil] = profiler.list()
+    assert (perfil["rota"], perfil["path"], perfil["status"], perfil["motivo"]) == (
+        "/api/itens/{item_id}", "/api/itens/7", 201, "cabecalho",
+    )
+    assert perfil["amostras_cpu"] > 0 and perfil["amostras_espera"] > 0
+    assert perfil["amostras"] == perfil["amostras_cpu"] + perfil["amostras_espera"]
+    assert "_stacks" not in perfil
+
+    folded = profiling.collapsed(profiler.get(perfil["id"]))
+    linhas = folded.splitlines()
+    assert any("busy_wait" in linha for linha in linhas)
+    assert any(linha.rsplit(" ", 1)[0].endswith(profiling.WAITING) for linha in linhas)
+    assert all(linha.rsplit(" ", 1)[1].isdigit() for linha in linhas)
+
+
+async def test_sampler_thread_stops_when_idle():
+    profiler = SamplingProfiler(interval_ms=1)
+    await call(make_app(profiler), [(profiling.PROFILE_HEADER, profiler.token.encode())])
+    await asyncio.sleep(0.02)
+    assert profiler._thread is None
+
+
+async def test_buffer_keeps_the_newest_profiles():
+    profiler = SamplingProfiler(interval_ms=1, capacity=2)
+    app = make_app(profiler)
+    profiler.fracao = 1.0
+    for _ in range(3):
+        await call(app)
+    assert len(profiler.list()) == 2
+    assert profiler.get("nenhum") is None
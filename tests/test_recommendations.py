@@ -0,0 +1,114 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+import archival
+from recommendations import TfidfIndex
+from tests.support import MotorLikeDatabase, run
+
+TEXTO = "plataforma logística com rotas otimizadas para entregas urbanas"
+
+
+@pytest.fixture
+def api(server, client, make_user, monkeypatch):
+    database = MotorLikeDatabase()
+    index = TfidfIndex()
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "desafio_index", index)
+    formando_id, headers = make_user("formando")
+    return client, headers, formando_id, database, index
+
+
+def add_desafio(database, titulo: str, criado_em: datetime, **campos) -> str:
+    desafio_id = str(uuid.uuid4())
+    database.mongo.desafios.insert_one({
+        "id": desafio_id, "empresa_id": "e1", "empresa_nome": "Empresa", "titulo": titulo,
+        "descricao": TEXTO, "criado_em": criado_em, "status": archival.STATUS_ABERTO, **campos,
+    })
+    return desafio_id
+
+
+def test_ranked_recommendations_skip_closed_desafios(api, server):
+    client, headers, formando_id, database, index = api
+    agora = datetime.utcnow()
+    respondido = add_desafio(database, "Rotas", agora)
+    database.mongo.respostas.insert_one({
+        "id": str(uuid.uuid4()), "desafio_id": respondido, "usuario_id": formando_id, "texto": TEXTO,
+    })
+    ids = {nome: add_desafio(database, f"Logística {nome}", agora - timedelta(minutes=i))
+           for i, nome in enumerate(["aberto1", "encerrado", "vencido", "arquivado", "aberto2"])}
+    run(index.ensure_built(database))
+    assert len(index) == 6
+
+    # Closed after the index was built: explicitly, by prazo and by archiving
+    database.mongo.desafios.update_one({"id": ids["encerrado"]}, {"$set": {"status": archival.STATUS_ENCERRADO}})
+    database.mongo.desafios.update_one({"id": ids["vencido"]}, {"$set": {"prazo": agora - timedelta(days=1)}})
+    database.mongo.desafios.delete_one({"id": ids["arquivado"]})
+
+    response = client.get("/api/desafios/recomendados", headers=headers, params={"limite": 2})
+    assert response.status_code == 200
+    assert {d["id"] for d in response.json()} == {ids["aberto1"], ids["aberto2"]}
+    assert all(d["similaridade"] > 0 for d in response.json())
+    for nome in ("encerrado", "vencido", "arquivado"):
+        assert ids[nome] not in index.doc_terms
+
+
+def test_cold_start_suggests_only_open_desafios(api):
+    client, headers, _, database, index = api
+    agora = datetime.utcnow()
+    aberto = add_desafio(database, "Aberto", agora - timedelta(hours=1))
+    add_desafio(database, "Encerrado", agora, status=archival.STATUS_ENCERRADO)
+    add_desafio(database, "Vencido", agora, prazo=agora - timedelta(hours=2))
+    futuro = add_desafio(database, "Com prazo", agora - timedelta(hours=2), prazo=agora + timedelta(days=3))
+
+    response = client.get("/api/desafios/recomendados", headers=headers)
+    assert response.status_code == 200
+    assert [d["id"] for d in response.json()] == [aberto, futuro]
+
+
+def test_index_is_built_from_open_desafios_only():
+    database = MotorLikeDatabase()
+    aberto = add_desafio(database, "Aberto", datetime.utcnow())
+    add_desafio(database, "Encerrado", datetime.utcnow(), status=archival.STATUS_ENCERRADO)
+    index = TfidfIndex()
+    run(index.ensure_built(database))
+    assert set(index.doc_terms) == {aberto}
+
+
+def test_index_follows_desafios_written_by_other_workers(monkeypatch):
+    import recommendations
+
+    monkeypatch.setattr(recommendations, "VERSION_CHECK_INTERVAL", 0)
+    database = MotorLikeDatabase()
+    agora = datetime.utcnow()
+    primeiro = add_desafio(database, "Primeiro", agora - timedelta(hours=1))
+    index = TfidfIndex()
+    run(index.ensure_built(database))
+    assert set(index.doc_terms) == {primeiro}
+
+    builds = []
+    monkeypatch.setattr(index, "build", lambda docs: builds.append(1) or TfidfIndex.build(index, docs))
+    run(index.ensure_built(database))
+    assert builds == [], "unchanged collection, no rebuild"
+
+    # Created and closed in another process: this one never saw add() or remove()
+    novo = add_desafio(database, "Novo", agora)
+    run(index.ensure_built(database))
+    assert set(index.doc_terms) == {primeiro, novo}
+    database.mongo.desafios.update_one({"id": primeiro}, {"$set": {"status": archival.STATUS_ENCERRADO}})
+    run(index.ensure_built(database))
+    assert set(index.doc_terms) == {novo}
+    assert len(builds) == 2
+
+
+def test_version_is_checked_at_most_once_per_interval():
+    database = MotorLikeDatabase()
+    index = TfidfIndex()
+    run(index.ensure_built(database))
+    add_desafio(database, "Depois", datetime.utcnow())
+    run(index.ensure_built(database))
+    assert len(index) == 0
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("mongomock")
+
+import refresh_tokens
+from tests.support import MotorLikeDatabase, run
+
+pytestmark = pytest.mark.anyio
+
+USUARIO = {"id": "u1", "tipo": "formando", "nome": "Ana"}
+
+
+@pytest.fixture
+def database():
+    return MotorLikeDatabase()
+
+
+async def family_revoked(database, familia: str) -> bool:
+    return await database.refresh_tokens.count_documents({"familia": familia, "revogado": False}) == 0
+
+
+async def test_rotation_is_single_use(database):
+    token = await refresh_tokens.issue(database, USUARIO, 30)
+    record = await refresh_tokens.rotate(database, token, 30)
+    assert record["usuario_id"] == "u1"
+    novo = await refresh_tokens.rotate(database, record["novo_token"], 30)
+    assert novo["novo_token"] not in (token, record["novo_token"])
+
+
+async def test_concurrent_refresh_gets_the_same_successor(database):
+    token = await refresh_tokens.issue(database, USUARIO, 30)
+    primeiro = await refresh_tokens.rotate(database, token, 30)
+    # The second tab presents the token the first one just rotated
+    segundo = await refresh_tokens.rotate(database, token, 30)
+    assert segundo is not None
+    assert segundo["novo_token"] == primeiro["novo_token"]
+    assert not await family_revoked(database, primeiro["familia"])
+    assert await refresh_tokens.rotate(database, segundo["novo_token"], 30) is not None
+
+
+async def test_reuse_after_grace_revokes_family(database):
+    token = await refresh_tokens.issue(database, USUARIO, 30)
+    record = await refresh_tokens.rotate(database, token, 30)
+    await database.refresh_tokens.update_one(
+        {"_id": refresh_tokens.hash_token(token)},
+        {"$set": {"usado_em": record["criado_em"] - timedelta(seconds=refresh_tokens.GRACE_SECONDS + 1)}},
+    )
+    assert await refresh_tokens.rotate(database, token, 30) is None
+    assert await family_revoked(database, record["familia"])
+
+
+async def test_reuse_after_successor_rotated_revokes_family(database):
+    token = await refresh_tokens.issue(database, USUARIO, 30)
+    record = await refresh_tokens.rotate(database, token, 30)
+    await refresh_tokens.rotate(database, record["novo_token"], 30)
+    assert await refresh_tokens.rotate(database, token, 30) is None
+    assert await family_revoked(database, record["familia"])
+
+
+async def test_no_grace_after_logout(database):
+    token = await refresh_tokens.issue(database, USUARIO, 30)
+    record = await refresh_tokens.rotate(database, token, 30)
+    await refresh_tokens.revoke(database, record["novo_token"])
+    assert await refresh_tokens.rotate(database, token, 30) is None
+
+
+async def test_grace_stores_successor_the_winner_has_not_written_yet(database):
+    token = await refresh_tokens.issue(database, USUARIO, 30)
+    record = await refresh_tokens.rotate(database, token, 30)
+    # As if the second request ran between the winner's update and its insert
+    await database.refresh_tokens.delete_one({"_id": refresh_tokens.hash_token(record["novo_token"])})
+    segundo = await refresh_tokens.rotate(database, token, 30)
+    assert segundo["novo_token"] == record["novo_token"]
+    assert await refresh_tokens._store_successor(database, record, record["novo_token"], 30) == record["novo_token"]
+    assert await refresh_tokens.rotate(database, record["novo_token"], 30) is not None
+
+
+@pytest.fixture
+def route_db(server, monkeypatch):
+    database = MotorLikeDatabase()
+    monkeypatch.setitem(server.app.dependency_overrides, server.require_mongo, lambda: None)
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+def test_refresh_reports_the_users_current_tipo_and_nome(server, client, make_user, route_db):
+    user_id, _ = make_user("formando")
+    token = run(refresh_tokens.issue(route_db, {"id": user_id, "tipo": "formando", "nome": "Nome antigo"}, 30))
+    run(server.repos.usuarios.update(user_id, {"nome": "Nome novo", "tipo": "empresa"}))
+
+    response = client.post("/api/token/refresh", json={"refresh_token": token})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["user_id"], body["user_type"], body["user_name"]) == (user_id, "empresa", "Nome novo")
+
+
+def test_refresh_for_a_removed_user_is_rejected_and_revokes_the_family(client, route_db):
+    token = run(refresh_tokens.issue(route_db, {"id": "removido", "tipo": "formando", "nome": "Ana"}, 30))
+    response = client.post("/api/token/refresh", json={"refresh_token": token})
+    assert response.status_code == 401
+    familia = route_db.mongo.refresh_tokens.find_one({"_id": refresh_tokens.hash_token(token)})["familia"]
+    assert run(family_revoked(route_db, familia))
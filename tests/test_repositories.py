@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import archival
+import repositories
+from tests.support import MotorLikeDatabase
+
+pytestmark = pytest.mark.anyio
+
+INICIO = datetime(2024, 5, 1)
+
+
+@pytest.fixture(params=[repositories.BACKEND_MEMORY, repositories.BACKEND_MONGO])
+def repos(request):
+    if request.param == repositories.BACKEND_MEMORY:
+        return repositories.memory_repositories()
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    # The unique indexes created at startup
+    database.mongo.respostas.create_index([("usuario_id", 1), ("desafio_id", 1)], unique=True)
+    database.mongo.avaliacoes.create_index("resposta_id", unique=True)
+    repos = repositories.motor_repositories(database)
+    repos.database = database
+    return repos
+
+
+def resposta(i: int, **campos) -> dict:
+    return {
+        "id": f"r{i}", "desafio_id": "d1", "usuario_id": f"u{i}", "empresa_id": "emp1",
+        "texto": "t", "enviada_em": INICIO + timedelta(hours=i), **campos,
+    }
+
+
+async def test_find_sorts_limits_and_projects(repos):
+    for i in (2, 0, 1):
+        await repos.respostas.insert(resposta(i))
+    docs = await repos.respostas.find({"desafio_id": "d1"}, sort=("enviada_em", -1), limit=2, fields=["id"])
+    assert docs == [{"id": "r2"}, {"id": "r1"}]
+    assert await repos.respostas.count({"empresa_id": "emp1"}) == 3
+    assert await repos.respostas.count({"empresa_id": "emp1", "usuario_id": "u1"}) == 1
+    assert await repos.respostas.count() == 3
+    assert (await repos.respostas.find_one({"id": "r0"}))["usuario_id"] == "u0"
+    assert await repos.respostas.find_one({"id": "nenhuma"}) is None
+
+
+async def test_returned_documents_are_copies_without_hidden_fields(repos):
+    await repos.respostas.insert(resposta(0, minhash=[1, 2, 3]))
+    doc = await repos.respostas.find_one({"id": "r0"})
+    assert "minhash" not in doc and "_id" not in doc
+    doc["texto"] = "alterado"
+    assert (await repos.respostas.find_one({"id": "r0"}))["texto"] == "t"
+
+
+async def test_update_moves_indexed_values(repos):
+    await repos.respostas.insert(resposta(0))
+    assert await repos.respostas.update("r0", {"empresa_id": "emp2"})
+    assert await repos.respostas.count({"empresa_id": "emp1"}) == 0
+    assert await repos.respostas.count({"empresa_id": "emp2"}) == 1
+    assert not await repos.respostas.update("nenhuma", {"empresa_id": "emp2"})
+
+
+async def test_second_resposta_and_second_avaliacao_are_rejected(repos):
+    await repos.respostas.insert(resposta(0))
+    with pytest.raises(DuplicateKeyError):
+        await repos.respostas.insert({**resposta(0), "id": "outra"})
+    await repos.avaliacoes.insert({"id": "a0", "resposta_id": "r0", "nota": 5.0})
+    with pytest.raises(DuplicateKeyError):
+        await repos.avaliacoes.insert({"id": "a1", "resposta_id": "r0", "nota": 6.0})
+
+
+async def test_get_full_returns_long_descriptions_whole(repos):
+    descricao = "descrição longa " * 500
+    await repos.desafios.insert({"id": "d1", "empresa_id": "emp1", "titulo": "T", "descricao": descricao})
+    assert (await repos.desafios.get_full("d1"))["descricao"] == descricao
+    assert await repos.desafios.get_full("nenhum") is None
+
+
+async def test_matches_average_per_formando_and_empresa(repos):
+    notas = [("f1", "emp1", 9.0, "A"), ("f1", "emp1", 7.0, "B"), ("f2", "emp1", 5.0, "A"), (None, "emp1", 10.0, "A")]
+    for i, (formando, empresa, nota, titulo) in enumerate(notas):
+        await repos.avaliacoes.insert({
+            "id": f"a{i}", "resposta_id": f"r{i}", "formando_id": formando, "empresa_id": empresa,
+            "formando_nome": formando, "empresa_nome": "Acme", "desafio_titulo": titulo, "nota": nota,
+        })
+    matches = await repos.avaliacoes.matches(6.0)
+    assert len(matches) == 1
+    match = matches[0]
+    assert (match["formando_id"], match["empresa_id"], match["nota_media"]) == ("f1", "emp1", 8.0)
+    assert (match["total_respostas"], sorted(match["desafios"])) == (2, ["A", "B"])
+    assert [m["formando_id"] for m in await repos.avaliacoes.matches(0)] == ["f1", "f2"]
+
+
+async def test_memory_backend_rejects_operator_filters():
+    repos = repositories.memory_repositories()
+    with pytest.raises(ValueError):
+        await repos.respostas.find({"enviada_em": {"$gt": INICIO}})
+
+
+async def test_archived_documents_are_read_only_when_asked():
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    repos = repositories.motor_repositories(database)
+    database.mongo.respostas.insert_one(resposta(1))
+    database.mongo[archival.ARQUIVO["respostas"]].insert_many([resposta(0), resposta(2)])
+
+    assert await repos.respostas.find_one({"id": "r0"}) is None
+    assert (await repos.respostas.find_one({"id": "r0"}, incluir_arquivados=True))["id"] == "r0"
+    assert await repos.respostas.count({"desafio_id": "d1"}, incluir_arquivados=True) == 3
+    # Each collection comes back sorted; the merge keeps the order across them
+    docs = await repos.respostas.find({"desafio_id": "d1"}, sort=("enviada_em", -1), limit=2,
+                                      fields=["id"], incluir_arquivados=True)
+    assert docs == [{"id": "r2"}, {"id": "r1"}]
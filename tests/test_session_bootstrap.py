@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import display_names
+import repositories
+import session_bootstrap
+from tests.support import MotorLikeDatabase, run
+
+pytestmark = pytest.mark.anyio
+
+INICIO = datetime(2024, 5, 1)
+
+
+async def seed(repos):
+    await repos.desafios.insert({"id": "d1", "empresa_id": "emp1", "titulo": "Um", "criado_em": INICIO})
+    await repos.desafios.insert({"id": "d2", "empresa_id": "emp1", "titulo": "Dois", "criado_em": INICIO})
+    await repos.desafios.insert({"id": "d3", "empresa_id": "emp2", "titulo": "Três", "criado_em": INICIO})
+    for i, (desafio, empresa) in enumerate([("d1", "emp1"), ("d2", "emp1"), ("d3", "emp2")]):
+        await repos.respostas.insert({
+            "id": f"r{i}", "desafio_id": desafio, "usuario_id": "f1", "texto": "t",
+            "empresa_id": empresa, "desafio_titulo": "T", "formando_nome": "Ana",
+            "enviada_em": INICIO + timedelta(hours=i),
+        })
+    await repos.avaliacoes.insert({
+        "id": "a0", "resposta_id": "r0", "desafio_id": "d1", "empresa_id": "emp1", "formando_id": "f1",
+        "nota": 9.0, "avaliado_em": INICIO + timedelta(hours=10),
+    })
+
+
+async def test_empresa_summary_counts_only_its_own_data():
+    repos = repositories.memory_repositories()
+    await seed(repos)
+    resumo = await session_bootstrap.empresa_summary(repos, {"id": "emp1"})
+    assert {k: v for k, v in resumo.items() if k != "atividade_recente"} == {
+        "total_desafios": 2, "total_respostas": 2, "total_avaliacoes": 1, "avaliacoes_pendentes": 1,
+    }
+    atividade = resumo["atividade_recente"]
+    # Newest first, respostas and avaliacoes interleaved
+    assert [(item["tipo"], item["resposta_id"]) for item in atividade] == [
+        ("avaliacao", "r0"), ("resposta", "r1"), ("resposta", "r0"),
+    ]
+    assert atividade[0]["nota"] == 9.0
+
+
+async def test_empresa_without_profile_gets_an_empty_summary():
+    repos = repositories.memory_repositories()
+    await seed(repos)
+    resumo = await session_bootstrap.empresa_summary(repos, None)
+    assert resumo == session_bootstrap._empty()
+
+
+async def test_formando_summary_counts_desafios_still_open():
+    repos = repositories.memory_repositories()
+    await seed(repos)
+    await repos.desafios.insert({"id": "d4", "empresa_id": "emp2", "titulo": "Quatro", "criado_em": INICIO})
+    resumo = await session_bootstrap.formando_summary(repos, "f1")
+    assert (resumo["total_desafios"], resumo["total_respostas"], resumo["total_avaliacoes"]) == (1, 3, 1)
+    assert (await session_bootstrap.formando_summary(repos, "outro"))["total_respostas"] == 0
+
+
+async def test_recent_activity_is_limited():
+    repos = repositories.memory_repositories()
+    for i in range(session_bootstrap.ATIVIDADE_LIMITE + 3):
+        await repos.respostas.insert({
+            "id": f"r{i}", "desafio_id": "d1", "usuario_id": f"f{i}", "empresa_id": "emp1", "texto": "t",
+            "enviada_em": INICIO + timedelta(minutes=i),
+        })
+    resumo = await session_bootstrap.admin_summary(repos)
+    assert resumo["total_respostas"] == session_bootstrap.ATIVIDADE_LIMITE + 3
+    assert len(resumo["atividade_recente"]) == session_bootstrap.ATIVIDADE_LIMITE
+    assert resumo["atividade_recente"][0]["resposta_id"] == f"r{session_bootstrap.ATIVIDADE_LIMITE + 2}"
+
+
+async def test_legacy_documents_are_counted_after_the_startup_backfill():
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    mongo = database.mongo
+    mongo.usuarios.insert_one({"id": "f1", "nome": "Ana", "tipo": "formando"})
+    mongo.empresas.insert_one({"id": "emp1", "usuario_id": "e1", "nome": "Acme"})
+    mongo.desafios.insert_one({"id": "d1", "empresa_id": "emp1", "titulo": "Desafio"})
+    # Written before respostas and avaliacoes carried owner ids and names
+    mongo.respostas.insert_one({"id": "r1", "desafio_id": "d1", "usuario_id": "f1", "enviada_em": INICIO})
+    mongo.avaliacoes.insert_one({"id": "a1", "resposta_id": "r1", "nota": 6.0, "avaliado_em": INICIO})
+    repos = repositories.motor_repositories(database)
+
+    assert (await session_bootstrap.empresa_summary(repos, {"id": "emp1"}))["total_respostas"] == 0
+    await display_names.backfill(database)
+
+    empresa = await session_bootstrap.empresa_summary(repos, {"id": "emp1"})
+    assert (empresa["total_respostas"], empresa["total_avaliacoes"]) == (1, 1)
+    assert {item["formando_nome"] for item in empresa["atividade_recente"]} == {"Ana"}
+    assert {item["empresa_nome"] for item in empresa["atividade_recente"]} == {"Acme"}
+    formando = await session_bootstrap.formando_summary(repos, "f1")
+    assert (formando["total_respostas"], formando["total_avaliacoes"]) == (1, 1)
+
+
+def test_bootstrap_route_returns_the_callers_summary(server, client, make_user, monkeypatch):
+    repos = repositories.memory_repositories()
+    monkeypatch.setattr(server, "repos", repos)
+    run(seed(repos))
+    user_id, headers = make_user("empresa")
+    run(repos.empresas.insert({"id": "emp1", "usuario_id": user_id, "nome": "Acme", "cnpj": "12345678000190", "descricao": "d"}))
+
+    response = client.get("/api/me/bootstrap", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["usuario"]["id"] == user_id
+    assert body["empresa"]["id"] == "emp1"
+    assert (body["total_desafios"], body["total_respostas"], body["avaliacoes_pendentes"]) == (2, 2, 1)
@@ -0,0 +1,74 @@
+import pytest
+
+import text_storage
+from tests.support import MotorLikeDatabase
+
+pytestmark = pytest.mark.anyio
+
+
+def test_excerpt_cuts_at_a_word_boundary():
+    assert text_storage.excerpt("curto", 10) == "curto"
+    assert text_storage.excerpt("uma frase bem longa", 12) == "uma frase…"
+    # No space in the last 40%: cut mid-word rather than drop most of the limit
+    assert text_storage.excerpt("a " + "x" * 20, 10) == "a xxxxxxxx…"
+
+
+@pytest.mark.parametrize("codec", [text_storage.CODEC_ZLIB, text_storage.CODEC_ZSTD])
+def test_codecs_round_trip(codec):
+    if codec == text_storage.CODEC_ZSTD:
+        pytest.importorskip("zstandard")
+    texto = "ação " * 500
+    assert text_storage.decompress(text_storage.compress(texto, codec), codec) == texto
+
+
+def test_zstd_body_without_the_package_fails_clearly(monkeypatch):
+    monkeypatch.setattr(text_storage, "zstandard", None)
+    with pytest.raises(RuntimeError):
+        text_storage.decompress(b"", text_storage.CODEC_ZSTD)
+
+
+def test_small_bodies_stay_inline():
+    doc = {"id": "r1", "texto": "curto"}
+    assert text_storage.split_body(doc, "texto", text_storage.KIND_RESPOSTA) is None
+    assert doc == {"id": "r1", "texto": "curto"}
+
+
+def test_threshold_counts_utf8_bytes(monkeypatch):
+    monkeypatch.setattr(text_storage, "COMPRESS_THRESHOLD", 10)
+    # Six characters, twelve bytes
+    doc = {"id": "r1", "texto": "çççççç"}
+    assert text_storage.split_body(doc, "texto", text_storage.KIND_RESPOSTA) is not None
+
+
+async def test_large_bodies_move_to_the_side_collection_and_expand_back():
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    texto = "palavra " * 1000
+    doc = {"id": "d1", "descricao": texto}
+    side = text_storage.split_body(doc, "descricao", text_storage.KIND_DESAFIO)
+    assert side["_id"] == "desafio:d1"
+    assert side["tamanho"] == len(texto)
+    assert doc["descricao_truncada"] is True
+    assert len(doc["descricao"]) <= text_storage.EXCERPT_CHARS + 1
+
+    await text_storage.store_side(database, side)
+    # Storing again (an edit) replaces the side document
+    await text_storage.store_side(database, side)
+    assert database.mongo[text_storage.SIDE_COLLECTION].count_documents({}) == 1
+
+    inline = {"id": "d2", "descricao": "curta"}
+    expanded = await text_storage.expand(database, [doc, inline], "descricao", text_storage.KIND_DESAFIO)
+    assert expanded[0]["descricao"] == texto
+    assert expanded[0]["descricao_truncada"] is False
+    assert expanded[1] == {"id": "d2", "descricao": "curta"}
+
+
+async def test_expand_uses_the_given_id_field():
+    pytest.importorskip("mongomock")
+    database = MotorLikeDatabase()
+    texto = "resposta " * 1000
+    doc = {"id": "r1", "texto": texto}
+    await text_storage.store_side(database, text_storage.split_body(doc, "texto", text_storage.KIND_RESPOSTA))
+    linha = {"resposta_id": "r1", "texto": doc["texto"], "texto_truncado": True}
+    [linha] = await text_storage.expand(database, [linha], "texto", text_storage.KIND_RESPOSTA, id_field="resposta_id")
+    assert linha["texto"] == texto
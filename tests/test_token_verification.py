@@ -0,0 +1,81 @@
+import time
+
+import jwt
+import pytest
+
+from token_verification import ALGORITHM, KeyRing, VerifiedTokenCache
+
+
+def claims(segundos: float = 60) -> dict:
+    return {"sub": "u1", "exp": int(time.time() + segundos)}
+
+
+def test_from_env_parses_keys_and_falls_back_to_the_secret():
+    ring = KeyRing.from_env("a:um, b:dois", "b", "segredo")
+    assert ring.keys == {"a": "um", "b": "dois"}
+    assert ring.active_secret == "dois"
+    assert KeyRing.from_env(None, None, "segredo").keys == {"default": "segredo"}
+    with pytest.raises(ValueError):
+        KeyRing.from_env("a:um", "c", "segredo")
+
+
+def test_retired_kid_is_rejected_and_listed_kids_verify():
+    antigo = KeyRing({"a": "um"}, "a").encode(claims())
+    assert KeyRing({"a": "um", "b": "dois"}, "b").decode(antigo)["sub"] == "u1"
+    with pytest.raises(jwt.InvalidKeyError):
+        KeyRing({"b": "dois"}, "b").decode(antigo)
+
+
+def test_tokens_without_kid_try_every_key():
+    legado = jwt.encode(claims(), "um", algorithm=ALGORITHM)
+    assert KeyRing({"b": "dois", "a": "um"}, "b").decode(legado)["sub"] == "u1"
+    with pytest.raises(jwt.InvalidSignatureError):
+        KeyRing({"b": "dois"}, "b").decode(legado)
+
+
+def test_cache_hits_and_returns_copies():
+    ring = KeyRing({"a": "um"}, "a")
+    cache = VerifiedTokenCache(ring)
+    token = ring.encode(claims())
+    primeiro = cache.decode(token)
+    primeiro["sub"] = "outro"
+    segundo = cache.decode(token)
+    assert segundo["sub"] == "u1"
+    segundo["sub"] = "outro"
+    assert cache.decode(token)["sub"] == "u1"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_expired_entries_are_verified_again(monkeypatch):
+    ring = KeyRing({"a": "um"}, "a")
+    cache = VerifiedTokenCache(ring)
+    token = ring.encode(claims(30))
+    cache.decode(token)
+    agora = time.time()
+    # Only the cache's clock moves; PyJWT still sees the token as valid
+    monkeypatch.setattr(time, "time", lambda: agora + 60)
+    cache.decode(token)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_cache_is_bounded_and_skips_tokens_without_exp():
+    ring = KeyRing({"a": "um"}, "a")
+    cache = VerifiedTokenCache(ring, maxsize=2)
+    tokens = [ring.encode({**claims(), "n": n}) for n in range(3)]
+    for token in tokens:
+        cache.decode(token)
+    assert len(cache) == 2
+    cache.decode(tokens[0])
+    assert cache.misses == 4
+
+    cache.decode(ring.encode({"sub": "u1"}))
+    assert len(cache) == 2
+
+
+def test_bad_signature_is_not_cached():
+    cache = VerifiedTokenCache(KeyRing({"a": "um"}, "a"))
+    forjado = KeyRing({"a": "outro"}, "a").encode(claims())
+    for _ in range(2):
+        with pytest.raises(jwt.InvalidSignatureError):
+            cache.decode(forjado)
+    assert len(cache) == 0
@@ -0,0 +1,110 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import user_listing
+from user_listing import Consulta, ListagemInvalida
+from tests.support import run
+
+T0 = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def admin(server, make_user, monkeypatch):
+    # A fresh store, so the listing only holds this test's usuarios
+    monkeypatch.setattr(server, "repos", server.repositories.memory_repositories())
+    monkeypatch.setattr(server, "user_counters", user_listing.UserCounters())
+    _, headers = make_user("admin")
+    return headers
+
+
+def add_usuario(server, nome: str, email: str, criado_em: datetime, tipo: str = "formando") -> str:
+    usuario = {"id": str(uuid.uuid4()), "nome": nome, "email": email, "tipo": tipo, "criado_em": criado_em}
+    usuario.update(user_listing.search_fields(usuario))
+    run(server.repos.usuarios.insert(usuario))
+    return usuario["id"]
+
+
+def test_keyset_cursor_walks_every_user_once_across_ties(server, client, admin):
+    # Same criado_em for several users: the id breaks the tie
+    ids = {add_usuario(server, f"Nome {i}", f"u{i}@x.com", T0 + timedelta(days=i // 3)) for i in range(7)}
+    vistos, cursor = [], None
+    while True:
+        params = {"tipo": "formando", "limite": 2, **({"cursor": cursor} if cursor else {})}
+        pagina = client.get("/api/admin/usuarios", headers=admin, params=params).json()
+        vistos += [u["id"] for u in pagina["usuarios"]]
+        cursor = pagina["proximo_cursor"]
+        if cursor is None:
+            break
+    assert len(vistos) == 7 and set(vistos) == ids
+
+
+def test_response_shape(server, client, admin):
+    add_usuario(server, "Ana", "ana@x.com", T0)
+    pagina = client.get("/api/admin/usuarios", headers=admin, params={"tipo": "formando"}).json()
+    assert set(pagina) == {"usuarios", "totais", "proximo_cursor"}
+    assert set(pagina["usuarios"][0]) == {"id", "email", "nome", "tipo", "criado_em"}
+    assert pagina["totais"] == {"admin": 1, "empresa": 0, "formando": 1, "todos": 2}
+    assert pagina["proximo_cursor"] is None
+
+
+def test_email_prefix_matches_mixed_case_emails(server, client, admin):
+    maria = add_usuario(server, "Maria", "Maria.Silva@Empresa.com", T0)
+    add_usuario(server, "Mario", "mario@empresa.com", T0)
+    pagina = client.get("/api/admin/usuarios", headers=admin, params={"email": "MARIA.s"}).json()
+    assert [u["id"] for u in pagina["usuarios"]] == [maria]
+    # Shown as registered; EmailStr itself lowercases only the domain
+    assert pagina["usuarios"][0]["email"] == "Maria.Silva@empresa.com"
+
+
+def test_registration_stores_the_search_copy(server, client, monkeypatch):
+    monkeypatch.setattr(server, "repos", server.repositories.memory_repositories())
+    response = client.post("/api/register", json={"nome": "Zé", "email": "Ze@Teste.com", "senha": "123456",
+                                                  "tipo": "formando"})
+    assert response.status_code == 200
+    usuario = run(server.repos.usuarios.find_one({"email": "Ze@teste.com"}))
+    assert usuario["email_busca"] == "ze@teste.com"
+    assert usuario["nome_busca"] == "ze"
+
+
+def test_cursor_is_bound_to_its_sort():
+    cursor = user_listing.encode_cursor("nome_busca", "ana", "id-1")
+    assert user_listing.decode_cursor(cursor, "nome_busca") == ("ana", "id-1")
+    with pytest.raises(ListagemInvalida):
+        Consulta(ordem="email", cursor=cursor)
+    with pytest.raises(ListagemInvalida):
+        Consulta(cursor="nao-e-um-cursor")
+
+
+def test_cursor_keeps_datetimes():
+    cursor = user_listing.encode_cursor("criado_em", T0, "id-1")
+    assert Consulta(cursor=cursor).apos == (T0, "id-1")
+
+
+def test_mongo_filter_resumes_after_the_cursor():
+    consulta = Consulta(tipo="empresa", email="A@B", direcao=-1, cursor=user_listing.encode_cursor("email_busca", "a@bc", "x"))
+    assert consulta.mongo_filter() == {"$and": [
+        {"tipo": "empresa"},
+        {"email_busca": {"$regex": "^a@b"}},
+        {"$or": [{"email_busca": {"$lt": "a@bc"}}, {"email_busca": "a@bc", "id": {"$lt": "x"}}]},
+    ]}
+    assert consulta.mongo_sort() == [("email_busca", -1), ("id", -1)]
+
+
+mongomock = pytest.importorskip("mongomock")
+
+from tests.support import MotorLikeDatabase  # noqa: E402
+
+
+def test_backfill_adds_the_email_search_copy():
+    database = MotorLikeDatabase()
+    database.mongo.usuarios.insert_many([
+        {"id": "u1", "nome": "Ana", "email": "Ana@X.com"},
+        {"id": "u2", "nome": "Bia", "email": "bia@x.com", "nome_busca": "bia"},
+        {"id": "u3", "nome": "Caio", "email": "caio@x.com", "nome_busca": "caio", "email_busca": "caio@x.com"},
+    ])
+    assert run(user_listing.backfill(database)) == 2
+    assert database.mongo.usuarios.find_one({"id": "u1"})["email_busca"] == "ana@x.com"
+    assert database.mongo.usuarios.find_one({"id": "u2"})["email_busca"] == "bia@x.com"
+    assert run(user_listing.backfill(database)) == 0